@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib import messages
-from .models import AttendanceRecord, AttendanceSettings
+from .models import AttendanceRecord, AttendanceSettings, AutoCheckoutBatch
+from .penalties import recalculate_penalties
 
 @admin.register(AttendanceRecord)
 class AttendanceRecordAdmin(admin.ModelAdmin):
@@ -34,11 +35,7 @@ class AttendanceRecordAdmin(admin.ModelAdmin):
     
     def recalculate_penalty(self, request, queryset):
         """Принудительно пересчитывает штрафы для выбранных записей"""
-        updated_count = 0
-        for record in queryset:
-            if record.recalculate_penalty():
-                updated_count += 1
-                record.save()
+        updated_count = recalculate_penalties(queryset)['updated']
         
         if updated_count > 0:
             messages.success(request, f'Штрафы пересчитаны для {updated_count} записей')
@@ -55,3 +52,10 @@ class AttendanceSettingsAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(AutoCheckoutBatch)
+class AutoCheckoutBatchAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'source', 'shift_date', 'work_schedule', 'check_out', 'records_count']
+    list_filter = ['source', 'work_schedule', 'shift_date']
+    readonly_fields = ['created_at', 'source', 'shift_date', 'work_schedule', 'check_out', 'records_count']
@@ -0,0 +1,99 @@
+"""
+Автоматическая отметка ухода пачками.
+
+Время ухода зависит только от даты смены и графика сотрудника (правила
+AttendanceRecord.get_shift_end: дневная смена до 20:00 того же дня,
+ночная — до 8:00 следующего). Поэтому открытые записи группируются одним
+запросом по (дата, ночной график), и каждая группа, чья смена уже
+закончилась, закрывается одним UPDATE check_out — число запросов зависит
+от числа открытых дат, а не от числа сотрудников. save() не вызывается:
+штраф зависит только от прихода и не меняется. На каждую закрытую группу
+пишется строка AutoCheckoutBatch.
+"""
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+from typing import List, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AttendanceRecord, AutoCheckoutBatch
+
+User = get_user_model()
+
+DAY = User.WorkSchedule.DAY
+NIGHT = User.WorkSchedule.NIGHT
+
+
+def shift_end(shift_date, work_schedule) -> datetime:
+    """Конец смены по дате и графику (как AttendanceRecord.get_shift_end)."""
+    if work_schedule == NIGHT:
+        end = datetime.combine(shift_date + timedelta(days=1), time(8, 0))
+    else:
+        end = datetime.combine(shift_date, time(20, 0))
+    return timezone.make_aware(end, timezone.get_current_timezone())
+
+
+def _open_records():
+    return AttendanceRecord.objects.filter(check_in__isnull=False, check_out__isnull=True)
+
+
+def _groups(records):
+    """(дата, график) открытых записей одним запросом; без ночного графика — дневной."""
+    rows = records.order_by().values_list('date', 'employee__work_schedule').distinct()
+    return sorted({(shift_date, NIGHT if schedule == NIGHT else DAY) for shift_date, schedule in rows})
+
+
+def _close(shift_date, work_schedule, check_out, source) -> Optional[AutoCheckoutBatch]:
+    records = _open_records().filter(date=shift_date)
+    if work_schedule == NIGHT:
+        records = records.filter(employee__work_schedule=NIGHT)
+    else:
+        records = records.filter(~Q(employee__work_schedule=NIGHT))
+    count = records.update(check_out=check_out)
+    if not count:
+        return None
+    return AutoCheckoutBatch(
+        source=source,
+        shift_date=shift_date,
+        work_schedule=work_schedule,
+        check_out=check_out,
+        records_count=count,
+    )
+
+
+def _checkout(groups, check_out_for, source) -> List[AutoCheckoutBatch]:
+    batches = []
+    with transaction.atomic():
+        for shift_date, work_schedule in groups:
+            check_out = check_out_for(shift_date, work_schedule)
+            if check_out is None:
+                continue
+            batch = _close(shift_date, work_schedule, check_out, source)
+            if batch is not None:
+                batches.append(batch)
+        AutoCheckoutBatch.objects.bulk_create(batches)
+    return batches
+
+
+def auto_checkout(now: Optional[datetime] = None, source: str = 'task') -> List[AutoCheckoutBatch]:
+    """
+    Закрывает открытые записи, смена которых закончилась, временем конца смены.
+
+    Возвращает созданные строки журнала (по одной на дату и график).
+    """
+    now = now or timezone.now()
+
+    def check_out_for(shift_date, work_schedule):
+        end = shift_end(shift_date, work_schedule)
+        return end if end <= now else None
+
+    return _checkout(_groups(_open_records()), check_out_for, source)
+
+
+def checkout_open_records(shift_date, at: datetime, source: str = 'command') -> List[AutoCheckoutBatch]:
+    """Закрывает все открытые записи даты shift_date временем at (ручной запуск)."""
+    return _checkout(_groups(_open_records().filter(date=shift_date)), lambda *group: at, source)
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import time
-from apps.attendance.models import AttendanceRecord
+from apps.attendance.checkout import checkout_open_records
 
 
 class Command(BaseCommand):
@@ -30,30 +30,18 @@ class Command(BaseCommand):
         
         today = timezone.localdate()
         
-        # Находим всех сотрудников, которые пришли, но не ушли
-        active_records = AttendanceRecord.objects.filter(
-            date=today,
-            check_in__isnull=False,
-            check_out__isnull=True
-        )
+        # Закрываем все открытые записи за сегодня пачками по графику
+        batches = checkout_open_records(today, current_time)
+        checked_out_count = sum(batch.records_count for batch in batches)
         
-        if not active_records.exists():
+        if not checked_out_count:
             self.stdout.write(
                 self.style.SUCCESS('Нет сотрудников для автоматической отметки ухода')
             )
             return
         
-        checked_out_count = 0
-        for record in active_records:
-            record.check_out = current_time
-            record.save()
-            checked_out_count += 1
-            self.stdout.write(
-                f'Отмечен уход для {record.employee.get_full_name() or record.employee.username}'
-            )
-        
         self.stdout.write(
             self.style.SUCCESS(
                 f'Успешно отмечен уход для {checked_out_count} сотрудников в {local_time.strftime("%H:%M")}'
             )
-        ) 
\ No newline at end of file
+        )
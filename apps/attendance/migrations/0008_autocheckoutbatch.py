@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0007_attendancerecord_penalty_charged_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutoCheckoutBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Выполнено')),
+                ('source', models.CharField(choices=[('task', 'Задача по расписанию'), ('command', 'Команда управления')], default='task', max_length=20, verbose_name='Источник')),
+                ('shift_date', models.DateField(verbose_name='Дата смены')),
+                ('work_schedule', models.CharField(max_length=10, verbose_name='График')),
+                ('check_out', models.DateTimeField(verbose_name='Проставленное время ухода')),
+                ('records_count', models.PositiveIntegerField(default=0, verbose_name='Закрыто записей')),
+            ],
+            options={
+                'verbose_name': 'Автоматическая отметка ухода',
+                'verbose_name_plural': 'Автоматические отметки ухода',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
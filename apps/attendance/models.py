@@ -6,9 +6,13 @@ from datetime import datetime, time, timedelta
 from decimal import Decimal
 import math
 
+from core.caching import get_or_set, invalidate_on
+
 # Create your models here.
 User = get_user_model()
 
+ATTENDANCE_SETTINGS_CACHE = 'attendance-settings'
+
 class AttendanceSettings(models.Model):
     """Настройки системы посещаемости (singleton)"""
     penalty_per_hour = models.DecimalField(
@@ -33,7 +37,11 @@ class AttendanceSettings(models.Model):
 
     @classmethod
     def get_settings(cls):
-        """Получить настройки (singleton pattern)"""
+        """Получить настройки (singleton pattern), кэшируются до их изменения"""
+        return get_or_set(ATTENDANCE_SETTINGS_CACHE, ('solo',), cls._load_settings, ttl=3600)
+
+    @classmethod
+    def _load_settings(cls):
         settings_obj, _ = cls.objects.get_or_create(pk=1)
         return settings_obj
 
@@ -42,6 +50,10 @@ class AttendanceSettings(models.Model):
         self.pk = 1
         super().save(*args, **kwargs)
 
+
+invalidate_on(ATTENDANCE_SETTINGS_CACHE, AttendanceSettings)
+
+
 class AttendanceRecord(models.Model):
     MAX_PENALTY_HOURS = 8
     employee = models.ForeignKey(
@@ -128,19 +140,24 @@ class AttendanceRecord(models.Model):
         naive_dt = datetime.combine(end_date, shift_end)
         return timezone.make_aware(naive_dt, timezone.get_current_timezone())
 
-    def get_late_hours(self):
+    def _grace_time(self, attendance_settings=None):
+        """Начало смены плюс льготный период (None, если смена не определена)"""
+        shift_start = self.get_shift_start()
+        if not shift_start:
+            return None
+        attendance_settings = attendance_settings or AttendanceSettings.get_settings()
+        return shift_start + timedelta(minutes=attendance_settings.grace_period_minutes)
+
+    def get_late_hours(self, attendance_settings=None):
         """Возвращает количество часов опоздания (с округлением вверх)"""
         if not self.check_in:
             return 0
 
-        shift_start = self.get_shift_start()
-        if not shift_start:
+        grace_time = self._grace_time(attendance_settings)
+        if not grace_time:
             return 0
 
-        settings = AttendanceSettings.get_settings()
         local_check_in = timezone.localtime(self.check_in)
-        grace_time = shift_start + timedelta(minutes=settings.grace_period_minutes)
-
         if local_check_in <= grace_time:
             return 0
 
@@ -149,64 +166,72 @@ class AttendanceRecord(models.Model):
         late_hours = math.ceil(late_delta.total_seconds() / 3600)
         return late_hours
 
-    def calculate_penalty(self):
-        """Рассчитывает штраф за опоздание на основе времени опоздания"""
-        if not self.check_in:
-            self.is_late = False
-            if not self.penalty_manual:
-                self.penalty_amount = Decimal('0.00')
-            return self.penalty_amount
+    def calculate_penalty(self, attendance_settings=None):
+        """
+        Рассчитывает штраф за опоздание на основе времени опоздания.
 
-        shift_start = self.get_shift_start()
-        if not shift_start:
+        Для пакетного пересчёта настройки передаются один раз
+        (attendance_settings), иначе берутся из кэша.
+        """
+        grace_time = self._grace_time(attendance_settings) if self.check_in else None
+        if not grace_time:
             self.is_late = False
             if not self.penalty_manual:
                 self.penalty_amount = Decimal('0.00')
             return self.penalty_amount
 
-        settings = AttendanceSettings.get_settings()
-        local_check_in = timezone.localtime(self.check_in)
-        grace_time = shift_start + timedelta(minutes=settings.grace_period_minutes)
-
-        self.is_late = local_check_in > grace_time
+        attendance_settings = attendance_settings or AttendanceSettings.get_settings()
+        self.is_late = timezone.localtime(self.check_in) > grace_time
         
         if not self.penalty_manual:
             if self.is_late:
-                late_hours = self.get_late_hours()
+                late_hours = self.get_late_hours(attendance_settings)
                 penalty_hours = min(late_hours, self.MAX_PENALTY_HOURS)
-                self.penalty_amount = settings.penalty_per_hour * Decimal(str(penalty_hours))
+                self.penalty_amount = attendance_settings.penalty_per_hour * Decimal(str(penalty_hours))
             else:
                 self.penalty_amount = Decimal('0.00')
         
         return self.penalty_amount
 
-    def get_late_status(self):
+    def get_late_status(self, attendance_settings=None):
         """Возвращает статус опоздания без изменения модели"""
         if not self.check_in:
             return False
-        shift_start = self.get_shift_start()
-        if not shift_start:
+        grace_time = self._grace_time(attendance_settings)
+        if not grace_time:
             return False
-        settings = AttendanceSettings.get_settings()
-        local_check_in = timezone.localtime(self.check_in)
-        grace_time = shift_start + timedelta(minutes=settings.grace_period_minutes)
-        return local_check_in > grace_time
+        return timezone.localtime(self.check_in) > grace_time
 
-    def recalculate_penalty(self):
+    def recalculate_penalty(self, attendance_settings=None):
         """Принудительно пересчитывает штраф (для существующих записей)"""
         old_penalty = self.penalty_amount
         old_is_late = self.is_late
         
-        self.calculate_penalty()
+        self.calculate_penalty(attendance_settings)
         
         # Возвращаем True если что-то изменилось
         return old_penalty != self.penalty_amount or old_is_late != self.is_late
 
+    @property
+    def target_charged_amount(self):
+        """Штраф, который должен быть списан с баланса по текущему расчёту"""
+        return Decimal(str(self.penalty_amount or 0)) if self.is_late else Decimal('0.00')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        record = super().from_db(db, field_names, values)
+        # Списанная сумма на момент загрузки: save() не перечитывает строку
+        if 'penalty_charged_amount' in field_names:
+            record._loaded_charged_amount = record.penalty_charged_amount
+        return record
+
     def save(self, *args, **kwargs):
         if not self.date and self.check_in:
             self.date = timezone.localtime(self.check_in).date()
         old_charged_amount = Decimal('0.00')
-        if self.pk:
+        if getattr(self, '_loaded_charged_amount', None) is not None:
+            old_charged_amount = Decimal(str(self._loaded_charged_amount))
+        elif self.pk:
             try:
                 old_record = AttendanceRecord.objects.only('penalty_charged_amount').get(pk=self.pk)
                 old_charged_amount = Decimal(str(old_record.penalty_charged_amount or 0))
@@ -215,6 +240,7 @@ class AttendanceRecord(models.Model):
         self.calculate_penalty()
         super().save(*args, **kwargs)
         self._sync_penalty_finance(old_charged_amount)
+        self._loaded_charged_amount = self.penalty_charged_amount
 
     def _sync_penalty_finance(self, old_charged_amount):
         """
@@ -226,7 +252,7 @@ class AttendanceRecord(models.Model):
         except Exception:
             return
 
-        target_penalty = Decimal(str(self.penalty_amount or 0)) if self.is_late else Decimal('0.00')
+        target_penalty = self.target_charged_amount
         current_charged = Decimal(str(self.penalty_charged_amount or 0))
 
         if current_charged != old_charged_amount:
@@ -254,3 +280,26 @@ class AttendanceRecord(models.Model):
 
         AttendanceRecord.objects.filter(pk=self.pk).update(penalty_charged_amount=target_penalty)
         self.penalty_charged_amount = target_penalty
+
+
+class AutoCheckoutBatch(models.Model):
+    """Журнал автоматической отметки ухода: одна строка на закрытую пачку записей"""
+    SOURCE_CHOICES = [
+        ('task', 'Задача по расписанию'),
+        ('command', 'Команда управления'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Выполнено')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='task', verbose_name='Источник')
+    shift_date = models.DateField(verbose_name='Дата смены')
+    work_schedule = models.CharField(max_length=10, verbose_name='График')
+    check_out = models.DateTimeField(verbose_name='Проставленное время ухода')
+    records_count = models.PositiveIntegerField(default=0, verbose_name='Закрыто записей')
+
+    class Meta:
+        verbose_name = 'Автоматическая отметка ухода'
+        verbose_name_plural = 'Автоматические отметки ухода'
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"{self.shift_date} ({self.work_schedule}): {self.records_count}"
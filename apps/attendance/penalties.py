@@ -0,0 +1,180 @@
+"""
+Пакетный пересчёт штрафов за опоздания.
+
+Настройки посещаемости загружаются один раз на весь пересчёт, опоздание и
+штраф записей считаются в памяти (AttendanceRecord.calculate_penalty с
+переданными настройками). Для каждой пачки записей:
+
+- изменённые записи сохраняются одним bulk_update;
+- разница между новым и уже списанным штрафом сводится по сотрудникам и
+  применяется к балансу одним UPDATE balance = F('balance') - CASE по
+  сотрудникам пачки;
+- операции «Штраф за опоздание» и «Возврат штрафа за опоздание»
+  создаются одним bulk_create — по одной на запись, как при сохранении
+  записи по одной.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .models import AttendanceRecord, AttendanceSettings
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+
+BALANCE_BATCH = 500
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+PENALTY_NOTE = 'Штраф за опоздание'
+REFUND_NOTE = 'Возврат штрафа за опоздание'
+
+_FIELDS = ['is_late', 'penalty_amount', 'penalty_charged_amount']
+
+
+def describe_change(record, old_penalty, old_is_late) -> str:
+    """Строка отчёта об изменении записи (время прихода может быть не указано)."""
+    check_in = timezone.localtime(record.check_in).time() if record.check_in else '—'
+    return (
+        f"{record.employee.get_full_name()} - {record.date} {check_in}: "
+        f"штраф {old_penalty} → {record.penalty_amount}, опоздание {old_is_late} → {record.is_late}"
+    )
+
+
+def records_for(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    employee_ids: Optional[Iterable[int]] = None,
+    include_manual: bool = True,
+):
+    """Записи посещаемости за период (границы включительно)."""
+    records = AttendanceRecord.objects.select_related('employee').order_by('pk')
+    if date_from:
+        records = records.filter(date__gte=date_from)
+    if date_to:
+        records = records.filter(date__lte=date_to)
+    if employee_ids is not None:
+        records = records.filter(employee_id__in=list(employee_ids))
+    if not include_manual:
+        records = records.filter(penalty_manual=False)
+    return records
+
+
+def _apply_balances(deltas: Dict[int, Decimal]) -> None:
+    """
+    Списывает с баланса {id сотрудника: сумма}; отрицательная сумма — возврат.
+
+    Один UPDATE balance = balance - CASE ... на BALANCE_BATCH сотрудников.
+    """
+    deltas = [(employee_id, delta) for employee_id, delta in deltas.items() if delta]
+    for start in range(0, len(deltas), BALANCE_BATCH):
+        chunk = deltas[start:start + BALANCE_BATCH]
+        User.objects.filter(pk__in=[employee_id for employee_id, _ in chunk]).update(
+            balance=F('balance') - Case(
+                *[When(pk=employee_id, then=Value(delta)) for employee_id, delta in chunk],
+                default=Value(Decimal('0.00')),
+                output_field=_MONEY,
+            )
+        )
+
+
+def _transactions(changes) -> List:
+    from apps.employees.models import EmployeeFinanceTransaction
+
+    rows = []
+    for record, delta in changes:
+        if delta > 0:
+            rows.append(EmployeeFinanceTransaction(
+                employee_id=record.employee_id,
+                issued_by=None,
+                transaction_type=EmployeeFinanceTransaction.Type.PENALTY,
+                amount=delta,
+                note=PENALTY_NOTE,
+            ))
+        else:
+            rows.append(EmployeeFinanceTransaction(
+                employee_id=record.employee_id,
+                issued_by=None,
+                transaction_type=EmployeeFinanceTransaction.Type.EARNING,
+                amount=-delta,
+                note=REFUND_NOTE,
+            ))
+    return rows
+
+
+def _flush(records: List[AttendanceRecord], charges) -> None:
+    from apps.employees.models import EmployeeFinanceTransaction
+
+    balances = defaultdict(Decimal)
+    for record, delta in charges:
+        balances[record.employee_id] += delta
+    with transaction.atomic():
+        AttendanceRecord.objects.bulk_update(records, _FIELDS, batch_size=500)
+        _apply_balances(balances)
+        EmployeeFinanceTransaction.objects.bulk_create(_transactions(charges), batch_size=500)
+
+
+def recalculate_penalties(
+    records=None,
+    *,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    employee_ids: Optional[Iterable[int]] = None,
+    include_manual: bool = True,
+    dry_run: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> dict:
+    """
+    Пересчитывает штрафы записей (queryset records или выборки за период).
+
+    Возвращает итоги: обработано и изменено записей, списано и возвращено
+    сумм, а в 'changed' — первые изменённые записи с прежними значениями
+    для вывода в командах. При dry_run в БД ничего не пишется.
+    """
+    if records is None:
+        records = records_for(date_from, date_to, employee_ids, include_manual)
+    attendance_settings = AttendanceSettings.get_settings()
+
+    result = {
+        'processed': 0,
+        'updated': 0,
+        'charged': Decimal('0.00'),
+        'refunded': Decimal('0.00'),
+        'changed': [],
+    }
+    # Пачки по первичному ключу: запись идёт не во время чтения курсора
+    pks = list(records.values_list('pk', flat=True))
+    for start in range(0, len(pks), batch_size):
+        batch, charges = [], []
+        for record in records.select_related('employee').filter(pk__in=pks[start:start + batch_size]):
+            result['processed'] += 1
+            old_penalty, old_is_late = record.penalty_amount, record.is_late
+            record.calculate_penalty(attendance_settings)
+            target = record.target_charged_amount
+            delta = target - Decimal(str(record.penalty_charged_amount or 0))
+            if old_penalty == record.penalty_amount and old_is_late == record.is_late and not delta:
+                continue
+
+            result['updated'] += 1
+            if len(result['changed']) < 10:
+                result['changed'].append((record, old_penalty, old_is_late))
+            if delta:
+                charges.append((record, delta))
+                if delta > 0:
+                    result['charged'] += delta
+                else:
+                    result['refunded'] -= delta
+                record.penalty_charged_amount = target
+            batch.append(record)
+        if batch and not dry_run:
+            _flush(batch, charges)
+    return result
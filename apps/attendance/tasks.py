@@ -1,39 +1,33 @@
 from celery import shared_task
 from django.utils import timezone
 from .models import AttendanceRecord
+from .checkout import auto_checkout
+from .penalties import recalculate_penalties
 
 
 @shared_task
 def auto_checkout_after_6pm():
     """
     Автоматически отмечает уход сотрудников после конца смены.
+
+    Записи закрываются пачками по дате и графику смены (см. checkout.py).
     """
     current_time = timezone.now()
-
-    active_records = AttendanceRecord.objects.select_related('employee').filter(
-        check_in__isnull=False,
-        check_out__isnull=True
-    )
+    batches = auto_checkout(current_time)
+    checked_out_count = sum(batch.records_count for batch in batches)
     
-    if not active_records.exists():
+    if not checked_out_count:
         return {
             'status': 'success',
             'message': 'Нет сотрудников для автоматической отметки ухода',
             'checked_out_count': 0
         }
     
-    checked_out_count = 0
-    for record in active_records:
-        shift_end = record.get_shift_end()
-        if shift_end and current_time >= shift_end:
-            record.check_out = shift_end
-            record.save()
-            checked_out_count += 1
-    
     return {
         'status': 'success',
         'message': f'Автоматически отмечен уход для {checked_out_count} сотрудников',
         'checked_out_count': checked_out_count,
+        'batches': len(batches),
         'checkout_time': current_time.isoformat()
     }
 
@@ -61,13 +55,7 @@ def recalculate_today_penalties():
     Пересчитывает штрафы за сегодняшний день
     """
     today = timezone.localdate()
-    today_records = AttendanceRecord.objects.filter(date=today)
-    
-    updated_count = 0
-    for record in today_records:
-        if record.recalculate_penalty():
-            updated_count += 1
-            record.save()
+    updated_count = recalculate_penalties(date_from=today, date_to=today)['updated']
     
     return {
         'status': 'success',
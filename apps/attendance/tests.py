@@ -1,3 +1,147 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.employees.models import EmployeeFinanceTransaction
+
+from .checkout import auto_checkout, shift_end
+from .models import AttendanceRecord, AttendanceSettings, AutoCheckoutBatch
+from .penalties import describe_change, recalculate_penalties
+
+User = get_user_model()
+
+
+class PenaltyRecalculationTests(TestCase):
+    def setUp(self):
+        settings_obj = AttendanceSettings.get_settings()
+        settings_obj.penalty_per_hour = Decimal('100.00')
+        settings_obj.grace_period_minutes = 10
+        settings_obj.save()
+        self.day = date(2026, 3, 2)
+        self.workers = [User.objects.create_user(username=f'worker{i}', password='pass') for i in range(3)]
+
+    def check_in(self, employee, day, hour, minute=0):
+        moment = timezone.make_aware(datetime.combine(day, time(hour, minute)), timezone.get_current_timezone())
+        return AttendanceRecord.objects.create(employee=employee, date=day, check_in=moment)
+
+    def balance(self, employee):
+        employee.refresh_from_db(fields=['balance'])
+        return employee.balance
+
+    def test_save_charges_penalty_once(self):
+        worker = self.workers[0]
+        record = self.check_in(worker, self.day, 10, 30)
+        self.assertTrue(record.is_late)
+        self.assertEqual(record.penalty_amount, Decimal('300.00'))
+        self.assertEqual(self.balance(worker), Decimal('-300.00'))
+        record = AttendanceRecord.objects.get(pk=record.pk)
+        record.note = 'Пробки'
+        record.save()
+        self.assertEqual(self.balance(worker), Decimal('-300.00'))
+        self.assertEqual(EmployeeFinanceTransaction.objects.filter(employee=worker).count(), 1)
+
+    def test_bulk_recalculation_matches_record_by_record(self):
+        for offset in range(5):
+            day = self.day + timedelta(days=offset)
+            self.check_in(self.workers[0], day, 9, 30)
+            self.check_in(self.workers[1], day, 8, 5)
+            self.check_in(self.workers[2], day, 11, 15)
+
+        settings_obj = AttendanceSettings.get_settings()
+        settings_obj.penalty_per_hour = Decimal('50.00')
+        settings_obj.grace_period_minutes = 30
+        settings_obj.save()
+
+        preview = recalculate_penalties(date_from=self.day, dry_run=True)
+        self.assertEqual(preview['updated'], 10)
+        self.assertEqual(self.balance(self.workers[0]), Decimal('-1000.00'))
+
+        result = recalculate_penalties(date_from=self.day, date_to=self.day + timedelta(days=4))
+        self.assertEqual((result['processed'], result['updated']), (15, 10))
+        self.assertEqual(result['refunded'], Decimal('2000.00'))
+        # 9:30 при льготе до 8:30 — ровно час опоздания: 50 вместо 200 в день
+        self.assertEqual(self.balance(self.workers[0]), Decimal('-250.00'))
+        self.assertEqual(self.balance(self.workers[1]), Decimal('0.00'))
+        # 11:15 — 2 ч 45 мин после льготы, 3 часа по 50 вместо 4 по 100
+        self.assertEqual(self.balance(self.workers[2]), Decimal('-750.00'))
+        self.assertEqual(
+            EmployeeFinanceTransaction.objects.filter(note='Возврат штрафа за опоздание').count(), 10
+        )
+        self.assertEqual(recalculate_penalties()['updated'], 0)
+
+    def set_penalty(self, amount):
+        settings_obj = AttendanceSettings.get_settings()
+        settings_obj.penalty_per_hour = Decimal(amount)
+        settings_obj.save()
+
+    def test_query_count_does_not_grow_with_records(self):
+        self.check_in(self.workers[0], self.day, 10, 0)
+        self.set_penalty('10.00')
+        with CaptureQueriesContext(connection) as one:
+            recalculate_penalties()
+
+        for offset in range(1, 6):
+            for worker in self.workers:
+                self.check_in(worker, self.day + timedelta(days=offset), 10, 0)
+        self.set_penalty('20.00')
+        with CaptureQueriesContext(connection) as many:
+            result = recalculate_penalties()
+        self.assertEqual(result['updated'], 16)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(self.balance(self.workers[0]), Decimal('-240.00'))
+
+    def test_describe_change_without_check_in(self):
+        record = self.check_in(self.workers[0], self.day, 10, 30)
+        self.assertIn('10:30:00: штраф 0 → 300.00', describe_change(record, 0, False))
+        record.check_in = None
+        self.assertIn(f'{self.day} —: штраф', describe_change(record, 0, False))
+
+
+class AutoCheckoutTests(TestCase):
+    def setUp(self):
+        self.day = date(2026, 3, 2)
+        self.tz = timezone.get_current_timezone()
+
+    def at(self, day, hour, minute=0):
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)), self.tz)
+
+    def add_records(self, count, schedule, day, hour):
+        records = []
+        for i in range(count):
+            worker = User.objects.create_user(username=f'{schedule}{day}{i}', password='pass', work_schedule=schedule)
+            records.append(AttendanceRecord.objects.create(employee=worker, date=day, check_in=self.at(day, hour)))
+        return records
+
+    def test_closes_finished_shifts_by_schedule(self):
+        day_records = self.add_records(3, 'day', self.day, 8)
+        night_records = self.add_records(2, 'night', self.day, 20)
+        balances = {r.employee_id: r.employee.balance for r in day_records + night_records}
+
+        batches = auto_checkout(self.at(self.day, 21))
+        self.assertEqual([(b.work_schedule, b.records_count) for b in batches], [('day', 3)])
+        self.assertEqual(AttendanceRecord.objects.filter(check_out=self.at(self.day, 20)).count(), 3)
+        self.assertEqual(AttendanceRecord.objects.filter(check_out__isnull=True).count(), 2)
+
+        auto_checkout(self.at(self.day + timedelta(days=1), 9))
+        self.assertEqual(
+            AttendanceRecord.objects.filter(check_out=shift_end(self.day, 'night')).count(), 2
+        )
+        self.assertEqual(AutoCheckoutBatch.objects.count(), 2)
+        for record in AttendanceRecord.objects.select_related('employee'):
+            self.assertEqual(record.employee.balance, balances[record.employee_id])
 
-# Create your tests here.
+    def test_query_count_does_not_grow_with_headcount(self):
+        self.add_records(1, 'day', self.day, 8)
+        with CaptureQueriesContext(connection) as one:
+            auto_checkout(self.at(self.day, 21))
+        other_day = self.day + timedelta(days=1)
+        self.add_records(6, 'day', other_day, 8)
+        with CaptureQueriesContext(connection) as many:
+            batches = auto_checkout(self.at(other_day, 21))
+        self.assertEqual(batches[0].records_count, 6)
+        self.assertEqual(len(one), len(many))
@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from .models import AttendanceRecord, AttendanceSettings
+from .penalties import recalculate_penalties
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db.models import Q, Count
@@ -259,12 +260,13 @@ def attendance_list(request):
         
         # Формируем данные для ответа
         records_data = []
+        attendance_settings = AttendanceSettings.get_settings()
         for record in records_page:
             # Конвертируем время в местное время для отображения
             local_check_in = timezone.localtime(record.check_in) if record.check_in else None
             local_check_out = timezone.localtime(record.check_out) if record.check_out else None
             
-            late_hours = record.get_late_hours() if record.is_late else 0
+            late_hours = record.get_late_hours(attendance_settings) if record.is_late else 0
             records_data.append({
                 'id': record.id,
                 'employee': {
@@ -337,13 +339,7 @@ def recalculate_today_penalties(request):
     """Принудительно пересчитывает штрафы за сегодня"""
     try:
         today = timezone.localdate()
-        today_records = AttendanceRecord.objects.filter(date=today)
-        
-        updated_count = 0
-        for record in today_records:
-            if record.recalculate_penalty():
-                updated_count += 1
-                record.save()
+        updated_count = recalculate_penalties(date_from=today, date_to=today)['updated']
         
         return Response({
             'success': True,
@@ -632,10 +628,7 @@ def attendance_settings(request):
             
             # Пересчитываем штрафы для всех записей за сегодня
             today = timezone.localdate()
-            today_records = AttendanceRecord.objects.filter(date=today, penalty_manual=False)
-            for record in today_records:
-                record.calculate_penalty()
-                record.save()
+            recalculate_penalties(date_from=today, date_to=today, include_manual=False)
             
             return Response({
                 'success': True,
@@ -0,0 +1,254 @@
+"""
+Аналитика клиента: заказы, оборот и долги агрегатами в БД.
+
+Оборот заказа — сумма «количество × текущая цена товара» по позициям,
+количество заказа — сумма позиций (или количество самого заказа, если
+позиций нет). Для карточки клиента итоги и список заказов считаются
+аннотированными запросами, долги — с остатком и статусом, вычисленными в
+БД.
+
+Для списка клиентов итоги хранятся в ClientSummary. Сигналы отмечают
+клиента изменённым, а после коммита транзакции итоги всех отмеченных
+клиентов пересчитываются одной пачкой сгруппированных запросов
+(refresh_client_summaries).
+"""
+from __future__ import annotations
+
+import threading
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import (
+    Case, CharField, Count, DecimalField, ExpressionWrapper, F, IntegerField, Max, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.clients.models import Client, ClientSummary
+
+
+ZERO = Decimal('0.00')
+
+_MONEY = DecimalField(max_digits=16, decimal_places=2)
+
+_dirty = threading.local()
+
+
+def _line_total(prefix: str = ''):
+    return ExpressionWrapper(F(f'{prefix}quantity') * F(f'{prefix}product__price'), output_field=_MONEY)
+
+
+def client_orders(client_id: int):
+    """Заказы клиента с количеством и суммой, посчитанными в БД (новые сначала)."""
+    from apps.orders.models import Order
+
+    return (
+        Order.objects
+        .filter(client_id=client_id)
+        .select_related('client', 'product')
+        .annotate(
+            items_quantity=Coalesce(Sum('items__quantity'), 0),
+            total_price=Coalesce(Sum(_line_total('items__')), Value(ZERO), output_field=_MONEY),
+        )
+        .annotate(
+            quantity_total=Case(
+                When(items_quantity__gt=0, then=F('items_quantity')),
+                default=F('quantity'),
+                output_field=IntegerField(),
+            ),
+        )
+        .order_by('-created_at')
+    )
+
+
+def order_row(order) -> dict:
+    return {
+        'id': order.id,
+        'name': str(order),
+        'status': order.status,
+        'status_display': order.status_display,
+        'created_at': order.created_at,
+        'total_quantity': order.quantity_total or 0,
+        'total_price': order.total_price,
+    }
+
+
+def order_totals(client_id: int) -> dict:
+    """Число заказов, количество товаров по позициям и оборот клиента."""
+    from apps.orders.models import Order, OrderItem
+
+    items = OrderItem.objects.filter(order__client_id=client_id).aggregate(
+        items_quantity=Sum('quantity'),
+        turnover=Sum(_line_total()),
+    )
+    orders_count = Order.objects.filter(client_id=client_id).count()
+    turnover = items['turnover'] or ZERO
+    return {
+        'orders_count': orders_count,
+        'orders_total_quantity': items['items_quantity'] or 0,
+        'total_turnover': turnover,
+        'average_check': float(turnover / orders_count) if orders_count else 0,
+    }
+
+
+def client_debts(client_id: int):
+    """Долги клиента с остатком и статусом из БД."""
+    from apps.finance.models import Debt
+
+    return (
+        Debt.objects
+        .filter(client_id=client_id)
+        .annotate(
+            outstanding=ExpressionWrapper(F('original_amount') - F('amount_paid'), output_field=_MONEY),
+            state=Case(
+                When(amount_paid__gte=F('original_amount'), then=Value('closed')),
+                When(amount_paid__gt=0, then=Value('partial')),
+                default=Value('open'),
+                output_field=CharField(),
+            ),
+        )
+        .order_by('-created_at', '-id')
+    )
+
+
+def debt_totals(client_id: int) -> dict:
+    from apps.finance.models import Debt
+
+    totals = Debt.objects.filter(client_id=client_id).aggregate(
+        count=Count('id'),
+        original=Sum('original_amount'),
+        paid=Sum('amount_paid'),
+    )
+    original = totals['original'] or ZERO
+    paid = totals['paid'] or ZERO
+    return {
+        'debts_count': totals['count'],
+        'debts_total_original': original,
+        'debts_total_paid': paid,
+        'debts_total_outstanding': original - paid,
+    }
+
+
+def client_details(client) -> dict:
+    """Карточка клиента (ClientViewSet.details) фиксированным числом запросов."""
+    from apps.finance.models import Request
+
+    totals = order_totals(client.pk)
+    debts = [
+        {
+            'id': debt.id,
+            'title': debt.title,
+            'direction': debt.direction,
+            'status': debt.state,
+            'original_amount': debt.original_amount,
+            'amount_paid': debt.amount_paid,
+            'outstanding_amount': debt.outstanding,
+            'due_date': debt.due_date,
+            'created_at': debt.created_at,
+        }
+        for debt in client_debts(client.pk)
+    ]
+    requests = Request.objects.filter(client=client).aggregate(total=Sum('total_amount'), count=Count('id'))
+    return {
+        'orders': [order_row(order) for order in client_orders(client.pk).iterator(chunk_size=500)],
+        **totals,
+        # Для мобильного шаблона
+        'total_spent': totals['total_turnover'],
+        # Инфо по заявкам (продажи через finance)
+        'requests_total_amount': requests['total'] or 0,
+        'requests_count': requests['count'],
+        'debts': debts,
+        **debt_totals(client.pk),
+    }
+
+
+def refresh_client_summaries(client_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересчитывает ClientSummary указанных (или всех) клиентов.
+
+    Четыре сгруппированных запроса на всю пачку; возвращает число клиентов.
+    """
+    from apps.finance.models import Debt
+    from apps.orders.models import Order, OrderItem
+
+    clients = Client.objects.all()
+    if client_ids is not None:
+        client_ids = {pk for pk in client_ids if pk}
+        if not client_ids:
+            return 0
+        clients = clients.filter(pk__in=client_ids)
+    ids = list(clients.values_list('pk', flat=True))
+    if not ids:
+        return 0
+
+    orders = {
+        row['client_id']: row
+        for row in Order.objects.filter(client_id__in=ids)
+        .values('client_id')
+        .annotate(orders_count=Count('id'), last_order_at=Max('created_at'))
+    }
+    items = {
+        row['order__client_id']: row
+        for row in OrderItem.objects.filter(order__client_id__in=ids)
+        .values('order__client_id')
+        .annotate(total_quantity=Sum('quantity'), turnover=Sum(_line_total()))
+    }
+    debts = dict(
+        Debt.objects.filter(client_id__in=ids)
+        .values('client_id')
+        .annotate(outstanding=Sum(ExpressionWrapper(F('original_amount') - F('amount_paid'), output_field=_MONEY)))
+        .values_list('client_id', 'outstanding')
+    )
+
+    summaries = []
+    for client_id in ids:
+        counts = orders.get(client_id, {})
+        item_row = items.get(client_id, {})
+        summaries.append(ClientSummary(
+            client_id=client_id,
+            orders_count=counts.get('orders_count', 0),
+            last_order_at=counts.get('last_order_at'),
+            total_quantity=item_row.get('total_quantity') or 0,
+            turnover=item_row.get('turnover') or ZERO,
+            debts_outstanding=debts.get(client_id) or ZERO,
+        ))
+
+    now = timezone.now()
+    for summary in summaries:
+        summary.updated_at = now
+    fields = ['orders_count', 'last_order_at', 'total_quantity', 'turnover', 'debts_outstanding', 'updated_at']
+    with transaction.atomic():
+        existing = set(ClientSummary.objects.filter(client_id__in=ids).values_list('client_id', flat=True))
+        ClientSummary.objects.bulk_update([s for s in summaries if s.client_id in existing], fields, batch_size=500)
+        ClientSummary.objects.bulk_create([s for s in summaries if s.client_id not in existing], batch_size=500, ignore_conflicts=True)
+    return len(ids)
+
+
+def _pending() -> set:
+    if not hasattr(_dirty, 'ids'):
+        _dirty.ids = set()
+    return _dirty.ids
+
+
+def flush_dirty_clients() -> int:
+    """Пересчитывает итоги всех отмеченных клиентов (вызывается после коммита)."""
+    ids = _pending()
+    if not ids:
+        return 0
+    batch = set(ids)
+    ids.clear()
+    return refresh_client_summaries(batch)
+
+
+def mark_client_dirty(client_id: Optional[int]) -> None:
+    """
+    Отмечает итоги клиента устаревшими до коммита текущей транзакции.
+
+    Отметки схлопываются: первый после коммита обработчик пересчитывает
+    всех отмеченных клиентов разом, остальные ничего не делают.
+    """
+    if not client_id:
+        return
+    _pending().add(client_id)
+    transaction.on_commit(flush_dirty_clients)
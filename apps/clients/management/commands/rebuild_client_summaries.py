@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.clients.analytics import refresh_client_summaries
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги клиентов (оборот, число заказов, остаток долгов) для сортировки списка'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--client',
+            type=int,
+            action='append',
+            default=None,
+            help='ID клиента (можно указать несколько раз; по умолчанию — все)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересчёт итогов клиентов...')
+
+        count = refresh_client_summaries(options['client'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Готово. Клиентов обработано: {count}')
+        )
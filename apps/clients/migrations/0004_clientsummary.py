@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_client_whatsapp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSummary',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='clients.client', verbose_name='Клиент')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('total_quantity', models.PositiveIntegerField(default=0, verbose_name='Товаров в заказах')),
+                ('turnover', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Оборот')),
+                ('debts_outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Остаток долгов')),
+                ('last_order_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний заказ')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Итоги клиента',
+                'verbose_name_plural': 'Итоги клиентов',
+                'indexes': [models.Index(fields=['-turnover'], name='client_summary_turnover_idx')],
+            },
+        ),
+    ]
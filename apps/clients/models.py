@@ -25,3 +25,84 @@ class Client(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.company})" if self.company else self.name
+
+
+class ClientSummary(models.Model):
+    """
+    Итоги клиента для списка (сортировка по обороту без пересчёта заказов).
+
+    Обновляется сигналами заказов, позиций, долгов и оплат (см. analytics.py).
+    """
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='summary', verbose_name='Клиент')
+    orders_count = models.PositiveIntegerField('Заказов', default=0)
+    total_quantity = models.PositiveIntegerField('Товаров в заказах', default=0)
+    turnover = models.DecimalField('Оборот', max_digits=16, decimal_places=2, default=0)
+    debts_outstanding = models.DecimalField('Остаток долгов', max_digits=16, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField('Последний заказ', null=True, blank=True)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        app_label = 'clients'
+        verbose_name = 'Итоги клиента'
+        verbose_name_plural = 'Итоги клиентов'
+        indexes = [
+            models.Index(fields=['-turnover'], name='client_summary_turnover_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client}: {self.turnover}"
+
+
+# Пересчёт итогов клиента после изменения заказов, позиций, долгов и оплат.
+# OrderItem.bulk_create (orders/ingestion.py) сигналов не вызывает, но заказ
+# создаётся в той же транзакции и отмечает клиента, а пересчёт идёт после коммита.
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+def _client_of_order(order_id):
+    from apps.orders.models import Order
+    return Order.objects.filter(pk=order_id).values_list('client_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender='orders.Order')
+def refresh_summary_on_order(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from apps.clients.analytics import mark_client_dirty
+        mark_client_dirty(instance.client_id)
+
+
+@receiver([post_save, post_delete], sender='orders.OrderItem')
+def refresh_summary_on_order_item(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from apps.clients.analytics import mark_client_dirty
+        mark_client_dirty(_client_of_order(instance.order_id))
+
+
+@receiver([post_save, post_delete], sender='finance.Debt')
+def refresh_summary_on_debt(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from apps.clients.analytics import mark_client_dirty
+        mark_client_dirty(instance.client_id)
+
+
+@receiver([post_save, post_delete], sender='finance.DebtPayment')
+def refresh_summary_on_debt_payment(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from apps.finance.models import Debt
+        from apps.clients.analytics import mark_client_dirty
+        mark_client_dirty(Debt.objects.filter(pk=instance.debt_id).values_list('client_id', flat=True).first())
+
+
+@receiver(post_save, sender='products.Product')
+def refresh_summary_on_product(sender, instance, created, **kwargs):
+    # Оборот считается по текущей цене товара
+    if created or kwargs.get('raw'):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'price' not in update_fields:
+        return
+    from apps.orders.models import OrderItem
+    from apps.clients.analytics import mark_client_dirty
+    for client_id in OrderItem.objects.filter(product=instance).values_list('order__client_id', flat=True).distinct():
+        mark_client_dirty(client_id)
@@ -2,6 +2,28 @@ from rest_framework import serializers
 from apps.clients.models import Client
  
 class ClientSerializer(serializers.ModelSerializer):
+    turnover = serializers.SerializerMethodField()
+    orders_count = serializers.SerializerMethodField()
+    debts_outstanding = serializers.SerializerMethodField()
+
     class Meta:
         model = Client
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__'
+
+    def _summary(self, obj):
+        try:
+            return obj.summary
+        except Client.summary.RelatedObjectDoesNotExist:
+            return None
+
+    def get_turnover(self, obj):
+        summary = self._summary(obj)
+        return float(summary.turnover) if summary else 0
+
+    def get_orders_count(self, obj):
+        summary = self._summary(obj)
+        return summary.orders_count if summary else 0
+
+    def get_debts_outstanding(self, obj):
+        summary = self._summary(obj)
+        return float(summary.debts_outstanding) if summary else 0
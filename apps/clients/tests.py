@@ -1,3 +1,99 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.finance.models import Debt, DebtPayment
+from apps.orders.models import Order, OrderItem
+from apps.products.models import Product
+
+from .analytics import refresh_client_summaries
+from .models import Client, ClientSummary
+
+User = get_user_model()
+
+
+class ClientAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="manager", password="pass")
+        self.client.force_login(self.user)
+        self.door = Product.objects.create(name="Дверь", price=Decimal("100.00"))
+        self.frame = Product.objects.create(name="Коробка", price=Decimal("30.00"))
+        self.buyer = Client.objects.create(name="Клиент")
+
+    def add_order(self, client, lines):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(name="Заказ", client=client)
+            for product, quantity in lines:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity)
+        return order
+
+    def test_details_totals(self):
+        self.add_order(self.buyer, [(self.door, 2), (self.frame, 1)])
+        self.add_order(self.buyer, [(self.frame, 3)])
+        Debt.objects.create(
+            direction="receivable", client=self.buyer, title="Отсрочка",
+            original_amount=Decimal("100.00"), amount_paid=Decimal("40.00"), created_by=self.user,
+        )
+
+        data = self.client.get(reverse("client-details", args=[self.buyer.pk])).json()
+        self.assertEqual(data["orders_count"], 2)
+        self.assertEqual(data["orders_total_quantity"], 6)
+        self.assertEqual(Decimal(str(data["total_turnover"])), Decimal("320.00"))
+        self.assertEqual(data["average_check"], 160.0)
+        self.assertEqual(sorted(Decimal(str(o["total_price"])) for o in data["orders"]), [Decimal("90.00"), Decimal("230.00")])
+        self.assertEqual(data["debts"][0]["status"], "partial")
+        self.assertEqual(Decimal(str(data["debts_total_outstanding"])), Decimal("60.00"))
+
+    def test_details_query_count_does_not_grow_with_orders(self):
+        self.add_order(self.buyer, [(self.door, 1)])
+        url = reverse("client-details", args=[self.buyer.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url)
+        for _ in range(5):
+            self.add_order(self.buyer, [(self.door, 1), (self.frame, 2)])
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(one), len(many))
+
+    def test_summary_follows_orders_and_payments(self):
+        self.add_order(self.buyer, [(self.door, 3)])
+        summary = ClientSummary.objects.get(client=self.buyer)
+        self.assertEqual((summary.orders_count, summary.total_quantity, summary.turnover), (1, 3, Decimal("300.00")))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            debt = Debt.objects.create(
+                direction="receivable", client=self.buyer, title="Долг",
+                original_amount=Decimal("200.00"), created_by=self.user,
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            DebtPayment.objects.create(debt=debt, amount=Decimal("50.00"), date=date.today(), created_by=self.user)
+        self.assertEqual(ClientSummary.objects.get(client=self.buyer).debts_outstanding, Decimal("150.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.door.price = Decimal("110.00")
+            self.door.save()
+        self.assertEqual(ClientSummary.objects.get(client=self.buyer).turnover, Decimal("330.00"))
+
+    def test_list_ordering_by_turnover_and_paginated_orders(self):
+        small = Client.objects.create(name="Малый")
+        self.add_order(small, [(self.frame, 1)])
+        for _ in range(3):
+            self.add_order(self.buyer, [(self.door, 1)])
+        Client.objects.create(name="Без заказов")
+        ClientSummary.objects.all().delete()
+        self.assertEqual(refresh_client_summaries(), 3)
+
+        data = self.client.get(reverse("client-list"), {"ordering": "-turnover"}).json()
+        rows = data["results"] if isinstance(data, dict) else data
+        self.assertEqual([row["name"] for row in rows], ["Клиент", "Малый", "Без заказов"])
+        self.assertEqual(rows[0]["orders_count"], 3)
 
-# Create your tests here.
+        page = self.client.get(reverse("client-orders", args=[self.buyer.pk])).json()
+        self.assertEqual(page["count"], 3)
+        self.assertEqual(page["results"][0]["total_quantity"], 1)
@@ -4,11 +4,18 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from django.db import models
+from django.db.models import F
 
 from apps.clients.models import Client
 from .serializers import ClientSerializer
-from apps.orders.models import Order
-from apps.finance.models import Request, Debt
+from apps.clients.analytics import client_details, client_orders, order_row
+
+SUMMARY_ORDERING = {
+    'turnover': 'turnover',
+    'orders_count': 'orders_count',
+    'debts_outstanding': 'debts_outstanding',
+    'last_order_at': 'last_order_at',
+}
 
 # Create your views here.
 
@@ -31,7 +38,12 @@ class ClientViewSet(viewsets.ModelViewSet):
         status = self.request.query_params.get('status')
         if status:
             queryset = queryset.filter(status=status)
-        return queryset
+        # Сортировка по итогам клиента (ClientSummary) без пересчёта заказов
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering.lstrip('-') in SUMMARY_ORDERING:
+            field = 'summary__' + SUMMARY_ORDERING[ordering.lstrip('-')]
+            queryset = queryset.order_by(F(field).desc(nulls_last=True) if ordering.startswith('-') else F(field).asc(nulls_first=True), '-created_at')
+        return queryset.select_related('summary')
 
     @action(detail=True, methods=['get'], url_path='details')
     def details(self, request, pk=None):
@@ -43,93 +55,19 @@ class ClientViewSet(viewsets.ModelViewSet):
         - заявки из финансового модуля
         """
         client = self.get_object()
-
-        # Заказы клиента
-        orders_qs = (
-            Order.objects.filter(client=client)
-            .prefetch_related('items__product')
-            .order_by('-created_at')
-        )
-
-        orders_data = []
-        total_turnover = 0
-        total_quantity = 0
-
-        for order in orders_qs:
-            order_total = 0
-            for item in order.items.all():
-                product = getattr(item, 'product', None)
-                price = getattr(product, 'price', 0) or 0
-                qty = item.quantity or 0
-                order_total += qty * price
-                total_quantity += qty
-
-            total_turnover += order_total
-
-            orders_data.append({
-                'id': order.id,
-                'name': str(order),
-                'status': order.status,
-                'status_display': getattr(order, 'status_display', order.status),
-                'created_at': order.created_at,
-                'total_quantity': getattr(order, 'total_quantity', None) or 0,
-                'total_price': order_total,
-            })
-
-        orders_count = len(orders_data)
-        average_check = float(total_turnover / orders_count) if orders_count else 0
-
-        # Заявки из finance.Request
-        from django.db.models import Sum
-
-        requests_qs = Request.objects.filter(client=client)
-        agg = requests_qs.aggregate(total=Sum('total_amount'))
-        requests_total = agg.get('total') or 0
-        requests_count = requests_qs.count()
-
-        debts_qs = Debt.objects.filter(client=client).order_by('-created_at', '-id')
-        debts_data = []
-        total_debt_original = 0
-        total_debt_paid = 0
-        total_debt_outstanding = 0
-
-        for debt in debts_qs:
-            outstanding_amount = debt.outstanding_amount
-            total_debt_original += debt.original_amount or 0
-            total_debt_paid += debt.amount_paid or 0
-            total_debt_outstanding += outstanding_amount or 0
-            debts_data.append({
-                'id': debt.id,
-                'title': debt.title,
-                'direction': debt.direction,
-                'status': debt.status,
-                'original_amount': debt.original_amount,
-                'amount_paid': debt.amount_paid,
-                'outstanding_amount': outstanding_amount,
-                'due_date': debt.due_date,
-                'created_at': debt.created_at,
-            })
-
         client_data = ClientSerializer(client).data
-        client_data.update({
-            'orders': orders_data,
-            'orders_count': orders_count,
-            'orders_total_quantity': total_quantity,
-            'total_turnover': total_turnover,
-            'average_check': average_check,
-            # Для мобильного шаблона
-            'total_spent': total_turnover,
-            # Инфо по заявкам (продажи через finance)
-            'requests_total_amount': requests_total,
-            'requests_count': requests_count,
-            'debts': debts_data,
-            'debts_count': len(debts_data),
-            'debts_total_original': total_debt_original,
-            'debts_total_paid': total_debt_paid,
-            'debts_total_outstanding': total_debt_outstanding,
-        })
+        client_data.update(client_details(client))
         return Response(client_data)
 
+    @action(detail=True, methods=['get'], url_path='orders')
+    def orders(self, request, pk=None):
+        """Заказы клиента постранично (?page=) с суммой и количеством из БД."""
+        client = self.get_object()
+        page = self.paginate_queryset(client_orders(client.pk))
+        if page is not None:
+            return self.get_paginated_response([order_row(order) for order in page])
+        return Response([order_row(order) for order in client_orders(client.pk)])
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -4,6 +4,7 @@ from .models import Defect, DefectRework
 from apps.products.models import Product
 from apps.users.models import User
 from apps.inventory.models import RawMaterial
+from core.api import SparseFieldsetMixin
 
 
 class ProductShortSerializer(serializers.ModelSerializer):
@@ -23,7 +24,7 @@ class UserShortSerializer(serializers.ModelSerializer):
         return obj.get_full_name() or obj.username
 
 
-class DefectSerializer(serializers.ModelSerializer):
+class DefectSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductShortSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(),
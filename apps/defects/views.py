@@ -18,6 +18,7 @@ from .serializers import (
 from apps.users.models import User
 from apps.employees.views import is_mobile
 from apps.inventory.models import RawMaterial
+from core.api import CreatedAtPagination
 
 
 def defects_page(request):
@@ -45,6 +46,7 @@ class DefectViewSet(viewsets.ModelViewSet):
     ).all()
     serializer_class = DefectSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtPagination
     http_method_names = ["get", "post", "head", "options"]
 
     def get_queryset(self):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EmployeeTask
+from .models import EmployeeTask, ProductionDailyRollup
 
 
 @admin.register(EmployeeTask)
@@ -60,3 +60,12 @@ class EmployeeTaskAdmin(admin.ModelAdmin):
         return obj.employee.get_payment_type_display()
 
     employee_payment_type.short_description = 'Тип оплаты'
+
+
+@admin.register(ProductionDailyRollup)
+class ProductionDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'workshop', 'employee', 'task_count', 'completed', 'defective', 'net_earnings']
+    list_filter = ['date', 'workshop']
+    search_fields = ['employee__username', 'employee__first_name', 'employee__last_name']
+    list_select_related = ['workshop', 'employee']
+    readonly_fields = ['date', 'workshop', 'employee', 'task_count', 'quantity', 'completed', 'defective', 'earnings', 'penalties', 'net_earnings']
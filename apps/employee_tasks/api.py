@@ -5,7 +5,9 @@ from rest_framework.response import Response
 from django.db.models import Sum, Count, F, OuterRef, Subquery, DecimalField, ExpressionWrapper
 from django.db.models.functions import ExtractMonth, ExtractYear, Coalesce
 from django.contrib.auth import get_user_model
-from .models import EmployeeTask
+from .models import EmployeeTask, ProductionDailyRollup
+from .rollup import rollup_totals
+from .earnings import recalculate_earnings
 from apps.services.models import Service
 from .serializers import EmployeeTaskSerializer
 
@@ -187,29 +189,20 @@ def workshop_earnings_stats(request, workshop_id):
         from apps.operations.workshops.models import Workshop
         workshop = Workshop.objects.get(id=workshop_id)
         
-        # Базовый queryset по цеху
-        tasks = EmployeeTask.objects.filter(stage__workshop=workshop)
-        
-        # Простая статистика
-        try:
-            total_earnings = tasks.aggregate(s=Sum('earnings'))['s'] or 0
-            total_penalties = tasks.aggregate(s=Sum('penalties'))['s'] or 0
-            total_net_earnings = tasks.aggregate(s=Sum('net_earnings'))['s'] or 0
-        except Exception as e:
-            total_earnings = 0
-            total_penalties = 0
-            total_net_earnings = 0
+        # Итоги по цеху из дневных агрегатов (без сканирования всех задач)
+        rollups = ProductionDailyRollup.objects.filter(workshop=workshop)
+        totals = rollup_totals(rollups)
+        total_earnings = totals['earnings']
+        total_penalties = totals['penalties']
+        total_net_earnings = totals['net_earnings']
         
         # Статистика по сотрудникам
-        try:
-            employee_stats = list(tasks.values('employee__username', 'employee__first_name', 'employee__last_name').annotate(
+        employee_stats = list(rollups.values('employee__username', 'employee__first_name', 'employee__last_name').annotate(
             total_earnings=Sum('earnings'),
             total_penalties=Sum('penalties'),
             total_net=Sum('net_earnings'),
-            task_count=Count('id')
-            ))
-        except Exception as e:
-            employee_stats = []
+            task_count=Sum('task_count')
+        ).order_by())
         
         # Получаем услугу цеха
         try:
@@ -231,7 +224,7 @@ def workshop_earnings_stats(request, workshop_id):
                 'total_earnings': total_earnings,
                 'total_penalties': total_penalties,
                 'total_net_earnings': total_net_earnings,
-                'total_tasks': tasks.count()
+                'total_tasks': totals['task_count']
             },
             'employee_stats': employee_stats,
             'service': service_info
@@ -250,7 +243,7 @@ def top_earners(request):
     """Топ сотрудников по заработку"""
     try:
         # Получаем топ-10 сотрудников по чистому заработку
-        top_employees = EmployeeTask.objects.values(
+        top_employees = ProductionDailyRollup.objects.values(
             'employee__username', 
             'employee__first_name', 
             'employee__last_name'
@@ -258,7 +251,7 @@ def top_earners(request):
             total_earnings=Sum('earnings'),
             total_penalties=Sum('penalties'),
             total_net=Sum('net_earnings'),
-            task_count=Count('id')
+            task_count=Sum('task_count')
         ).order_by('-total_net')[:10]
         
         return Response({
@@ -588,46 +581,16 @@ def recalculate_employee_earnings(request, employee_id):
     """Принудительно пересчитывает заработок для сотрудника"""
     try:
         employee = User.objects.get(id=employee_id)
-        tasks = EmployeeTask.objects.filter(employee=employee)
-        
-        updated_count = 0
-        total_earnings = 0
-        total_penalties = 0
-        total_net = 0
-        
-        for task in tasks:
-            try:
-                # Сохраняем старые значения
-                old_earnings = task.earnings
-                old_penalties = task.penalties
-                old_net = task.net_earnings
-                
-                # Пересчитываем заработок
-                task.calculate_earnings()
-                
-                # Обновляем в базе
-                EmployeeTask.objects.filter(pk=task.pk).update(
-                    earnings=task.earnings,
-                    penalties=task.penalties,
-                    net_earnings=task.net_earnings
-                )
-                
-                updated_count += 1
-                total_earnings += float(task.earnings)
-                total_penalties += float(task.penalties)
-                total_net += float(task.net_earnings)
-                
-            except Exception as e:
-                print(f"Error recalculating task {task.id}: {e}")
-                continue
+        summary = recalculate_earnings(EmployeeTask.objects.filter(employee=employee))
         
         return Response({
             'success': True,
-            'message': f'Пересчитано задач: {updated_count}',
-            'updated_count': updated_count,
-            'total_earnings': total_earnings,
-            'total_penalties': total_penalties,
-            'total_net': total_net
+            'message': f'Пересчитано задач: {summary["processed"]}',
+            'updated_count': summary['processed'],
+            'changed_count': summary['updated'],
+            'total_earnings': float(summary['total_earnings']),
+            'total_penalties': float(summary['total_penalties']),
+            'total_net': float(summary['total_net'])
         })
         
     except User.DoesNotExist:
@@ -0,0 +1,245 @@
+"""
+Расчёт заработка и штрафов по задачам сотрудников.
+
+Цены услуг (товар, цех, операция) → (оплата, штраф за брак) загружаются
+одним проходом в ServicePriceBook и переиспользуются для всех задач
+пакета. Справочник процесса помечен версией пространства имён
+PRICE_BOOK_NAMESPACE в общем кэше (core.caching): при изменении услуг или
+их привязки к товарам сигналы увеличивают версию (см. models.py), и все
+процессы перечитывают справочник при следующем обращении.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+
+from core import caching
+
+
+BASE_RATE = Decimal('100.00')  # за единицу работы, если услуга не найдена
+BASE_PENALTY_RATE = Decimal('50.00')  # за единицу брака
+
+PRICE_BOOK_NAMESPACE = 'service_prices'
+
+EARNINGS_FIELDS = ('earnings', 'penalties', 'net_earnings')
+
+_QUANT = Decimal('0.1')
+
+
+class ServicePriceBook:
+    """
+    Справочник услуг для расчёта заработка.
+
+    Порядок выбора совпадает с прежними запросами: услуги упорядочены по
+    названию (Meta.ordering), у товара берётся первая активная услуга
+    цеха, иначе любая.
+    """
+
+    def __init__(self):
+        from apps.products.models import Product
+        from apps.services.models import Service
+
+        services = list(Service.objects.order_by('name', 'pk'))
+        self._services = {service.pk: service for service in services}
+        self._active_by_workshop = defaultdict(list)
+        for service in services:
+            if service.is_active and service.workshop_id:
+                self._active_by_workshop[service.workshop_id].append(service)
+
+        rank = {service.pk: position for position, service in enumerate(services)}
+        by_product = defaultdict(list)
+        links = Product.services.through.objects.values_list('product_id', 'service_id')
+        for product_id, service_id in links:
+            service = self._services.get(service_id)
+            if service and service.workshop_id:
+                by_product[(product_id, service.workshop_id)].append(service)
+
+        self._product_services = {}
+        for key, linked in by_product.items():
+            linked.sort(key=lambda service: rank[service.pk])
+            active = [service for service in linked if service.is_active]
+            self._product_services[key] = (active or linked)[0]
+
+    def product_service(self, product_id, workshop_id):
+        """Услуга товара в цехе (product.services.filter(workshop=...))."""
+        if not product_id or not workshop_id:
+            return None
+        return self._product_services.get((product_id, workshop_id))
+
+    def stage_service(self, workshop_id, operation):
+        """Услуга этапа: активная услуга цеха по названию операции, иначе первая активная."""
+        active = self._active_by_workshop.get(workshop_id) or []
+        if operation and operation.strip():
+            for service in active:
+                if service.name == operation:
+                    return service
+        return active[0] if active else None
+
+    def product_price(self, product_id, workshop_id) -> Decimal:
+        service = self.product_service(product_id, workshop_id)
+        return Decimal(str(service.service_price or 0)) if service else Decimal('0')
+
+
+_price_book = {'book': None, 'version': None}
+
+
+def get_price_book() -> ServicePriceBook:
+    """Справочник процесса; перечитывается, если версия в общем кэше изменилась."""
+    # Версия читается до загрузки: изменение во время загрузки даст новую версию
+    version = caching.namespace_version(PRICE_BOOK_NAMESPACE)
+    book = _price_book['book']
+    if book is None or _price_book['version'] != version:
+        book = ServicePriceBook()
+        _price_book.update(book=book, version=version)
+    return book
+
+
+def invalidate_price_book(**kwargs):
+    """Сбрасывает справочник во всех процессах (сейчас и после коммита)."""
+    _price_book['book'] = None
+    caching.invalidate(PRICE_BOOK_NAMESPACE)
+
+
+def _aggregated_cost(task, stage, book, workshop_id):
+    """
+    Реальная стоимость выполненного по позициям заказа (агрегированный этап).
+
+    Выполненное количество распределяется по позициям по порядку. Возвращает
+    (сумма, количество) или (None, 0), если ничего не учтено.
+    """
+    order = stage.order if stage.order_id else None
+    if order is None or not workshop_id:
+        return None, 0
+    total_value = Decimal('0')
+    total_qty = 0
+    remaining = task.completed_quantity
+    for item in order.items.all():
+        executed = min(remaining, int(item.quantity or 0))
+        if executed > 0:
+            total_value += book.product_price(item.product_id, workshop_id) * Decimal(str(executed))
+            total_qty += executed
+            remaining -= executed
+        if remaining <= 0:
+            break
+    if total_qty > 0:
+        return total_value, total_qty
+    return None, 0
+
+
+def compute_earnings(task, book: Optional[ServicePriceBook] = None) -> None:
+    """
+    Заполняет task.earnings, penalties и net_earnings.
+
+    Приоритет цены: индивидуальная цена → услуга товара в цехе → реальная
+    стоимость по позициям заказа → услуга этапа → BASE_RATE.
+    """
+    book = book or get_price_book()
+    stage = task.stage if task.stage_id else None
+    workshop_id = stage.workshop_id if stage else None
+    operation = stage.operation if stage else None
+    stage_service = book.stage_service(workshop_id, operation) if workshop_id else None
+
+    service_price = None
+    penalty_rate = None
+    real_cost_sum = None
+
+    if task.custom_unit_price is not None:
+        try:
+            service_price = Decimal(str(task.custom_unit_price))
+        except InvalidOperation:
+            service_price = None
+        penalty_rate = stage_service.defect_penalty if stage_service else BASE_PENALTY_RATE
+    else:
+        order_item = stage.order_item if stage and stage.order_item_id else None
+        matched = book.product_service(order_item.product_id if order_item else None, workshop_id)
+        if matched:
+            service_price = matched.service_price
+            penalty_rate = matched.defect_penalty
+        else:
+            real_cost_sum, _ = _aggregated_cost(task, stage, book, workshop_id) if stage else (None, 0)
+
+        if service_price is None:
+            if stage_service:
+                service_price = stage_service.service_price
+                penalty_rate = stage_service.defect_penalty
+            else:
+                service_price = BASE_RATE
+        if penalty_rate is None:
+            penalty_rate = stage_service.defect_penalty if stage_service else BASE_PENALTY_RATE
+
+    # Множитель слоёв только для цеха ID=7
+    layers = int(task.layers_per_unit or 1)
+    multiplier = Decimal(layers if (workshop_id == 7 and layers > 0) else 1)
+
+    if real_cost_sum is not None:
+        # Агрегированный этап: точная сумма по продуктам, без усреднения
+        gross = real_cost_sum * multiplier
+    else:
+        gross = Decimal(str(task.completed_quantity)) * Decimal(str(service_price)) * multiplier
+    task.earnings = gross.quantize(_QUANT)
+
+    # Штрафы: за брак + дополнительные вручную начисленные
+    defect_penalties = Decimal(str(task.defective_quantity)) * Decimal(str(penalty_rate))
+    manual_penalties = Decimal(str(task.additional_penalties or 0))
+    task.penalties = (defect_penalties + manual_penalties).quantize(_QUANT)
+    task.net_earnings = (task.earnings - task.penalties).quantize(_QUANT)
+
+
+def recalculate_earnings(queryset, batch_size: int = 500) -> Dict[str, object]:
+    """
+    Пересчитывает заработок задач пакетами с одним справочником услуг.
+
+    Изменившиеся задачи записываются через bulk_update, дневные итоги
+    производства корректируются на разницу. Баланс сотрудников не
+    меняется (как и при прежнем ручном пересчёте).
+    """
+    from .models import EmployeeTask
+    from .rollup import apply_delta, task_contribution
+
+    book = ServicePriceBook()
+    tasks = (
+        queryset
+        .select_related('stage__order_item', 'stage__order')
+        .prefetch_related('stage__order__items')
+        .order_by('pk')
+    )
+    summary = {
+        'processed': 0,
+        'updated': 0,
+        'total_earnings': Decimal('0'),
+        'total_penalties': Decimal('0'),
+        'total_net': Decimal('0'),
+    }
+    changed: List[EmployeeTask] = []
+    rollup_deltas = defaultdict(lambda: {field: Decimal('0') for field in EARNINGS_FIELDS})
+
+    def flush():
+        if not changed:
+            return
+        with transaction.atomic():
+            EmployeeTask.objects.bulk_update(changed, EARNINGS_FIELDS)
+        changed.clear()
+
+    for task in tasks.iterator(chunk_size=batch_size):
+        old = {field: getattr(task, field) for field in EARNINGS_FIELDS}
+        compute_earnings(task, book)
+        summary['processed'] += 1
+        summary['total_earnings'] += task.earnings
+        summary['total_penalties'] += task.penalties
+        summary['total_net'] += task.net_earnings
+        if any(getattr(task, field) != old[field] for field in EARNINGS_FIELDS):
+            key, _ = task_contribution(task)
+            for field in EARNINGS_FIELDS:
+                rollup_deltas[key][field] += getattr(task, field) - old[field]
+            changed.append(task)
+            summary['updated'] += 1
+            if len(changed) >= batch_size:
+                flush()
+    flush()
+
+    for key, delta in rollup_deltas.items():
+        apply_delta(key, delta)
+    return summary
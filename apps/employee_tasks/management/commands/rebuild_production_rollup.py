@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.employee_tasks.rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневные итоги производства (ProductionDailyRollup) из задач сотрудников'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Пересобрать только последние N дней (по умолчанию — вся история)',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        start = None
+        if days:
+            start = timezone.localdate() - timedelta(days=days - 1)
+            self.stdout.write(f'Пересборка итогов с {start}...')
+        else:
+            self.stdout.write('Полная пересборка итогов...')
+
+        count = rebuild_rollup(start=start)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Готово. Строк итогов: {count}')
+        )
@@ -1,55 +1,50 @@
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.employee_tasks.earnings import recalculate_earnings
 from apps.employee_tasks.models import EmployeeTask
-from decimal import Decimal
+
 
 class Command(BaseCommand):
     help = 'Пересчитывает заработок для всех задач сотрудников'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Только задачи за последние N дней (по умолчанию — все)',
+        )
+        parser.add_argument(
+            '--employee',
+            type=int,
+            default=None,
+            help='ID сотрудника',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пакета для bulk_update',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Начинаю пересчет заработка...')
-        
+
         tasks = EmployeeTask.objects.all()
-        updated_count = 0
-        
-        for task in tasks:
-            try:
-                # Сохраняем старые значения для сравнения
-                old_earnings = task.earnings
-                old_penalties = task.penalties
-                old_net_earnings = task.net_earnings
-                
-                # Пересчитываем заработок
-                task.calculate_earnings()
-                
-                # Проверяем, изменились ли значения
-                if (task.earnings != old_earnings or 
-                    task.penalties != old_penalties or 
-                    task.net_earnings != old_net_earnings):
-                    
-                    # Сохраняем в базе
-                    EmployeeTask.objects.filter(pk=task.pk).update(
-                        earnings=task.earnings,
-                        penalties=task.penalties,
-                        net_earnings=task.net_earnings
-                    )
-                    updated_count += 1
-                    
-                    self.stdout.write(
-                        f'Задача {task.id}: {task.employee.username} - '
-                        f'Заработок: {old_earnings} → {task.earnings}, '
-                        f'Штрафы: {old_penalties} → {task.penalties}, '
-                        f'Чистый: {old_net_earnings} → {task.net_earnings}'
-                    )
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Ошибка при обработке задачи {task.id}: {e}'
-                    )
-                )
-        
+        if options['days']:
+            start = timezone.localdate() - timedelta(days=options['days'] - 1)
+            tasks = tasks.filter(created_at__date__gte=start)
+        if options['employee']:
+            tasks = tasks.filter(employee_id=options['employee'])
+
+        summary = recalculate_earnings(tasks, batch_size=options['batch_size'])
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Пересчет завершен. Обновлено задач: {updated_count}'
+                f'Пересчет завершен. Проверено задач: {summary["processed"]}, '
+                f'обновлено: {summary["updated"]}'
             )
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee_tasks', '0008_employeetask_additional_penalties_and_more'),
+        ('operations_workshops', '0008_storagezone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('task_count', models.IntegerField(default=0, verbose_name='Задач')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Назначено')),
+                ('completed', models.IntegerField(default=0, verbose_name='Выполнено')),
+                ('defective', models.IntegerField(default=0, verbose_name='Брак')),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Заработок')),
+                ('penalties', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Штрафы')),
+                ('net_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Чистый заработок')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='production_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Сотрудник')),
+                ('workshop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='production_rollups', to='operations_workshops.workshop', verbose_name='Цех')),
+            ],
+            options={
+                'verbose_name': 'Дневные итоги производства',
+                'verbose_name_plural': 'Дневные итоги производства',
+                'indexes': [models.Index(fields=['workshop', 'date'], name='employee_ta_worksho_37c310_idx'), models.Index(fields=['employee', 'date'], name='employee_ta_employe_e8f3c1_idx')],
+                'unique_together': {('date', 'workshop', 'employee')},
+            },
+        ),
+    ]
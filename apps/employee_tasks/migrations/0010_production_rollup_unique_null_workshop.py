@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 16:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+ROLLUP_FIELDS = ('task_count', 'quantity', 'completed', 'defective', 'earnings', 'penalties', 'net_earnings')
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """Сливает дубли строк итогов без цеха (прежний unique_together их не ловил)."""
+    ProductionDailyRollup = apps.get_model('employee_tasks', 'ProductionDailyRollup')
+    duplicates = (
+        ProductionDailyRollup.objects.filter(workshop__isnull=True)
+        .values('date', 'employee_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for key in duplicates:
+        rows = list(ProductionDailyRollup.objects.filter(
+            workshop__isnull=True, date=key['date'], employee_id=key['employee_id'],
+        ).order_by('pk'))
+        keep = rows[0]
+        for row in rows[1:]:
+            for field in ROLLUP_FIELDS:
+                setattr(keep, field, getattr(keep, field) + getattr(row, field))
+        keep.save(update_fields=list(ROLLUP_FIELDS))
+        ProductionDailyRollup.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee_tasks', '0009_productiondailyrollup'),
+        ('operations_workshops', '0009_packaging_defect_link'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='productiondailyrollup',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='productiondailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('workshop__isnull', False)), fields=('date', 'workshop', 'employee'), name='production_rollup_unique_row'),
+        ),
+        migrations.AddConstraint(
+            model_name='productiondailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('workshop__isnull', True)), fields=('date', 'employee'), name='production_rollup_unique_no_workshop'),
+        ),
+    ]
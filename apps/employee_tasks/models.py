@@ -1,7 +1,7 @@
 from django.db import models
 from apps.orders.models import OrderStage
 from django.contrib.auth import get_user_model
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.db import transaction
 from decimal import Decimal
@@ -36,29 +36,9 @@ class EmployeeTask(models.Model):
     @property
     def service(self):
         """Получаем услугу через цех этапа и название операции"""
-        if self.stage and self.stage.workshop:
-            from apps.services.models import Service
-            try:
-                # Если есть название операции, ищем по нему
-                if self.stage.operation and self.stage.operation.strip():
-                    service = Service.objects.filter(
-                        workshop=self.stage.workshop, 
-                        name=self.stage.operation,
-                        is_active=True
-                    ).first()
-                    
-                    if service:
-                        return service
-                
-                # Если по операции не найдено или операция пустая, ищем первую активную услугу для цеха
-                service = Service.objects.filter(
-                    workshop=self.stage.workshop, 
-                    is_active=True
-                ).first()
-                
-                return service
-            except Exception:
-                return None
+        if self.stage and self.stage.workshop_id:
+            from .earnings import get_price_book
+            return get_price_book().stage_service(self.stage.workshop_id, self.stage.operation)
         return None
     class Meta:
         verbose_name = 'Задача сотрудника'
@@ -67,213 +47,10 @@ class EmployeeTask(models.Model):
     def __str__(self):
         return f"Задача {self.employee} - {self.stage}"
 
-    def calculate_earnings(self):
-        """Рассчитывает заработок, штрафы и чистый заработок"""
-        from decimal import Decimal, InvalidOperation
-        
-        print(f"\n=== DEBUG: Расчет заработка для EmployeeTask #{self.id} ===")
-        print(f"Сотрудник: {self.employee}")
-        print(f"Этап: {self.stage}")
-        print(f"Цех: {getattr(self.stage, 'workshop', 'N/A')}")
-        print(f"Операция: {getattr(self.stage, 'operation', 'N/A')}")
-        print(f"Выполнено: {self.completed_quantity}, Брак: {self.defective_quantity}")
-        print(f"Индивидуальная цена: {self.custom_unit_price}")
-        print(f"Слои на единицу: {self.layers_per_unit}")
-        
-        # Базовая ставка за единицу работы (если услуга не найдена)
-        BASE_RATE = Decimal('100.00')  # 100 рублей за единицу
-        BASE_PENALTY_RATE = Decimal('50.00')  # 50 рублей за единицу брака
-        
-        # Определяем ставку за единицу: приоритет custom_unit_price → цена продукта → цена услуги → базовая
-        service_price = None
-        penalty_rate = None
-        price_source = 'unknown'
-        real_cost_sum = None  # Сумма реальной стоимости по продуктам для агрегированных этапов
-        real_cost_qty = 0     # Реальное выполненное количество, учтенное в сумме
-        
-        # 1) Индивидуальная цена от мастера
-        if self.custom_unit_price is not None:
-            try:
-                service_price = Decimal(str(self.custom_unit_price))
-                price_source = 'custom_unit_price'
-                print(f"✓ Используется индивидуальная цена: {service_price}")
-            except InvalidOperation:
-                service_price = None
-                print("✗ Ошибка в индивидуальной цене")
-            penalty_rate = self.service.defect_penalty if self.service else BASE_PENALTY_RATE
-        else:
-            print("Индивидуальная цена не задана, ищем услугу...")
-            
-            # 2) Цена услуги ДЛЯ КОНКРЕТНОГО ТОВАРА в данном цехе (приоритетная логика)
-            matched_service = None
-            try:
-                order_item = getattr(self.stage, 'order_item', None)
-                product = getattr(order_item, 'product', None) if order_item else None
-                workshop = getattr(self.stage, 'workshop', None)
-                operation = getattr(self.stage, 'operation', None)
-                
-                print(f"Поиск услуги для товара: {product}")
-                print(f"Цех: {workshop}")
-                print(f"Операция: '{operation}'")
-                
-                # Если этап агрегированный (order_item отсутствует) — покажем товары заявки
-                if (product is None) and getattr(self.stage, 'order', None) and hasattr(self.stage.order, 'items'):
-                    try:
-                        items_info = ", ".join([f"{it.product.name if it.product else '—'} x{it.quantity}" for it in self.stage.order.items.all()])
-                        print(f"Товары в заявке: {items_info}")
-                    except Exception:
-                        pass
-                
-                if product and workshop:
-                    # Пытаемся найти услугу по продукту, цеху и названию операции
-                    qs = product.services.filter(workshop=workshop)
-                    print(f"Найдено услуг для товара в цехе: {qs.count()}")
-                    
-                    # Всегда берем первую активную услугу для продукта в цехе (не ищем по названию операции)
-                    matched_service = qs.filter(is_active=True).first()
-                    if matched_service:
-                        print(f"✓ Берем первую активную услугу: {matched_service.name}")
-                    else:
-                        # Если активных услуг нет, берем любую
-                        matched_service = qs.first()
-                        if matched_service:
-                            print(f"  Активных услуг нет, берем любую: {matched_service.name}")
-                        
-                    if matched_service:
-                        service_price = matched_service.service_price
-                        penalty_rate = matched_service.defect_penalty
-                        price_source = f'product.services[{matched_service.id}]@{workshop.id}'
-                        print(f"✓ Найдена услуга товара: {matched_service.name} = {service_price}")
-                    else:
-                        print(f"✗ Услуга для товара {product.name} в цехе {workshop} не найдена!")
-            except Exception as e:
-                matched_service = None
-                print(f"✗ Ошибка поиска услуги товара: {e}")            
-                        # 2b) Агрегированный этап: считаем реальную стоимость по каждому продукту отдельно
-            if service_price is None:
-                print("Услуга товара не найдена, считаем реальную стоимость по продуктам...")
-                try:
-                    order = getattr(self.stage, 'order', None)
-                    workshop = getattr(self.stage, 'workshop', None)
-                    operation = getattr(self.stage, 'operation', None)
-                    if order and workshop and hasattr(order, 'items') and order.items.exists():
-                        print(f"Позиции заказа: {order.items.count()}")
-                        
-                        # Считаем реальную стоимость для выполненного количества
-                        real_total_value = Decimal('0')
-                        real_total_qty = 0
-                        remaining_completed = self.completed_quantity
-                        
-                        for it in order.items.all():
-                            it_qty = int(getattr(it, 'quantity', 0) or 0)
-                            it_service = None
-                            it_price = Decimal('0')
-                            
-                            try:
-                                if it.product:
-                                    # Ищем услугу для конкретного продукта в данном цехе
-                                    qs = it.product.services.filter(workshop=workshop)
-                                    print(f"Товар {it.product.name}: найдено услуг в цехе {workshop}: {qs.count()}")
-                                    
-                                    # Всегда берем первую активную услугу для продукта в цехе (не ищем по названию операции)
-                                    it_service = qs.filter(is_active=True).first()
-                                    if it_service:
-                                        print(f"  Берем первую активную услугу: {it_service.name}")
-                                    else:
-                                        # Если активных услуг нет, берем любую
-                                        it_service = qs.first()
-                                        if it_service:
-                                            print(f"  Активных услуг нет, берем любую: {it_service.name}")
-                                    
-                                    if it_service:
-                                        it_price = Decimal(str(it_service.service_price or 0))
-                                        print(f"  Цена услуги '{it_service.name}': {it_price}")
-                                    else:
-                                        print(f"  Услуга для товара {it.product.name} в цехе {workshop} не найдена!")
-                                        
-                            except Exception as e:
-                                print(f"✗ Ошибка поиска услуги для {it.product}: {e}")
-                                it_service = None
-                                it_price = Decimal('0')
-                            
-                            # Считаем реальную стоимость для этого продукта
-                            # Берем количество из позиции или оставшееся выполненное количество
-                            executed_qty = min(remaining_completed, it_qty)
-                            if executed_qty > 0:
-                                real_total_value += (it_price * Decimal(str(executed_qty)))
-                                real_total_qty += executed_qty
-                                remaining_completed -= executed_qty
-                                print(f"  Выполнено {executed_qty} x {it_price} = {it_price * Decimal(str(executed_qty))}")
-                            
-                            # Если все выполнено - выходим из цикла
-                            if remaining_completed <= 0:
-                                break
-                        
-                        if real_total_qty > 0:
-                            # Сохраняем точную сумму и количество для дальнейшего расчета заработка без усреднения
-                            real_cost_sum = real_total_value
-                            real_cost_qty = real_total_qty
-                            price_source = 'real_cost_by_products_sum'
-                            print(f"✓ Реальная стоимость (сумма): {real_cost_sum} за {real_cost_qty} выполненных единиц")
-                        else:
-                            print("✗ Не выполнено ни одной единицы, не можем рассчитать стоимость")
-                except Exception as e:
-                    print(f"✗ Ошибка расчета реальной стоимости: {e}")
-                    pass
-            
-            # 3) Цена услуги этапа (если не удалось выше) и штраф
-            if service_price is None:
-                print("Взвешенная цена не рассчитана, ищем услугу цеха...")
-                if self.service:
-                    service_price = self.service.service_price
-                    price_source = 'service.service_price'
-                    penalty_rate = self.service.defect_penalty
-                    print(f"✓ Найдена услуга цеха: {self.service.name} = {service_price}")
-                else:
-                    service_price = BASE_RATE
-                    price_source = 'BASE_RATE'
-                    print(f"✓ Используется базовая ставка: {BASE_RATE}")            
-            # Если штраф не определен выше, используем базовый
-            if penalty_rate is None:
-                if self.service:
-                    penalty_rate = self.service.defect_penalty
-                    print(f"Штраф за брак из услуги цеха: {penalty_rate}")
-                else:
-                    penalty_rate = BASE_PENALTY_RATE
-                    print(f"Штраф за брак базовый: {penalty_rate}")        
-        # Множитель слоёв только для цеха ID=7
-        try:
-            workshop_id = getattr(self.stage.workshop, 'id', None)
-        except Exception:
-            workshop_id = None
-        layers_multiplier = self.layers_per_unit if (workshop_id == 7 and int(self.layers_per_unit or 1) > 0) else 1
-        print(f"Множитель слоев (цех {workshop_id}): {layers_multiplier}")
-        
-        # Заработок за выполненную работу
-        if real_cost_sum is not None and real_cost_qty > 0:
-            # Агрегированный этап: используем точную сумму по продуктам, без усреднения
-            gross = Decimal(str(real_cost_sum)) * Decimal(str(layers_multiplier))
-            self.earnings = gross.quantize(Decimal('0.1'))
-            print(f"Заработок (точная сумма по продуктам): {real_cost_sum} x {layers_multiplier} = {self.earnings}")
-        else:
-            # Обычный этап или когда удалось определить единичную цену
-            gross = (Decimal(str(self.completed_quantity)) * Decimal(str(service_price))) * Decimal(str(layers_multiplier))
-            self.earnings = gross.quantize(Decimal('0.1'))
-            print(f"Заработок: {self.completed_quantity} x {service_price} x {layers_multiplier} = {self.earnings}")
-        
-        # Штрафы: за брак + дополнительные вручную начисленные
-        base_defect_penalties = Decimal(str(self.defective_quantity)) * Decimal(str(penalty_rate))
-        manual_penalties = Decimal(str(self.additional_penalties or 0))
-        raw_penalties = base_defect_penalties + manual_penalties
-        self.penalties = raw_penalties.quantize(Decimal('0.1'))
-        print(f"Штрафы: брак {self.defective_quantity} x {penalty_rate} = {base_defect_penalties} + ручные {manual_penalties} = {self.penalties}")
-        
-        # Чистый заработок
-        raw_net = self.earnings - self.penalties
-        self.net_earnings = raw_net.quantize(Decimal('0.1'))
-        print(f"Чистый заработок: {self.earnings} - {self.penalties} = {self.net_earnings}")
-        print(f"Источник цены: {price_source}")
-        print("=== КОНЕЦ DEBUG ===\n")
+    def calculate_earnings(self, price_book=None):
+        """Рассчитывает заработок, штрафы и чистый заработок (см. earnings.py)"""
+        from .earnings import compute_earnings
+        compute_earnings(self, price_book)
 
     @property
     def is_completed(self):
@@ -344,12 +121,59 @@ class EmployeeTask(models.Model):
                     # Логируем ошибку, но не прерываем выполнение
                     logging.getLogger(__name__).warning(f"Ошибка создания уведомления: {e}")
 
+
+class ProductionDailyRollup(models.Model):
+    """
+    Материализованные дневные итоги по задачам: (дата создания задачи, цех, сотрудник).
+
+    Поддерживается инкрементально сигналами EmployeeTask (см. rollup.py),
+    полностью пересобирается командой rebuild_production_rollup.
+    """
+    date = models.DateField('Дата')
+    workshop = models.ForeignKey('operations_workshops.Workshop', on_delete=models.CASCADE, null=True, blank=True, related_name='production_rollups', verbose_name='Цех')
+    employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='production_rollups', verbose_name='Сотрудник')
+    task_count = models.IntegerField('Задач', default=0)
+    quantity = models.IntegerField('Назначено', default=0)
+    completed = models.IntegerField('Выполнено', default=0)
+    defective = models.IntegerField('Брак', default=0)
+    earnings = models.DecimalField('Заработок', max_digits=14, decimal_places=2, default=0)
+    penalties = models.DecimalField('Штрафы', max_digits=14, decimal_places=2, default=0)
+    net_earnings = models.DecimalField('Чистый заработок', max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Дневные итоги производства'
+        verbose_name_plural = 'Дневные итоги производства'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'workshop', 'employee'],
+                condition=models.Q(workshop__isnull=False),
+                name='production_rollup_unique_row',
+            ),
+            # Строки без цеха: NULL в unique не совпадает с NULL, поэтому отдельное условие
+            models.UniqueConstraint(
+                fields=['date', 'employee'],
+                condition=models.Q(workshop__isnull=True),
+                name='production_rollup_unique_no_workshop',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['workshop', 'date']),
+            models.Index(fields=['employee', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} — {self.workshop} — {self.employee}: {self.completed} / брак {self.defective}"
+
+
 @receiver(pre_save, sender=EmployeeTask)
 def create_defect_on_defective_change(sender, instance, **kwargs):
     """Создает записи браков в новой системе при изменении defective_quantity и сохраняет предыдущее значение net_earnings"""
     if instance.pk:
         try:
-            old_instance = EmployeeTask.objects.get(pk=instance.pk)
+            old_instance = EmployeeTask.objects.select_related('stage').get(pk=instance.pk)
+            # Прежний вклад задачи в дневные итоги производства
+            from .rollup import task_contribution
+            instance._old_rollup = task_contribution(old_instance)
             # Дельта выполненного для последующего списания материалов
             delta_completed = int(instance.completed_quantity) - int(old_instance.completed_quantity)
             instance._delta_completed_quantity = max(delta_completed, 0)
@@ -404,6 +228,10 @@ def update_earnings_and_materials(sender, instance, created, **kwargs):
 				penalties=instance.penalties,
 				net_earnings=instance.net_earnings
 			)
+			# Переносим изменение в дневные итоги производства
+			from .rollup import apply_change, task_contribution
+			apply_change(getattr(instance, '_old_rollup', None), task_contribution(instance))
+			instance._old_rollup = None
 			# Пополняем баланс сотрудника разницей чистого заработка
 			old_net = getattr(instance, '_old_net_earnings', Decimal('0'))
 			new_net = Decimal(str(instance.net_earnings or 0))
@@ -445,3 +273,31 @@ def update_earnings_and_materials(sender, instance, created, **kwargs):
 	except Exception as e:
 		# Логируем ошибку, но не прерываем выполнение
 		logging.getLogger(__name__).warning(f"Ошибка в update_earnings_and_materials: {e}")
+
+
+@receiver(post_delete, sender=EmployeeTask)
+def remove_task_from_rollup(sender, instance, **kwargs):
+    """Вычитает удалённую задачу из дневных итогов производства"""
+    try:
+        from .rollup import apply_change, task_contribution
+        apply_change(task_contribution(instance), None)
+    except Exception as e:
+        # Этап мог быть удалён каскадом раньше задачи — итоги поправит пересборка
+        logging.getLogger(__name__).warning(f"Ошибка обновления итогов производства: {e}")
+
+
+@receiver([post_save, post_delete], sender=EmployeeTask)
+def touch_stage_for_board(sender, instance, **kwargs):
+    """Отмечает этап изменённым для опроса доски цехов по курсору since"""
+    if kwargs.get('raw'):
+        return
+    from django.utils import timezone
+    OrderStage.objects.filter(pk=instance.stage_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender='services.Service')
+@receiver(m2m_changed, sender='products.Product_services')
+def invalidate_service_prices(sender, **kwargs):
+    """Сбрасывает кэш цен услуг после изменения услуг или их привязки к товарам"""
+    from .earnings import invalidate_price_book
+    invalidate_price_book()
@@ -0,0 +1,140 @@
+"""
+Дневные итоги производства (ProductionDailyRollup).
+
+Каждая задача EmployeeTask вносит «вклад» в строку (дата создания, цех,
+сотрудник). Сигналы применяют разницу между старым и новым вкладом
+атомарными F()-обновлениями, поэтому статистика читает несколько строк
+итогов вместо агрегации всей таблицы задач.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import EmployeeTask, ProductionDailyRollup
+
+
+ROLLUP_FIELDS = ('task_count', 'quantity', 'completed', 'defective', 'earnings', 'penalties', 'net_earnings')
+
+RollupKey = Tuple[date, Optional[int], int]
+
+
+def task_contribution(task, workshop_id=None) -> Tuple[RollupKey, Dict[str, object]]:
+    """Ключ строки итогов и вклад одной задачи в неё."""
+    if workshop_id is None and task.stage_id:
+        workshop_id = task.stage.workshop_id
+    created_at = task.created_at or timezone.now()
+    key = (timezone.localtime(created_at).date(), workshop_id, task.employee_id)
+    values = {
+        'task_count': 1,
+        'quantity': int(task.quantity or 0),
+        'completed': int(task.completed_quantity or 0),
+        'defective': int(task.defective_quantity or 0),
+        'earnings': Decimal(str(task.earnings or 0)),
+        'penalties': Decimal(str(task.penalties or 0)),
+        'net_earnings': Decimal(str(task.net_earnings or 0)),
+    }
+    return key, values
+
+
+def apply_delta(key: RollupKey, delta: Dict[str, object]) -> None:
+    """Прибавляет delta к строке итогов, создавая её при необходимости."""
+    if not any(delta.values()):
+        return
+    day, workshop_id, employee_id = key
+    lookup = {'date': day, 'workshop_id': workshop_id, 'employee_id': employee_id}
+    updates = {field: F(field) + value for field, value in delta.items()}
+    if ProductionDailyRollup.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ProductionDailyRollup.objects.create(**lookup, **delta)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        ProductionDailyRollup.objects.filter(**lookup).update(**updates)
+
+
+def apply_change(old, new) -> None:
+    """
+    Переносит изменение задачи в итоги.
+
+    old/new — результаты task_contribution() (или None для создания/удаления).
+    """
+    if old and new and old[0] == new[0]:
+        apply_delta(new[0], {f: new[1][f] - old[1][f] for f in ROLLUP_FIELDS})
+        return
+    if old:
+        apply_delta(old[0], {f: -old[1][f] for f in ROLLUP_FIELDS})
+    if new:
+        apply_delta(new[0], dict(new[1]))
+
+
+def rebuild_rollup(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Пересобирает итоги за период (или целиком) из EmployeeTask одним GROUP BY.
+
+    Нужна для первичного заполнения и для исправления расхождений после
+    массовых .update() в обход сигналов. Агрегат читается в той же
+    транзакции, что удаляет и вставляет строки, чтобы изменения задач
+    между чтением и записью не терялись. Возвращает число строк итогов.
+    """
+    from django.db.models import Count, DateField
+    from django.db.models.functions import Trunc
+
+    tasks = EmployeeTask.objects.all()
+    existing = ProductionDailyRollup.objects.all()
+    if start:
+        tasks = tasks.filter(created_at__date__gte=start)
+        existing = existing.filter(date__gte=start)
+    if end:
+        tasks = tasks.filter(created_at__date__lte=end)
+        existing = existing.filter(date__lte=end)
+
+    rows = (
+        tasks
+        .annotate(day=Trunc('created_at', 'day', output_field=DateField()))
+        .values('day', 'stage__workshop_id', 'employee_id')
+        .annotate(
+            task_count=Count('id'),
+            quantity_sum=Sum('quantity'),
+            completed_sum=Sum('completed_quantity'),
+            defective_sum=Sum('defective_quantity'),
+            earnings_sum=Sum('earnings'),
+            penalties_sum=Sum('penalties'),
+            net_sum=Sum('net_earnings'),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        existing.delete()
+        rollups = [
+            ProductionDailyRollup(
+                date=row['day'],
+                workshop_id=row['stage__workshop_id'],
+                employee_id=row['employee_id'],
+                task_count=row['task_count'],
+                quantity=row['quantity_sum'] or 0,
+                completed=row['completed_sum'] or 0,
+                defective=row['defective_sum'] or 0,
+                earnings=row['earnings_sum'] or 0,
+                penalties=row['penalties_sum'] or 0,
+                net_earnings=row['net_sum'] or 0,
+            )
+            for row in rows
+        ]
+        ProductionDailyRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def rollup_totals(queryset=None, **filters) -> Dict[str, object]:
+    """Суммы по строкам итогов (нули вместо None)."""
+    qs = queryset if queryset is not None else ProductionDailyRollup.objects.all()
+    if filters:
+        qs = qs.filter(**filters)
+    totals = qs.aggregate(**{field: Sum(field) for field in ROLLUP_FIELDS})
+    return {field: totals[field] or 0 for field in ROLLUP_FIELDS}
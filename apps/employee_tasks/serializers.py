@@ -73,16 +73,16 @@ class EmployeeTaskSerializer(serializers.ModelSerializer):
         elif stage_obj and stage_obj.order:
             # Fallback: если order_item равен null, пытаемся получить данные через заказ
             logger.info("Using fallback through order")
-            from apps.orders.models import OrderItem
             from apps.orders.serializers import OrderItemSerializer
             
             # Ищем позиции заказа для этого заказа
-            order_items = OrderItem.objects.filter(order=stage_obj.order)
-            logger.info(f"Found {order_items.count()} order items for order {stage_obj.order.id}")
+            # Через менеджер заказа: при prefetch_related('items') запросов не будет
+            order_items = sorted(stage_obj.order.items.all(), key=lambda it: it.pk)
+            logger.info(f"Found {len(order_items)} order items for order {stage_obj.order.id}")
             
-            if order_items.exists():
+            if order_items:
                 # Берем первую позицию (обычно их одна для простых заказов)
-                first_item = order_items.first()
+                first_item = order_items[0]
                 logger.info(f"Using first order item: {first_item}")
                 item_data = OrderItemSerializer(first_item).data
                 
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .rollup import rebuild_rollup
+
+
+@shared_task
+def refresh_production_rollup(days=3):
+    """
+    Пересобирает дневные итоги производства за последние дни.
+
+    Сигналы поддерживают итоги инкрементально; периодическая пересборка
+    исправляет расхождения от массовых .update() в обход сигналов.
+    """
+    start = timezone.localdate() - timedelta(days=days - 1)
+    count = rebuild_rollup(start=start)
+    return {
+        'status': 'success',
+        'message': f'Итоги производства пересобраны с {start}',
+        'rows': count,
+    }
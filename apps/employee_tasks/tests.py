@@ -1,3 +1,153 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.clients.models import Client
+from apps.operations.workshops.models import Workshop
+from apps.orders.models import Order, OrderItem, OrderStage
+from apps.products.models import Product
+from apps.services.models import Service
+
+from .models import EmployeeTask, ProductionDailyRollup
+from .earnings import get_price_book, recalculate_earnings
+from .rollup import rebuild_rollup, rollup_totals
+
+User = get_user_model()
+
+
+class ProductionDailyRollupTests(TestCase):
+    def setUp(self):
+        self.workshop = Workshop.objects.create(name="Распил")
+        self.employee = User.objects.create_user(username="worker", password="pass")
+        order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+        self.stage = OrderStage.objects.create(order=order, workshop=self.workshop, plan_quantity=10)
+
+    def snapshot(self):
+        return list(
+            ProductionDailyRollup.objects.order_by('date', 'workshop_id', 'employee_id').values(
+                'date', 'workshop_id', 'employee_id', 'task_count', 'quantity',
+                'completed', 'defective', 'earnings', 'penalties', 'net_earnings',
+            )
+        )
+
+    def test_signals_keep_rollup_in_sync_with_rebuild(self):
+        task = EmployeeTask.objects.create(stage=self.stage, employee=self.employee, quantity=10)
+        task.completed_quantity = 6
+        task.defective_quantity = 1
+        task.save()
+        EmployeeTask.objects.create(stage=self.stage, employee=self.employee, quantity=4, completed_quantity=4)
+
+        totals = rollup_totals(workshop=self.workshop)
+        self.assertEqual(totals['task_count'], 2)
+        self.assertEqual(totals['quantity'], 14)
+        self.assertEqual(totals['completed'], 10)
+        self.assertEqual(totals['defective'], 1)
+
+        incremental = self.snapshot()
+        rebuild_rollup()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_delete_subtracts_task(self):
+        task = EmployeeTask.objects.create(stage=self.stage, employee=self.employee, quantity=5, completed_quantity=5)
+        task.delete()
+
+        totals = rollup_totals(employee=self.employee)
+        self.assertEqual(totals['task_count'], 0)
+        self.assertEqual(totals['completed'], 0)
+
+
+    def test_rows_without_workshop_are_unique(self):
+        from datetime import date
+        from django.db import IntegrityError, transaction
+        from .rollup import apply_delta
+
+        key = (date(2024, 3, 1), None, self.employee.id)
+        apply_delta(key, {'task_count': 1, 'completed': 2})
+        apply_delta(key, {'task_count': 1, 'completed': 3})
+        row = ProductionDailyRollup.objects.get(workshop__isnull=True)
+        self.assertEqual((row.task_count, row.completed), (2, 5))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductionDailyRollup.objects.create(date=key[0], workshop=None, employee=self.employee)
+
+    def test_rebuild_reads_tasks_inside_transaction(self):
+        EmployeeTask.objects.create(stage=self.stage, employee=self.employee, quantity=3)
+        with CaptureQueriesContext(connection) as ctx:
+            rebuild_rollup()
+        sql = [query['sql'].upper() for query in ctx.captured_queries]
+        delete = next(i for i, query in enumerate(sql) if query.startswith('DELETE'))
+        aggregate = next(i for i, query in enumerate(sql) if 'GROUP BY' in query)
+        self.assertLess(delete, aggregate)
+
+
+class EarningsEngineTests(TestCase):
+    def setUp(self):
+        self.workshop = Workshop.objects.create(name="Кромка")
+        self.employee = User.objects.create_user(username="worker", password="pass")
+        self.order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+        self.door = Product.objects.create(name="Дверь")
+        self.panel = Product.objects.create(name="Панель")
+        self.door_service = Service.objects.create(name="Кромка двери", workshop=self.workshop, service_price=10, defect_penalty=3)
+        self.panel_service = Service.objects.create(name="Кромка панели", workshop=self.workshop, service_price=4, defect_penalty=1)
+        self.door.services.add(self.door_service)
+        self.panel.services.add(self.panel_service)
+
+    def test_item_stage_uses_product_service(self):
+        item = OrderItem.objects.create(order=self.order, product=self.door, quantity=5)
+        stage = OrderStage.objects.create(order=self.order, order_item=item, workshop=self.workshop, plan_quantity=5)
+        task = EmployeeTask.objects.create(stage=stage, employee=self.employee, quantity=5, completed_quantity=4, defective_quantity=1)
+
+        task.refresh_from_db()
+        self.assertEqual(task.earnings, Decimal("40.00"))
+        self.assertEqual(task.penalties, Decimal("3.00"))
+        self.assertEqual(task.net_earnings, Decimal("37.00"))
+
+    def test_aggregated_stage_sums_item_prices(self):
+        OrderItem.objects.create(order=self.order, product=self.door, quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.panel, quantity=5)
+        stage = OrderStage.objects.create(order=self.order, workshop=self.workshop, plan_quantity=7)
+        task = EmployeeTask.objects.create(stage=stage, employee=self.employee, quantity=7, completed_quantity=4)
+
+        task.refresh_from_db()
+        self.assertEqual(task.earnings, Decimal("28.00"))
+
+    def test_service_change_invalidates_cache(self):
+        book = get_price_book()
+        self.door_service.service_price = 20
+        self.door_service.save()
+        self.assertIsNot(get_price_book(), book)
+        self.assertEqual(get_price_book().product_price(self.door.pk, self.workshop.pk), Decimal("20"))
+
+        book = get_price_book()
+        self.door.services.remove(self.door_service)
+        self.assertIsNot(get_price_book(), book)
+
+    def test_price_book_follows_shared_version(self):
+        from django.core.cache import cache
+        from core import caching
+        from .earnings import PRICE_BOOK_NAMESPACE
+
+        book = get_price_book()
+        self.assertIs(get_price_book(), book)
+        # Услугу изменили в другом процессе: сигналы здесь не сработали,
+        # но версия в общем кэше увеличена
+        Service.objects.filter(pk=self.door_service.pk).update(service_price=30)
+        cache.incr(caching.VERSION_KEY.format(PRICE_BOOK_NAMESPACE))
+        self.assertEqual(get_price_book().product_price(self.door.pk, self.workshop.pk), Decimal("30"))
+
+    def test_batch_recalculation_updates_tasks_and_rollup(self):
+        item = OrderItem.objects.create(order=self.order, product=self.door, quantity=50)
+        stage = OrderStage.objects.create(order=self.order, order_item=item, workshop=self.workshop, plan_quantity=50)
+        for _ in range(5):
+            EmployeeTask.objects.create(stage=stage, employee=self.employee, quantity=10, completed_quantity=10)
+        Service.objects.filter(pk=self.door_service.pk).update(service_price=12)
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = recalculate_earnings(EmployeeTask.objects.all())
 
-# Create your tests here.
+        self.assertEqual(summary['updated'], 5)
+        self.assertLess(len(queries), 15)
+        self.assertEqual(set(EmployeeTask.objects.values_list('earnings', flat=True)), {Decimal("120.00")})
+        self.assertEqual(rollup_totals(employee=self.employee)['earnings'], Decimal("600.00"))
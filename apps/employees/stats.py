@@ -0,0 +1,215 @@
+"""
+Статистика сотрудников одним набором запросов на всех сразу.
+
+Вместо расчёта по каждому сотруднику и поиска услуги на каждую задачу
+показатели собираются сгруппированными запросами:
+
+- дневные итоги производства (выполнено, брак, графики) — GROUP BY
+  сотрудник/дата по ProductionDailyRollup;
+- заработок и штрафы — GROUP BY сотрудник/цех/операция/месяц по задачам,
+  суммы умножаются на таблицу цен (цех, операция) → услуга, загруженную
+  одним запросом;
+- активные задачи, отработанные часы, переработка и соблюдение сроков —
+  условной агрегацией по задачам.
+
+Число запросов не зависит от числа сотрудников.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from apps.employee_tasks.models import EmployeeTask, ProductionDailyRollup
+
+
+SALARY_MONTHS = 6
+CHART_DAYS = 30
+WORKDAY = timedelta(hours=8)
+
+PriceTable = Dict[Tuple[int, str], Tuple[float, float]]
+
+
+def service_price_table() -> PriceTable:
+    """{(id цеха, операция): (оплата за единицу, штраф за брак)} по всем услугам цехов."""
+    from apps.services.models import Service
+
+    table: PriceTable = {}
+    rows = (
+        Service.objects
+        .filter(workshop__isnull=False)
+        .order_by('name', 'pk')
+        .values_list('workshop_id', 'name', 'service_price', 'defect_penalty')
+    )
+    for workshop_id, name, price, penalty in rows:
+        # При дублях берётся первая услуга, как прежний .first()
+        table.setdefault((workshop_id, name), (float(price or 0), float(penalty or 0)))
+    return table
+
+
+def _month_starts(today: date, months: int) -> List[date]:
+    """Первые числа последних months месяцев, от старого к текущему."""
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        starts.insert(0, date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def quality_score(defect_rate) -> int:
+    if defect_rate < 5:
+        return 10
+    if defect_rate < 10:
+        return 8
+    if defect_rate < 20:
+        return 6
+    return 4
+
+
+def compute_workforce_stats(employee_ids: Iterable[int], period_days: int = 30, now: Optional[datetime] = None) -> Dict[int, dict]:
+    """
+    Показатели сотрудников за последние period_days дней: {id сотрудника: статистика}.
+
+    Состав статистики — как у calculate_employee_stats.
+    """
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return {}
+    now = now or timezone.now()
+    period_start = now - timedelta(days=period_days)
+    today = timezone.localdate(now)
+    period_start_date = timezone.localtime(period_start).date()
+    chart_start = today - timedelta(days=CHART_DAYS - 1)
+    months = _month_starts(today, SALARY_MONTHS)
+    months_start = timezone.make_aware(datetime.combine(months[0], datetime.min.time()))
+
+    # Дневные итоги: выполнено и брак за период и график за 30 дней
+    totals = defaultdict(lambda: {'completed': 0, 'defective': 0})
+    daily = defaultdict(dict)
+    rollup_rows = (
+        ProductionDailyRollup.objects
+        .filter(employee_id__in=employee_ids, date__gte=min(period_start_date, chart_start))
+        .values('employee_id', 'date')
+        .annotate(completed_sum=Sum('completed'), defective_sum=Sum('defective'))
+        .values_list('employee_id', 'date', 'completed_sum', 'defective_sum')
+    )
+    for employee_id, day, completed, defective in rollup_rows:
+        if day >= period_start_date:
+            totals[employee_id]['completed'] += completed or 0
+            totals[employee_id]['defective'] += defective or 0
+        if day >= chart_start:
+            daily[employee_id][day] = completed or 0
+
+    # Заработок: суммы по (цех, операция) за период и по месяцам
+    prices = service_price_table()
+    salary = defaultdict(float)
+    salary_by_month = defaultdict(lambda: defaultdict(float))
+    in_period = Q(created_at__gte=period_start)
+    work_rows = (
+        EmployeeTask.objects
+        .filter(
+            employee_id__in=employee_ids,
+            created_at__gte=min(period_start, months_start),
+            stage__workshop__isnull=False,
+        )
+        .exclude(stage__operation='')
+        .annotate(month=TruncMonth('created_at'))
+        .values('employee_id', 'stage__workshop_id', 'stage__operation', 'month')
+        .annotate(
+            completed_sum=Sum('completed_quantity'),
+            defective_sum=Sum('defective_quantity'),
+            period_completed=Sum('completed_quantity', filter=in_period),
+            period_defective=Sum('defective_quantity', filter=in_period),
+        )
+        .values_list(
+            'employee_id', 'stage__workshop_id', 'stage__operation', 'month',
+            'completed_sum', 'defective_sum', 'period_completed', 'period_defective',
+        )
+    )
+    for employee_id, workshop_id, operation, month, completed, defective, p_completed, p_defective in work_rows:
+        price = prices.get((workshop_id, operation))
+        if price is None:
+            continue
+        service_price, defect_penalty = price
+        salary[employee_id] += (p_completed or 0) * service_price - (p_defective or 0) * defect_penalty
+        if month is not None:
+            salary_by_month[employee_id][_as_date(month)] += (completed or 0) * service_price - (defective or 0) * defect_penalty
+
+    active = dict(
+        EmployeeTask.objects
+        .filter(employee_id__in=employee_ids, completed_quantity__lt=F('quantity'))
+        .values('employee_id')
+        .annotate(total=Count('id'))
+        .values_list('employee_id', 'total')
+    )
+
+    # Полностью выполненные задачи периода: часы, переработка, сроки
+    spent = ExpressionWrapper(F('completed_at') - F('created_at'), output_field=DurationField())
+    finished = {
+        row['employee_id']: row
+        for row in EmployeeTask.objects
+        .filter(
+            employee_id__in=employee_ids,
+            created_at__gte=period_start,
+            completed_quantity=F('quantity'),
+            completed_at__isnull=False,
+        )
+        .annotate(spent=spent)
+        .values('employee_id')
+        .annotate(
+            spent_total=Sum('spent'),
+            overtime_total=Sum(Case(
+                When(spent__gt=WORKDAY, then=ExpressionWrapper(F('spent') - Value(WORKDAY), output_field=DurationField())),
+                default=Value(timedelta(0)),
+                output_field=DurationField(),
+            )),
+            with_deadline=Count('id', filter=Q(stage__deadline__isnull=False)),
+            on_time=Count('id', filter=Q(stage__deadline__isnull=False, completed_at__date__lte=F('stage__deadline'))),
+        )
+    }
+
+    days = max((now - period_start).days, 1)
+    result = {}
+    for employee_id in employee_ids:
+        completed_works = totals[employee_id]['completed']
+        defects = totals[employee_id]['defective']
+        defect_rate = round(defects / completed_works * 100, 2) if completed_works else 0
+        done = finished.get(employee_id) or {}
+        spent_total = done.get('spent_total') or timedelta(0)
+        overtime_total = done.get('overtime_total') or timedelta(0)
+        with_deadline = done.get('with_deadline') or 0
+        monthly_productivity = [
+            daily[employee_id].get(today - timedelta(days=i), 0)
+            for i in range(CHART_DAYS - 1, -1, -1)
+        ]
+        result[employee_id] = {
+            'completed_works': completed_works,
+            'defects': defects,
+            'monthly_salary': salary[employee_id],
+            'efficiency': round((completed_works - defects) / completed_works * 100) if completed_works > 0 else 0,
+            'active_tasks': active.get(employee_id, 0),
+            'avg_productivity': round(completed_works / days, 2),
+            'defect_rate': defect_rate,
+            'hours_worked': int(spent_total.total_seconds() / 3600),
+            'overtime_hours': int(overtime_total.total_seconds() / 3600),
+            'quality_score': quality_score(defect_rate),
+            'deadline_compliance': round(done.get('on_time', 0) / with_deadline * 100, 2) if with_deadline else 0,
+            # Инициативность и командная работа — пока среднее
+            'initiative_score': 7,
+            'teamwork_score': 7,
+            'productivity_chart': monthly_productivity[-7:],
+            'monthly_productivity': monthly_productivity,
+            'salary_history': [salary_by_month[employee_id].get(month, 0) for month in months],
+        }
+    return result
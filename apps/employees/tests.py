@@ -1,3 +1,83 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.clients.models import Client
+from apps.employee_tasks.models import EmployeeTask
+from apps.operations.workshops.models import Workshop
+from apps.orders.models import Order, OrderStage
+from apps.services.models import Service
+
+from .stats import compute_workforce_stats
+from .utils import calculate_employee_stats
+
+User = get_user_model()
+
+
+class WorkforceStatsTests(TestCase):
+    def setUp(self):
+        self.workshop = Workshop.objects.create(name="Распил")
+        Service.objects.create(name="Распил", workshop=self.workshop, service_price=10, defect_penalty=3)
+        self.order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+        self.workers = [
+            User.objects.create_user(username=f"worker{i}", password="pass", role=User.Role.WORKER)
+            for i in range(3)
+        ]
+
+    def add_task(self, employee, quantity, completed, defective=0, hours=None, deadline=None):
+        stage = OrderStage.objects.create(
+            order=self.order, workshop=self.workshop, operation="Распил",
+            plan_quantity=quantity, deadline=deadline,
+        )
+        task = EmployeeTask.objects.create(
+            stage=stage, employee=employee, quantity=quantity,
+            completed_quantity=completed, defective_quantity=defective,
+        )
+        if hours is not None:
+            EmployeeTask.objects.filter(pk=task.pk).update(completed_at=task.created_at + timedelta(hours=hours))
+        return task
+
+    def test_single_employee_stats(self):
+        worker = self.workers[0]
+        today = timezone.localdate()
+        self.add_task(worker, 10, 10, 1, hours=10, deadline=today + timedelta(days=1))
+        self.add_task(worker, 5, 5, hours=2, deadline=today - timedelta(days=1))
+        self.add_task(worker, 4, 1)
+
+        stats = calculate_employee_stats(worker)
+        self.assertEqual(stats['completed_works'], 16)
+        self.assertEqual(stats['defects'], 1)
+        self.assertEqual(stats['monthly_salary'], 16 * 10 - 3)
+        self.assertEqual(stats['active_tasks'], 1)
+        self.assertEqual(stats['hours_worked'], 12)
+        self.assertEqual(stats['overtime_hours'], 2)
+        self.assertEqual(stats['deadline_compliance'], 50)
+        self.assertEqual(stats['salary_history'][-1], 157)
+        self.assertEqual(stats['monthly_productivity'][-1], 16)
+        self.assertEqual(len(stats['productivity_chart']), 7)
+
+    def test_query_count_does_not_depend_on_employees(self):
+        for worker in self.workers:
+            self.add_task(worker, 3, 3, hours=1)
+        ids = [worker.pk for worker in self.workers]
+        with CaptureQueriesContext(connection) as one:
+            compute_workforce_stats(ids[:1])
+        with CaptureQueriesContext(connection) as many:
+            stats = compute_workforce_stats(ids)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual([stats[pk]['monthly_salary'] for pk in ids], [30.0] * 3)
 
-# Create your tests here.
+    def test_stats_endpoint_totals(self):
+        admin = User.objects.create_user(username="boss", password="pass", role=User.Role.ADMIN)
+        self.client.force_login(admin)
+        for worker in self.workers:
+            self.add_task(worker, 4, 2)
+        response = self.client.get(reverse("employee-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_completed_works'], 6)
+        self.assertEqual(response.json()['active_tasks'], 3)
@@ -19,6 +19,7 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from apps.operations.workshops.models import Workshop
 from apps.operations.workshops.views import WorkshopSerializer
+from .stats import compute_workforce_stats
 from .utils import calculate_employee_stats
 from decimal import Decimal, InvalidOperation
 from django.db import transaction
@@ -165,8 +166,8 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         # Получаем статистику из связанных моделей
         total_employees = queryset.count()
         
-        # Агрегируем данные из EmployeeStatistics
-        all_stats = [calculate_employee_stats(emp) for emp in queryset]
+        # Показатели всех сотрудников — сгруппированными запросами
+        all_stats = list(compute_workforce_stats(queryset.values_list('pk', flat=True)).values())
         total_completed_works = sum(s['completed_works'] for s in all_stats)
         total_defects = sum(s['defects'] for s in all_stats)
         total_salary = sum(s['monthly_salary'] for s in all_stats)
@@ -239,12 +240,18 @@ class EmployeeViewSet(viewsets.ModelViewSet):
                 entry['reason'] = entry.get('note') or 'Заработок'
                 earnings.append(entry)
         if not earnings:
+            computed = []
+
+            def employee_stats():
+                if not computed:
+                    computed.append(calculate_employee_stats(employee))
+                return computed[0]
+
             stats_obj = getattr(employee, 'statistics', None)
             if stats_obj and isinstance(stats_obj.salary_history, list) and stats_obj.salary_history:
                 history = stats_obj.salary_history
             else:
-                stats = calculate_employee_stats(employee)
-                history = stats.get('salary_history') or []
+                history = employee_stats().get('salary_history') or []
             if isinstance(history, list) and history:
                 now = timezone.now()
                 for idx, value in enumerate(history):
@@ -263,7 +270,7 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             if not earnings or all((e.get('amount') or 0) <= 0 for e in earnings):
                 earnings = []
                 try:
-                    amount = float(calculate_employee_stats(employee).get('monthly_salary') or 0)
+                    amount = float(employee_stats().get('monthly_salary') or 0)
                 except (TypeError, ValueError):
                     amount = 0
                 if amount > 0:
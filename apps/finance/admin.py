@@ -2,8 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.db.models import Sum
 from .models import (
-    ExpenseCategory, Supplier, SupplierItem, MainBankAccount, 
-    MoneyMovement, Expense, Income, FactoryAsset, FinancialReport, AccountingAccount, JournalEntry, JournalEntryLine, AnalyticalAccount, StandardOperation, StandardOperationLine, AccountCorrespondence, FinancialPeriod, Request, RequestItem
+    ExpenseCategory, Supplier, SupplierItem, MainBankAccount, BankLedgerEntry, ExportJob, 
+    MoneyMovement, Expense, Income, FactoryAsset, FinancialReport, AccountingAccount, JournalEntry, JournalEntryLine, AnalyticalAccount, StandardOperation, StandardOperationLine, AccountCorrespondence, FinancialPeriod, FinancialReportSnapshot, Request, RequestItem
 )
 
 @admin.register(ExpenseCategory)
@@ -40,6 +40,33 @@ class MainBankAccountAdmin(admin.ModelAdmin):
         """Запрещаем удаление основного счета"""
         return False
 
+@admin.register(BankLedgerEntry)
+class BankLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'source', 'source_id', 'amount', 'comment', 'created_at']
+    list_filter = ['source', 'date']
+    date_hierarchy = 'date'
+    ordering = ['-date', '-id']
+
+    def has_add_permission(self, request):
+        """Проводки создаются документами; корректировка — bank.adjust_to"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Журнал основного счета неизменяемый"""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'filename', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['kind', 'params', 'status', 'file', 'filename', 'error', 'created_by', 'created_at', 'finished_at']
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(MoneyMovement)
 class MoneyMovementAdmin(admin.ModelAdmin):
     list_display = ['movement_type', 'amount', 'user', 'date', 'comment_short']
@@ -156,6 +183,18 @@ class FinancialPeriodAdmin(admin.ModelAdmin):
 	search_fields = ('name',)
 	date_hierarchy = 'start_date'
 
+@admin.register(FinancialReportSnapshot)
+class FinancialReportSnapshotAdmin(admin.ModelAdmin):
+	list_display = ('period', 'start_date', 'end_date', 'total_income', 'total_expenses', 'net_income', 'created_at')
+	list_filter = ('period',)
+	readonly_fields = ('period', 'start_date', 'end_date', 'total_income', 'total_expenses', 'net_income', 'operating_income', 'total_assets', 'breakdown', 'created_at')
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
 class RequestItemInline(admin.TabularInline):
     model = RequestItem
     extra = 1
@@ -0,0 +1,84 @@
+"""
+Баланс основного банковского счета по журналу проводок.
+
+Каждое движение денег (вложение/инкассация, расход, доход, оплата долга,
+корректировка) записывается неизменяемой строкой BankLedgerEntry, а
+MainBankAccount.balance меняется одним UPDATE balance = balance + дельта
+без чтения строки: параллельные проводки не теряют обновлений и не
+перезаписывают баланс друг друга, а блокировка строки счета держится
+только на время этого UPDATE до конца транзакции проводки.
+
+Журнал — источник истины: остаток на любую дату считается суммой
+проводок (balance_as_of), а reconcile сверяет и при необходимости
+выравнивает сохранённый баланс по журналу.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from core.caching import invalidate
+
+from .models import FINANCE_DASHBOARD_CACHE, BankLedgerEntry, MainBankAccount
+
+ZERO = Decimal('0.00')
+
+MAIN_ACCOUNT_ID = 1
+
+
+def post(amount, source: str, on_date: date, source_id: Optional[int] = None, comment: str = '') -> BankLedgerEntry:
+    """Проводит сумму со знаком по основному счету и сдвигает его баланс."""
+    amount = Decimal(str(amount))
+    with transaction.atomic():
+        account = MainBankAccount.objects.filter(pk=MAIN_ACCOUNT_ID)
+        if not account.update(balance=F('balance') + amount):
+            MainBankAccount.get_main_account()
+            account.update(balance=F('balance') + amount)
+        return BankLedgerEntry.objects.create(
+            account_id=MAIN_ACCOUNT_ID,
+            source=source,
+            source_id=source_id,
+            amount=amount,
+            date=on_date,
+            comment=comment[:255],
+        )
+
+
+def adjust_to(target, on_date: date, comment: str = 'Корректировка остатка') -> Optional[BankLedgerEntry]:
+    """Доводит баланс до target корректирующей проводкой (None — если уже равен)."""
+    difference = Decimal(str(target)) - MainBankAccount.get_main_account().balance
+    if not difference:
+        return None
+    return post(difference, 'adjustment', on_date, comment=comment)
+
+
+def balance_as_of(on_date: Optional[date] = None) -> Decimal:
+    """Остаток основного счета на конец дня on_date (без даты — по всему журналу)."""
+    entries = BankLedgerEntry.objects.filter(account_id=MAIN_ACCOUNT_ID)
+    if on_date is not None:
+        entries = entries.filter(date__lte=on_date)
+    return entries.aggregate(total=Sum('amount'))['total'] or ZERO
+
+
+def reconcile(fix: bool = True) -> Dict[str, Decimal]:
+    """
+    Сверяет сохранённый баланс с суммой журнала.
+
+    При fix расхождение устраняется записью суммы журнала в баланс
+    (строка счета блокируется на время сверки), а кэш сводок финансов
+    сбрасывается явно: UPDATE не вызывает сигналов invalidate_on.
+    Возвращает {'stored', 'ledger', 'difference'} до исправления.
+    """
+    with transaction.atomic():
+        MainBankAccount.get_main_account()
+        account = MainBankAccount.objects.select_for_update().get(pk=MAIN_ACCOUNT_ID)
+        ledger = balance_as_of()
+        result = {'stored': account.balance, 'ledger': ledger, 'difference': account.balance - ledger}
+        if fix and result['difference']:
+            MainBankAccount.objects.filter(pk=MAIN_ACCOUNT_ID).update(balance=ledger)
+            invalidate(FINANCE_DASHBOARD_CACHE)
+    return result
@@ -0,0 +1,436 @@
+"""
+Выгрузки в Excel и CSV с ограниченным расходом памяти.
+
+XLSX пишется openpyxl в режиме write_only: строки листа сразу уходят во
+временный файл openpyxl, а стили ячеек — именованные стили книги (одна
+запись в styles.xml на стиль, а не на ячейку). Готовая книга сохраняется
+во временный файл на диске и отдаётся FileResponse (StreamingHttpResponse)
+блоками. Записи читаются iterator(chunk_size=...) вместе с prefetch, так
+что в памяти одновременно находится одна пачка.
+
+Заявки пишутся блоками строк в один лист, а не листом на заявку: у
+каждого листа write_only до сохранения открыт свой временный файл (см.
+RequestSheet).
+
+CSV отдаётся StreamingHttpResponse построчно, без сборки файла.
+
+Большие выгрузки можно запустить асинхронно (?async=1): создаётся
+ExportJob, задача build_export (очередь finance) собирает файл и
+сохраняет его в хранилище, а пользователь скачивает его позже по
+export_job_download.
+"""
+from __future__ import annotations
+
+import csv
+import tempfile
+from typing import Callable, Dict, Iterable, Tuple
+
+from django.core.files import File
+from django.db import transaction
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.pagebreak import Break
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+CHUNK_SIZE = 500
+
+_THIN = Side(style='thin')
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+_CENTER = Alignment(horizontal="center", vertical="center")
+
+
+def _style(name, **attrs) -> Callable[[], NamedStyle]:
+    return lambda: NamedStyle(name=name, **attrs)
+
+
+# Общие стили выгрузок: регистрируются в книге при первом использовании
+STYLES = {
+    'export-title': _style('export-title', font=Font(bold=True, size=14)),
+    'export-subtitle': _style('export-subtitle', font=Font(bold=True, size=12), alignment=_CENTER),
+    'export-label': _style('export-label', font=Font(bold=True, size=12)),
+    'export-value': _style('export-value', font=Font(size=12)),
+    'export-value-bold': _style('export-value-bold', font=Font(bold=True, size=12)),
+    'export-header': _style('export-header', font=Font(bold=True, size=12), fill=_HEADER_FILL, alignment=_CENTER, border=_BORDER),
+    'export-header-light': _style('export-header-light', font=Font(bold=True, size=10, color="FFFFFF"), fill=_HEADER_FILL, alignment=_CENTER, border=_BORDER),
+    'export-cell': _style('export-cell', border=_BORDER),
+    'export-money': _style('export-money', border=_BORDER, number_format='#,##0.00'),
+    'export-date': _style('export-date', border=_BORDER, number_format='DD.MM.YYYY'),
+    'export-total': _style('export-total', font=Font(bold=True), border=_BORDER),
+    'export-total-right': _style('export-total-right', font=Font(bold=True), border=_BORDER, alignment=Alignment(horizontal="right")),
+}
+
+
+def new_workbook() -> Workbook:
+    return Workbook(write_only=True)
+
+
+def cell(ws, value, style: str = None) -> WriteOnlyCell:
+    """Ячейка листа write_only с именованным стилем книги."""
+    result = WriteOnlyCell(ws, value=value)
+    if style:
+        workbook = ws.parent
+        if style not in workbook.named_styles:
+            workbook.add_named_style(STYLES[style]())
+        result.style = style
+    return result
+
+
+def bordered(ws, values: Iterable, style: str = 'export-cell') -> list:
+    return [cell(ws, value, style) for value in values]
+
+
+def set_widths(ws, widths: Iterable[float]) -> None:
+    """Ширина столбцов A, B, ... (в режиме write_only — до первой строки)."""
+    for index, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+
+def save_to_tempfile(workbook: Workbook):
+    """Сохраняет книгу во временный файл на диске и возвращает его с начала."""
+    tmp = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(tmp)
+    tmp.seek(0)
+    return tmp
+
+
+def xlsx_response(workbook: Workbook, filename: str) -> FileResponse:
+    """Отдаёт книгу блоками из временного файла (закрывается после отправки)."""
+    return FileResponse(
+        save_to_tempfile(workbook),
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает готовую строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(rows: Iterable[Iterable], filename: str) -> StreamingHttpResponse:
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in rows),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ==================== Заявки ====================
+
+_REQUEST_STATUSES = {
+    'pending': 'Ожидает',
+    'approved': 'Одобрена',
+    'in_production': 'В производстве',
+    'rejected': 'Отклонена',
+}
+
+_GLASS_OPERATIONS = ['Распил', 'ЧПУ', 'Пескоструй', 'УФ печать']
+_REGULAR_OPERATIONS = ['Распил', 'ЧПУ', 'Пресс', 'Кромка', 'Шлифовка', 'Грунтовка', 'Покраска']
+
+# Число строк цеха в выгрузке по клиенту (по умолчанию — одна)
+_WORKSHOP_ROWS = {1: 3, 3: 2, 4: 2, 8: 2, 9: 6, 10: 2, 11: 2}
+
+
+def _requests_queryset(client_id=None):
+    from .models import Request
+
+    requests = Request.objects.select_related('client').prefetch_related('items__product').order_by('-created_at')
+    if client_id is not None:
+        requests = requests.filter(client_id=client_id)
+    return requests.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _request_heading(request_obj) -> str:
+    return f"Заказ №{request_obj.id}-{request_obj.name} {request_obj.created_at.strftime('%d/%m/%y')}"
+
+
+def add_one_to_size(size):
+    """Добавляет 1 к размеру до пресса (например, 80-200 -> 81-201)"""
+    if not size:
+        return size
+    try:
+        parts = size.split('-')
+        if len(parts) == 2:
+            return f"{int(parts[0]) + 1}-{int(parts[1]) + 1}"
+        # Если размер не в формате X-Y, возвращаем как есть
+        return size
+    except (ValueError, TypeError):
+        return size
+
+
+def write_request_block(sheet: 'RequestSheet', request_obj) -> None:
+    """Блок заявки: клиент, позиции с операциями, итоги и статус."""
+    ws = sheet.ws
+    client = request_obj.client
+
+    sheet.append([cell(ws, _request_heading(request_obj), 'export-title')], merge_to='E')
+    sheet.append([])
+    sheet.append([cell(ws, "Клиент:", 'export-label'), cell(ws, client.name, 'export-value')])
+    sheet.append([cell(ws, "Компания:", 'export-label'), cell(ws, client.company or "", 'export-value')])
+    sheet.append([cell(ws, "Телефон:", 'export-label'), cell(ws, client.phone or "", 'export-value')])
+    sheet.append([])
+    sheet.append(bordered(ws, ['№', 'Материал', 'Размер', 'Шт', 'Операции'], 'export-header'))
+
+    total_quantity = 0
+    for idx, item in enumerate(request_obj.items.all(), 1):
+        material = item.product.name
+        if item.glass_type:
+            material += f" ({item.glass_type})"
+        operations = _GLASS_OPERATIONS if item.product.is_glass else _REGULAR_OPERATIONS
+        total_quantity += item.quantity
+        sheet.append(bordered(ws, [idx, material, item.size or "", item.quantity, ", ".join(operations)]))
+
+    sheet.append([cell(ws, "Общий", 'export-total'), None, None, cell(ws, f"{total_quantity}шт", 'export-total')])
+    sheet.append([])
+    sheet.append([])
+    sheet.append([cell(ws, "Комментарий:", 'export-label'), cell(ws, request_obj.comment or "", 'export-value')])
+    sheet.append([cell(ws, "Общая сумма:", 'export-label'), cell(ws, f"{request_obj.total_amount or 0} сом", 'export-value-bold')])
+    sheet.append([
+        cell(ws, "Статус:", 'export-label'),
+        cell(ws, _REQUEST_STATUSES.get(request_obj.status, request_obj.status), 'export-value'),
+    ])
+
+
+def _client_item_row(workshop, workshop_row: int, item) -> list:
+    """Столбцы 3-6 строки цеха для позиции заявки (см. выгрузку по клиенту)."""
+    name = item.product.name
+    if workshop.id == 1 and workshop_row == 0:  # Распил: до пресса x2 и размер +1
+        return [name, add_one_to_size(item.size or "80-200"), item.quantity * 2, ""]
+    if workshop.id == 1 and workshop_row == 1:
+        return [f"{name} МДФ {item.size or '1,0'}", "", "", ""]
+    if workshop.id == 1 and workshop_row == 2:
+        return [f"{name} стекло", item.size or "30 40", "", ""]
+    if workshop.id == 3 and workshop_row == 0:  # Заготовка
+        return [f"{name} ГЛУХОЙ", add_one_to_size(item.size or "80-200"), item.quantity * 2, ""]
+    if workshop.id in (4, 10) and workshop_row == 0:  # Пресс и покраска: реальное количество
+        return [f"{name} ГЛУХОЙ", item.size or "80-200", item.quantity, ""]
+    if workshop.id in (8, 9) and workshop_row == 0:  # Грунтовка, шкурка
+        return ["", "", f"{item.quantity}шт", ""]
+    return ["", "", "", ""]
+
+
+def _setup_client_sheet(ws) -> None:
+    """Альбомная страница по ширине; заявки разделены разрывами страниц."""
+    ws.page_setup.orientation = 'landscape'
+    ws.page_setup.fitToHeight = 0
+    ws.page_setup.fitToWidth = 1
+    ws.page_setup.fitToPage = True
+    ws.page_margins.left = ws.page_margins.right = 0.3
+    ws.page_margins.top = ws.page_margins.bottom = 0.3
+    ws.page_margins.header = ws.page_margins.footer = 0.2
+
+
+def write_client_request_block(sheet: 'RequestSheet', request_obj, workshops) -> None:
+    """Блок заявки клиента: строки по цехам для каждой позиции."""
+    ws = sheet.ws
+    sheet.append([cell(ws, _request_heading(request_obj), 'export-subtitle')], merge_to='I')
+    sheet.append(bordered(ws, ['№', 'цеха', 'материал', 'размер', 'шт', '', '', '', ''], 'export-header-light'))
+
+    items = list(request_obj.items.all())
+    for workshop_num, workshop in enumerate(workshops, 1):
+        for item in items:
+            for workshop_row in range(_WORKSHOP_ROWS.get(workshop.id, 1)):
+                head = [workshop_num, workshop.name] if workshop_row == 0 else ["", ""]
+                sheet.append(bordered(ws, head + _client_item_row(workshop, workshop_row, item) + ["", "", ""]))
+
+    total = sum(item.quantity for item in items)
+    sheet.append(
+        [cell(ws, "общий", 'export-total-right')]
+        + bordered(ws, ["", "", "", "", ""])
+        + [cell(ws, f"{total}шт", 'export-total')]
+        + bordered(ws, ["", ""])
+    )
+
+
+class RequestSheet:
+    """
+    Лист «Заявки» write_only, в который заявки пишутся блоками строк.
+
+    У каждого листа write_only до сохранения книги открыт свой временный
+    файл, поэтому выгрузка не заводит лист на заявку: все заявки идут
+    подряд в один лист (с разрывом страницы после каждой), а новый лист
+    начинается, только когда строк больше MAX_SHEET_ROWS.
+    """
+    MAX_SHEET_ROWS = 1_000_000
+
+    def __init__(self, workbook: Workbook, widths, setup: Callable = None):
+        self.workbook = workbook
+        self.widths = widths
+        self.setup = setup
+        self.sheets = 0
+        self._new_sheet()
+
+    def _new_sheet(self) -> None:
+        self.sheets += 1
+        self.ws = self.workbook.create_sheet(title="Заявки" if self.sheets == 1 else f"Заявки {self.sheets}")
+        set_widths(self.ws, self.widths)
+        if self.setup:
+            self.setup(self.ws)
+        self.row = 0
+
+    def append(self, values, merge_to: str = None) -> None:
+        self.ws.append(values)
+        self.row += 1
+        if merge_to:
+            self.ws.merged_cells.add(f'A{self.row}:{merge_to}{self.row}')
+
+    def end_block(self) -> None:
+        """Пустая строка и разрыв страницы после заявки; новый лист при переполнении."""
+        self.ws.row_breaks.append(Break(id=self.row))
+        self.append([])
+        if self.row >= self.MAX_SHEET_ROWS:
+            self._new_sheet()
+
+
+def requests_export(client_id=None) -> Tuple[Workbook, str]:
+    """Все заявки (или заявки клиента) — блоками строк на листе «Заявки»."""
+    workbook = new_workbook()
+    sheet = RequestSheet(workbook, [8, 40, 15, 10, 50])
+    for request_obj in _requests_queryset(client_id):
+        write_request_block(sheet, request_obj)
+        sheet.end_block()
+    return workbook, f'заявки_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+
+def client_requests_export(client_id) -> Tuple[Workbook, str]:
+    """Заявки клиента в формате по цехам (цех ID 2 не выводится)."""
+    from apps.clients.models import Client
+    from apps.operations.workshops.models import Workshop
+
+    client = Client.objects.get(pk=client_id)
+    workshops = list(Workshop.objects.exclude(id=2).order_by('id'))
+    workbook = new_workbook()
+    sheet = RequestSheet(workbook, [8, 20, 35, 18, 12, 18, 15, 12, 12], setup=_setup_client_sheet)
+    for request_obj in _requests_queryset(client.pk):
+        write_client_request_block(sheet, request_obj, workshops)
+        sheet.end_block()
+    return workbook, f'заявки_{client.name}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+
+# ==================== Финансовый отчет ====================
+
+def report_summary_rows(report) -> list:
+    return [
+        ['Общий доход', report.total_income],
+        ['Общий расход', report.total_expenses],
+        ['Чистая прибыль', report.net_income],
+        ['Операционный доход', report.operating_income],
+        ['Общие активы', report.total_assets],
+    ]
+
+
+def financial_report_export(report_id) -> Tuple[Workbook, str]:
+    """Отчет: лист итогов и построчные листы доходов и расходов периода."""
+    from .models import Expense, FinancialReport, Income
+
+    report = FinancialReport.objects.get(pk=report_id)
+    report.calculate_totals()
+    period = [report.start_date, report.end_date]
+    workbook = new_workbook()
+
+    ws = workbook.create_sheet(title="Отчет")
+    set_widths(ws, [30, 20])
+    ws.append([cell(ws, report.title, 'export-title')])
+    ws.append([cell(ws, f"Период: {report.start_date} - {report.end_date}", 'export-value')])
+    ws.append([])
+    ws.append(bordered(ws, ['Показатель', 'Значение'], 'export-header'))
+    for label, value in report_summary_rows(report):
+        ws.append([cell(ws, label, 'export-cell'), cell(ws, value, 'export-money')])
+
+    ws = workbook.create_sheet(title="Доходы")
+    set_widths(ws, [12, 20, 15, 60])
+    ws.append(bordered(ws, ['Дата', 'Тип', 'Сумма', 'Описание'], 'export-header'))
+    for income in Income.objects.filter(date__range=period).order_by('-amount').iterator(chunk_size=2000):
+        ws.append([
+            cell(ws, income.date, 'export-date'),
+            cell(ws, income.get_income_type_display(), 'export-cell'),
+            cell(ws, income.amount, 'export-money'),
+            cell(ws, income.description, 'export-cell'),
+        ])
+
+    ws = workbook.create_sheet(title="Расходы")
+    set_widths(ws, [12, 25, 25, 15, 60])
+    ws.append(bordered(ws, ['Дата', 'Категория', 'Поставщик', 'Сумма', 'Описание'], 'export-header'))
+    expenses = (
+        Expense.objects.filter(date__range=period)
+        .select_related('category', 'supplier')
+        .order_by('-amount')
+    )
+    for expense in expenses.iterator(chunk_size=2000):
+        ws.append([
+            cell(ws, expense.date, 'export-date'),
+            cell(ws, expense.category.name if expense.category_id else '', 'export-cell'),
+            cell(ws, expense.supplier.name if expense.supplier_id else '', 'export-cell'),
+            cell(ws, expense.amount, 'export-money'),
+            cell(ws, expense.description, 'export-cell'),
+        ])
+    return workbook, f'financial_report_{report.pk}.xlsx'
+
+
+EXPORTS: Dict[str, Callable[..., Tuple[Workbook, str]]] = {
+    'requests': requests_export,
+    'client_requests': client_requests_export,
+    'financial_report': financial_report_export,
+}
+
+
+# ==================== Асинхронные выгрузки ====================
+
+def job_payload(job) -> dict:
+    return {
+        'id': str(job.pk),
+        'kind': job.kind,
+        'status': job.status,
+        'error': job.error,
+        'status_url': reverse('finance:export_job_status', args=[job.pk]),
+        'download_url': reverse('finance:export_job_download', args=[job.pk]) if job.status == job.Status.DONE else None,
+    }
+
+
+def start_export(kind: str, params: dict, user):
+    """Создаёт ExportJob и ставит сборку файла в очередь после коммита."""
+    from .models import ExportJob
+    from .tasks import build_export
+
+    job = ExportJob.objects.create(kind=kind, params=params, created_by=user)
+    transaction.on_commit(lambda: build_export.delay(str(job.pk)))
+    return job
+
+
+def run_export(job) -> None:
+    """Собирает файл выгрузки и сохраняет его в хранилище (для задачи build_export)."""
+    job.status = job.Status.RUNNING
+    job.save(update_fields=['status'])
+    try:
+        workbook, filename = EXPORTS[job.kind](**job.params)
+        with save_to_tempfile(workbook) as tmp:
+            job.file.save(f'{job.pk}.xlsx', File(tmp), save=False)
+    except Exception as e:
+        job.status = job.Status.FAILED
+        job.error = str(e)
+    else:
+        job.status = job.Status.DONE
+        job.filename = filename
+    job.finished_at = timezone.now()
+    job.save()
+
+
+def export_response(request, kind: str, **params):
+    """Файл выгрузки потоком, а при ?async=1 — задание ExportJob (202)."""
+    if request.GET.get('async') == '1':
+        job = start_export(kind, params, request.user)
+        return JsonResponse(job_payload(job), status=202)
+    workbook, filename = EXPORTS[kind](**params)
+    return xlsx_response(workbook, filename)
@@ -0,0 +1,206 @@
+"""
+Обороты и остатки по плану счетов.
+
+Обороты всех счетов считаются одним сгруппированным запросом к строкам
+проводок (входящие и за период — условной агрегацией), а итоги родительских
+счетов собираются из дочерних по parent в памяти.
+
+Входящий остаток берётся от последнего закрытого периода: при закрытии
+FinancialPeriod сохраняет нарастающие итоги по счетам
+(AccountBalanceSnapshot), и журнал читается только после даты его окончания.
+Проводки с датой в закрытом периоде запрещены (ClosedPeriodGuard), а при
+открытии периода остатки на закрытие его и более поздних периодов
+удаляются (FinancialPeriod.invalidate_snapshots).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.db.models import Exists, OuterRef, Q, Sum
+
+from .models import AccountBalanceSnapshot, AccountingAccount, FinancialPeriod, JournalEntryLine
+
+
+ZERO = Decimal('0.00')
+
+
+@dataclass
+class AccountTotals:
+    opening_debit: Decimal = ZERO
+    opening_credit: Decimal = ZERO
+    debit: Decimal = ZERO
+    credit: Decimal = ZERO
+
+    def add(self, other: 'AccountTotals') -> None:
+        self.opening_debit += other.opening_debit
+        self.opening_credit += other.opening_credit
+        self.debit += other.debit
+        self.credit += other.credit
+
+
+def side_balance(account, debit: Decimal, credit: Decimal) -> Decimal:
+    """Сальдо по нормальной стороне счета."""
+    if account.normal_side == AccountingAccount.DEBIT:
+        return debit - credit
+    return credit - debit
+
+
+def last_snapshot_period(before) -> Optional[FinancialPeriod]:
+    """
+    Последний закрытый период с сохранёнными остатками, окончившийся до before.
+
+    Остатки не берутся, если раньше их даты окончания начинается открытый
+    период, у которого ещё есть остатки (открыт в обход
+    FinancialPeriod.save): в них могли не попасть новые проводки.
+    """
+    reopened = FinancialPeriod.objects.filter(
+        is_closed=False, balance_snapshots__isnull=False, start_date__lte=OuterRef('end_date'),
+    )
+    return (
+        FinancialPeriod.objects
+        .filter(is_closed=True, end_date__lt=before, balance_snapshots__isnull=False)
+        .exclude(Exists(reopened))
+        .order_by('-end_date')
+        .first()
+    )
+
+
+def _snapshot_totals(period) -> Dict[int, AccountTotals]:
+    return {
+        account_id: AccountTotals(opening_debit=debit, opening_credit=credit)
+        for account_id, debit, credit in AccountBalanceSnapshot.objects
+        .filter(period=period)
+        .values_list('account_id', 'debit_total', 'credit_total')
+    }
+
+
+def account_totals(date_from=None, date_to=None) -> Dict[int, AccountTotals]:
+    """
+    Собственные (без дочерних) обороты счетов: {id счета: AccountTotals}.
+
+    Без date_from входящий остаток не считается, а все строки до date_to
+    идут в обороты — как в прежнем AccountingAccount.get_balance.
+    """
+    totals: Dict[int, AccountTotals] = defaultdict(AccountTotals)
+    lines = JournalEntryLine.objects.all()
+    if date_to:
+        lines = lines.filter(entry__date__lte=date_to)
+
+    if date_from:
+        base = last_snapshot_period(date_from)
+        if base is not None:
+            totals.update(_snapshot_totals(base))
+            lines = lines.filter(entry__date__gt=base.end_date)
+        before = Q(entry__date__lt=date_from)
+        within = Q(entry__date__gte=date_from)
+        rows = lines.values('account_id').annotate(
+            od=Sum('debit', filter=before),
+            oc=Sum('credit', filter=before),
+            d=Sum('debit', filter=within),
+            c=Sum('credit', filter=within),
+        ).values_list('account_id', 'od', 'oc', 'd', 'c')
+    else:
+        rows = lines.values('account_id').annotate(
+            d=Sum('debit'),
+            c=Sum('credit'),
+        ).values_list('account_id', 'd', 'c')
+        rows = ((account_id, None, None, debit, credit) for account_id, debit, credit in rows)
+
+    for account_id, opening_debit, opening_credit, debit, credit in rows:
+        totals[account_id].add(AccountTotals(
+            opening_debit=opening_debit or ZERO,
+            opening_credit=opening_credit or ZERO,
+            debit=debit or ZERO,
+            credit=credit or ZERO,
+        ))
+    return totals
+
+
+def roll_up(accounts, totals: Dict[int, AccountTotals]) -> Dict[int, AccountTotals]:
+    """Итоги счетов вместе со всеми дочерними (по цепочке parent)."""
+    parents = {account.pk: account.parent_id for account in accounts}
+    rolled: Dict[int, AccountTotals] = defaultdict(AccountTotals)
+    for account_id, own in totals.items():
+        seen = set()
+        current = account_id
+        while current is not None and current not in seen:
+            seen.add(current)
+            rolled[current].add(own)
+            current = parents.get(current)
+    return rolled
+
+
+def trial_balance(date_from=None, date_to=None) -> Dict[str, object]:
+    """
+    Оборотно-сальдовая ведомость по всем счетам.
+
+    Строки содержат итоги счета с дочерними; итоговые обороты считаются по
+    собственным оборотам, чтобы родительские счета не учитывались дважды.
+    """
+    accounts = list(AccountingAccount.objects.select_related('parent').order_by('code'))
+    own = account_totals(date_from, date_to)
+    rolled = roll_up(accounts, own)
+
+    rows = []
+    for account in accounts:
+        t = rolled.get(account.pk) or AccountTotals()
+        opening = side_balance(account, t.opening_debit, t.opening_credit)
+        rows.append({
+            'account': account,
+            'opening_balance': opening,
+            'debit_turnover': t.debit,
+            'credit_turnover': t.credit,
+            'closing_balance': opening + side_balance(account, t.debit, t.credit),
+        })
+    return {
+        'rows': rows,
+        'total_debit': sum((t.debit for t in own.values()), ZERO),
+        'total_credit': sum((t.credit for t in own.values()), ZERO),
+    }
+
+
+def snapshot_period_balances(period) -> List[AccountBalanceSnapshot]:
+    """
+    Сохраняет нарастающие обороты всех счетов на дату окончания периода.
+
+    Строки пишутся для каждого счета (в том числе нулевые), чтобы наличие
+    снимка означало полный набор остатков.
+    """
+    base = last_snapshot_period(period.end_date)
+    totals = _snapshot_totals(base) if base is not None else {}
+    lines = JournalEntryLine.objects.filter(entry__date__lte=period.end_date)
+    if base is not None:
+        lines = lines.filter(entry__date__gt=base.end_date)
+    for account_id, debit, credit in (
+        lines.values('account_id').annotate(d=Sum('debit'), c=Sum('credit')).values_list('account_id', 'd', 'c')
+    ):
+        entry = totals.setdefault(account_id, AccountTotals())
+        entry.opening_debit += debit or ZERO
+        entry.opening_credit += credit or ZERO
+
+    AccountBalanceSnapshot.objects.filter(period=period).delete()
+    snapshots = []
+    for account_id in AccountingAccount.objects.values_list('pk', flat=True):
+        entry = totals.get(account_id) or AccountTotals()
+        snapshots.append(AccountBalanceSnapshot(
+            period=period,
+            account_id=account_id,
+            debit_total=entry.opening_debit,
+            credit_total=entry.opening_credit,
+        ))
+    return AccountBalanceSnapshot.objects.bulk_create(snapshots)
+
+
+def rebuild_period_balances(since) -> int:
+    """
+    Пересчитывает остатки на закрытие всех закрытых периодов, окончившихся
+    не раньше since (по порядку дат: каждый опирается на предыдущий).
+    Возвращает число периодов.
+    """
+    periods = list(FinancialPeriod.objects.filter(is_closed=True, end_date__gte=since).order_by('end_date'))
+    for period in periods:
+        snapshot_period_balances(period)
+    return len(periods)
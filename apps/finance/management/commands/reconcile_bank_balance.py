@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.finance.bank import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет баланс основного счета с журналом проводок и выравнивает его по журналу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождение, не исправляя баланс',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Сверка баланса основного счета с журналом...')
+
+        result = reconcile(fix=not options['dry_run'])
+
+        self.stdout.write(f"Баланс счета: {result['stored']} сом, по журналу: {result['ledger']} сом")
+        self.stdout.write(
+            self.style.SUCCESS(f"Готово. Расхождение: {result['difference']} сом")
+        )
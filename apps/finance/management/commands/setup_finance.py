@@ -10,6 +10,7 @@ from apps.finance.models import (
     ExpenseCategory, Supplier, SupplierItem, MainBankAccount, 
     MoneyMovement, Expense, Income, FactoryAsset, FinancialReport
 )
+from apps.finance.bank import adjust_to
 
 class Command(BaseCommand):
     help = 'Первоначальная настройка финансовой системы'
@@ -50,10 +51,9 @@ class Command(BaseCommand):
         account = MainBankAccount.get_main_account()
         
         if account.balance == 0:
-            # Устанавливаем начальный баланс
-            account.balance = Decimal('1000000.00')
-            account.description = 'Основной банковский счет предприятия'
-            account.save()
+            # Устанавливаем начальный баланс корректирующей проводкой журнала счета
+            adjust_to(Decimal('1000000.00'), date.today(), comment='Начальный остаток')
+            account.refresh_from_db()
             self.stdout.write(f'  ✓ Создан основной счет с балансом: {account.balance} {account.currency}')
         else:
             self.stdout.write(f'  - Основной счет уже существует с балансом: {account.balance} {account.currency}')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_add_debt_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Дебет нарастающим итогом')),
+                ('credit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Кредит нарастающим итогом')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='finance.accountingaccount', verbose_name='Счет')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='finance.financialperiod', verbose_name='Период')),
+            ],
+            options={
+                'verbose_name': 'Остаток счета на закрытие периода',
+                'verbose_name_plural': 'Остатки счетов на закрытие периодов',
+                'unique_together': {('period', 'account')},
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-18 15:55
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_ledger(apps, schema_editor):
+    """
+    Переносит в журнал уже проведённые документы, а разницу с текущим
+    балансом счета — начальной корректировкой на дату первого документа.
+    """
+    MainBankAccount = apps.get_model('finance', 'MainBankAccount')
+    BankLedgerEntry = apps.get_model('finance', 'BankLedgerEntry')
+    account = MainBankAccount.objects.filter(pk=1).first()
+    if account is None:
+        return
+
+    entries = []
+    for movement in apps.get_model('finance', 'MoneyMovement').objects.all():
+        amount = movement.amount if movement.movement_type == 'deposit' else -movement.amount
+        entries.append(BankLedgerEntry(account=account, source='movement', source_id=movement.pk, amount=amount, date=timezone.localdate(movement.date)))
+    for expense in apps.get_model('finance', 'Expense').objects.all():
+        entries.append(BankLedgerEntry(account=account, source='expense', source_id=expense.pk, amount=-expense.amount, date=expense.date))
+    for income in apps.get_model('finance', 'Income').objects.all():
+        entries.append(BankLedgerEntry(account=account, source='income', source_id=income.pk, amount=income.amount, date=income.date))
+    for payment in apps.get_model('finance', 'DebtPayment').objects.select_related('debt'):
+        amount = -payment.amount if payment.debt.direction == 'payable' else payment.amount
+        entries.append(BankLedgerEntry(account=account, source='debt_payment', source_id=payment.pk, amount=amount, date=payment.date))
+
+    opening = account.balance - sum((entry.amount for entry in entries), Decimal('0.00'))
+    if opening:
+        first_date = min((entry.date for entry in entries), default=timezone.localdate())
+        entries.insert(0, BankLedgerEntry(account=account, source='adjustment', amount=opening, date=first_date, comment='Начальный остаток'))
+    BankLedgerEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_account_balance_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('movement', 'Движение денег'), ('expense', 'Расход'), ('income', 'Доход'), ('debt_payment', 'Оплата долга'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Источник')),
+                ('source_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID документа')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Сумма (сом)')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('comment', models.CharField(blank=True, max_length=255, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='finance.mainbankaccount', verbose_name='Счет')),
+            ],
+            options={
+                'verbose_name': 'Проводка по основному счету',
+                'verbose_name_plural': 'Журнал основного счета',
+                'ordering': ['-date', '-id'],
+                'indexes': [models.Index(fields=['account', 'date'], name='bank_entry_account_date_idx'), models.Index(fields=['source', 'source_id'], name='bank_entry_source_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
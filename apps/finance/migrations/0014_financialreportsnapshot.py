@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinancialReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Дата начала')),
+                ('end_date', models.DateField(verbose_name='Дата окончания')),
+                ('total_income', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Общий доход')),
+                ('total_expenses', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Общий расход')),
+                ('net_income', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Чистый доход')),
+                ('operating_income', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Операционный доход')),
+                ('total_assets', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Общая стоимость активов')),
+                ('breakdown', models.JSONField(default=dict, verbose_name='Разбивки и дневные ряды')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_snapshots', to='finance.financialperiod', verbose_name='Период')),
+            ],
+            options={
+                'verbose_name': 'Снимок финансового отчета',
+                'verbose_name_plural': 'Снимки финансовых отчетов',
+                'ordering': ['-end_date', '-start_date'],
+                'unique_together': {('start_date', 'end_date')},
+            },
+        ),
+    ]
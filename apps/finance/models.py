@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 import uuid
@@ -100,6 +101,95 @@ class MainBankAccount(models.Model):
         )
         return account
 
+
+# Журнал движения баланса основного счета (только добавление)
+class BankLedgerEntry(models.Model):
+    """
+    Неизменяемая проводка по основному счету: сумма со знаком (+ приход, − расход).
+
+    Баланс MainBankAccount — сумма всех проводок; он меняется атомарной
+    дельтой F() при проводке (bank.post), остаток на любую дату — сумма
+    проводок по эту дату (bank.balance_as_of).
+    """
+    SOURCES = [
+        ('movement', 'Движение денег'),
+        ('expense', 'Расход'),
+        ('income', 'Доход'),
+        ('debt_payment', 'Оплата долга'),
+        ('adjustment', 'Корректировка'),
+    ]
+
+    account = models.ForeignKey(MainBankAccount, on_delete=models.PROTECT, related_name='entries', verbose_name="Счет")
+    source = models.CharField(max_length=20, choices=SOURCES, verbose_name="Источник")
+    source_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="ID документа")
+    amount = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Сумма (сом)")
+    date = models.DateField(verbose_name="Дата")
+    comment = models.CharField(max_length=255, blank=True, verbose_name="Комментарий")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Проводка по основному счету"
+        verbose_name_plural = "Журнал основного счета"
+        ordering = ['-date', '-id']
+        indexes = [
+            models.Index(fields=['account', 'date'], name='bank_entry_account_date_idx'),
+            models.Index(fields=['source', 'source_id'], name='bank_entry_source_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()} {self.amount:+} сом - {self.date}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Проводки журнала основного счета не изменяются — создайте корректировку")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Проводки журнала основного счета не удаляются — создайте корректировку")
+
+class ClosedPeriodGuard:
+    """
+    Запрет изменений документов в закрытых финансовых периодах.
+
+    Документ с датой внутри закрытого периода нельзя создать, изменить
+    (в том числе перенести из закрытого периода в открытый) или удалить:
+    снимки показателей закрытого периода остались бы неверными. В формах
+    ошибка выводится у поля даты (clean), вне форм — ValidationError из
+    save/delete.
+    """
+    period_date_field = 'date'
+    # Поле формы для ошибки (NON_FIELD_ERRORS — если даты в форме нет)
+    period_error_field = None
+
+    def _period_dates(self):
+        dates = [getattr(self, self.period_date_field, None)]
+        if self.pk:
+            dates.append(
+                type(self)._default_manager.filter(pk=self.pk)
+                .values_list(self.period_date_field, flat=True).first()
+            )
+        return [value for value in dates if value]
+
+    def check_period_open(self):
+        period = FinancialPeriod.closed_for_dates(self._period_dates())
+        if period is not None:
+            raise ValidationError({
+                self.period_error_field or self.period_date_field: f"Финансовый период «{period.name}» ({period.start_date} - {period.end_date}) закрыт",
+            })
+
+    def clean(self):
+        super().clean()
+        self.check_period_open()
+
+    def save(self, *args, **kwargs):
+        self.check_period_open()
+        return super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.check_period_open()
+        return super().delete(*args, **kwargs)
+
+
 # Движение денег
 class MoneyMovement(models.Model):
     MOVEMENT_TYPES = [
@@ -122,17 +212,17 @@ class MoneyMovement(models.Model):
         return f"{self.get_movement_type_display()} - {self.amount} сом - {self.date.strftime('%d.%m.%Y')}"
     
     def save(self, *args, **kwargs):
-        if not self.pk:  # Только при создании
-            account = MainBankAccount.get_main_account()
-            if self.movement_type == 'deposit':
-                account.balance += self.amount
-            else:
-                account.balance -= self.amount
-            account.save()
-        super().save(*args, **kwargs)
+        from .bank import post
+
+        if self.pk:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():  # Только при создании: проводка по основному счету
+            super().save(*args, **kwargs)
+            amount = self.amount if self.movement_type == 'deposit' else -self.amount
+            post(amount, 'movement', timezone.localdate(self.date), source_id=self.pk)
 
 # Расходы
-class Expense(models.Model):
+class Expense(ClosedPeriodGuard, models.Model):
     category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE, verbose_name="Категория")
     amount = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Сумма (сом)")
     description = models.TextField(verbose_name="Описание")
@@ -152,14 +242,16 @@ class Expense(models.Model):
         return f"{self.category.name} - {self.amount} сом - {self.date}"
     
     def save(self, *args, **kwargs):
-        if not self.pk:  # Только при создании
-            account = MainBankAccount.get_main_account()
-            account.balance -= self.amount  # Расход уменьшает баланс
-            account.save()
-        super().save(*args, **kwargs)
+        from .bank import post
+
+        if self.pk:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():  # Только при создании: расход уменьшает баланс
+            super().save(*args, **kwargs)
+            post(-self.amount, 'expense', self.date, source_id=self.pk)
 
 # Доходы
-class Income(models.Model):
+class Income(ClosedPeriodGuard, models.Model):
     INCOME_TYPES = [
         ('sales', 'С продаж'),
         ('other', 'Другое'),
@@ -182,11 +274,13 @@ class Income(models.Model):
         return f"{self.get_income_type_display()} - {self.amount} сом - {self.date}"
     
     def save(self, *args, **kwargs):
-        if not self.pk:  # Только при создании
-            account = MainBankAccount.get_main_account()
-            account.balance += self.amount  # Доход увеличивает баланс
-            account.save()
-        super().save(*args, **kwargs)
+        from .bank import post
+
+        if self.pk:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():  # Только при создании: доход увеличивает баланс
+            super().save(*args, **kwargs)
+            post(self.amount, 'income', self.date, source_id=self.pk)
 
 # Система долгов
 class Debt(models.Model):
@@ -246,20 +340,18 @@ class DebtPayment(models.Model):
         return f"Оплата {self.amount} сом по: {self.debt.title}"
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
+        from .bank import post
+
+        if self.pk:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
             # Обновляем сумму оплат по долгу
             Debt.objects.filter(pk=self.debt_id).update(amount_paid=models.F('amount_paid') + self.amount)
-            # Двигаем баланс основного счета
-            account = MainBankAccount.get_main_account()
-            if self.debt.direction == 'payable':
-                # Платим поставщику -> уменьшаем баланс
-                account.balance -= self.amount
-            else:
-                # Получили оплату от клиента -> увеличиваем баланс
-                account.balance += self.amount
-            account.save()
+            # Двигаем баланс основного счета: платим поставщику -> уменьшаем,
+            # получили оплату от клиента -> увеличиваем
+            amount = -self.amount if self.debt.direction == 'payable' else self.amount
+            post(amount, 'debt_payment', self.date, source_id=self.pk)
 
 # Состояние имущества завода
 class FactoryAsset(models.Model):
@@ -322,27 +414,24 @@ class FinancialReport(models.Model):
         return f"{self.title} ({self.start_date} - {self.end_date})"
     
     def calculate_totals(self):
-        """Расчет всех показателей отчета"""
-        # Доходы за период
-        incomes = Income.objects.filter(date__range=[self.start_date, self.end_date])
-        self.total_income = sum(income.amount for income in incomes)
-        
-        # Расходы за период
-        expenses = Expense.objects.filter(date__range=[self.start_date, self.end_date])
-        self.total_expenses = sum(expense.amount for expense in expenses)
-        
-        # Чистый доход
-        self.net_income = self.total_income - self.total_expenses
-        
-        # Операционный доход (доходы от продаж минус расходы)
-        sales_income = sum(income.amount for income in incomes if income.income_type == 'sales')
-        self.operating_income = sales_income - self.total_expenses
-        
-        # Общая стоимость активов
-        assets = FactoryAsset.objects.filter(is_active=True)
-        self.total_assets = sum(asset.current_value for asset in assets)
-        
-        self.save()
+        """
+        Расчет всех показателей отчета.
+
+        Показатели считаются сгруппированными агрегатами в БД, а для дат
+        внутри закрытого финансового периода берутся из неизменяемого
+        снимка (см. reports.report_figures). Отчет сохраняется, только
+        если показатели изменились.
+        """
+        from .reports import TOTAL_FIELDS, report_figures
+
+        figures = report_figures(self.start_date, self.end_date)
+        changed = [field for field in TOTAL_FIELDS if getattr(self, field) != figures[field]]
+        for field in changed:
+            setattr(self, field, figures[field])
+        if self.pk is None:
+            self.save()
+        elif changed:
+            self.save(update_fields=changed)
 
 
 # ====== ДВОЙНАЯ ЗАПИСЬ (ДЕБЕТ/КРЕДИТ), ПЛАН СЧЕТОВ, ЖУРНАЛ ======
@@ -407,7 +496,7 @@ class AccountingAccount(models.Model):
         }
 
 
-class JournalEntry(models.Model):
+class JournalEntry(ClosedPeriodGuard, models.Model):
     """Хозяйственная операция (проводка), объединяющая строки Дт/Кт."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     date = models.DateField(verbose_name="Дата")
@@ -431,7 +520,7 @@ class JournalEntry(models.Model):
         return self.lines.aggregate(s=models.Sum('credit'))['s'] or Decimal('0.00')
 
 
-class JournalEntryLine(models.Model):
+class JournalEntryLine(ClosedPeriodGuard, models.Model):
     """Строка проводки: дебет/кредит конкретного счета."""
     entry = models.ForeignKey(JournalEntry, on_delete=models.CASCADE, related_name='lines', verbose_name="Операция")
     account = models.ForeignKey(AccountingAccount, on_delete=models.PROTECT, verbose_name="Счет")
@@ -444,15 +533,27 @@ class JournalEntryLine(models.Model):
         verbose_name = "Строка проводки"
         verbose_name_plural = "Строки проводок"
 
+    period_error_field = NON_FIELD_ERRORS
+
     def __str__(self):
         return f"{self.account.code}: Дт {self.debit} Кт {self.credit}"
 
+    def _period_dates(self):
+        """Дата операции строки (и прежней операции, если строку переносят)."""
+        entry_ids = {self.entry_id}
+        if self.pk:
+            entry_ids.add(JournalEntryLine.objects.filter(pk=self.pk).values_list('entry_id', flat=True).first())
+        entry_ids.discard(None)
+        if not entry_ids:
+            return []
+        return list(JournalEntry.objects.filter(pk__in=entry_ids).values_list('date', flat=True))
+
     def clean(self):
-        from django.core.exceptions import ValidationError
         if (self.debit and self.debit > 0) and (self.credit and self.credit > 0):
             raise ValidationError("Нельзя указывать одновременно дебет и кредит в одной строке")
         if (not self.debit or self.debit == 0) and (not self.credit or self.credit == 0):
             raise ValidationError("Нужно заполнить дебет или кредит")
+        super().clean()
 
 
 def create_simple_entry(date, debit_account: AccountingAccount, credit_account: AccountingAccount, amount: Decimal, memo: str = "", user=None) -> JournalEntry:
@@ -589,14 +690,73 @@ class FinancialPeriod(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.start_date} - {self.end_date})"
+
+    @classmethod
+    def closed_for_dates(cls, dates):
+        """Закрытый период, в который попадает хотя бы одна из дат (или None)."""
+        condition = models.Q()
+        for value in dates:
+            condition |= models.Q(start_date__lte=value, end_date__gte=value)
+        if not condition:
+            return None
+        return cls.objects.filter(condition, is_closed=True).order_by('start_date').first()
+
+    def save(self, *args, **kwargs):
+        """
+        При открытии закрытого периода или изменении его дат снимки
+        показателей периода удаляются: они считаются заново после
+        повторного закрытия (или при первом расчёте, если период закрыт).
+        """
+        previous = None
+        if self.pk:
+            previous = FinancialPeriod.objects.filter(pk=self.pk).values('is_closed', 'start_date', 'end_date').first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous and previous['is_closed'] and (
+                not self.is_closed
+                or (previous['start_date'], previous['end_date']) != (self.start_date, self.end_date)
+            ):
+                self.invalidate_snapshots()
+
+    def invalidate_snapshots(self):
+        """
+        Удаляет снимки показателей финансовых отчетов периода и остатки
+        счетов на закрытие этого и всех более поздних периодов (остатки —
+        нарастающие итоги, в них входят обороты этого периода).
+        """
+        self.report_snapshots.all().delete()
+        AccountBalanceSnapshot.objects.filter(period__end_date__gte=self.start_date).delete()
+
+    def reopen_period(self):
+        """Открытие ранее закрытого периода (снимки удаляются, см. save)."""
+        if self.is_closed:
+            self.is_closed = False
+            self.closed_at = None
+            self.closed_by = None
+            self.save()
     
     def close_period(self, user):
-        """Закрытие финансового периода."""
+        """
+        Закрытие финансового периода.
+
+        Вместе с закрытием сохраняются нарастающие итоги по всем счетам на
+        дату окончания периода (AccountBalanceSnapshot), от которых
+        отчёты считают остатки без чтения журнала до этой даты, и снимки
+        показателей финансовых отчетов периода (FinancialReportSnapshot).
+        Остатки более поздних закрытых периодов пересчитываются: после
+        повторного закрытия в них входят обороты этого периода.
+        """
+        from .ledger import rebuild_period_balances
+        from .reports import snapshot_period_reports
+
         if not self.is_closed:
-            self.is_closed = True
-            self.closed_at = timezone.now()
-            self.closed_by = user
-            self.save()
+            with transaction.atomic():
+                self.is_closed = True
+                self.closed_at = timezone.now()
+                self.closed_by = user
+                self.save()
+                rebuild_period_balances(self.start_date)
+                snapshot_period_reports(self)
     
     def get_period_entries(self):
         """Получение всех операций за период."""
@@ -605,6 +765,93 @@ class FinancialPeriod(models.Model):
             posted=True
         )
 
+
+class AccountBalanceSnapshot(models.Model):
+    """Нарастающие обороты по счету на дату окончания закрытого периода."""
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE, related_name='balance_snapshots', verbose_name="Период")
+    account = models.ForeignKey(AccountingAccount, on_delete=models.CASCADE, related_name='balance_snapshots', verbose_name="Счет")
+    debit_total = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name="Дебет нарастающим итогом")
+    credit_total = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name="Кредит нарастающим итогом")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Остаток счета на закрытие периода"
+        verbose_name_plural = "Остатки счетов на закрытие периодов"
+        unique_together = ['period', 'account']
+
+    def __str__(self):
+        return f"{self.period.name}: {self.account.code}"
+
+
+class FinancialReportSnapshot(models.Model):
+    """
+    Неизменяемые показатели финансового отчета за даты внутри закрытого периода.
+
+    Итоги хранятся полями, разбивки по типам доходов и категориям
+    расходов и дневные ряды — в breakdown (суммы строками, даты в ISO).
+    """
+    BREAKDOWN_KEYS = ('income_by_type', 'expense_by_category', 'daily_income', 'daily_expenses')
+
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE, related_name='report_snapshots', verbose_name="Период")
+    start_date = models.DateField(verbose_name="Дата начала")
+    end_date = models.DateField(verbose_name="Дата окончания")
+    total_income = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Общий доход")
+    total_expenses = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Общий расход")
+    net_income = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Чистый доход")
+    operating_income = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Операционный доход")
+    total_assets = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Общая стоимость активов")
+    breakdown = models.JSONField(default=dict, verbose_name="Разбивки и дневные ряды")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Снимок финансового отчета"
+        verbose_name_plural = "Снимки финансовых отчетов"
+        unique_together = ['start_date', 'end_date']
+        ordering = ['-end_date', '-start_date']
+
+    def __str__(self):
+        return f"{self.period.name}: {self.start_date} - {self.end_date}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Снимки показателей закрытых периодов не изменяются")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def encode_breakdown(cls, figures):
+        """Разбивки показателей в JSON: Decimal — строкой, дата — в ISO."""
+        def encode(value):
+            if isinstance(value, Decimal):
+                return str(value)
+            if hasattr(value, 'isoformat'):
+                return value.isoformat()
+            return value
+
+        return {
+            key: [{name: encode(value) for name, value in row.items()} for row in figures[key]]
+            for key in cls.BREAKDOWN_KEYS
+        }
+
+    def figures(self):
+        """Показатели снимка в том же виде, что reports.compute_figures."""
+        from datetime import date
+
+        def decode(row):
+            row = dict(row)
+            row['total'] = Decimal(row['total'])
+            if 'date' in row:
+                row['date'] = date.fromisoformat(row['date'])
+            return row
+
+        result = {
+            field: getattr(self, field)
+            for field in ('total_income', 'total_expenses', 'net_income', 'operating_income', 'total_assets')
+        }
+        for key in self.BREAKDOWN_KEYS:
+            result[key] = [decode(row) for row in self.breakdown.get(key, [])]
+        return result
+
+
 class Request(models.Model):
     """Модель для заявок от бухгалтера к администратору"""
     STATUS_CHOICES = [
@@ -639,43 +886,37 @@ class Request(models.Model):
     
     def approve_and_create_order(self, admin_user):
         """Одобряет заявку и создает заказ"""
-        from apps.orders.models import Order, OrderItem, create_order_stages
+        from apps.orders.ingestion import ITEM_FIELDS, create_order
         
         if self.status != 'pending':
             return False, "Заявка уже не в статусе ожидания"
         
-        # Создаем заказ
-        order = Order.objects.create(
-            name=self.name,
-            client=self.client,
-            status='production',
-            comment=self.comment
-        )
+        # Позиции заявки уже содержат товары — повторно их не загружаем
+        request_items = list(self.items.select_related('product'))
+        items_data = [
+            {
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                **{field: getattr(item, field) for field in ITEM_FIELDS},
+            }
+            for item in request_items
+        ]
+        products = {item.product_id: item.product for item in request_items}
         
-        # Создаем позиции заказа из заявки
-        for item in self.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                size=item.size,
-                color=item.color,
-                glass_type=item.glass_type,
-                paint_type=item.paint_type,
-                paint_color=item.paint_color,
-                cnc_specs=item.cnc_specs,
-                cutting_specs=item.cutting_specs,
-                preparation_specs=item.preparation_specs,
-                packaging_notes=item.packaging_notes
+        with transaction.atomic():
+            # Заказ, позиции и этапы создаются вместе
+            order = create_order(
+                self.name,
+                self.client,
+                items_data,
+                comment=self.comment,
+                products=products,
             )
-        
-        # Создаем этапы заказа
-        create_order_stages(order)
-        
-        # Обновляем статус заявки
-        self.status = 'in_production'
-        self.order = order
-        self.save()
+            
+            # Обновляем статус заявки
+            self.status = 'in_production'
+            self.order = order
+            self.save()
         
         return True, f"Заявка одобрена, создан заказ #{order.id}"
 
@@ -735,3 +976,39 @@ class RequestItem(models.Model):
         except:
             pass
         super().save(*args, **kwargs)
+
+
+
+class ExportJob(models.Model):
+    """Асинхронная выгрузка (см. exports.py): файл собирается задачей и скачивается позже"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Формируется'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField('Выгрузка', max_length=50)
+    params = models.JSONField('Параметры', default=dict, blank=True)
+    status = models.CharField('Статус', max_length=20, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField('Файл', upload_to='exports/%Y/%m/', blank=True)
+    filename = models.CharField('Имя файла', max_length=255, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs', verbose_name='Создал')
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} [{self.get_status_display()}]"
+
+# Сброс кэша сводки финансового дашборда (views._dashboard_totals)
+from core.caching import invalidate_on
+
+FINANCE_DASHBOARD_CACHE = 'finance-dashboard'
+
+invalidate_on(FINANCE_DASHBOARD_CACHE, MainBankAccount, BankLedgerEntry, MoneyMovement, Income, Expense, FactoryAsset)
@@ -0,0 +1,159 @@
+"""
+Показатели финансовых отчетов.
+
+Доходы и расходы периода читаются одним сгруппированным запросом каждый
+(тип дохода / категория расхода × дата): из этих строк в памяти
+собираются итоги, разбивки по типам и категориям и дневные ряды.
+Стоимость активов — один SUM.
+
+Для периодов, закрытых в FinancialPeriod, показатели сохраняются
+неизменяемым снимком FinancialReportSnapshot (по датам отчета) — при
+закрытии периода или при первом расчёте после закрытия — и дальше
+читаются только из снимка: отчеты и выгрузки прошлых периодов не
+пересчитываются. Доходы и расходы с датой в закрытом периоде не
+создаются и не меняются (ClosedPeriodGuard), а при открытии периода его
+снимки удаляются (FinancialPeriod.save).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.db.models import Count, Q, Sum
+
+from .models import (
+    Expense, FactoryAsset, FinancialPeriod, FinancialReport, FinancialReportSnapshot, Income,
+)
+
+ZERO = Decimal('0.00')
+
+TOTAL_FIELDS = ('total_income', 'total_expenses', 'net_income', 'operating_income', 'total_assets')
+
+
+def _as_date(value) -> date:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _breakdown(rows, key: str):
+    """Итог, разбивка по key и дневной ряд из строк (key, date, total, cnt)."""
+    total = ZERO
+    groups = defaultdict(lambda: {'total': ZERO, 'cnt': 0})
+    daily = defaultdict(lambda: ZERO)
+    for row in rows:
+        amount = row['total'] or ZERO
+        total += amount
+        groups[row[key]]['total'] += amount
+        groups[row[key]]['cnt'] += row['cnt']
+        daily[row['date']] += amount
+    by_key = sorted(
+        ({key: name, 'total': group['total'], 'cnt': group['cnt']} for name, group in groups.items()),
+        key=lambda row: -row['total'],
+    )
+    series = [{'date': day, 'total': daily[day]} for day in sorted(daily)]
+    return total, by_key, series
+
+
+def compute_figures(start_date, end_date) -> Dict[str, object]:
+    """Показатели периода по сгруппированным агрегатам (три запроса)."""
+    period = [_as_date(start_date), _as_date(end_date)]
+    income_rows = (
+        Income.objects.filter(date__range=period)
+        .values('income_type', 'date')
+        .annotate(total=Sum('amount'), cnt=Count('id'))
+        .order_by()
+    )
+    expense_rows = (
+        Expense.objects.filter(date__range=period)
+        .values('category__name', 'date')
+        .annotate(total=Sum('amount'), cnt=Count('id'))
+        .order_by()
+    )
+    total_income, income_by_type, daily_income = _breakdown(income_rows, 'income_type')
+    total_expenses, expense_by_category, daily_expenses = _breakdown(expense_rows, 'category__name')
+    sales_income = sum((row['total'] for row in income_by_type if row['income_type'] == 'sales'), ZERO)
+    total_assets = FactoryAsset.objects.aggregate(
+        total=Sum('current_value', filter=Q(is_active=True))
+    )['total'] or ZERO
+
+    return {
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_income': total_income - total_expenses,
+        # Операционный доход (доходы от продаж минус расходы)
+        'operating_income': sales_income - total_expenses,
+        'total_assets': total_assets,
+        'income_by_type': income_by_type,
+        'expense_by_category': expense_by_category,
+        'daily_income': daily_income,
+        'daily_expenses': daily_expenses,
+    }
+
+
+def closed_period_for(start_date, end_date) -> Optional[FinancialPeriod]:
+    """Закрытый период, целиком содержащий даты отчета."""
+    return (
+        FinancialPeriod.objects
+        .filter(is_closed=True, start_date__lte=_as_date(start_date), end_date__gte=_as_date(end_date))
+        .order_by('end_date')
+        .first()
+    )
+
+
+def store_snapshot(period, start_date, end_date, figures) -> FinancialReportSnapshot:
+    """Сохраняет снимок показателей (существующий снимок не перезаписывается)."""
+    snapshot, _ = FinancialReportSnapshot.objects.get_or_create(
+        start_date=_as_date(start_date),
+        end_date=_as_date(end_date),
+        defaults={
+            'period': period,
+            **{field: figures[field] for field in TOTAL_FIELDS},
+            'breakdown': FinancialReportSnapshot.encode_breakdown(figures),
+        },
+    )
+    return snapshot
+
+
+def report_figures(start_date, end_date) -> Dict[str, object]:
+    """
+    Показатели отчета за даты: из снимка, если он есть, иначе — расчёт.
+
+    Расчёт для дат внутри закрытого периода сохраняется снимком; снимок
+    открытого периода не используется и удаляется.
+    """
+    snapshot = FinancialReportSnapshot.objects.select_related('period').filter(
+        start_date=_as_date(start_date), end_date=_as_date(end_date),
+    ).first()
+    if snapshot is not None:
+        if snapshot.period.is_closed:
+            return snapshot.figures()
+        # Период открыт в обход FinancialPeriod.save — снимок устарел
+        snapshot.delete()
+    figures = compute_figures(start_date, end_date)
+    period = closed_period_for(start_date, end_date)
+    if period is not None:
+        store_snapshot(period, start_date, end_date, figures)
+    return figures
+
+
+def snapshot_period_reports(period) -> int:
+    """
+    Снимки показателей закрываемого периода: за весь период и за даты
+    отчетов внутри него. Возвращает число сохранённых снимков.
+    """
+    ranges = {(period.start_date, period.end_date)}
+    ranges.update(
+        FinancialReport.objects
+        .filter(start_date__gte=period.start_date, end_date__lte=period.end_date)
+        .values_list('start_date', 'end_date')
+        .distinct()
+    )
+    existing = set(
+        FinancialReportSnapshot.objects
+        .filter(start_date__gte=period.start_date, end_date__lte=period.end_date)
+        .values_list('start_date', 'end_date')
+    )
+    for start_date, end_date in ranges - existing:
+        store_snapshot(period, start_date, end_date, compute_figures(start_date, end_date))
+    return len(ranges - existing)
@@ -0,0 +1,206 @@
+"""
+Сводки и постраничный вывод списков финансов.
+
+Все показатели страницы списка (итоги, разбивки по направлениям, число
+просроченных, количество записей) считаются одним запросом условной
+агрегации — Sum/Count(..., filter=Q(...)) по отфильтрованной выборке.
+Количество из сводки передаётся в CountedPaginator, чтобы Paginator не
+делал отдельный COUNT(*).
+
+Для больших таблиц расходов и доходов есть keyset-пагинация: страница
+выбирается условием «после последней строки предыдущей страницы» по
+ключу сортировки (дата, id) вместо OFFSET, а курсор передаётся в
+параметре ?after=.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Max, Q, Sum
+
+ZERO = Decimal('0.00')
+
+PER_PAGE = 25
+
+# Начиная с этого числа строк списки расходов и доходов листаются курсором
+KEYSET_MIN_ROWS = 5000
+
+CURSOR_PARAM = 'after'
+
+
+def summarize(queryset, **aggregates) -> Dict[str, object]:
+    """
+    Один aggregate() по выборке без сортировки; пустые суммы — ZERO.
+
+    Значения aggregates — выражения Django (Sum, Count, Max с filter=Q(...)).
+    """
+    result = queryset.order_by().aggregate(**aggregates)
+    for name, expression in aggregates.items():
+        if result[name] is None and isinstance(expression, Sum):
+            result[name] = ZERO
+    return result
+
+
+def _average(total, count) -> Decimal:
+    return (total / count) if count else ZERO
+
+
+def debt_summary(queryset, today: date) -> Dict[str, object]:
+    """Итоги, разбивка по направлениям и число просроченных долгов."""
+    receivable = Q(direction='receivable')
+    payable = Q(direction='payable')
+    summary = summarize(
+        queryset,
+        count=Count('id'),
+        total_original=Sum('original_amount'),
+        total_paid=Sum('amount_paid'),
+        receivable_original=Sum('original_amount', filter=receivable),
+        receivable_paid=Sum('amount_paid', filter=receivable),
+        payable_original=Sum('original_amount', filter=payable),
+        payable_paid=Sum('amount_paid', filter=payable),
+        overdue_count=Count('id', filter=Q(due_date__lt=today) & Q(amount_paid__lt=F('original_amount'))),
+    )
+    for prefix in ('total', 'receivable', 'payable'):
+        summary[f'{prefix}_outstanding'] = summary[f'{prefix}_original'] - summary[f'{prefix}_paid']
+    return summary
+
+
+def expense_summary(queryset) -> Dict[str, object]:
+    """Сумма, количество, средний расход и дата последнего расхода."""
+    summary = summarize(queryset, total_expenses=Sum('amount'), expenses_count=Count('id'), latest_expense_date=Max('date'))
+    summary['avg_expense'] = _average(summary['total_expenses'], summary['expenses_count'])
+    return summary
+
+
+def income_summary(queryset) -> Dict[str, object]:
+    """Сумма, количество, средний доход и дата последнего дохода."""
+    summary = summarize(queryset, total_income=Sum('amount'), income_count=Count('id'), latest_income_date=Max('date'))
+    summary['avg_income'] = _average(summary['total_income'], summary['income_count'])
+    return summary
+
+
+def asset_summary(queryset) -> Dict[str, object]:
+    """Текущая и закупочная стоимость, количество и активные единицы имущества."""
+    summary = summarize(
+        queryset,
+        total_current_value=Sum('current_value'),
+        total_purchase_value=Sum('purchase_price'),
+        assets_count=Count('id'),
+        active_assets=Count('id', filter=Q(is_active=True)),
+    )
+    summary['avg_asset_value'] = _average(summary['total_current_value'], summary['assets_count'])
+    return summary
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным количеством строк (без COUNT(*))."""
+
+    def __init__(self, object_list, per_page, count: int, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации.
+
+    В шаблонах: object_list, has_next, next_cursor и is_keyset (отличает
+    её от Page обычного Paginator); has_previous — страница открыта по
+    курсору, «назад» ведёт на первую страницу.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, has_next: bool, next_cursor: Optional[str], has_previous: bool):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, queryset, keys: Sequence[str]) -> Optional[list]:
+    """Значения ключа из курсора (None — курсор повреждён)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+        fields = [queryset.model._meta.get_field(key.lstrip('-')) for key in keys]
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _after(keys: Sequence[str], values: Sequence) -> Q:
+    """Условие «строго после values» для сортировки keys (с '-' — по убыванию)."""
+    condition = Q()
+    for position, key in enumerate(keys):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[position]})
+        for previous, value in zip(keys[:position], values[:position]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, cursor: Optional[str], keys: Sequence[str] = ('-date', '-id'), per_page: int = PER_PAGE) -> KeysetPage:
+    """
+    Страница выборки после курсора по ключу сортировки keys.
+
+    Последним в keys должен быть уникальный столбец (id), иначе строки с
+    одинаковым ключом на границе страниц пропадут.
+    """
+    queryset = queryset.order_by(*keys)
+    values = decode_cursor(cursor, queryset, keys) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(keys, values))
+    rows = list(queryset[:per_page + 1])
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, key.lstrip('-')) for key in keys])
+    return KeysetPage(rows, has_next, next_cursor, has_previous=values is not None)
+
+
+def list_page(request, queryset, count: int, per_page: int = PER_PAGE):
+    """
+    Страница списка расходов/доходов: keyset при ?after= или больших
+    таблицах, иначе номер страницы с количеством из сводки.
+    """
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor or count >= KEYSET_MIN_ROWS:
+        return keyset_page(queryset, cursor, per_page=per_page)
+    return CountedPaginator(queryset, per_page, count=count).get_page(request.GET.get('page'))
+
+
+def is_paginated(page) -> bool:
+    if getattr(page, 'is_keyset', False):
+        return page.has_next or page.has_previous
+    return page.paginator.num_pages > 1
+
+
+def pagination_query_string(request) -> str:
+    """GET-параметры фильтров без номера страницы и курсора."""
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
+    query_params.pop(CURSOR_PARAM, None)
+    return query_params.urlencode()
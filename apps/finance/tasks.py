@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .exports import run_export
+from .models import ExportJob
+
+# Сколько дней хранятся файлы асинхронных выгрузок
+EXPORT_RETENTION_DAYS = 7
+
+
+@shared_task
+def build_export(job_id):
+    """Собирает файл асинхронной выгрузки ExportJob (см. exports.py)."""
+    job = ExportJob.objects.filter(pk=job_id, status=ExportJob.Status.PENDING).first()
+    if job is None:
+        return {'status': 'skipped', 'message': f'Выгрузка {job_id} не найдена или уже обработана'}
+    run_export(job)
+    return {
+        'status': 'success' if job.status == ExportJob.Status.DONE else 'error',
+        'message': job.error or f'Выгрузка {job.filename} готова',
+    }
+
+
+@shared_task
+def cleanup_export_jobs(days=EXPORT_RETENTION_DAYS):
+    """Удаляет выгрузки старше days дней вместе с файлами."""
+    removed = 0
+    for job in ExportJob.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        removed += 1
+    return {'status': 'success', 'message': f'Удалено выгрузок: {removed}', 'removed': removed}
@@ -451,3 +451,453 @@ class FinanceFormsTestCase(TestCase):
         form = MoneyMovementForm(data=data)
         self.assertFalse(form.is_valid())
         self.assertIn('amount', form.errors)
+
+
+class LedgerReportTestCase(TestCase):
+    """Тесты оборотно-сальдовой ведомости и снимков закрытых периодов"""
+
+    def setUp(self):
+        from .models import AccountingAccount
+
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.cash = AccountingAccount.objects.create(code='50', name='Касса', account_type='asset', normal_side='debit')
+        self.cash_main = AccountingAccount.objects.create(
+            code='50.1', name='Основная касса', account_type='asset', normal_side='debit', parent=self.cash,
+        )
+        self.revenue = AccountingAccount.objects.create(code='90', name='Выручка', account_type='income', normal_side='credit')
+
+    def post(self, day, amount):
+        from .models import create_simple_entry
+        create_simple_entry(day, self.cash_main, self.revenue, Decimal(amount), user=self.user)
+
+    def test_single_grouped_query_with_roll_up(self):
+        from . import ledger
+
+        self.post(date(2024, 1, 10), '100.00')
+        self.post(date(2024, 2, 5), '40.00')
+        with self.assertNumQueries(3):
+            report = ledger.trial_balance(date(2024, 2, 1), date(2024, 2, 29))
+        rows = {row['account'].code: row for row in report['rows']}
+
+        self.assertEqual(rows['50.1']['opening_balance'], Decimal('100.00'))
+        self.assertEqual(rows['50.1']['debit_turnover'], Decimal('40.00'))
+        # Родительский счет включает обороты дочернего
+        self.assertEqual(rows['50']['debit_turnover'], Decimal('40.00'))
+        self.assertEqual(rows['50']['closing_balance'], Decimal('140.00'))
+        self.assertEqual(rows['90']['closing_balance'], Decimal('140.00'))
+        # Итоги не удваиваются за счет родительских счетов
+        self.assertEqual(report['total_debit'], Decimal('40.00'))
+        self.assertEqual(report['total_credit'], Decimal('40.00'))
+
+    def test_close_period_snapshots_balances(self):
+        from . import ledger
+        from .models import AccountBalanceSnapshot, FinancialPeriod
+
+        self.post(date(2024, 1, 10), '100.00')
+        january = FinancialPeriod.objects.create(
+            name='Январь', period_type='month', start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+        )
+        january.close_period(self.user)
+        snapshot = AccountBalanceSnapshot.objects.get(period=january, account=self.cash_main)
+        self.assertEqual(snapshot.debit_total, Decimal('100.00'))
+        self.assertEqual(AccountBalanceSnapshot.objects.filter(period=january).count(), 3)
+
+        # Входящий остаток берется из снимка, журнал до закрытия не читается
+        AccountBalanceSnapshot.objects.filter(pk=snapshot.pk).update(debit_total=Decimal('70.00'))
+        self.post(date(2024, 2, 5), '40.00')
+        report = ledger.trial_balance(date(2024, 2, 1), date(2024, 2, 29))
+        rows = {row['account'].code: row for row in report['rows']}
+        self.assertEqual(rows['50.1']['opening_balance'], Decimal('70.00'))
+        self.assertEqual(rows['50.1']['closing_balance'], Decimal('110.00'))
+
+    def test_closed_period_rejects_entries(self):
+        from django.core.exceptions import ValidationError
+        from .models import FinancialPeriod, JournalEntry, JournalEntryLine
+
+        self.post(date(2024, 1, 10), '100.00')
+        january = FinancialPeriod.objects.create(
+            name='Январь', period_type='month', start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+        )
+        january.close_period(self.user)
+
+        with self.assertRaises(ValidationError):
+            self.post(date(2024, 1, 20), '50.00')
+        entry = JournalEntry.objects.get()
+        with self.assertRaises(ValidationError):
+            entry.delete()
+        with self.assertRaises(ValidationError):
+            JournalEntryLine.objects.filter(entry=entry).first().save()
+        # Перенос операции из закрытого периода тоже запрещен
+        entry.date = date(2024, 2, 1)
+        with self.assertRaises(ValidationError):
+            entry.save()
+        self.assertEqual(JournalEntry.objects.count(), 1)
+
+    def test_reopened_period_rebuilds_balances(self):
+        from . import ledger
+        from .models import AccountBalanceSnapshot, FinancialPeriod
+
+        self.post(date(2024, 1, 10), '100.00')
+        self.post(date(2024, 2, 5), '40.00')
+        january = FinancialPeriod.objects.create(
+            name='Январь', period_type='month', start_date=date(2024, 1, 1), end_date=date(2024, 1, 31),
+        )
+        february = FinancialPeriod.objects.create(
+            name='Февраль', period_type='month', start_date=date(2024, 2, 1), end_date=date(2024, 2, 29),
+        )
+        january.close_period(self.user)
+        february.close_period(self.user)
+
+        # Открытие января удаляет остатки января и февраля (нарастающие итоги)
+        january.reopen_period()
+        self.assertFalse(AccountBalanceSnapshot.objects.exists())
+        self.post(date(2024, 1, 20), '50.00')
+        report = ledger.trial_balance(date(2024, 3, 1), date(2024, 3, 31))
+        rows = {row['account'].code: row for row in report['rows']}
+        self.assertEqual(rows['50.1']['opening_balance'], Decimal('190.00'))
+
+        # Повторное закрытие пересчитывает остатки и более позднего февраля
+        january.close_period(self.user)
+        self.assertEqual(
+            AccountBalanceSnapshot.objects.get(period=february, account=self.cash_main).debit_total,
+            Decimal('190.00'),
+        )
+
+        # Открытие в обход save: остатки февраля не используются
+        FinancialPeriod.objects.filter(pk=january.pk).update(is_closed=False)
+        self.post(date(2024, 1, 25), '10.00')
+        report = ledger.trial_balance(date(2024, 3, 1), date(2024, 3, 31))
+        rows = {row['account'].code: row for row in report['rows']}
+        self.assertEqual(rows['50.1']['opening_balance'], Decimal('200.00'))
+
+    def test_trial_balance_view(self):
+        self.post(date(2024, 2, 5), '40.00')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('finance:trial_balance'), {'date_from': '2024-02-01', 'date_to': '2024-02-29'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_debit'], Decimal('40.00'))
+
+
+class BankLedgerTestCase(TestCase):
+    """Тесты журнала основного счета"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.category = ExpenseCategory.objects.create(name='Сырье')
+
+    def test_postings_and_balance_as_of(self):
+        from . import bank
+        from .models import BankLedgerEntry, Debt, DebtPayment
+
+        Income.objects.create(income_type='sales', amount=Decimal('1000.00'), description='Продажа', date=date(2024, 3, 1), created_by=self.user)
+        Expense.objects.create(category=self.category, amount=Decimal('300.00'), description='Закупка', date=date(2024, 3, 5), created_by=self.user)
+        debt = Debt.objects.create(direction='payable', title='Поставщик', original_amount=Decimal('200.00'), created_by=self.user)
+        DebtPayment.objects.create(debt=debt, amount=Decimal('50.00'), date=date(2024, 3, 10), created_by=self.user)
+
+        self.assertEqual(MainBankAccount.get_main_account().balance, Decimal('650.00'))
+        self.assertEqual(bank.balance_as_of(date(2024, 3, 1)), Decimal('1000.00'))
+        self.assertEqual(bank.balance_as_of(date(2024, 3, 7)), Decimal('700.00'))
+        self.assertEqual(bank.balance_as_of(), Decimal('650.00'))
+        self.assertEqual(
+            sorted(BankLedgerEntry.objects.values_list('source', flat=True)),
+            ['debt_payment', 'expense', 'income'],
+        )
+
+    def test_posting_does_not_read_modify_write_balance(self):
+        from . import bank
+
+        stale = MainBankAccount.get_main_account()
+        Income.objects.create(income_type='other', amount=Decimal('100.00'), description='Доход', date=date.today(), created_by=self.user)
+        # Проводка по устаревшему экземпляру счета не затирает чужую
+        Expense.objects.create(category=self.category, amount=Decimal('30.00'), description='Расход', date=date.today(), created_by=self.user)
+        stale.refresh_from_db()
+        self.assertEqual(stale.balance, Decimal('70.00'))
+        self.assertEqual(bank.reconcile()['difference'], Decimal('0.00'))
+
+    def test_entries_are_immutable_and_reconcile_restores_balance(self):
+        from . import bank
+
+        entry = bank.post(Decimal('500.00'), 'adjustment', date.today())
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+        MainBankAccount.objects.filter(pk=1).update(balance=Decimal('1.00'))
+        result = bank.reconcile()
+        self.assertEqual(result['difference'], Decimal('-499.00'))
+        self.assertEqual(MainBankAccount.get_main_account().balance, Decimal('500.00'))
+
+    def test_reconcile_invalidates_dashboard_cache(self):
+        from django.core.cache import cache
+        from core import caching
+        from . import bank
+        from .models import FINANCE_DASHBOARD_CACHE
+
+        bank.post(Decimal('500.00'), 'adjustment', date.today())
+        MainBankAccount.objects.filter(pk=1).update(balance=Decimal('1.00'))
+        key = caching.make_key(FINANCE_DASHBOARD_CACHE, 'dashboard')
+        cache.set(key, 'stale')
+        bank.reconcile()
+        self.assertIsNone(cache.get(caching.make_key(FINANCE_DASHBOARD_CACHE, 'dashboard')))
+
+
+class ExportTestCase(TestCase):
+    """Тесты потоковых и асинхронных выгрузок"""
+
+    def setUp(self):
+        from apps.clients.models import Client as Customer
+        from apps.products.models import Product
+        from .models import Request, RequestItem
+
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name='Клиент', phone='+996 555 000 000')
+        door = Product.objects.create(name='Дверь', price=Decimal('100.00'))
+        self.requests = []
+        for n in range(3):
+            request_obj = Request.objects.create(name=f'Заявка {n}', client=self.customer, total_amount=Decimal('500.00'))
+            RequestItem.objects.create(request=request_obj, product=door, quantity=2, size='80-200')
+            self.requests.append(request_obj)
+
+    def load(self, response):
+        from io import BytesIO
+        from openpyxl import load_workbook
+
+        self.assertTrue(response.streaming)
+        return load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+    def test_requests_export_writes_blocks_on_one_sheet(self):
+        response = self.client.get(reverse('orders:export_requests_excel'))
+        workbook = self.load(response)
+
+        self.assertEqual(workbook.sheetnames, ['Заявки'])
+        ws = workbook['Заявки']
+        newest, previous = self.requests[2], self.requests[1]
+        self.assertTrue(ws['A1'].value.startswith(f'Заказ №{newest.id}-'))
+        self.assertEqual(ws['B3'].value, 'Клиент')
+        self.assertEqual(ws['A7'].value, '№')
+        self.assertTrue(ws['A7'].font.bold)
+        self.assertEqual(ws['D8'].value, 2)
+        self.assertEqual(ws['D9'].value, '2шт')
+        self.assertTrue(ws['A16'].value.startswith(f'Заказ №{previous.id}-'))
+        self.assertEqual([brk.id for brk in ws.row_breaks.brk][:2], [14, 29])
+
+    def test_client_export_keeps_total(self):
+        response = self.client.get(reverse('orders:export_requests_excel_for_client', args=[self.customer.pk]))
+        ws = self.load(response)['Заявки']
+
+        totals = [row for row in ws.iter_rows(values_only=True) if row[0] == 'общий']
+        self.assertEqual(len(totals), 3)
+        self.assertEqual(totals[0][6], '2шт')
+
+    def test_export_does_not_open_file_per_request(self):
+        import os
+        import resource
+        from apps.products.models import Product
+        from .exports import client_requests_export, requests_export, save_to_tempfile
+        from .models import Request, RequestItem
+
+        door = Product.objects.get(name='Дверь')
+        requests = Request.objects.bulk_create(
+            Request(name=f'Массовая {n}', client=self.customer) for n in range(150)
+        )
+        RequestItem.objects.bulk_create(
+            RequestItem(request=request_obj, product=door, quantity=1) for request_obj in requests
+        )
+        # Заявок больше, чем свободных дескрипторов процесса
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (len(os.listdir('/proc/self/fd')) + 64, hard))
+        try:
+            for build in (lambda: requests_export(), lambda: client_requests_export(self.customer.pk)):
+                workbook, _ = build()
+                save_to_tempfile(workbook).close()
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_financial_report_export_lists_all_rows(self):
+        category = ExpenseCategory.objects.create(name='Сырье')
+        for n in range(3):
+            Expense.objects.create(category=category, amount=Decimal('10.00') + n, description=f'Расход {n}', date=date(2024, 5, 2), created_by=self.user)
+        report = FinancialReport.objects.create(
+            report_type='monthly', title='Май', start_date=date(2024, 5, 1), end_date=date(2024, 5, 31), created_by=self.user,
+        )
+        workbook = self.load(self.client.get(reverse('finance:financial_report_export_excel', args=[report.pk])))
+
+        self.assertEqual(workbook['Расходы'].max_row, 4)
+        self.assertEqual(workbook['Отчет']['B6'].value, 33)
+
+        response = self.client.get(reverse('finance:financial_report_export_csv', args=[report.pk]))
+        self.assertIn('Общий расход,33.00', b''.join(response.streaming_content).decode())
+
+    def test_async_export_builds_file_for_download(self):
+        import tempfile
+        from unittest import mock
+        from django.test import override_settings
+        from .exports import run_export
+        from .models import ExportJob
+
+        with mock.patch('apps.finance.tasks.build_export.delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('orders:export_requests_excel'), {'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get(pk=response.json()['id'])
+        delay.assert_called_once_with(str(job.pk))
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            run_export(job)
+            self.assertEqual(self.client.get(reverse('finance:export_job_status', args=[job.pk])).json()['status'], 'done')
+            workbook = self.load(self.client.get(reverse('finance:export_job_download', args=[job.pk])))
+            self.assertEqual(workbook.sheetnames, ['Заявки'])
+
+
+class FinancialReportFiguresTestCase(TestCase):
+    """Тесты агрегатов и снимков показателей финансовых отчетов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        materials = ExpenseCategory.objects.create(name='Сырье')
+        rent = ExpenseCategory.objects.create(name='Аренда')
+        Income.objects.create(income_type='sales', amount=Decimal('1000.00'), description='Продажа', date=date(2024, 4, 1), created_by=self.user)
+        Income.objects.create(income_type='sales', amount=Decimal('500.00'), description='Продажа', date=date(2024, 4, 2), created_by=self.user)
+        Income.objects.create(income_type='other', amount=Decimal('200.00'), description='Прочее', date=date(2024, 4, 2), created_by=self.user)
+        Expense.objects.create(category=materials, amount=Decimal('300.00'), description='Закупка', date=date(2024, 4, 1), created_by=self.user)
+        Expense.objects.create(category=rent, amount=Decimal('100.00'), description='Аренда', date=date(2024, 4, 3), created_by=self.user)
+        self.category = materials
+
+    def test_figures_from_grouped_aggregates(self):
+        from .reports import compute_figures
+
+        with self.assertNumQueries(3):
+            figures = compute_figures(date(2024, 4, 1), date(2024, 4, 30))
+
+        self.assertEqual(figures['total_income'], Decimal('1700.00'))
+        self.assertEqual(figures['total_expenses'], Decimal('400.00'))
+        self.assertEqual(figures['operating_income'], Decimal('1100.00'))
+        self.assertEqual(figures['income_by_type'][0], {'income_type': 'sales', 'total': Decimal('1500.00'), 'cnt': 2})
+        self.assertEqual([row['category__name'] for row in figures['expense_by_category']], ['Сырье', 'Аренда'])
+        self.assertEqual(
+            [(row['date'].day, row['total']) for row in figures['daily_income']],
+            [(1, Decimal('1000.00')), (2, Decimal('700.00'))],
+        )
+
+    def test_closed_period_reads_snapshot(self):
+        from .models import FinancialPeriod, FinancialReportSnapshot
+        from .views import build_financial_report_context
+
+        report = FinancialReport.objects.create(
+            report_type='monthly', title='Апрель', start_date=date(2024, 4, 1), end_date=date(2024, 4, 30), created_by=self.user,
+        )
+        period = FinancialPeriod.objects.create(name='Апрель 2024', period_type='month', start_date=date(2024, 4, 1), end_date=date(2024, 4, 30))
+        period.close_period(self.user)
+        snapshot = FinancialReportSnapshot.objects.get(start_date=date(2024, 4, 1), end_date=date(2024, 4, 30))
+        with self.assertRaises(ValueError):
+            snapshot.save()
+
+        with self.assertNumQueries(2):
+            report.calculate_totals()
+        self.assertEqual(report.total_expenses, Decimal('400.00'))
+        self.assertEqual(report.net_income, Decimal('1300.00'))
+
+        context = build_financial_report_context(report)
+        self.assertEqual(context['daily_expenses'][-1], {'date': date(2024, 4, 3), 'total': Decimal('100.00')})
+
+    def test_closed_period_rejects_postings(self):
+        from django.core.exceptions import ValidationError
+        from .forms import IncomeForm
+        from .models import FinancialPeriod
+
+        expense = Expense.objects.get(description='Аренда')
+        period = FinancialPeriod.objects.create(name='Апрель 2024', period_type='month', start_date=date(2024, 4, 1), end_date=date(2024, 4, 30))
+        period.close_period(self.user)
+
+        with self.assertRaises(ValidationError):
+            Expense.objects.create(category=self.category, amount=Decimal('50.00'), description='Поздно', date=date(2024, 4, 5), created_by=self.user)
+        # Перенос расхода из закрытого периода тоже запрещён
+        expense.date = date(2024, 5, 3)
+        with self.assertRaises(ValidationError):
+            expense.save()
+        with self.assertRaises(ValidationError):
+            expense.delete()
+
+        form = IncomeForm(data={'income_type': 'sales', 'amount': '10.00', 'description': 'Поздно', 'date': '2024-04-10'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('date', form.errors)
+        self.assertTrue(IncomeForm(data={'income_type': 'sales', 'amount': '10.00', 'description': 'Вовремя', 'date': '2024-05-10'}).is_valid())
+        self.assertEqual(MainBankAccount.get_main_account().balance, Decimal('1300.00'))
+
+    def test_reopened_period_drops_snapshots(self):
+        from .models import FinancialPeriod, FinancialReportSnapshot
+        from .reports import report_figures
+
+        period = FinancialPeriod.objects.create(name='Апрель 2024', period_type='month', start_date=date(2024, 4, 1), end_date=date(2024, 4, 30))
+        period.close_period(self.user)
+        self.assertTrue(period.report_snapshots.exists())
+
+        # Снятие флага в админке: снимки удаляются, новые записи попадают в отчет
+        period.is_closed = False
+        period.save()
+        self.assertFalse(FinancialReportSnapshot.objects.exists())
+        Expense.objects.create(category=self.category, amount=Decimal('50.00'), description='Поздно', date=date(2024, 4, 5), created_by=self.user)
+        self.assertEqual(report_figures(date(2024, 4, 1), date(2024, 4, 30))['total_expenses'], Decimal('450.00'))
+
+        # Открытие мимо save: устаревший снимок не используется
+        period.close_period(self.user)
+        FinancialPeriod.objects.filter(pk=period.pk).update(is_closed=False)
+        Income.objects.create(income_type='other', amount=Decimal('5.00'), description='Поздно', date=date(2024, 4, 6), created_by=self.user)
+        self.assertEqual(report_figures(date(2024, 4, 1), date(2024, 4, 30))['total_income'], Decimal('1705.00'))
+        self.assertFalse(FinancialReportSnapshot.objects.exists())
+
+
+class FinanceSummaryTestCase(TestCase):
+    """Тесты сводок и keyset-пагинации списков финансов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='accountant', password='testpass123')
+        self.client.force_login(self.user)
+
+    def test_debt_summary_in_one_query(self):
+        from .models import Debt
+        from .summaries import debt_summary
+
+        today = date(2024, 6, 1)
+        Debt.objects.create(direction='receivable', title='Клиент', original_amount=Decimal('300.00'), amount_paid=Decimal('100.00'), due_date=date(2024, 5, 1), created_by=self.user)
+        Debt.objects.create(direction='payable', title='Поставщик', original_amount=Decimal('200.00'), amount_paid=Decimal('200.00'), due_date=date(2024, 5, 1), created_by=self.user)
+        Debt.objects.create(direction='payable', title='Аренда', original_amount=Decimal('50.00'), created_by=self.user)
+
+        with self.assertNumQueries(1):
+            summary = debt_summary(Debt.objects.all(), today)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['total_outstanding'], Decimal('250.00'))
+        self.assertEqual(summary['receivable_outstanding'], Decimal('200.00'))
+        self.assertEqual(summary['payable_original'], Decimal('250.00'))
+        self.assertEqual(summary['overdue_count'], 1)
+
+    def test_keyset_pages_cover_all_rows(self):
+        from .summaries import keyset_page
+
+        for n in range(7):
+            Income.objects.create(income_type='other', amount=Decimal('10.00'), description=f'Доход {n}', date=date(2024, 6, 1 + n % 3), created_by=self.user)
+        expected = list(Income.objects.order_by('-date', '-id').values_list('pk', flat=True))
+
+        seen, cursor = [], None
+        while True:
+            page = keyset_page(Income.objects.all(), cursor, per_page=3)
+            seen.extend(income.pk for income in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(keyset_page(Income.objects.all(), 'испорчен', per_page=3)), 3)
+
+    def test_incomes_page_by_cursor(self):
+        from .summaries import keyset_page
+
+        for n in range(30):
+            Income.objects.create(income_type='other', amount=Decimal('1.00'), description=f'Доход {n}', date=date(2024, 6, 1), created_by=self.user)
+        cursor = keyset_page(Income.objects.all(), None).next_cursor
+
+        response = self.client.get(reverse('finance:incomes'), {'after': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['incomes']), 5)
+        self.assertEqual(response.context['income_count'], 30)
+        self.assertTrue(response.context['is_paginated'])
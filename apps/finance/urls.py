@@ -61,6 +61,10 @@ urlpatterns = [
     path('financial-reports/<int:pk>/export/csv/', views.financial_report_export_csv, name='financial_report_export_csv'),
     path('financial-reports/<int:pk>/export/excel/', views.financial_report_export_excel, name='financial_report_export_excel'),
     
+    # Асинхронные выгрузки
+    path('exports/<uuid:pk>/', views.export_job_status, name='export_job_status'),
+    path('exports/<uuid:pk>/download/', views.export_job_download, name='export_job_download'),
+    
     # API для AJAX
     path('api/expense-categories/', views.get_expense_categories, name='api_expense_categories'),
     path('api/suppliers/', views.get_suppliers, name='api_suppliers'),
@@ -18,39 +18,53 @@ from .forms import (
     MoneyMovementForm, ExpenseForm, IncomeForm, FactoryAssetForm, FinancialReportForm
 )
 from .forms import DebtForm, DebtPaymentForm
-from .models import Debt, DebtPayment
+from .models import Debt, DebtPayment, ExportJob
 from .models import AccountingAccount, JournalEntry, JournalEntryLine, AnalyticalAccount, StandardOperation, StandardOperationLine, AccountCorrespondence, FinancialPeriod, Request, RequestItem
+from . import ledger
+from . import summaries
+from .models import FINANCE_DASHBOARD_CACHE
+from core.caching import cache_aside
 from .forms import AccountingAccountForm, JournalEntryForm, JournalEntryLineForm, AnalyticalAccountForm, StandardOperationForm, StandardOperationLineForm, AccountCorrespondenceForm, FinancialPeriodForm, RequestForm, RequestItemForm
 
-# Главная страница финансовой системы
-@login_required
-def finance_dashboard(request):
-	"""Главный дашборд финансовой системы"""
-	
-	# Получаем основной счет
-	main_account = MainBankAccount.get_main_account()
-	total_balance = main_account.balance
-	
-	# Доходы и расходы за текущий месяц
-	current_month = timezone.now().month
-	current_year = timezone.now().year
+@cache_aside(FINANCE_DASHBOARD_CACHE, ttl=300, key=lambda year, month: (year, month))
+def _dashboard_totals(year, month):
+	"""Остаток, доходы/расходы месяца и стоимость активов (кэшируются до изменения данных)"""
+	total_balance = MainBankAccount.get_main_account().balance
 	
 	monthly_income = Income.objects.filter(
-		date__month=current_month,
-		date__year=current_year
+		date__month=month,
+		date__year=year
 	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 	
 	monthly_expenses = Expense.objects.filter(
-		date__month=current_month,
-		date__year=current_year
+		date__month=month,
+		date__year=year
 	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 	
-	monthly_profit = monthly_income - monthly_expenses
-	
 	# Общая стоимость активов
 	total_assets = FactoryAsset.objects.filter(is_active=True).aggregate(
 		total=Sum('current_value'))['total'] or Decimal('0.00')
 	
+	return {
+		'total_balance': total_balance,
+		'monthly_income': monthly_income,
+		'monthly_expenses': monthly_expenses,
+		'monthly_profit': monthly_income - monthly_expenses,
+		'total_assets': total_assets,
+	}
+
+# Главная страница финансовой системы
+@login_required
+def finance_dashboard(request):
+	"""Главный дашборд финансовой системы"""
+	
+	# Получаем основной счет
+	main_account = MainBankAccount.get_main_account()
+	
+	# Остаток, доходы и расходы за текущий месяц
+	now = timezone.now()
+	totals = _dashboard_totals(now.year, now.month)
+	
 	# Последние операции с оптимизацией
 	recent_movements = MoneyMovement.objects.select_related('user').order_by('-date', '-id')[:5]
 	recent_expenses = Expense.objects.select_related('category', 'supplier').order_by('-date', '-id')[:5]
@@ -63,11 +77,7 @@ def finance_dashboard(request):
 	).order_by('next_purchase_date')[:5]
 	
 	context = {
-		'total_balance': total_balance,
-		'monthly_income': monthly_income,
-		'monthly_expenses': monthly_expenses,
-		'monthly_profit': monthly_profit,
-		'total_assets': total_assets,
+		**totals,
 		'recent_movements': recent_movements,
 		'recent_expenses': recent_expenses,
 		'recent_incomes': recent_incomes,
@@ -382,10 +392,8 @@ def build_expenses_context(request):
 			expenses_qs = expenses_qs.filter(amount__lte=Decimal(amount_max))
 		except Exception:
 			pass
-	total_expenses = expenses_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-	expenses_count = expenses_qs.count()
-	avg_expense = (total_expenses / expenses_count) if expenses_count else Decimal('0.00')
-	latest_expense_date = expenses_qs.values_list('date', flat=True).first()
+	summary = summaries.expense_summary(expenses_qs)
+	total_expenses = summary['total_expenses']
 	top_categories = list(
 		expenses_qs.values('category__name')
 		.annotate(total=Sum('amount'))
@@ -397,11 +405,8 @@ def build_expenses_context(request):
 		total = row.get('total') or Decimal('0.00')
 		share = (total / total_expenses * 100) if total_expenses else Decimal('0.00')
 		category_summary.append({'name': name, 'total': total, 'share': share})
-	paginator = Paginator(expenses_qs, 25)
-	page_obj = paginator.get_page(request.GET.get('page'))
-	query_params = request.GET.copy()
-	query_params.pop('page', None)
-	query_string = query_params.urlencode()
+	page_obj = summaries.list_page(request, expenses_qs, summary['expenses_count'])
+	query_string = summaries.pagination_query_string(request)
 	categories = ExpenseCategory.objects.all()
 	suppliers = Supplier.objects.all()
 	form = ExpenseForm()
@@ -410,12 +415,12 @@ def build_expenses_context(request):
 		'categories': categories,
 		'suppliers': suppliers,
 		'total_expenses': total_expenses,
-		'expenses_count': expenses_count,
-		'avg_expense': avg_expense,
-		'latest_expense_date': latest_expense_date,
+		'expenses_count': summary['expenses_count'],
+		'avg_expense': summary['avg_expense'],
+		'latest_expense_date': summary['latest_expense_date'],
 		'top_categories': category_summary,
 		'page_obj': page_obj,
-		'is_paginated': page_obj.paginator.num_pages > 1,
+		'is_paginated': summaries.is_paginated(page_obj),
 		'query_string': query_string,
 		'form': form,
 	}
@@ -489,16 +494,10 @@ def incomes(request):
 			incomes_qs = incomes_qs.filter(amount__lte=Decimal(amount_max))
 		except Exception:
 			pass
-	total_income = incomes_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-	income_count = incomes_qs.count()
-	avg_income = (total_income / income_count) if income_count else Decimal('0.00')
-	latest_income_date = incomes_qs.values_list('date', flat=True).first()
-	paginator = Paginator(incomes_qs, 25)
-	page_obj = paginator.get_page(request.GET.get('page'))
+	summary = summaries.income_summary(incomes_qs)
+	page_obj = summaries.list_page(request, incomes_qs, summary['income_count'])
 	# Preserve filters in pagination
-	query_params = request.GET.copy()
-	query_params.pop('page', None)
-	query_string = query_params.urlencode()
+	query_string = summaries.pagination_query_string(request)
 	income_types = Income.INCOME_TYPES
 	user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
 	is_mobile = any(m in user_agent for m in ['android', 'iphone', 'ipad', 'mobile'])
@@ -506,14 +505,14 @@ def incomes(request):
 	return render(request, template, {
 		'incomes': page_obj.object_list,
 		'page_obj': page_obj,
-		'is_paginated': page_obj.paginator.num_pages > 1,
+		'is_paginated': summaries.is_paginated(page_obj),
 		'query_string': query_string,
 		'income_types': income_types,
 		'form': IncomeForm(),
-		'total_income': total_income,
-		'income_count': income_count,
-		'avg_income': avg_income,
-		'latest_income_date': latest_income_date,
+		'total_income': summary['total_income'],
+		'income_count': summary['income_count'],
+		'avg_income': summary['avg_income'],
+		'latest_income_date': summary['latest_income_date'],
 	})
 
 @login_required
@@ -567,12 +566,8 @@ def factory_assets(request):
 		assets_qs = assets_qs.filter(is_active=True)
 	elif status == 'inactive':
 		assets_qs = assets_qs.filter(is_active=False)
-	total_current_value = assets_qs.aggregate(total=Sum('current_value'))['total'] or Decimal('0.00')
-	total_purchase_value = assets_qs.aggregate(total=Sum('purchase_price'))['total'] or Decimal('0.00')
-	assets_count = assets_qs.count()
-	active_assets = assets_qs.filter(is_active=True).count()
-	avg_asset_value = (total_current_value / assets_count) if assets_count else Decimal('0.00')
-	paginator = Paginator(assets_qs, 25)
+	summary = summaries.asset_summary(assets_qs)
+	paginator = summaries.CountedPaginator(assets_qs, 25, count=summary['assets_count'])
 	page_obj = paginator.get_page(request.GET.get('page'))
 	query_params = request.GET.copy()
 	query_params.pop('page', None)
@@ -582,11 +577,11 @@ def factory_assets(request):
 		'page_obj': page_obj,
 		'is_paginated': page_obj.paginator.num_pages > 1,
 		'query_string': query_string,
-		'total_current_value': total_current_value,
-		'total_purchase_value': total_purchase_value,
-		'assets_count': assets_count,
-		'active_assets': active_assets,
-		'avg_asset_value': avg_asset_value,
+		'total_current_value': summary['total_current_value'],
+		'total_purchase_value': summary['total_purchase_value'],
+		'assets_count': summary['assets_count'],
+		'active_assets': summary['active_assets'],
+		'avg_asset_value': summary['avg_asset_value'],
 	})
 
 @login_required
@@ -711,44 +706,10 @@ def financial_report_create(request):
 
 @login_required
 def financial_report_export_excel(request, pk):
+	"""XLSX отчета потоком: итоги и все доходы/расходы периода (?async=1 — фоновая выгрузка)"""
+	from .exports import export_response
 	report = get_object_or_404(FinancialReport, pk=pk)
-	report.calculate_totals()
-	from django.http import HttpResponse
-	# Генерируем HTML-таблицу, совместимую с Excel
-	html = []
-	html.append('<html><head><meta charset="utf-8"></head><body>')
-	html.append(f'<h2>{report.title}</h2>')
-	html.append(f'<p>Период: {report.start_date} - {report.end_date}</p>')
-	html.append('<table border="1" cellspacing="0" cellpadding="4">')
-	html.append('<tr><th>Показатель</th><th>Значение</th></tr>')
-	html.append(f'<tr><td>Общий доход</td><td>{report.total_income}</td></tr>')
-	html.append(f'<tr><td>Общий расход</td><td>{report.total_expenses}</td></tr>')
-	html.append(f'<tr><td>Чистая прибыль</td><td>{report.net_income}</td></tr>')
-	html.append(f'<tr><td>Операционный доход</td><td>{report.operating_income}</td></tr>')
-	html.append(f'<tr><td>Общие активы</td><td>{report.total_assets}</td></tr>')
-	html.append('</table>')
-	# Детализация доходов/расходов
-	incomes = Income.objects.filter(date__range=[report.start_date, report.end_date]).order_by('-amount')[:500]
-	expenses = Expense.objects.filter(date__range=[report.start_date, report.end_date]).order_by('-amount')[:500]
-	html.append('<h3>Доходы</h3>')
-	html.append('<table border="1" cellspacing="0" cellpadding="4">')
-	html.append('<tr><th>Дата</th><th>Тип</th><th>Сумма</th><th>Описание</th></tr>')
-	for inc in incomes:
-		html.append(f'<tr><td>{inc.date}</td><td>{inc.get_income_type_display()}</td><td>{inc.amount}</td><td>{inc.description}</td></tr>')
-	html.append('</table>')
-	html.append('<h3>Расходы</h3>')
-	html.append('<table border="1" cellspacing="0" cellpadding="4">')
-	html.append('<tr><th>Дата</th><th>Категория</th><th>Поставщик</th><th>Сумма</th><th>Описание</th></tr>')
-	for exp in expenses:
-		cat = exp.category.name if exp.category_id else ''
-		supp = exp.supplier.name if exp.supplier_id else ''
-		html.append(f'<tr><td>{exp.date}</td><td>{cat}</td><td>{supp}</td><td>{exp.amount}</td><td>{exp.description}</td></tr>')
-	html.append('</table>')
-	html.append('</body></html>')
-	content = ''.join(html)
-	response = HttpResponse(content, content_type='application/vnd.ms-excel; charset=utf-8')
-	response['Content-Disposition'] = f'attachment; filename="financial_report_{report.pk}.xls"'
-	return response
+	return export_response(request, 'financial_report', report_id=report.pk)
 
 # Уточним детальный отчет: добавим разбивки и топы
 def build_financial_report_context(report):
@@ -758,24 +719,22 @@ def build_financial_report_context(report):
 			profit_margin_pct = (report.net_income / report.total_income) * 100
 		except Exception:
 			profit_margin_pct = None
+	# Разбивки и дневные ряды — из сгруппированных агрегатов или снимка закрытого периода
+	from .reports import report_figures
+	figures = report_figures(report.start_date, report.end_date)
 	incomes_qs = Income.objects.filter(date__range=[report.start_date, report.end_date])
 	expenses_qs = Expense.objects.filter(date__range=[report.start_date, report.end_date])
-	from django.db.models import Count
-	income_by_type = list(incomes_qs.values('income_type').annotate(total=Sum('amount'), cnt=Count('id')).order_by('-total'))
-	expense_by_category = list(expenses_qs.values('category__name').annotate(total=Sum('amount'), cnt=Count('id')).order_by('-total'))
 	top_incomes = incomes_qs.order_by('-amount')[:10]
 	top_expenses = expenses_qs.order_by('-amount')[:10]
-	daily_income = list(incomes_qs.values('date').annotate(total=Sum('amount')).order_by('date'))
-	daily_expenses = list(expenses_qs.values('date').annotate(total=Sum('amount')).order_by('date'))
 	return {
 		'report': report,
 		'profit_margin_pct': profit_margin_pct,
-		'income_by_type': income_by_type,
-		'expense_by_category': expense_by_category,
+		'income_by_type': figures['income_by_type'],
+		'expense_by_category': figures['expense_by_category'],
 		'top_incomes': top_incomes,
 		'top_expenses': top_expenses,
-		'daily_income': daily_income,
-		'daily_expenses': daily_expenses,
+		'daily_income': figures['daily_income'],
+		'daily_expenses': figures['daily_expenses'],
 	}
 
 
@@ -823,24 +782,40 @@ def financial_report_delete(request, pk):
 
 @login_required
 def financial_report_export_csv(request, pk):
+	from .exports import csv_response, report_summary_rows
 	report = get_object_or_404(FinancialReport, pk=pk)
 	# Ensure totals are up to date
 	report.calculate_totals()
-	import csv
-	from django.http import HttpResponse
-	response = HttpResponse(content_type='text/csv; charset=utf-8')
-	response['Content-Disposition'] = f'attachment; filename="financial_report_{report.pk}.csv"'
-	writer = csv.writer(response)
-	writer.writerow(['Название', report.title])
-	writer.writerow(['Период', f"{report.start_date} - {report.end_date}"])
-	writer.writerow([])
-	writer.writerow(['Показатель', 'Значение'])
-	writer.writerow(['Общий доход', report.total_income])
-	writer.writerow(['Общий расход', report.total_expenses])
-	writer.writerow(['Чистая прибыль', report.net_income])
-	writer.writerow(['Операционный доход', report.operating_income])
-	writer.writerow(['Общие активы', report.total_assets])
-	return response
+	rows = [
+		['Название', report.title],
+		['Период', f"{report.start_date} - {report.end_date}"],
+		[],
+		['Показатель', 'Значение'],
+		*report_summary_rows(report),
+	]
+	return csv_response(rows, f"financial_report_{report.pk}.csv")
+
+
+@login_required
+def export_job_status(request, pk):
+	"""Статус асинхронной выгрузки (JSON)"""
+	from .exports import job_payload
+	job = get_object_or_404(ExportJob, pk=pk)
+	if job.created_by_id != request.user.pk and not request.user.is_staff:
+		return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+	return JsonResponse(job_payload(job))
+
+
+@login_required
+def export_job_download(request, pk):
+	"""Скачивание готового файла асинхронной выгрузки"""
+	from django.http import FileResponse, Http404
+	job = get_object_or_404(ExportJob, pk=pk)
+	if job.created_by_id != request.user.pk and not request.user.is_staff:
+		return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+	if job.status != ExportJob.Status.DONE or not job.file:
+		raise Http404('Выгрузка еще не готова')
+	return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
 
 # ==================== API ДЛЯ AJAX ====================
 @login_required
@@ -913,37 +888,9 @@ def supplier_item_delete(request, pk):
 @login_required
 def dashboard_stats(request):
 	"""API для получения статистики дашборда"""
-	# Получаем основной счет
-	main_account = MainBankAccount.get_main_account()
-	total_balance = main_account.balance
-	
-	# Доходы и расходы за текущий месяц
-	current_month = timezone.now().month
-	current_year = timezone.now().year
-	
-	monthly_income = Income.objects.filter(
-		date__month=current_month,
-		date__year=current_year
-	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-	
-	monthly_expenses = Expense.objects.filter(
-		date__month=current_month,
-		date__year=current_year
-	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-	
-	monthly_profit = monthly_income - monthly_expenses
-	
-	# Общая стоимость активов
-	total_assets = FactoryAsset.objects.filter(is_active=True).aggregate(
-		total=Sum('current_value'))['total'] or Decimal('0.00')
-	
-	data = {
-		'total_balance': float(total_balance),
-		'monthly_income': float(monthly_income),
-		'monthly_expenses': float(monthly_expenses),
-		'monthly_profit': float(monthly_profit),
-		'total_assets': float(total_assets),
-	}
+	now = timezone.now()
+	totals = _dashboard_totals(now.year, now.month)
+	data = {name: float(value) for name, value in totals.items()}
 	
 	return JsonResponse(data)
 
@@ -963,24 +910,14 @@ def debts(request):
             debts_qs = debts_qs.filter(amount_paid__gt=Decimal('0.00')).exclude(amount_paid__gte=F('original_amount'))
         else:
             debts_qs = debts_qs.filter(amount_paid__gte=F('original_amount'))
-    total_original = debts_qs.aggregate(total=Sum('original_amount'))['total'] or Decimal('0.00')
-    total_paid = debts_qs.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
-    total_outstanding = total_original - total_paid
-    today = timezone.now().date()
-    overdue_count = debts_qs.filter(due_date__lt=today).exclude(amount_paid__gte=F('original_amount')).count()
-    paginator = Paginator(debts_qs, 25)
+    summary = summaries.debt_summary(debts_qs, timezone.now().date())
+    paginator = summaries.CountedPaginator(debts_qs, 25, count=summary['count'])
     page_obj = paginator.get_page(request.GET.get('page'))
     query_params = request.GET.copy()
     query_params.pop('page', None)
     query_string = query_params.urlencode()
     receivable_debts = debts_qs.filter(direction='receivable')
     payable_debts = debts_qs.filter(direction='payable')
-    receivable_original = receivable_debts.aggregate(total=Sum('original_amount'))['total'] or Decimal('0.00')
-    receivable_paid = receivable_debts.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
-    receivable_outstanding = receivable_original - receivable_paid
-    payable_original = payable_debts.aggregate(total=Sum('original_amount'))['total'] or Decimal('0.00')
-    payable_paid = payable_debts.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
-    payable_outstanding = payable_original - payable_paid
     user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
     is_mobile = any(m in user_agent for m in ['android', 'iphone', 'ipad', 'mobile'])
     template = 'finance/debts_mobile.html' if is_mobile else 'finance/debts.html'
@@ -992,16 +929,16 @@ def debts(request):
         'is_paginated': page_obj.paginator.num_pages > 1,
         'query_string': query_string,
         'form': DebtForm(),
-        'receivable_original': receivable_original,
-        'receivable_paid': receivable_paid,
-        'receivable_outstanding': receivable_outstanding,
-        'payable_original': payable_original,
-        'payable_paid': payable_paid,
-        'payable_outstanding': payable_outstanding,
-        'total_original': total_original,
-        'total_paid': total_paid,
-        'total_outstanding': total_outstanding,
-        'overdue_count': overdue_count,
+        'receivable_original': summary['receivable_original'],
+        'receivable_paid': summary['receivable_paid'],
+        'receivable_outstanding': summary['receivable_outstanding'],
+        'payable_original': summary['payable_original'],
+        'payable_paid': summary['payable_paid'],
+        'payable_outstanding': summary['payable_outstanding'],
+        'total_original': summary['total_original'],
+        'total_paid': summary['total_paid'],
+        'total_outstanding': summary['total_outstanding'],
+        'overdue_count': summary['overdue_count'],
     })
 
 @login_required
@@ -1335,24 +1272,17 @@ def trial_balance(request):
 	df = _dt.strptime(date_from, '%Y-%m-%d').date() if date_from else None
 	dt = _dt.strptime(date_to, '%Y-%m-%d').date() if date_to else None
 	
-	rows = []
-	total_debit = Decimal('0.00')
-	total_credit = Decimal('0.00')
-	
-	for acc in AccountingAccount.objects.order_by('code'):
-		b = acc.get_balance(df, dt)
-		rows.append({'account': acc, **b})
-		total_debit += b['debit_turnover']
-		total_credit += b['credit_turnover']
+	# Обороты всех счетов одним запросом, остатки — от последнего закрытого периода
+	report = ledger.trial_balance(df, dt)
 	
 	# Получаем текущую дату для статистики
 	today = timezone.now().date()
 	current_month = timezone.now().month
 	
 	return render(request, 'finance/trial_balance.html', {
-		'rows': rows,
-		'total_debit': total_debit,
-		'total_credit': total_credit,
+		'rows': report['rows'],
+		'total_debit': report['total_debit'],
+		'total_credit': report['total_credit'],
 		'date_from': date_from,
 		'date_to': date_to,
 		'today': today,
@@ -0,0 +1,246 @@
+"""
+Фактическая себестоимость готовой продукции по заказам.
+
+Затраты по труду (EmployeeTask.net_earnings) и сырью (MaterialConsumption)
+считаются сразу для пачки заказов фиксированным числом запросов, а
+детализация FinishedGoodLaborCost/FinishedGoodMaterialCost пишется через
+bulk_create.
+
+Сигналы задач и расхода сырья не пересчитывают себестоимость сами, а
+только помечают заказ в PendingCostRecalculation; периодическая задача
+recalculate_pending_costs (очередь finance) обрабатывает каждый
+помеченный заказ один раз за окно.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    FinishedGood,
+    FinishedGoodCosting,
+    FinishedGoodLaborCost,
+    FinishedGoodMaterialCost,
+    PendingCostRecalculation,
+)
+
+
+MONEY_Q = Decimal('0.01')
+
+COSTING_FIELDS = ('cost_per_unit', 'total_cost', 'labor_cost', 'material_cost', 'calculated_at')
+
+
+def qmoney(value: Decimal) -> Decimal:
+    return (value or Decimal('0')).quantize(MONEY_Q, rounding=ROUND_HALF_UP)
+
+
+class OrderCosts:
+    """Затраты одного заказа: строки детализации и итоги."""
+
+    def __init__(self):
+        self.labor = []  # (task_id, cost, completed_quantity)
+        self.materials = []  # (consumption_id, cost, quantity)
+        self.labor_total = Decimal('0')
+        self.material_total = Decimal('0')
+
+    @property
+    def is_empty(self) -> bool:
+        return self.labor_total == 0 and self.material_total == 0
+
+    def result_for(self, quantity) -> dict:
+        total = self.labor_total + self.material_total
+        quantity = Decimal(str(quantity or 1))
+        cost_per_unit = qmoney(total / quantity) if quantity > 0 else Decimal('0')
+        return {
+            'cost_per_unit': cost_per_unit,
+            'total_cost': qmoney(total),
+            'labor_cost': qmoney(self.labor_total),
+            'material_cost': qmoney(self.material_total),
+        }
+
+
+def collect_order_costs(order_ids: Iterable[int]) -> Dict[int, OrderCosts]:
+    """
+    Затраты по заказам тремя запросами на всю пачку.
+
+    Сырьё учитывается, если его задача относится к этапу того же заказа
+    (или у заказа нет этапов) — как в прежнем расчёте по одному товару.
+    """
+    from apps.employee_tasks.models import EmployeeTask
+    from apps.inventory.models import MaterialConsumption
+    from apps.orders.models import OrderStage
+
+    order_ids = list(set(order_ids))
+    costs = defaultdict(OrderCosts)
+    if not order_ids:
+        return costs
+
+    tasks = (
+        EmployeeTask.objects
+        .filter(stage__order_id__in=order_ids, net_earnings__gt=0)
+        .values_list('id', 'stage__order_id', 'net_earnings', 'completed_quantity')
+    )
+    for task_id, order_id, net, completed in tasks:
+        cost = Decimal(str(net))
+        entry = costs[order_id]
+        entry.labor.append((task_id, cost, completed))
+        entry.labor_total += cost
+
+    staged_orders = set(
+        OrderStage.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True).distinct()
+    )
+    consumptions = (
+        MaterialConsumption.objects
+        .filter(order_id__in=order_ids)
+        .values_list(
+            'id', 'order_id', 'quantity', 'employee_task__stage__order_id',
+            'material__purchase_price', 'material__price',
+        )
+    )
+    for consumption_id, order_id, quantity, task_order_id, purchase_price, price in consumptions:
+        if order_id in staged_orders and task_order_id != order_id:
+            continue
+        # Используем цену закупки, если есть, иначе цену продажи
+        unit_price = purchase_price or price or Decimal('0')
+        cost = Decimal(str(quantity)) * Decimal(str(unit_price))
+        entry = costs[order_id]
+        entry.materials.append((consumption_id, cost, quantity))
+        entry.material_total += cost
+    return costs
+
+
+def write_costings(finished_goods: List[FinishedGood], costs: Dict[int, OrderCosts]) -> Dict[int, dict]:
+    """
+    Сохраняет себестоимость и детализацию для товаров, по заказам которых есть затраты.
+
+    Возвращает {id товара: результат}. Товары без затрат не трогаются.
+    """
+    results = {}
+    for fg in finished_goods:
+        order_costs = costs.get(fg.order_id)
+        if order_costs and not order_costs.is_empty:
+            results[fg.pk] = order_costs.result_for(fg.quantity)
+    if not results:
+        return results
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            costing.finished_good_id: costing
+            for costing in FinishedGoodCosting.objects.filter(finished_good_id__in=results)
+        }
+        to_update, to_create = [], []
+        for fg_id, result in results.items():
+            costing = existing.get(fg_id) or FinishedGoodCosting(finished_good_id=fg_id)
+            for field, value in result.items():
+                setattr(costing, field, value)
+            costing.calculated_at = now
+            (to_update if costing.pk else to_create).append(costing)
+        FinishedGoodCosting.objects.bulk_update(to_update, COSTING_FIELDS)
+        FinishedGoodCosting.objects.bulk_create(to_create)
+        if any(costing.pk is None for costing in to_create):
+            # Бэкенд не вернул первичные ключи
+            existing.update({
+                costing.finished_good_id: costing
+                for costing in FinishedGoodCosting.objects.filter(finished_good_id__in=results)
+            })
+        else:
+            existing.update({costing.finished_good_id: costing for costing in to_create})
+
+        costing_ids = [existing[fg_id].pk for fg_id in results]
+        FinishedGoodLaborCost.objects.filter(costing_id__in=costing_ids).delete()
+        FinishedGoodMaterialCost.objects.filter(costing_id__in=costing_ids).delete()
+
+        labor_rows, material_rows = [], []
+        for fg in finished_goods:
+            if fg.pk not in results:
+                continue
+            costing_id = existing[fg.pk].pk
+            order_costs = costs[fg.order_id]
+            labor_rows.extend(
+                FinishedGoodLaborCost(costing_id=costing_id, employee_task_id=task_id, cost=cost, completed_quantity=completed)
+                for task_id, cost, completed in order_costs.labor
+            )
+            material_rows.extend(
+                FinishedGoodMaterialCost(costing_id=costing_id, material_consumption_id=consumption_id, cost=cost, quantity=quantity)
+                for consumption_id, cost, quantity in order_costs.materials
+            )
+        FinishedGoodLaborCost.objects.bulk_create(labor_rows, batch_size=1000)
+        FinishedGoodMaterialCost.objects.bulk_create(material_rows, batch_size=1000)
+    return results
+
+
+def changed_finished_goods(finished_goods: List[FinishedGood], costs: Dict[int, OrderCosts]) -> List[FinishedGood]:
+    """Товары, у которых сохранённая себестоимость отличается от рассчитанной (или её нет)."""
+    stored = {
+        row[0]: row[1:]
+        for row in FinishedGoodCosting.objects
+        .filter(finished_good_id__in=[fg.pk for fg in finished_goods])
+        .values_list('finished_good_id', 'cost_per_unit', 'total_cost', 'labor_cost', 'material_cost')
+    }
+    changed = []
+    for fg in finished_goods:
+        order_costs = costs.get(fg.order_id)
+        if not order_costs or order_costs.is_empty:
+            continue
+        result = order_costs.result_for(fg.quantity)
+        fresh = (result['cost_per_unit'], result['total_cost'], result['labor_cost'], result['material_cost'])
+        if stored.get(fg.pk) != fresh:
+            changed.append(fg)
+    return changed
+
+
+def recalculate_order_costs(order_ids: Iterable[int]) -> Dict[int, dict]:
+    """Пересчитывает себестоимость всех товаров указанных заказов."""
+    order_ids = list(set(order_ids))
+    finished_goods = list(FinishedGood.objects.filter(order_id__in=order_ids).only('id', 'order_id', 'quantity'))
+    if not finished_goods:
+        return {}
+    return write_costings(finished_goods, collect_order_costs(order_ids))
+
+
+def mark_order_dirty(order_id: Optional[int]) -> None:
+    """
+    Ставит заказ в очередь пересчёта после коммита текущей транзакции.
+
+    Повторные отметки до обработки схлопываются в одну строку.
+    """
+    if not order_id:
+        return
+    transaction.on_commit(lambda: PendingCostRecalculation.objects.bulk_create(
+        [PendingCostRecalculation(order_id=order_id)], ignore_conflicts=True,
+    ))
+
+
+def process_pending_costs(limit: int = 500) -> int:
+    """
+    Забирает до limit помеченных заказов и пересчитывает их.
+
+    Строки очереди удаляются до расчёта: отметка, пришедшая во время
+    расчёта, создаст новую строку и будет обработана в следующем окне.
+    Возвращает число обработанных заказов.
+    """
+    with transaction.atomic():
+        order_ids = list(
+            PendingCostRecalculation.objects
+            .select_for_update(skip_locked=True)
+            .order_by('marked_at')
+            .values_list('order_id', flat=True)[:limit]
+        )
+        if not order_ids:
+            return 0
+        PendingCostRecalculation.objects.filter(order_id__in=order_ids).delete()
+    try:
+        recalculate_order_costs(order_ids)
+    except Exception:
+        # Возвращаем заказы в очередь, чтобы не потерять пересчёт
+        PendingCostRecalculation.objects.bulk_create(
+            [PendingCostRecalculation(order_id=order_id) for order_id in order_ids],
+            ignore_conflicts=True,
+        )
+        raise
+    return len(order_ids)
@@ -0,0 +1,182 @@
+"""
+Фоновый пересчёт себестоимости всего склада готовой продукции.
+
+Запуск (start_job) создаёт запись CostRecalculationJob, а задача очереди
+finance делит заказы товаров на складе на пачки (plan_job) и раздаёт их
+параллельным задачам (run_chunk). Пачка считает затраты своих заказов
+фиксированным числом запросов (costing.collect_order_costs) и пишет только
+товары, себестоимость которых изменилась, поэтому повторный запуск по тем
+же данным ничего не перезаписывает. Счётчики и примеры ошибок пачка
+добавляет в запись задания под блокировкой строки; последняя пачка
+завершает задание.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .costing import changed_finished_goods, collect_order_costs, write_costings
+from .models import CostRecalculationJob, FinishedGood
+
+
+CHUNK_SIZE = 200
+
+# Задание, которое не завершилось за это время, считается зависшим
+STALE_AFTER = timedelta(hours=2)
+
+STALE_MESSAGE = 'Задание не завершилось вовремя и снято при запуске нового'
+
+
+def active_job() -> Optional[CostRecalculationJob]:
+    """Незавершённое задание, начатое не раньше STALE_AFTER назад."""
+    return (
+        CostRecalculationJob.objects
+        .filter(status__in=['pending', 'running'], created_at__gte=timezone.now() - STALE_AFTER)
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def start_job(user=None) -> CostRecalculationJob:
+    """
+    Создаёт задание и ставит его планирование в очередь после коммита.
+
+    Пока предыдущее задание не завершено, возвращается оно же. Два
+    одновременных запуска не создадут двух заданий: незавершённое задание
+    может быть только одно (ограничение cost_job_single_active), и
+    проигравший запуск получает задание победителя. Зависшие задания
+    перед этим отмечаются проваленными.
+    """
+    from .tasks import plan_cost_recalculation
+
+    with transaction.atomic():
+        job = active_job()
+        if job is not None:
+            return job
+        CostRecalculationJob.objects.filter(
+            status__in=['pending', 'running'], created_at__lt=timezone.now() - STALE_AFTER,
+        ).update(
+            status='failed', finished_at=timezone.now(), errors=[STALE_MESSAGE],
+        )
+        try:
+            with transaction.atomic():
+                job = CostRecalculationJob.objects.create(requested_by=user)
+        except IntegrityError:
+            # Параллельный запуск успел создать задание
+            return active_job()
+        transaction.on_commit(lambda: plan_cost_recalculation.delay(job.pk))
+    return job
+
+
+def stock_order_ids() -> List[int]:
+    """Заказы, по которым на складе есть готовая продукция."""
+    return list(
+        FinishedGood.objects
+        .filter(status='stock', order__isnull=False)
+        .order_by('order_id')
+        .values_list('order_id', flat=True)
+        .distinct()
+    )
+
+
+def plan_job(job_id: int, chunk_size: int = CHUNK_SIZE) -> List[List[int]]:
+    """Переводит задание в работу и возвращает пачки id заказов."""
+    order_ids = stock_order_ids()
+    chunks = [order_ids[i:i + chunk_size] for i in range(0, len(order_ids), chunk_size)]
+    now = timezone.now()
+    CostRecalculationJob.objects.filter(pk=job_id).update(
+        status='running' if chunks else 'done',
+        started_at=now,
+        finished_at=None if chunks else now,
+        total_orders=len(order_ids),
+        total_chunks=len(chunks),
+    )
+    return chunks
+
+
+def _recalculate(order_ids: List[int]):
+    """(обновлено заказов, заказов без затрат) для пачки."""
+    finished_goods = list(
+        FinishedGood.objects
+        .filter(status='stock', order_id__in=order_ids)
+        .only('id', 'order_id', 'quantity')
+    )
+    costs = collect_order_costs(order_ids)
+    changed = changed_finished_goods(finished_goods, costs)
+    write_costings(changed, costs)
+    empty = sum(1 for order_id in order_ids if order_id not in costs or costs[order_id].is_empty)
+    return len({fg.order_id for fg in changed}), empty
+
+
+def run_chunk(job_id: int, order_ids: Iterable[int]) -> CostRecalculationJob:
+    """
+    Пересчитывает пачку заказов и добавляет её итоги в задание.
+
+    Ошибка пачки не останавливает задание: пачка пересчитывается по
+    одному заказу, чтобы записать ошибочные заказы и посчитать остальные.
+    """
+    order_ids = list(order_ids)
+    updated = empty = 0
+    errors = []
+    try:
+        updated, empty = _recalculate(order_ids)
+    except Exception:
+        for order_id in order_ids:
+            try:
+                one_updated, one_empty = _recalculate([order_id])
+            except Exception as exc:
+                errors.append(f"Заказ #{order_id}: {exc}")
+                continue
+            updated += one_updated
+            empty += one_empty
+    return _record_chunk(job_id, len(order_ids), updated, empty, errors)
+
+
+def _record_chunk(job_id: int, processed: int, updated: int, empty: int, errors: List[str]) -> CostRecalculationJob:
+    with transaction.atomic():
+        job = CostRecalculationJob.objects.select_for_update().get(pk=job_id)
+        job.processed_orders += processed
+        job.updated_orders += updated
+        job.empty_orders += empty
+        job.failed_orders += len(errors)
+        job.done_chunks += 1
+        job.errors = (job.errors + errors)[:CostRecalculationJob.MAX_ERRORS]
+        if job.done_chunks >= job.total_chunks:
+            job.status = 'done'
+            job.finished_at = timezone.now()
+        job.save()
+    return job
+
+
+def fail_job(job_id: int, message: str) -> None:
+    """Отмечает задание проваленным (ошибка планирования)."""
+    with transaction.atomic():
+        job = CostRecalculationJob.objects.select_for_update().get(pk=job_id)
+        job.status = 'failed'
+        job.finished_at = timezone.now()
+        job.errors = (job.errors + [message])[:CostRecalculationJob.MAX_ERRORS]
+        job.save()
+
+
+def job_payload(job: CostRecalculationJob) -> dict:
+    """Состояние задания для опроса из интерфейса."""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress_percent': job.progress_percent,
+        'total_orders': job.total_orders,
+        'processed_orders': job.processed_orders,
+        'updated_orders': job.updated_orders,
+        'empty_orders': job.empty_orders,
+        'failed_orders': job.failed_orders,
+        'total_chunks': job.total_chunks,
+        'done_chunks': job.done_chunks,
+        'errors': job.errors,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
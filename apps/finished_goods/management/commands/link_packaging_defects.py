@@ -0,0 +1,66 @@
+import re
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.defects.models import Defect
+from apps.finished_goods.models import FinishedGood
+
+
+COMMENT_INPUT_RE = re.compile(r"of\s+([\d.]+)\s+kg")
+
+
+def _comment_input(defect):
+    """Из комментария "Packaging defect: X kg of Y kg" извлекает Y."""
+    match = COMMENT_INPUT_RE.search(defect.employee_comment or "")
+    if not match:
+        return None
+    try:
+        return Decimal(match.group(1).rstrip('.'))
+    except InvalidOperation:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Связывает старую готовую продукцию с браком упаковки по прежнему правилу '
+        '(тот же день, сначала тот же товар) и сохраняет взятое и бракованное количество'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько записей будет связано')
+
+    def handle(self, *args, **options):
+        by_day = defaultdict(list)
+        for defect in Defect.objects.filter(employee_comment__icontains='Packaging defect').order_by('-created_at'):
+            by_day[defect.created_at.date()].append(defect)
+
+        linked = []
+        goods = FinishedGood.objects.filter(packaging_defect__isnull=True).only(
+            'id', 'product_id', 'quantity', 'received_at', 'packaging_date',
+        )
+        for finished_good in goods.iterator(chunk_size=500):
+            item_date = finished_good.received_at or finished_good.packaging_date
+            candidates = by_day.get(item_date.date(), []) if item_date else []
+            if not candidates:
+                continue
+            defect = next((d for d in candidates if d.product_id and d.product_id == finished_good.product_id), candidates[0])
+            scrap = defect.quantity or Decimal('0')
+            finished_good.packaging_defect = defect
+            finished_good.packaging_scrap_quantity = scrap
+            finished_good.packaging_input_quantity = _comment_input(defect) or Decimal(finished_good.quantity) + scrap
+            linked.append(finished_good)
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                FinishedGood.objects.bulk_update(
+                    linked,
+                    ['packaging_defect', 'packaging_scrap_quantity', 'packaging_input_quantity'],
+                    batch_size=500,
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Готово. Связано записей готовой продукции: {len(linked)}')
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 14:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finished_goods', '0005_finishedgoodcosting_finishedgoodlaborcost_and_more'),
+        ('orders', '0011_add_preparation_specs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCostRecalculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marked_at', models.DateTimeField(auto_now_add=True, verbose_name='Отмечен')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_cost_recalculation', to='orders.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Заказ в очереди пересчёта себестоимости',
+                'verbose_name_plural': 'Очередь пересчёта себестоимости',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 15:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finished_goods', '0007_packaging_defect_link'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostRecalculationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начато')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('total_orders', models.PositiveIntegerField(default=0, verbose_name='Заказов всего')),
+                ('processed_orders', models.PositiveIntegerField(default=0, verbose_name='Заказов обработано')),
+                ('updated_orders', models.PositiveIntegerField(default=0, verbose_name='Заказов с изменённой себестоимостью')),
+                ('empty_orders', models.PositiveIntegerField(default=0, verbose_name='Заказов без затрат')),
+                ('failed_orders', models.PositiveIntegerField(default=0, verbose_name='Заказов с ошибкой')),
+                ('total_chunks', models.PositiveIntegerField(default=0, verbose_name='Пачек всего')),
+                ('done_chunks', models.PositiveIntegerField(default=0, verbose_name='Пачек обработано')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Примеры ошибок')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cost_recalculation_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Запустил')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт себестоимости склада',
+                'verbose_name_plural': 'Пересчёты себестоимости склада',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
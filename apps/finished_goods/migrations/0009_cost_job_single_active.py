@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_extra_active_jobs(apps, schema_editor):
+    """Оставляет незавершённым только последнее задание."""
+    CostRecalculationJob = apps.get_model('finished_goods', 'CostRecalculationJob')
+    active = CostRecalculationJob.objects.filter(status__in=['pending', 'running']).order_by('-created_at', '-pk')
+    latest = active.first()
+    if latest is not None:
+        active.exclude(pk=latest.pk).update(status='failed', finished_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finished_goods', '0008_costrecalculationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_extra_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='costrecalculationjob',
+            constraint=models.UniqueConstraint(models.Value(1), condition=models.Q(('status__in', ['pending', 'running'])), name='cost_job_single_active'),
+        ),
+    ]
@@ -25,6 +25,11 @@ class FinishedGood(models.Model):
     workshop = models.ForeignKey('operations_workshops.Workshop', on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Цех производства')
     packaging_date = models.DateTimeField('Дата упаковки', null=True, blank=True)
     quality_check_passed = models.BooleanField('Проверка качества пройдена', default=False)
+
+    # Брак упаковки (ID2): сколько полуфабриката взято в упаковку и сколько ушло в брак
+    packaging_defect = models.ForeignKey('defects.Defect', on_delete=models.SET_NULL, null=True, blank=True, related_name='packaged_finished_goods', verbose_name='Брак упаковки')
+    packaging_input_quantity = models.DecimalField('Взято в упаковку', max_digits=12, decimal_places=3, null=True, blank=True)
+    packaging_scrap_quantity = models.DecimalField('Брак упаковки (кол-во)', max_digits=12, decimal_places=3, default=0)
     
     class Meta:
         verbose_name = 'Готовая продукция'
@@ -77,125 +82,22 @@ class FinishedGood(models.Model):
         
         Если save=True, сохраняет результаты в базу данных.
         """
-        from apps.employee_tasks.models import EmployeeTask
-        from apps.inventory.models import MaterialConsumption
-        from apps.orders.models import OrderStage
-        from django.db import transaction
-        
-        # Получаем связанный заказ
-        order = self.order
+        from .costing import collect_order_costs, write_costings
         
-        if not order:
+        if not self.order_id:
             return None
         
-        # Собираем ВСЕ этапы заказа (независимо от order_item)
-        # Это позволяет учитывать затраты на всех этапах производства
-        all_stages = OrderStage.objects.filter(order=order)
-        stage_ids = list(all_stages.values_list('id', flat=True))
-        
-        if not stage_ids:
-            # Если нет этапов, пытаемся найти затраты напрямую по заказу
-            employee_tasks = EmployeeTask.objects.filter(stage__order=order)
-            material_consumptions = MaterialConsumption.objects.filter(order=order)
-        else:
-            # Собираем все задачи сотрудников по ВСЕМ этапам заказа
-            employee_tasks = EmployeeTask.objects.filter(stage_id__in=stage_ids)
-            
-            # Собираем все расходы сырья по ВСЕМ этапам заказа
-            material_consumptions = MaterialConsumption.objects.filter(
-                order=order
-            ).filter(
-                Q(employee_task__stage_id__in=stage_ids) | Q(employee_task__isnull=True)
-            )
-        
-        # Суммируем заработок сотрудников (net_earnings - чистый заработок после штрафов)
-        total_labor_cost = Decimal('0')
-        labor_tasks = []
-        
-        for task in employee_tasks:
-            if task.net_earnings and task.net_earnings > 0:
-                labor_cost = Decimal(str(task.net_earnings))
-                total_labor_cost += labor_cost
-                
-                labor_tasks.append({
-                    'task': task,
-                    'cost': labor_cost,
-                })
-        
-        # Суммируем стоимость израсходованного сырья
-        total_material_cost = Decimal('0')
-        material_consumptions_list = []
-        
-        for consumption in material_consumptions:
-            # Используем цену закупки, если есть, иначе цену продажи
-            material_price = consumption.material.purchase_price or consumption.material.price or Decimal('0')
-            material_cost = Decimal(str(consumption.quantity)) * Decimal(str(material_price))
-            total_material_cost += material_cost
-            
-            material_consumptions_list.append({
-                'consumption': consumption,
-                'cost': material_cost,
-            })
+        costs = collect_order_costs([self.order_id])
+        order_costs = costs.get(self.order_id)
         
         # Если по заказу вообще нет ни задач, ни расходов сырья —
         # возвращаем None, чтобы фронт мог использовать нормативную себестоимость
-        if total_labor_cost == 0 and total_material_cost == 0:
+        if not order_costs or order_costs.is_empty:
             return None
-
-        # Общая себестоимость
-        total_cost = total_labor_cost + total_material_cost
-        
-        # Себестоимость на единицу товара
-        quantity = Decimal(str(self.quantity or 1))
-        if quantity > 0:
-            cost_per_unit = (total_cost / quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        else:
-            cost_per_unit = Decimal('0')
         
-        result = {
-            'cost_per_unit': cost_per_unit,
-            'total_cost': total_cost.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-            'labor_cost': total_labor_cost.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-            'material_cost': total_material_cost.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-        }
-        
-        # Сохраняем в базу данных, если требуется
         if save:
-            with transaction.atomic():
-                # Создаем или обновляем себестоимость
-                costing, created = FinishedGoodCosting.objects.update_or_create(
-                    finished_good=self,
-                    defaults={
-                        'cost_per_unit': result['cost_per_unit'],
-                        'total_cost': result['total_cost'],
-                        'labor_cost': result['labor_cost'],
-                        'material_cost': result['material_cost'],
-                    }
-                )
-                
-                # Удаляем старые детализации
-                costing.labor_costs.all().delete()
-                costing.material_costs.all().delete()
-                
-                # Создаем детализацию по труду
-                for item in labor_tasks:
-                    FinishedGoodLaborCost.objects.create(
-                        costing=costing,
-                        employee_task=item['task'],
-                        cost=item['cost'],
-                        completed_quantity=item['task'].completed_quantity,
-                    )
-                
-                # Создаем детализацию по сырью
-                for item in material_consumptions_list:
-                    FinishedGoodMaterialCost.objects.create(
-                        costing=costing,
-                        material_consumption=item['consumption'],
-                        cost=item['cost'],
-                        quantity=item['consumption'].quantity,
-                    )
-        
-        return result
+            return write_costings([self], costs)[self.pk]
+        return order_costs.result_for(self.quantity)
 
 
 class FinishedGoodCosting(models.Model):
@@ -384,6 +286,83 @@ class FinishedGoodSale(models.Model):
             'total_profit': total_profit.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
         }
 
+class PendingCostRecalculation(models.Model):
+    """
+    Заказ, себестоимость готовой продукции которого нужно пересчитать.
+
+    Одна строка на заказ: повторные изменения до обработки схлопываются.
+    """
+    order = models.OneToOneField(
+        'orders.Order',
+        on_delete=models.CASCADE,
+        related_name='pending_cost_recalculation',
+        verbose_name='Заказ'
+    )
+    marked_at = models.DateTimeField('Отмечен', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Заказ в очереди пересчёта себестоимости'
+        verbose_name_plural = 'Очередь пересчёта себестоимости'
+    
+    def __str__(self):
+        return f"Пересчёт себестоимости заказа #{self.order_id}"
+
+
+class CostRecalculationJob(models.Model):
+    """
+    Фоновый пересчёт себестоимости всей готовой продукции на складе.
+
+    Заказы делятся на пачки, которые обрабатываются параллельно задачами
+    очереди finance; прогресс и примеры ошибок пишутся сюда, интерфейс
+    опрашивает запись по id.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершено'),
+        ('failed', 'Ошибка'),
+    ]
+    MAX_ERRORS = 10
+
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='pending')
+    requested_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='cost_recalculation_jobs', verbose_name='Запустил')
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    started_at = models.DateTimeField('Начато', null=True, blank=True)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
+    total_orders = models.PositiveIntegerField('Заказов всего', default=0)
+    processed_orders = models.PositiveIntegerField('Заказов обработано', default=0)
+    updated_orders = models.PositiveIntegerField('Заказов с изменённой себестоимостью', default=0)
+    empty_orders = models.PositiveIntegerField('Заказов без затрат', default=0)
+    failed_orders = models.PositiveIntegerField('Заказов с ошибкой', default=0)
+    total_chunks = models.PositiveIntegerField('Пачек всего', default=0)
+    done_chunks = models.PositiveIntegerField('Пачек обработано', default=0)
+    errors = models.JSONField('Примеры ошибок', default=list, blank=True)
+
+    class Meta:
+        verbose_name = 'Пересчёт себестоимости склада'
+        verbose_name_plural = 'Пересчёты себестоимости склада'
+        ordering = ['-created_at']
+        constraints = [
+            # Не больше одного незавершённого задания (см. jobs.start_job)
+            models.UniqueConstraint(
+                models.Value(1),
+                condition=models.Q(status__in=['pending', 'running']),
+                name='cost_job_single_active',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Пересчёт себестоимости #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def progress_percent(self):
+        if self.status == 'done':
+            return 100.0
+        if not self.total_orders:
+            return 0.0
+        return round(self.processed_orders / self.total_orders * 100, 1)
+
+
 def create_example_finished_good():
     from apps.products.models import Product
     from apps.orders.models import Order
@@ -411,51 +390,29 @@ from django.dispatch import receiver
 @receiver(post_save, sender=FinishedGood)
 def calculate_finished_good_cost(sender, instance, created, **kwargs):
     """
-    Автоматически рассчитывает себестоимость при создании или обновлении FinishedGood.
-    Рассчитывается для всех товаров на складе (status='stock') и в процессе готовки.
+    Ставит заказ товара в очередь пересчёта себестоимости при создании или
+    изменении важных полей FinishedGood.
     """
-    # Рассчитываем себестоимость только если есть связанный заказ
-    # Можно рассчитывать даже если товар еще не готов (в процессе производства)
-    if instance.order:
-        try:
-            # Используем update_fields для оптимизации - пересчитываем только если изменились важные поля
-            update_fields = kwargs.get('update_fields')
-            if update_fields is None or any(field in update_fields for field in ['order', 'order_item', 'quantity', 'status']):
-                instance.calculate_actual_cost(save=True)
-        except Exception as e:
-            # Логируем ошибку, но не прерываем сохранение
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Ошибка расчета себестоимости для FinishedGood #{instance.id}: {e}")
+    if instance.order_id:
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or any(field in update_fields for field in ['order', 'order_item', 'quantity', 'status']):
+            from .costing import mark_order_dirty
+            mark_order_dirty(instance.order_id)
 
 
 @receiver(post_save, sender='employee_tasks.EmployeeTask')
 @receiver(post_save, sender='factory_inventory.MaterialConsumption')
 def recalculate_finished_good_cost(sender, instance, **kwargs):
     """
-    Пересчитывает себестоимость готовой продукции в реальном времени при изменении задач или расхода сырья.
-    Система автоматически обновляет себестоимость для всех готовой продукции, связанной с заказом.
+    Помечает заказ для пересчёта себестоимости готовой продукции.
+
+    Сам пересчёт выполняет задача recalculate_pending_costs один раз на
+    заказ за окно, независимо от числа сохранений задач и расходов.
     """
-    from apps.finished_goods.models import FinishedGood
-    from django.db import transaction
+    from .costing import mark_order_dirty
     
-    # Определяем связанный заказ
-    order = None
-    if hasattr(instance, 'stage'):
-        order = instance.stage.order if instance.stage else None
-    elif hasattr(instance, 'order'):
-        order = instance.order
-    
-    if order:
-        # Пересчитываем себестоимость для всех готовой продукции этого заказа
-        # Используем select_for_update для предотвращения race conditions
-        finished_goods = FinishedGood.objects.filter(order=order).select_related('order', 'order_item')
-        
-        for fg in finished_goods:
-            try:
-                with transaction.atomic():
-                    fg.calculate_actual_cost(save=True)
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Ошибка пересчета себестоимости для FinishedGood #{fg.id}: {e}", exc_info=True)
+    if sender._meta.model_name == 'employeetask':
+        order_id = instance.stage.order_id if instance.stage_id else None
+    else:
+        order_id = instance.order_id
+    mark_order_dirty(order_id)
@@ -7,6 +7,7 @@ from apps.clients.models import Client
 from apps.orders.models import Order
 from apps.products.serializers import ProductSerializer
 from apps.orders.serializers import OrderSerializer
+from core.api import SparseFieldsetMixin
 
 
 MONEY_Q = Decimal('0.01')
@@ -16,13 +17,20 @@ def qmoney(value: Decimal) -> Decimal:
     return (value or Decimal('0')).quantize(MONEY_Q, rounding=ROUND_HALF_UP)
 
 
-def _get_cost_breakdown(product, quantity=1):
+def _get_cost_breakdown(product, quantity=1, context=None):
     if not product:
         return None
-    return product.get_cost_breakdown(quantity=quantity)
+    if context is None:
+        return product.get_cost_breakdown(quantity=quantity)
+    # В списке нормативная себестоимость считается один раз на товар
+    cache = context.setdefault('_cost_breakdowns', {})
+    key = (product.pk, quantity)
+    if key not in cache:
+        cache[key] = product.get_cost_breakdown(quantity=quantity)
+    return cache[key]
 
 
-class FinishedGoodSerializer(serializers.ModelSerializer):
+class FinishedGoodSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = serializers.StringRelatedField()
     product_display_name = serializers.SerializerMethodField()
     order = serializers.StringRelatedField()
@@ -32,6 +40,10 @@ class FinishedGoodSerializer(serializers.ModelSerializer):
     labor_cost = serializers.SerializerMethodField()
     material_cost = serializers.SerializerMethodField()
     has_costing = serializers.SerializerMethodField()
+    input_quantity = serializers.SerializerMethodField()
+    scrap_quantity = serializers.SerializerMethodField()
+    efficiency = serializers.SerializerMethodField()
+    defect_id = serializers.IntegerField(source='packaging_defect_id', read_only=True)
 
     class Meta:
         model = FinishedGood
@@ -39,6 +51,7 @@ class FinishedGoodSerializer(serializers.ModelSerializer):
             'id', 'product', 'product_display_name', 'quantity', 'order', 'status', 'status_display',
             'received_at', 'issued_at', 'recipient', 'comment',
             'cost_per_unit', 'cost_total', 'labor_cost', 'material_cost', 'has_costing',
+            'input_quantity', 'scrap_quantity', 'efficiency', 'defect_id',
         ]
 
     def get_product_display_name(self, obj):
@@ -54,7 +67,7 @@ class FinishedGoodSerializer(serializers.ModelSerializer):
         if hasattr(obj, 'costing') and obj.costing:
             return float(obj.costing.cost_per_unit)
         # Иначе используем нормативную себестоимость
-        breakdown = _get_cost_breakdown(getattr(obj, 'product', None), quantity=1)
+        breakdown = _get_cost_breakdown(getattr(obj, 'product', None), quantity=1, context=self.context)
         if not breakdown:
             return None
         return float(breakdown["totals"]["total"])
@@ -64,7 +77,7 @@ class FinishedGoodSerializer(serializers.ModelSerializer):
         if hasattr(obj, 'costing') and obj.costing:
             return float(obj.costing.total_cost)
         # Иначе используем нормативную себестоимость
-        breakdown = _get_cost_breakdown(getattr(obj, 'product', None), quantity=1)
+        breakdown = _get_cost_breakdown(getattr(obj, 'product', None), quantity=1, context=self.context)
         if not breakdown:
             return None
         per_unit = breakdown["totals"]["total"]
@@ -86,6 +99,23 @@ class FinishedGoodSerializer(serializers.ModelSerializer):
         """Проверяет, есть ли рассчитанная себестоимость"""
         return hasattr(obj, 'costing') and obj.costing is not None
 
+    def get_input_quantity(self, obj):
+        """Сколько полуфабриката взято в упаковку (без брака — равно выпуску)"""
+        value = getattr(obj, 'packaging_input', None)
+        if value is None:
+            value = obj.packaging_input_quantity
+        if value is None:
+            value = Decimal(str(obj.quantity or 0)) + (obj.packaging_scrap_quantity or 0)
+        return float(value)
+
+    def get_scrap_quantity(self, obj):
+        return float(obj.packaging_scrap_quantity or 0)
+
+    def get_efficiency(self, obj):
+        input_quantity = self.get_input_quantity(obj)
+        efficiency = (float(obj.quantity) / input_quantity * 100) if input_quantity > 0 else 100.0
+        return round(efficiency, 1)
+
 
 class FinishedGoodLaborCostSerializer(serializers.ModelSerializer):
     employee_name = serializers.CharField(source='employee_task.employee.get_full_name', read_only=True)
@@ -0,0 +1,64 @@
+from celery import shared_task
+
+from .costing import process_pending_costs
+
+
+@shared_task
+def recalculate_pending_costs(limit=500):
+    """
+    Пересчитывает себестоимость готовой продукции помеченных заказов.
+
+    Запускается по расписанию (окно схлопывания, см. core/celery.py):
+    заказ пересчитывается один раз за запуск, сколько бы раз его ни
+    отметили. Обрабатывает очередь пачками по limit заказов, пока она не опустеет.
+    """
+    processed = 0
+    while True:
+        count = process_pending_costs(limit=limit)
+        processed += count
+        if count < limit:
+            break
+    return {
+        'status': 'success',
+        'message': f'Пересчитана себестоимость заказов: {processed}',
+        'orders': processed,
+    }
+
+
+@shared_task
+def plan_cost_recalculation(job_id, chunk_size=None):
+    """
+    Делит заказы склада на пачки и запускает их параллельный пересчёт.
+
+    Ставится в очередь из FinishedGoodViewSet.recalculate_all_costs;
+    прогресс пишется в CostRecalculationJob (см. jobs.py).
+    """
+    from celery import group
+
+    from .jobs import CHUNK_SIZE, fail_job, plan_job
+
+    try:
+        chunks = plan_job(job_id, chunk_size or CHUNK_SIZE)
+    except Exception as exc:
+        fail_job(job_id, f'Ошибка планирования: {exc}')
+        raise
+    if chunks:
+        group(recalculate_cost_chunk.s(job_id, chunk) for chunk in chunks).apply_async()
+    return {
+        'status': 'success',
+        'message': f'Запущено пачек пересчёта себестоимости: {len(chunks)}',
+        'chunks': len(chunks),
+    }
+
+
+@shared_task
+def recalculate_cost_chunk(job_id, order_ids):
+    """Пересчитывает себестоимость товаров пачки заказов задания job_id."""
+    from .jobs import run_chunk
+
+    job = run_chunk(job_id, order_ids)
+    return {
+        'status': 'success',
+        'message': f'Пачка пересчитана: {len(order_ids)} заказов',
+        'job_status': job.status,
+    }
@@ -1,3 +1,261 @@
+from io import StringIO
+from unittest import mock
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.clients.models import Client
+from apps.defects.models import Defect
+from apps.employee_tasks.models import EmployeeTask
+from apps.operations.workshops.models import NeutralBatch, StorageZone, Workshop
+from apps.orders.models import Order, OrderStage
+from apps.products.models import Product
+
+from . import jobs
+from .costing import process_pending_costs
+from .jobs import plan_job, run_chunk
+from .models import CostRecalculationJob, FinishedGood, FinishedGoodCosting, PendingCostRecalculation
+
+User = get_user_model()
+
+
+class CostRecalculationQueueTests(TestCase):
+    def setUp(self):
+        workshop = Workshop.objects.create(name="Упаковка")
+        self.employee = User.objects.create_user(username="worker", password="pass")
+        self.order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+        self.stage = OrderStage.objects.create(order=self.order, workshop=workshop, plan_quantity=10)
+        self.finished_good = FinishedGood.objects.create(
+            product=Product.objects.create(name="Дверь"), order=self.order, quantity=4,
+        )
+
+    def add_task(self, completed):
+        return EmployeeTask.objects.create(
+            stage=self.stage, employee=self.employee, quantity=completed,
+            completed_quantity=completed, custom_unit_price=Decimal("10"),
+        )
+
+    def test_task_saves_only_mark_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_task(2)
+            self.add_task(3)
+
+        self.assertEqual(PendingCostRecalculation.objects.filter(order=self.order).count(), 1)
+        self.assertFalse(FinishedGoodCosting.objects.exists())
+
+    def test_queue_is_processed_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_task(2)
+            self.add_task(6)
+
+        self.assertEqual(process_pending_costs(), 1)
+        self.assertEqual(process_pending_costs(), 0)
+
+        costing = FinishedGoodCosting.objects.get(finished_good=self.finished_good)
+        self.assertEqual(costing.labor_cost, Decimal("80.00"))
+        self.assertEqual(costing.cost_per_unit, Decimal("20.00"))
+        self.assertEqual(costing.labor_costs.count(), 2)
+
+    def test_direct_calculation_matches_queue(self):
+        self.add_task(5)
+        result = self.finished_good.calculate_actual_cost(save=True)
+
+        self.assertEqual(result['total_cost'], Decimal("50.00"))
+        self.assertEqual(self.finished_good.costing.labor_costs.count(), 1)
+        # Повторный расчёт заменяет детализацию, а не дублирует её
+        self.finished_good.calculate_actual_cost(save=True)
+        self.assertEqual(FinishedGoodCosting.objects.get().labor_costs.count(), 1)
+
+
+
+class CostRecalculationJobTests(TestCase):
+    def setUp(self):
+        workshop = Workshop.objects.create(name="Сборка")
+        employee = User.objects.create_user(username="worker", password="pass")
+        self.admin = User.objects.create_user(username="admin", password="pass")
+        product = Product.objects.create(name="Дверь")
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(name=f"Заказ {i}", client=Client.objects.create(name=f"Клиент {i}"))
+            stage = OrderStage.objects.create(order=order, workshop=workshop, plan_quantity=10)
+            EmployeeTask.objects.create(
+                stage=stage, employee=employee, quantity=4,
+                completed_quantity=4, custom_unit_price=Decimal("10"),
+            )
+            FinishedGood.objects.create(product=product, order=order, quantity=2)
+            self.orders.append(order)
+        FinishedGoodCosting.objects.all().delete()
+
+    def run_job(self, chunk_size=2):
+        job = CostRecalculationJob.objects.create()
+        for chunk in plan_job(job.pk, chunk_size):
+            run_chunk(job.pk, chunk)
+        job.refresh_from_db()
+        return job
+
+    def test_chunks_recalculate_and_rerun_is_idempotent(self):
+        job = self.run_job()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.total_chunks, job.done_chunks), (2, 2))
+        self.assertEqual((job.processed_orders, job.updated_orders), (3, 3))
+        self.assertEqual(FinishedGoodCosting.objects.count(), 3)
+        self.assertEqual(FinishedGoodCosting.objects.first().cost_per_unit, Decimal("20.00"))
+
+        calculated = list(FinishedGoodCosting.objects.order_by("pk").values_list("calculated_at", flat=True))
+        rerun = self.run_job()
+        self.assertEqual((rerun.processed_orders, rerun.updated_orders), (3, 0))
+        self.assertEqual(calculated, list(FinishedGoodCosting.objects.order_by("pk").values_list("calculated_at", flat=True)))
+
+    def test_failed_order_is_sampled_and_others_processed(self):
+        broken = self.orders[0].pk
+        original = jobs.collect_order_costs
+
+        def collect(order_ids):
+            if broken in order_ids:
+                raise ValueError("нет цены")
+            return original(order_ids)
+
+        with mock.patch.object(jobs, "collect_order_costs", side_effect=collect):
+            job = self.run_job(chunk_size=3)
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.failed_orders, job.updated_orders), (1, 2))
+        self.assertEqual(job.errors, [f"Заказ #{broken}: нет цены"])
+
+    def test_concurrent_start_reuses_active_job(self):
+        existing = CostRecalculationJob.objects.create()
+        real_active_job = jobs.active_job
+        # Параллельный запрос: проверка ещё не видит задание, созданное другим
+        with mock.patch.object(jobs, "active_job", side_effect=[None, real_active_job()]), \
+                mock.patch("apps.finished_goods.tasks.plan_cost_recalculation.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                job = jobs.start_job(self.admin)
+        self.assertEqual(job, existing)
+        self.assertEqual(CostRecalculationJob.objects.count(), 1)
+        delay.assert_not_called()
+
+    def test_stale_job_is_failed_on_start(self):
+        from django.utils import timezone
+
+        stale = CostRecalculationJob.objects.create(status="running")
+        CostRecalculationJob.objects.filter(pk=stale.pk).update(created_at=timezone.now() - jobs.STALE_AFTER * 2)
+        with mock.patch("apps.finished_goods.tasks.plan_cost_recalculation.delay"):
+            job = jobs.start_job(self.admin)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+        self.assertNotEqual(job.pk, stale.pk)
+        self.assertEqual(job.status, "pending")
+
+    def test_api_starts_single_job_and_reports_progress(self):
+        self.client.force_login(self.admin)
+        url = reverse("finishedgood-recalculate-all-costs")
+        with mock.patch("apps.finished_goods.tasks.plan_cost_recalculation.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.client.post(url)
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self.client.post(url)
+        self.assertEqual(first.status_code, 202)
+        job_id = first.json()["job"]["id"]
+        self.assertEqual(second.json()["job"]["id"], job_id)
+        delay.assert_called_once_with(job_id)
+
+        status_url = reverse("finishedgood-recalculate-all-costs-status", kwargs={"job_id": job_id})
+        self.assertEqual(self.client.get(status_url).json()["status"], "pending")
+
+
+class PackagingDefectLinkTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Пакет")
+        packaging = Workshop.objects.create(name="Упаковка")
+        storage = Workshop.objects.create(name="Склад")
+        self.packer = User.objects.create_user(username="packer", password="pass", workshop=packaging)
+        self.keeper = User.objects.create_user(username="keeper", password="pass", workshop=storage)
+        extrusion = Workshop.objects.create(name="Экструзия")
+        self.batch = NeutralBatch.objects.create(workshop=extrusion, employee=self.packer, total_quantity=Decimal("50"))
+
+    def listed(self):
+        return {row["id"]: row for row in self.client.get(reverse("finishedgood-list")).json()["results"]}
+
+    def test_packaging_scrap_travels_to_finished_good(self):
+        self.client.force_login(self.packer)
+        response = self.client.post("/api/workshops/api/packaging/report/", {
+            "neutral_batch_id": self.batch.id, "input_quantity": "40", "produced_quantity": "30",
+            "mode": "stock", "product_id": self.product.id,
+        })
+        self.assertEqual(response.status_code, 200)
+        zone = StorageZone.objects.get(pk=response.json()["storage_zone_id"])
+        self.assertEqual(zone.packaging_input_quantity, Decimal("40"))
+        self.assertEqual(zone.packaging_scrap_quantity, Decimal("10"))
+        self.assertEqual(zone.packaging_defect_id, response.json()["defect_id"])
+
+        self.client.force_login(self.keeper)
+        response = self.client.post("/api/workshops/api/warehouse/report/", {
+            "storage_zone_id": zone.id, "produced_quantity": "30",
+        })
+        self.assertEqual(response.status_code, 200)
+        finished_good = FinishedGood.objects.get(product=self.product)
+
+        item = self.listed()[finished_good.id]
+        self.assertEqual(item["input_quantity"], 40.0)
+        self.assertEqual(item["scrap_quantity"], 10.0)
+        self.assertEqual(item["efficiency"], 75.0)
+        self.assertEqual(item["defect_id"], zone.packaging_defect_id)
+
+    def pull(self, zone, quantity):
+        self.client.force_login(self.keeper)
+        response = self.client.post("/api/workshops/api/warehouse/report/", {
+            "storage_zone_id": zone.id, "produced_quantity": quantity, "input_quantity": quantity,
+        })
+        self.assertEqual(response.status_code, 200)
+        return FinishedGood.objects.order_by("-id").first()
+
+    def test_partial_pulls_share_packaging_input(self):
+        zone = StorageZone.objects.create(
+            workshop=self.packer.workshop, employee=self.packer, product=self.product,
+            total_quantity=Decimal("100"), packaging_input_quantity=Decimal("100"),
+        )
+        goods = [self.pull(zone, quantity) for quantity in ("30", "30", "30", "10")]
+        listed = self.listed()
+        for finished_good in goods:
+            self.assertEqual(listed[finished_good.id]["efficiency"], 100.0)
+            self.assertEqual(listed[finished_good.id]["input_quantity"], float(finished_good.quantity))
+        self.assertEqual(sum(good.packaging_input_quantity for good in goods), Decimal("100"))
+
+    def test_partial_pulls_share_packaging_scrap(self):
+        zone = StorageZone.objects.create(
+            workshop=self.packer.workshop, employee=self.packer, product=self.product,
+            total_quantity=Decimal("30"), packaging_input_quantity=Decimal("40"),
+            packaging_scrap_quantity=Decimal("10"),
+        )
+        goods = [self.pull(zone, "15"), self.pull(zone, "15")]
+        for finished_good in goods:
+            self.assertEqual(finished_good.packaging_input_quantity, Decimal("20"))
+            self.assertEqual(finished_good.packaging_scrap_quantity, Decimal("5"))
+            self.assertEqual(self.listed()[finished_good.id]["efficiency"], 75.0)
+
+    def test_list_query_count_is_fixed(self):
+        self.client.force_login(self.keeper)
+        FinishedGood.objects.create(product=self.product, quantity=2)
+        self.listed()  # сессия и настройки себестоимости в кэше
+        with CaptureQueriesContext(connection) as one:
+            self.listed()
+        for _ in range(10):
+            FinishedGood.objects.create(product=self.product, quantity=3)
+        with CaptureQueriesContext(connection) as many:
+            item = self.listed()
+        self.assertLessEqual(len(many), len(one))
+        self.assertTrue(all(row["input_quantity"] == row["quantity"] for row in item.values()))
 
-# Create your tests here.
+    def test_backfill_command_uses_legacy_comment(self):
+        finished_good = FinishedGood.objects.create(product=self.product, quantity=8)
+        defect = Defect.objects.create(product=self.product, user=self.packer, quantity=Decimal("2"),
+                                       employee_comment="Packaging defect: 2 kg of 12 kg.")
+        call_command("link_packaging_defects", stdout=StringIO())
+        finished_good.refresh_from_db()
+        self.assertEqual(finished_good.packaging_defect, defect)
+        self.assertEqual(finished_good.packaging_input_quantity, Decimal("12"))
+        self.assertEqual(finished_good.packaging_scrap_quantity, Decimal("2"))
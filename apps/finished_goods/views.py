@@ -10,9 +10,9 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
 from django.db import transaction
 from django.utils import timezone
-from apps.defects.models import Defect
-from datetime import timedelta
-import re
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Coalesce
+from core.api import ReceivedAtPagination
 
 # Create your views here.
 
@@ -27,83 +27,24 @@ class FinishedGoodViewSet(viewsets.ReadOnlyModelViewSet):
     ).all().order_by('-received_at')
     serializer_class = FinishedGoodSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReceivedAtPagination
 
-    def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-
-        # DRF при включённой пагинации возвращает структуру
-        # {"count": ..., "next": ..., "previous": ..., "results": [...]}
-        # поэтому достаём именно список записей
-        data = response.data
-        items = data.get('results', data) if isinstance(data, dict) else data
-
-        # Добавляем информацию о браках для каждой записи
-        for item in items:
-            # На всякий случай пропускаем некорректные элементы
-            if not isinstance(item, dict):
-                continue
-
-            finished_good_id = item.get('id')
-            if not finished_good_id:
-                continue
-            
-            try:
-                finished_good = FinishedGood.objects.get(id=finished_good_id)
-            except FinishedGood.DoesNotExist:
-                continue
-            
-            # Ищем связанный брак для этой готовой продукции
-            # Брак создается в тот же день с комментарием об упаковке
-            item_date = finished_good.received_at or finished_good.packaging_date
-            if not item_date:
-                continue
-                
-            date_start = item_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            date_end = date_start + timedelta(days=1)
-            
-            # Ищем брак по продукту и дате, или по комментарию
-            # Приоритет: продукт + дата, затем только дата + комментарий
-            related_defect = None
-            
-            # Сначала пытаемся найти по продукту и дате
-            if finished_good.product:
-                related_defect = Defect.objects.filter(
-                    product=finished_good.product,
-                    created_at__gte=date_start,
-                    created_at__lt=date_end,
-                    employee_comment__icontains="Packaging defect"
-                ).first()
-            
-            # Если не нашли, ищем только по дате и комментарию (может быть несколько, берем первый)
-            if not related_defect:
-                related_defect = Defect.objects.filter(
-                    created_at__gte=date_start,
-                    created_at__lt=date_end,
-                    employee_comment__icontains="Packaging defect"
-                ).order_by('-created_at').first()
-            
-            scrap_quantity = 0
-            input_quantity = float(finished_good.quantity)
-            
-            if related_defect:
-                scrap_quantity = float(related_defect.quantity)
-                # Из комментария "Packaging defect: X kg of Y kg" извлекаем Y
-                comment = related_defect.employee_comment or ""
-                match = re.search(r"of\s+([\d.]+)\s+kg", comment)
-                if match:
-                    input_quantity = float(match.group(1))
-                else:
-                    # Если не удалось извлечь, считаем что input = produced + scrap
-                    input_quantity = float(finished_good.quantity) + scrap_quantity
-            
-            efficiency = (float(finished_good.quantity) / input_quantity * 100) if input_quantity > 0 else 100.0
-            
-            item['input_quantity'] = input_quantity
-            item['scrap_quantity'] = scrap_quantity
-            item['efficiency'] = round(efficiency, 1)
-            item['defect_id'] = related_defect.id if related_defect else None
-        
-        return response
+    def get_queryset(self):
+        if self.action != 'list':
+            return super().get_queryset()
+        # Список: только то, что читает FinishedGoodSerializer, и брак упаковки
+        # из сохранённой связи — одним запросом на страницу
+        return FinishedGood.objects.select_related(
+            'product', 'order__client', 'order__product', 'order_item__product', 'costing'
+        ).annotate(
+            packaging_input=Coalesce(
+                'packaging_input_quantity',
+                ExpressionWrapper(
+                    F('quantity') + F('packaging_scrap_quantity'),
+                    output_field=DecimalField(max_digits=14, decimal_places=3),
+                ),
+            ),
+        ).order_by('-received_at')
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -149,35 +90,39 @@ class FinishedGoodViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=False, methods=['post'], url_path='recalculate-all-costs')
+    @action(detail=False, methods=['get', 'post'], url_path='recalculate-all-costs')
     def recalculate_all_costs(self, request):
         """
         Пересчитывает себестоимость для всех товаров на складе (status='stock').
+
+        POST ставит фоновое задание в очередь finance (или возвращает уже
+        идущее), GET — состояние последнего задания.
         """
-        finished_goods = FinishedGood.objects.filter(status='stock', order__isnull=False)
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for fg in finished_goods:
-            try:
-                result = fg.calculate_actual_cost(save=True)
-                if result is not None:
-                    success_count += 1
-                else:
-                    error_count += 1
-                    errors.append(f"FinishedGood #{fg.id}: нет связанных данных")
-            except Exception as e:
-                error_count += 1
-                errors.append(f"FinishedGood #{fg.id}: {str(e)}")
-        
+        from .jobs import job_payload, start_job
+        from .models import CostRecalculationJob
+
+        if request.method == 'GET':
+            job = CostRecalculationJob.objects.first()
+            if job is None:
+                return Response({'error': 'Пересчёт ещё не запускался'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(job_payload(job))
+
+        job = start_job(request.user)
         return Response({
-            'message': f'Пересчет завершен. Успешно: {success_count}, Ошибок: {error_count}',
-            'success_count': success_count,
-            'error_count': error_count,
-            'errors': errors[:10]  # Ограничиваем количество ошибок в ответе
-        }, status=status.HTTP_200_OK)
+            'message': 'Пересчет себестоимости запущен',
+            'job': job_payload(job),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'recalculate-all-costs/(?P<job_id>[0-9]+)')
+    def recalculate_all_costs_status(self, request, job_id=None):
+        """Прогресс задания пересчёта себестоимости для опроса из интерфейса."""
+        from .jobs import job_payload
+        from .models import CostRecalculationJob
+
+        job = CostRecalculationJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': 'Задание не найдено'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_payload(job))
 
 
 class FinishedGoodSaleViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.valuation import rebuild_layers
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает партии FIFO и стоимость остатков сырья из истории приходов, переработок и выдач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--material',
+            type=int,
+            action='append',
+            default=None,
+            help='ID материала (можно указать несколько раз; по умолчанию — все)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересборка партий FIFO...')
+
+        count = rebuild_layers(options['material'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Готово. Материалов обработано: {count}')
+        )
@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-18 14:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0008_defectrework'),
+        ('factory_inventory', '0011_rawmaterial_purchase_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawmaterial',
+            name='stock_value',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Стоимость остатка (FIFO)'),
+        ),
+        migrations.CreateModel(
+            name='InventoryLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('incoming', 'Приход'), ('rework', 'Переработка брака'), ('opening', 'Начальный остаток'), ('adjustment', 'Корректировка')], max_length=16, verbose_name='Источник')),
+                ('received_at', models.DateTimeField(db_index=True, verbose_name='Дата поступления')),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Количество')),
+                ('remaining', models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Остаток')),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за единицу')),
+                ('incoming', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fifo_layers', to='factory_inventory.materialincoming', verbose_name='Приход')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fifo_layers', to='factory_inventory.rawmaterial', verbose_name='Материал')),
+                ('rework', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fifo_layers', to='defects.defectrework', verbose_name='Переработка')),
+            ],
+            options={
+                'verbose_name': 'Партия сырья (FIFO)',
+                'verbose_name_plural': 'Партии сырья (FIFO)',
+                'ordering': ['received_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventoryLayerConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Количество')),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за единицу')),
+                ('consumed_at', models.DateTimeField(db_index=True, verbose_name='Дата списания')),
+                ('issue_log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fifo_consumptions', to='factory_inventory.materialissuelog', verbose_name='Выдача')),
+                ('layer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='factory_inventory.inventorylayer', verbose_name='Партия')),
+            ],
+            options={
+                'verbose_name': 'Списание партии (FIFO)',
+                'verbose_name_plural': 'Списания партий (FIFO)',
+                'ordering': ['consumed_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorylayer',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['material', 'received_at', 'id'], name='inv_layer_open_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations
+
+
+def backfill_opening_layers(apps, schema_editor):
+    """
+    Переносит текущие остатки в партии FIFO: у каждого материала с
+    остатком и без партий создаётся партия начального остатка по средней
+    закупочной цене (иначе по цене материала), и от неё заполняется
+    stock_value. Историю приходов и выдач при необходимости пересобирает
+    команда rebuild_inventory_layers.
+    """
+    RawMaterial = apps.get_model('factory_inventory', 'RawMaterial')
+    InventoryLayer = apps.get_model('factory_inventory', 'InventoryLayer')
+    money = Decimal('0.01')
+
+    layers = []
+    for material in RawMaterial.objects.filter(quantity__gt=0, fifo_layers__isnull=True).iterator(chunk_size=500):
+        unit_cost = Decimal(str(material.purchase_price or material.price or 0)).quantize(money, rounding=ROUND_HALF_UP)
+        layers.append(InventoryLayer(
+            material=material, source='opening', received_at=material.created_at,
+            quantity=material.quantity, remaining=material.quantity, unit_cost=unit_cost,
+        ))
+        RawMaterial.objects.filter(pk=material.pk).update(
+            stock_value=(material.quantity * unit_cost).quantize(money, rounding=ROUND_HALF_UP),
+        )
+    InventoryLayer.objects.bulk_create(layers, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_inventory', '0012_fifo_inventory_layers'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_opening_layers, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from decimal import Decimal
 from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 
 
 class RawMaterial(models.Model):
@@ -18,6 +20,7 @@ class RawMaterial(models.Model):
     min_quantity = models.DecimalField('Мин. остаток', max_digits=12, decimal_places=3, default=0)
     price = models.DecimalField('Цена за единицу', max_digits=10, decimal_places=2, default=0)
     purchase_price = models.DecimalField('Цена закупки (ср.)', max_digits=10, decimal_places=2, default=0)
+    stock_value = models.DecimalField('Стоимость остатка (FIFO)', max_digits=14, decimal_places=2, default=0, editable=False)
     country = models.CharField('Страна производителя', max_length=100, blank=True)
     description = models.TextField('Описание', blank=True)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
@@ -31,13 +34,20 @@ class RawMaterial(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # stock_value ведётся только регистром партий (valuation.py) через F(),
+        # поэтому полное сохранение существующей записи его не перезаписывает
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'stock_value'
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def total_value(self):
-        """Общая стоимость материала на складе."""
-        if self.quantity is None:
-            return 0
-        unit_cost = self.purchase_price or self.price or Decimal('0')
-        return (self.quantity * unit_cost).quantize(Decimal('0.01'))
+        """Общая стоимость материала на складе (по партиям FIFO)."""
+        return (self.stock_value or Decimal('0')).quantize(Decimal('0.01'))
 
 class MaterialIncoming(models.Model):
     """Модель для истории приходов материалов"""
@@ -135,6 +145,85 @@ class MaterialConsumption(models.Model):
         return f"{self.material.name} - {self.quantity} ({self.workshop.name})" 
 
 
+class InventoryLayer(models.Model):
+    """
+    Партия сырья для оценки остатков по FIFO.
+
+    Создаётся приходом, переработкой брака (цех ID4), начальным остатком или
+    ручной корректировкой; remaining уменьшается выдачами в порядке received_at.
+    """
+
+    SOURCE_CHOICES = (
+        ('incoming', 'Приход'),
+        ('rework', 'Переработка брака'),
+        ('opening', 'Начальный остаток'),
+        ('adjustment', 'Корректировка'),
+    )
+
+    material = models.ForeignKey(RawMaterial, on_delete=models.CASCADE, related_name='fifo_layers', verbose_name='Материал')
+    source = models.CharField('Источник', max_length=16, choices=SOURCE_CHOICES)
+    incoming = models.ForeignKey(
+        MaterialIncoming,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='fifo_layers',
+        verbose_name='Приход',
+    )
+    rework = models.ForeignKey(
+        'defects.DefectRework',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='fifo_layers',
+        verbose_name='Переработка',
+    )
+    received_at = models.DateTimeField('Дата поступления', db_index=True)
+    quantity = models.DecimalField('Количество', max_digits=12, decimal_places=3)
+    remaining = models.DecimalField('Остаток', max_digits=12, decimal_places=3)
+    unit_cost = models.DecimalField('Цена за единицу', max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'Партия сырья (FIFO)'
+        verbose_name_plural = 'Партии сырья (FIFO)'
+        ordering = ['received_at', 'id']
+        indexes = [
+            models.Index(
+                fields=['material', 'received_at', 'id'],
+                condition=models.Q(remaining__gt=0),
+                name='inv_layer_open_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.material.name}: {self.remaining}/{self.quantity} по {self.unit_cost}"
+
+
+class InventoryLayerConsumption(models.Model):
+    """Списание из партии FIFO (выдача или корректировка остатка)."""
+
+    layer = models.ForeignKey(InventoryLayer, on_delete=models.CASCADE, related_name='consumptions', verbose_name='Партия')
+    issue_log = models.ForeignKey(
+        MaterialIssueLog,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='fifo_consumptions',
+        verbose_name='Выдача',
+    )
+    quantity = models.DecimalField('Количество', max_digits=12, decimal_places=3)
+    unit_cost = models.DecimalField('Цена за единицу', max_digits=10, decimal_places=2)
+    consumed_at = models.DateTimeField('Дата списания', db_index=True)
+
+    class Meta:
+        verbose_name = 'Списание партии (FIFO)'
+        verbose_name_plural = 'Списания партий (FIFO)'
+        ordering = ['consumed_at', 'id']
+
+    def __str__(self):
+        return f"{self.layer_id}: -{self.quantity}"
+
+
 class EmployeeMaterialBalance(models.Model):
     employee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='material_balances')
     material = models.ForeignKey(RawMaterial, on_delete=models.CASCADE, related_name='employee_balances')
@@ -149,3 +238,24 @@ class EmployeeMaterialBalance(models.Model):
 
     def __str__(self):
         return f"{self.employee_id} - {self.material.name}: {self.quantity}"
+
+
+@receiver(post_save, sender=MaterialIncoming)
+def add_incoming_layer(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        from .valuation import add_incoming_layer as add_layer
+        add_layer(instance)
+
+
+@receiver(post_save, sender='defects.DefectRework')
+def add_rework_layer(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        from .valuation import add_rework_layer as add_layer
+        add_layer(instance)
+
+
+@receiver(post_save, sender=MaterialIssueLog)
+def consume_issue_layers(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        from .valuation import consume_fifo
+        consume_fifo(instance.material_id, instance.quantity, issue_log=instance, when=instance.created_at)
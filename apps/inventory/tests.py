@@ -0,0 +1,122 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import InventoryLayer, InventoryLayerConsumption, MaterialIncoming, MaterialIssueLog, RawMaterial
+from .valuation import rebuild_layers, valuation_as_of
+
+User = get_user_model()
+
+
+class FifoValuationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="storekeeper", password="pass")
+        self.client.force_login(self.user)
+        self.material = RawMaterial.objects.create(name="МДФ", unit="лист", price=Decimal("90.00"))
+
+    def post(self, name, payload):
+        return self.client.post(reverse(name), data=json.dumps(payload), content_type="application/json")
+
+    def receive(self, quantity, price):
+        response = self.post("inventory:api_material_incoming", {
+            "material_id": self.material.id, "quantity": quantity, "price_per_unit": price,
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def issue(self, quantity):
+        response = self.post("inventory:api_material_issue", {"material_id": self.material.id, "quantity": quantity})
+        self.assertEqual(response.status_code, 200)
+
+    def test_issue_consumes_oldest_layers(self):
+        self.receive(10, "100")
+        self.receive(5, "200")
+        self.issue(12)
+
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.quantity, Decimal("3"))
+        # Остались 3 ед. из второй партии по 200
+        self.assertEqual(self.material.stock_value, Decimal("600.00"))
+        self.assertEqual(
+            list(InventoryLayer.objects.filter(material=self.material).values_list("remaining", flat=True)),
+            [Decimal("0"), Decimal("3")],
+        )
+        self.assertEqual(InventoryLayerConsumption.objects.filter(issue_log__isnull=False).count(), 2)
+
+        response = self.client.get(reverse("inventory:api_material_price_breakdown", args=[self.material.id]))
+        data = response.json()["data"]
+        self.assertEqual(data["breakdown"], [{"price": 200.0, "quantity": 3.0}])
+        self.assertEqual(data["total_value"], 600.0)
+
+    def test_stats_and_list_read_running_value(self):
+        self.receive(4, "50")
+        stats = self.client.get(reverse("inventory:api_materials_stats")).json()["data"]
+        self.assertEqual(stats["totalValue"], 200.0)
+        self.assertEqual(stats["totalItems"], 1)
+        listed = self.client.get(reverse("inventory:api_materials_list")).json()["data"]
+        self.assertEqual(listed[0]["total_value"], 200.0)
+
+    def test_full_save_keeps_stock_value(self):
+        self.receive(2, "10")
+        material = RawMaterial.objects.get(pk=self.material.pk)
+        RawMaterial.objects.filter(pk=material.pk).update(stock_value=Decimal("999.00"))
+        material.name = "МДФ 16 мм"
+        material.save()
+        material.refresh_from_db()
+        self.assertEqual(material.stock_value, Decimal("999.00"))
+
+    def test_manual_quantity_update_goes_through_layers(self):
+        self.receive(10, "100")
+        response = self.client.put(
+            reverse("inventory:api_material_update", args=[self.material.id]),
+            data=json.dumps({"quantity": 4}), content_type="application/json",
+        )
+        self.assertEqual(response.json()["data"]["total_value"], 400.0)
+
+    def test_valuation_as_of(self):
+        self.receive(10, "100")
+        self.issue(4)
+        past = timezone.now() - timedelta(days=1)
+        self.assertEqual(valuation_as_of(past, [self.material.id]), {})
+        self.assertEqual(valuation_as_of(timezone.now(), [self.material.id]), {self.material.id: Decimal("600.00")})
+
+    def test_rebuild_matches_incremental_ledger(self):
+        self.receive(10, "100")
+        self.receive(5, "200")
+        self.issue(12)
+        MaterialIncoming.objects.create(material=self.material, quantity=Decimal("1"), price_per_unit=Decimal("300"))
+        MaterialIssueLog.objects.create(material=self.material, employee=self.user, quantity=Decimal("1"))
+        self.material.refresh_from_db()
+        incremental = self.material.stock_value
+
+        RawMaterial.objects.filter(pk=self.material.pk).update(stock_value=0)
+        rebuild_layers([self.material.id])
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.stock_value, incremental)
+        self.assertEqual(self.material.stock_value, Decimal("700.00"))
+
+    def test_migration_backfills_opening_layers(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module("apps.inventory.migrations.0013_backfill_opening_layers")
+        self.receive(2, "60")
+        legacy = RawMaterial.objects.create(name="ДСП", unit="лист", price=Decimal("50.00"))
+        RawMaterial.objects.filter(pk=legacy.pk).update(quantity=Decimal("4"), purchase_price=Decimal("75.00"))
+        RawMaterial.objects.create(name="Кромка", unit="м", price=Decimal("5.00"))
+
+        migration.backfill_opening_layers(apps, None)
+        migration.backfill_opening_layers(apps, None)
+
+        layer = InventoryLayer.objects.get(material=legacy)
+        self.assertEqual((layer.source, layer.remaining, layer.unit_cost), ("opening", Decimal("4"), Decimal("75.00")))
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.stock_value, Decimal("300.00"))
+        # Материалы с партиями и без остатка не затрагиваются
+        self.assertEqual(InventoryLayer.objects.filter(source="opening").count(), 1)
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.stock_value, Decimal("120.00"))
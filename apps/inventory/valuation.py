@@ -0,0 +1,262 @@
+"""
+Оценка остатков сырья по FIFO.
+
+Каждое поступление (приход, переработка брака в цехе ID4, начальный
+остаток, ручная корректировка) сохраняется партией InventoryLayer, а
+выдача списывает открытые партии в порядке поступления с записью
+InventoryLayerConsumption. Текущая стоимость остатка материала хранится в
+RawMaterial.stock_value и меняется на разницу F()-выражением в той же
+транзакции, поэтому списки и статистика склада читают её без пересчёта
+истории.
+
+Стоимость на произвольную дату считается двумя сгруппированными запросами
+по партиям и списаниям (valuation_as_of).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from .models import InventoryLayer, InventoryLayerConsumption, RawMaterial
+
+
+MONEY_Q = Decimal('0.01')
+
+_VALUE_FIELD = DecimalField(max_digits=20, decimal_places=5)
+
+
+def qmoney(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(MONEY_Q, rounding=ROUND_HALF_UP)
+
+
+def material_unit_cost(material) -> Decimal:
+    """Цена партии без собственной цены: средняя закупочная, иначе цена материала."""
+    return Decimal(str(material.purchase_price or material.price or 0))
+
+
+def _value(expression):
+    return ExpressionWrapper(expression, output_field=_VALUE_FIELD)
+
+
+def _shift_stock_value(material_id: int, delta: Decimal) -> None:
+    if delta:
+        RawMaterial.objects.filter(pk=material_id).update(stock_value=F('stock_value') + qmoney(delta))
+
+
+def add_layer(material, quantity, unit_cost, source, *, when=None, incoming=None, rework=None) -> Optional[InventoryLayer]:
+    """Создаёт партию и увеличивает стоимость остатка материала."""
+    quantity = Decimal(str(quantity or 0))
+    if quantity <= 0:
+        return None
+    unit_cost = qmoney(unit_cost)
+    with transaction.atomic():
+        layer = InventoryLayer.objects.create(
+            material_id=material.pk,
+            source=source,
+            incoming=incoming,
+            rework=rework,
+            received_at=when or timezone.now(),
+            quantity=quantity,
+            remaining=quantity,
+            unit_cost=unit_cost,
+        )
+        _shift_stock_value(material.pk, quantity * unit_cost)
+    return layer
+
+
+def add_incoming_layer(incoming) -> Optional[InventoryLayer]:
+    """Партия прихода; без цены прихода — по текущей цене материала."""
+    material = incoming.material
+    unit_cost = incoming.price_per_unit
+    if unit_cost is None:
+        unit_cost = material_unit_cost(material)
+    return add_layer(material, incoming.quantity, unit_cost, 'incoming', when=incoming.created_at, incoming=incoming)
+
+
+def add_rework_layer(rework) -> Optional[InventoryLayer]:
+    """Партия сырья после переработки брака; учитывается только цех ID4."""
+    if rework.workshop_id != 4:
+        return None
+    material = rework.raw_material
+    return add_layer(
+        material, rework.output_quantity, material_unit_cost(material), 'rework',
+        when=rework.created_at, rework=rework,
+    )
+
+
+def consume_fifo(material_id: int, quantity, *, issue_log=None, when=None) -> Decimal:
+    """
+    Списывает quantity из открытых партий в порядке поступления.
+
+    Партии блокируются на время списания. Количество сверх остатка партий
+    (например, приход до ведения партий) не оценивается, как и раньше.
+    Возвращает стоимость списанного.
+    """
+    remaining = Decimal(str(quantity or 0))
+    if remaining <= 0:
+        return Decimal('0')
+    when = when or timezone.now()
+    consumed_value = Decimal('0')
+    with transaction.atomic():
+        layers = (
+            InventoryLayer.objects
+            .select_for_update()
+            .filter(material_id=material_id, remaining__gt=0)
+            .order_by('received_at', 'id')
+            .only('id', 'remaining', 'unit_cost')
+        )
+        touched: List[InventoryLayer] = []
+        rows: List[InventoryLayerConsumption] = []
+        for layer in layers:
+            if remaining <= 0:
+                break
+            take = min(layer.remaining, remaining)
+            layer.remaining -= take
+            remaining -= take
+            consumed_value += take * layer.unit_cost
+            touched.append(layer)
+            rows.append(InventoryLayerConsumption(
+                layer=layer,
+                issue_log=issue_log,
+                quantity=take,
+                unit_cost=layer.unit_cost,
+                consumed_at=when,
+            ))
+        InventoryLayer.objects.bulk_update(touched, ['remaining'])
+        InventoryLayerConsumption.objects.bulk_create(rows)
+        _shift_stock_value(material_id, -consumed_value)
+    return consumed_value
+
+
+def adjust_to_quantity(material, old_quantity, new_quantity) -> None:
+    """Ручное изменение остатка: излишек — партией корректировки, недостача — списанием FIFO."""
+    delta = Decimal(str(new_quantity or 0)) - Decimal(str(old_quantity or 0))
+    if delta > 0:
+        add_layer(material, delta, material_unit_cost(material), 'adjustment')
+    elif delta < 0:
+        consume_fifo(material.pk, -delta)
+
+
+def price_breakdown(material_id: int) -> List[Dict[str, Decimal]]:
+    """Открытые остатки материала, сгруппированные по цене партии."""
+    rows = (
+        InventoryLayer.objects
+        .filter(material_id=material_id, remaining__gt=0)
+        .values('unit_cost')
+        .annotate(quantity=Sum('remaining'))
+        .order_by('unit_cost')
+    )
+    return [{'price': row['unit_cost'], 'quantity': row['quantity']} for row in rows]
+
+
+def valuation_as_of(when, material_ids: Optional[Iterable[int]] = None) -> Dict[int, Decimal]:
+    """
+    Стоимость остатков на момент when: {id материала: стоимость}.
+
+    Поступления до when минус списания до when, по ценам партий.
+    """
+    layers = InventoryLayer.objects.filter(received_at__lte=when)
+    consumptions = InventoryLayerConsumption.objects.filter(consumed_at__lte=when)
+    if material_ids is not None:
+        material_ids = list(material_ids)
+        layers = layers.filter(material_id__in=material_ids)
+        consumptions = consumptions.filter(layer__material_id__in=material_ids)
+
+    values = defaultdict(Decimal)
+    received = (
+        layers.values('material_id')
+        .annotate(value=Sum(_value(F('quantity') * F('unit_cost'))))
+        .values_list('material_id', 'value')
+    )
+    for material_id, value in received:
+        values[material_id] += Decimal(str(value or 0))
+    consumed = (
+        consumptions.values('layer__material_id')
+        .annotate(value=Sum(_value(F('quantity') * F('unit_cost'))))
+        .values_list('layer__material_id', 'value')
+    )
+    for material_id, value in consumed:
+        values[material_id] -= Decimal(str(value or 0))
+    return {material_id: qmoney(value) for material_id, value in values.items()}
+
+
+def rebuild_layers(material_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересобирает партии и стоимость остатков из истории приходов,
+    переработок и выдач (прежний построчный расчёт FIFO).
+
+    Партии без цены прихода оцениваются по текущей цене материала; если
+    истории нет, а остаток есть — создаётся партия начального остатка.
+    Дата списания не раньше даты партии, чтобы оценка на дату не уходила
+    в минус. Возвращает число обработанных материалов.
+    """
+    from apps.defects.models import DefectRework
+
+    materials = RawMaterial.objects.order_by('pk')
+    if material_ids is not None:
+        materials = materials.filter(pk__in=list(material_ids))
+
+    count = 0
+    for material in materials.iterator(chunk_size=200):
+        with transaction.atomic():
+            list(RawMaterial.objects.select_for_update().filter(pk=material.pk).values_list('pk', flat=True))
+            InventoryLayer.objects.filter(material=material).delete()
+
+            fallback_cost = qmoney(material_unit_cost(material))
+            layers = [
+                InventoryLayer(
+                    material=material, source='incoming', incoming=incoming,
+                    received_at=incoming.created_at, quantity=incoming.quantity,
+                    remaining=incoming.quantity,
+                    unit_cost=qmoney(incoming.price_per_unit) if incoming.price_per_unit is not None else fallback_cost,
+                )
+                for incoming in material.incomings.order_by('created_at', 'id')
+                if (incoming.quantity or 0) > 0
+            ]
+            layers.extend(
+                InventoryLayer(
+                    material=material, source='rework', rework=rework,
+                    received_at=rework.created_at, quantity=rework.output_quantity,
+                    remaining=rework.output_quantity, unit_cost=fallback_cost,
+                )
+                for rework in DefectRework.objects.filter(raw_material=material, workshop_id=4).order_by('created_at', 'id')
+                if (rework.output_quantity or 0) > 0
+            )
+            if not layers and (material.quantity or 0) > 0:
+                layers.append(InventoryLayer(
+                    material=material, source='opening', received_at=material.created_at,
+                    quantity=material.quantity, remaining=material.quantity, unit_cost=fallback_cost,
+                ))
+            layers.sort(key=lambda layer: layer.received_at)
+            InventoryLayer.objects.bulk_create(layers)
+            if any(layer.pk is None for layer in layers):
+                # Бэкенд не вернул первичные ключи
+                layers = list(InventoryLayer.objects.filter(material=material).order_by('received_at', 'id'))
+
+            rows = []
+            for issue in material.issue_logs.order_by('created_at', 'id'):
+                remaining = Decimal(str(issue.quantity or 0))
+                for layer in layers:
+                    if remaining <= 0:
+                        break
+                    if layer.remaining <= 0:
+                        continue
+                    take = min(layer.remaining, remaining)
+                    layer.remaining -= take
+                    remaining -= take
+                    rows.append(InventoryLayerConsumption(
+                        layer=layer, issue_log=issue, quantity=take, unit_cost=layer.unit_cost,
+                        consumed_at=max(issue.created_at, layer.received_at),
+                    ))
+            InventoryLayer.objects.bulk_update(layers, ['remaining'], batch_size=500)
+            InventoryLayerConsumption.objects.bulk_create(rows, batch_size=500)
+
+            stock_value = sum((layer.remaining * layer.unit_cost for layer in layers), Decimal('0'))
+            RawMaterial.objects.filter(pk=material.pk).update(stock_value=qmoney(stock_value))
+        count += 1
+    return count
@@ -7,6 +7,7 @@ from django.db import transaction
 import json
 from decimal import Decimal
 from django.db import models
+from django.db.models import Avg, Case, Count, Q, Sum, When
 
 from .models import (
     RawMaterial,
@@ -15,6 +16,7 @@ from .models import (
     MaterialIssueLog,
 )
 from apps.defects.models import DefectRework
+from . import valuation
 
 
 def _as_float(value):
@@ -22,69 +24,6 @@ def _as_float(value):
         return 0.0
     return float(value)
 
-def _fifo_batches(material):
-    batches = []
-
-    incomings = material.incomings.all().order_by('created_at', 'id')
-    for incoming in incomings:
-        unit_cost = incoming.price_per_unit
-        if unit_cost is None:
-            unit_cost = material.purchase_price or material.price or Decimal('0')
-        batches.append({
-            'quantity': Decimal(str(incoming.quantity or 0)),
-            'price': Decimal(str(unit_cost or 0)),
-            'created_at': incoming.created_at,
-        })
-
-    reworks = DefectRework.objects.filter(
-        raw_material=material,
-        workshop_id=4,
-    ).order_by('created_at', 'id')
-    rework_cost = material.purchase_price or material.price or Decimal('0')
-    for rework in reworks:
-        batches.append({
-            'quantity': Decimal(str(rework.output_quantity or 0)),
-            'price': Decimal(str(rework_cost or 0)),
-            'created_at': rework.created_at,
-        })
-
-    batches.sort(key=lambda b: b.get('created_at'))
-
-    issues = material.issue_logs.all().order_by('created_at', 'id')
-    for issue in issues:
-        remaining = Decimal(str(issue.quantity or 0))
-        if remaining <= 0:
-            continue
-        for batch in batches:
-            if remaining <= 0:
-                break
-            if batch['quantity'] <= 0:
-                continue
-            take = min(batch['quantity'], remaining)
-            batch['quantity'] -= take
-            remaining -= take
-
-    if not batches and (material.quantity or 0) > 0:
-        fallback_cost = material.purchase_price or material.price or Decimal('0')
-        batches.append({
-            'quantity': Decimal(str(material.quantity or 0)),
-            'price': Decimal(str(fallback_cost)),
-            'created_at': material.created_at,
-        })
-
-    return batches
-
-
-def _material_value_from_batches(batches):
-    total = Decimal('0')
-    for batch in batches:
-        qty = Decimal(str(batch['quantity'] or 0))
-        price = Decimal(str(batch['price'] or 0))
-        if qty <= 0:
-            continue
-        total += qty * price
-    return total.quantize(Decimal('0.01'))
-
 def is_mobile(request):
     """Определяет, является ли устройство мобильным"""
     user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
@@ -109,8 +48,6 @@ def api_materials_list(request):
         materials_data = []
 
         for material in materials:
-            batches = _fifo_batches(material)
-            total_value = _material_value_from_batches(batches)
             materials_data.append({
                 'id': material.id,
                 'name': material.name,
@@ -119,7 +56,7 @@ def api_materials_list(request):
                 'min_quantity': _as_float(material.min_quantity),
                 'price': _as_float(material.price),
                 'purchase_price': _as_float(material.purchase_price),
-                'total_value': _as_float(total_value),
+                'total_value': _as_float(material.total_value),
                 'country': material.country,
                 'description': material.description,
                 'created_at': material.created_at.isoformat(),
@@ -152,16 +89,22 @@ def api_material_create(request):
                     'message': f'Поле {field} обязательно для заполнения'
                 }, status=400)
         
-        # Создание материала
-        material = RawMaterial.objects.create(
-            name=data['name'],
-            unit=data['unit'],
-            quantity=Decimal(str(data['quantity'])),
-            min_quantity=Decimal(str(data['min_quantity'])),
-            price=Decimal(str(data['price'])),
-            country=data.get('country', ''),
-            description=data.get('description', '')
-        )
+        # Создание материала; начальный остаток становится первой партией FIFO
+        with transaction.atomic():
+            material = RawMaterial.objects.create(
+                name=data['name'],
+                unit=data['unit'],
+                quantity=Decimal(str(data['quantity'])),
+                min_quantity=Decimal(str(data['min_quantity'])),
+                price=Decimal(str(data['price'])),
+                country=data.get('country', ''),
+                description=data.get('description', '')
+            )
+            valuation.add_layer(
+                material, material.quantity, valuation.material_unit_cost(material), 'opening',
+                when=material.created_at,
+            )
+        material.refresh_from_db(fields=['stock_value'])
         
         return JsonResponse({
             'status': 'success',
@@ -206,6 +149,8 @@ def api_material_update(request, material_id):
                 'message': 'Материал не найден'
             }, status=404)
         
+        old_quantity = material.quantity
+
         # Обновление полей
         if 'name' in data:
             material.name = data['name']
@@ -222,8 +167,11 @@ def api_material_update(request, material_id):
         if 'description' in data:
             material.description = data['description']
         
-        # Сохраняем изменения
-        material.save()
+        # Сохраняем изменения; ручное изменение остатка проводим через партии FIFO
+        with transaction.atomic():
+            material.save()
+            valuation.adjust_to_quantity(material, old_quantity, material.quantity)
+        material.refresh_from_db(fields=['stock_value'])
         
         return JsonResponse({
             'status': 'success',
@@ -314,19 +262,21 @@ def api_materials_bulk_delete(request):
 def api_materials_stats(request):
     """API для получения статистики материалов"""
     try:
-        materials = RawMaterial.objects.all()
-        
-        total_value = Decimal('0')
-        for material in materials:
-            batches = _fifo_batches(material)
-            total_value += _material_value_from_batches(batches)
-        total_items = materials.count()
-        low_stock_count = materials.filter(quantity__lte=models.F('min_quantity')).count()
-        avg_base = sum(
-            (material.purchase_price or material.price or 0)
-            for material in materials
+        stats = RawMaterial.objects.aggregate(
+            total_value=Sum('stock_value'),
+            total_items=Count('id'),
+            low_stock_count=Count('id', filter=Q(quantity__lte=models.F('min_quantity'))),
+            # Закупочная цена, если задана, иначе цена материала
+            avg_price=Avg(Case(
+                When(purchase_price__gt=0, then='purchase_price'),
+                default='price',
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )),
         )
-        avg_price = avg_base / total_items if total_items else 0
+        total_value = stats['total_value'] or 0
+        total_items = stats['total_items']
+        low_stock_count = stats['low_stock_count']
+        avg_price = stats['avg_price'] or 0
         
         return JsonResponse({
             'status': 'success',
@@ -359,42 +309,44 @@ def api_material_incoming(request):
                     'message': f'Поле {field} обязательно для заполнения'
                 }, status=400)
         
-        try:
-            material = RawMaterial.objects.get(id=data['material_id'])
-        except RawMaterial.DoesNotExist:
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Материал не найден'
-            }, status=404)
-        
-        # Создание записи прихода
         price_per_unit = data.get('price_per_unit')
         if price_per_unit is not None and price_per_unit != '':
             price_per_unit = Decimal(str(price_per_unit))
         else:
             price_per_unit = None
-            
-        incoming = MaterialIncoming.objects.create(
-            material=material,
-            quantity=Decimal(str(data['quantity'])),
-            price_per_unit=price_per_unit,
-            notes=data.get('notes')  # Теперь может быть None
-        )
 
-        # Обновление средней цены и количества материала (метод средневзвешенной)
-        old_qty = material.quantity or Decimal('0')
-        old_cost = material.purchase_price or material.price or Decimal('0')
-        new_qty = incoming.quantity or Decimal('0')
+        # Приход, партия FIFO (сигнал) и остаток материала — в одной транзакции
+        with transaction.atomic():
+            try:
+                material = RawMaterial.objects.select_for_update().get(id=data['material_id'])
+            except RawMaterial.DoesNotExist:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Материал не найден'
+                }, status=404)
+
+            # Создание записи прихода
+            incoming = MaterialIncoming.objects.create(
+                material=material,
+                quantity=Decimal(str(data['quantity'])),
+                price_per_unit=price_per_unit,
+                notes=data.get('notes')  # Теперь может быть None
+            )
 
-        if incoming.price_per_unit is not None:
-            new_cost = incoming.price_per_unit
-            total_qty = old_qty + new_qty
-            if total_qty > 0:
-                total_value = old_qty * old_cost + new_qty * new_cost
-                material.purchase_price = (total_value / total_qty).quantize(Decimal('0.01'))
+            # Обновление средней цены и количества материала (метод средневзвешенной)
+            old_qty = material.quantity or Decimal('0')
+            old_cost = material.purchase_price or material.price or Decimal('0')
+            new_qty = incoming.quantity or Decimal('0')
 
-        material.quantity = old_qty + new_qty
-        material.save()
+            if incoming.price_per_unit is not None:
+                new_cost = incoming.price_per_unit
+                total_qty = old_qty + new_qty
+                if total_qty > 0:
+                    total_value = old_qty * old_cost + new_qty * new_cost
+                    material.purchase_price = (total_value / total_qty).quantize(Decimal('0.01'))
+
+            material.quantity = old_qty + new_qty
+            material.save()
         
         return JsonResponse({
             'status': 'success',
@@ -523,21 +475,13 @@ def api_material_price_breakdown(request, material_id):
                 'message': 'Материал не найден'
             }, status=404)
 
-        batches = _fifo_batches(material)
-        totals = {}
-        total_quantity = Decimal('0')
-        total_value = _material_value_from_batches(batches)
-        for batch in batches:
-            if batch['quantity'] <= 0:
-                continue
-            price = Decimal(str(batch['price'] or 0)).quantize(Decimal('0.01'))
-            qty = Decimal(str(batch['quantity'] or 0))
-            totals[price] = totals.get(price, Decimal('0')) + qty
-            total_quantity += qty
+        rows = valuation.price_breakdown(material.id)
+        total_quantity = sum((row['quantity'] for row in rows), Decimal('0'))
+        total_value = material.total_value
 
         breakdown = [
-            {'price': _as_float(price), 'quantity': _as_float(qty)}
-            for price, qty in sorted(totals.items(), key=lambda item: item[0])
+            {'price': _as_float(row['price']), 'quantity': _as_float(row['quantity'])}
+            for row in rows
         ]
 
         return JsonResponse({
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from . import counters
 from .models import (
     Notification, NotificationType, NotificationTemplate,
     NotificationGroup, NotificationPreference, NotificationLog
@@ -49,7 +50,8 @@ class NotificationAdmin(admin.ModelAdmin):
     actions = ['mark_as_read']
     
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(is_read=True)
+        # Через counters: обновление напрямую не списывает непрочитанные со счётчиков
+        updated = counters.mark_read(queryset)
         self.message_user(request, f'{updated} уведомлений отмечено как прочитанные')
     mark_as_read.short_description = 'Отметить как прочитанные'
 
@@ -0,0 +1,109 @@
+"""
+Счётчики уведомлений пользователя (всего / непрочитанных).
+
+NotificationCounter хранит итог на пользователя, поэтому значок в шапке
+и статистика читают одну строку по первичному ключу. Изменения вносятся
+дельтами F() одним UPDATE на группу пользователей с одинаковой дельтой;
+строки, которой ещё нет, дельта не касается — при первом чтении она
+собирается из уведомлений (rebuild_counters), уже с учётом изменения.
+Удаление уведомления сбрасывает строку пользователя (reset).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Notification, NotificationCounter
+
+
+def adjust(deltas: Dict[int, Tuple[int, int]]) -> None:
+    """Применяет дельты {id пользователя: (всего, непрочитанных)}."""
+    groups = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if user_id and delta != (0, 0):
+            groups[delta].append(user_id)
+    for (total, unread), user_ids in groups.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(
+            total=F('total') + total,
+            unread=F('unread') + unread,
+        )
+
+
+def reset(user_ids: Iterable[int]) -> None:
+    """Сбрасывает счётчики; они пересоберутся при следующем чтении."""
+    NotificationCounter.objects.filter(user_id__in=list(user_ids)).delete()
+
+
+def count_created(notifications: Iterable[Notification]) -> None:
+    """Учитывает уведомления, созданные bulk_create (сигналы не вызываются)."""
+    deltas = defaultdict(lambda: [0, 0])
+    for notification in notifications:
+        deltas[notification.user_id][0] += 1
+        if not notification.is_read:
+            deltas[notification.user_id][1] += 1
+    adjust({user_id: tuple(delta) for user_id, delta in deltas.items()})
+
+
+def mark_read(queryset) -> int:
+    """
+    Отмечает уведомления прочитанными одним UPDATE и списывает их со счётчиков.
+
+    Возвращает число отмеченных (ранее непрочитанных) уведомлений.
+    """
+    with transaction.atomic():
+        unread = queryset.filter(is_read=False)
+        per_user = dict(
+            unread.order_by().values('user_id').annotate(count=Count('id')).values_list('user_id', 'count')
+        )
+        marked = Notification.objects.filter(pk__in=unread.values('pk')).update(is_read=True)
+        adjust({user_id: (0, -count) for user_id, count in per_user.items()})
+    return marked
+
+
+def rebuild_counters(user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересобирает счётчики указанных (или всех имеющих уведомления) пользователей.
+
+    Один сгруппированный запрос по уведомлениям; возвращает число пользователей.
+    """
+    notifications = Notification.objects.all()
+    if user_ids is not None:
+        user_ids = {pk for pk in user_ids if pk}
+        if not user_ids:
+            return 0
+        notifications = notifications.filter(user_id__in=user_ids)
+    counts = {
+        row['user_id']: row
+        for row in notifications.order_by().values('user_id').annotate(
+            total=Count('id'),
+            unread=Count('id', filter=Q(is_read=False)),
+        )
+    }
+    if user_ids is None:
+        user_ids = set(counts) | set(NotificationCounter.objects.values_list('user_id', flat=True))
+
+    counters = [
+        NotificationCounter(
+            user_id=user_id,
+            total=counts.get(user_id, {}).get('total', 0),
+            unread=counts.get(user_id, {}).get('unread', 0),
+        )
+        for user_id in user_ids
+    ]
+    with transaction.atomic():
+        existing = set(NotificationCounter.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        NotificationCounter.objects.bulk_update([c for c in counters if c.user_id in existing], ['total', 'unread'], batch_size=500)
+        NotificationCounter.objects.bulk_create([c for c in counters if c.user_id not in existing], batch_size=500, ignore_conflicts=True)
+    return len(counters)
+
+
+def get_counts(user) -> Dict[str, int]:
+    """{'total', 'unread'} пользователя: одна строка, при отсутствии — пересборка."""
+    counter = NotificationCounter.objects.filter(user_id=user.pk).values('total', 'unread').first()
+    if counter is None:
+        rebuild_counters([user.pk])
+        counter = NotificationCounter.objects.filter(user_id=user.pk).values('total', 'unread').first()
+    return {'total': counter['total'], 'unread': counter['unread']}
@@ -0,0 +1,200 @@
+"""
+Массовая рассылка уведомлений (fan-out) пачками.
+
+Для любого числа получателей рассылка делает фиксированный набор
+запросов:
+
+- получатели и их NotificationPreference — по одному запросу;
+- уведомления — один bulk_create (тихие часы получателя пропускают его)
+  и один UPDATE счётчиков получателей (counters.py);
+- записи NotificationLog по каналам (email/push/sms) — один bulk_create
+  со статусом 'queued'.
+
+Доставка по каналам не выполняется в запросе: после коммита id записей
+журнала уходят пачками по DELIVERY_BATCH в задачу deliver_notification_batch
+(очередь notifications), которая отправляет письма одним SMTP-соединением
+на пачку, выставляет статусы и повторяет пачку при ошибке доставки. Каждое
+письмо отмечается отправленным сразу после отправки, поэтому повтор пачки
+досылает только неотправленные письма.
+"""
+from __future__ import annotations
+
+from datetime import time
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import count_created
+from .models import Notification, NotificationLog, NotificationPreference, NotificationType
+
+User = get_user_model()
+
+DELIVERY_BATCH = 100
+
+CHANNELS = ('email', 'push', 'sms')
+
+# Поле настройки, включающее канал
+_CHANNEL_FIELDS = {
+    'email': 'email_notifications',
+    'push': 'push_notifications',
+    'sms': 'sms_notifications',
+}
+
+_NOTIFICATION_CODES = {code for code, _ in Notification.NOTIFICATION_TYPES}
+
+
+def notification_code(notification_type) -> str:
+    """Код типа для Notification.notification_type (по умолчанию 'info')."""
+    if isinstance(notification_type, NotificationType):
+        notification_type = notification_type.code
+    return notification_type if notification_type in _NOTIFICATION_CODES else 'info'
+
+
+def load_preferences(user_ids: Iterable[int]) -> Dict[int, NotificationPreference]:
+    """Настройки получателей одним запросом: {id пользователя: настройки}."""
+    return {pref.user_id: pref for pref in NotificationPreference.objects.filter(user_id__in=list(user_ids))}
+
+
+def in_quiet_hours(preferences: Optional[NotificationPreference], now: time) -> bool:
+    """Попадает ли время now в тихие часы (в том числе через полночь)."""
+    if preferences is None or not (preferences.quiet_hours_start and preferences.quiet_hours_end):
+        return False
+    start, end = preferences.quiet_hours_start, preferences.quiet_hours_end
+    if start <= end:
+        return start <= now <= end
+    return now >= start or now <= end
+
+
+def enabled_channels(preferences: Optional[NotificationPreference]) -> List[str]:
+    """Каналы доставки получателя; без настроек — значения по умолчанию модели."""
+    channels = []
+    for channel in CHANNELS:
+        field = _CHANNEL_FIELDS[channel]
+        if preferences is not None:
+            enabled = getattr(preferences, field)
+        else:
+            enabled = NotificationPreference._meta.get_field(field).default
+        if enabled:
+            channels.append(channel)
+    return channels
+
+
+def fan_out(
+    recipient_ids: Iterable[int],
+    title: str,
+    message: str,
+    notification_type=None,
+) -> List[Notification]:
+    """
+    Создаёт уведомления получателям и ставит доставку по каналам в очередь.
+
+    Возвращает созданные уведомления (без получателей в тихих часах).
+    """
+    user_ids = list(User.objects.filter(id__in=list(recipient_ids)).values_list('id', flat=True))
+    if not user_ids:
+        return []
+    preferences = load_preferences(user_ids)
+    now = timezone.localtime().time()
+    code = notification_code(notification_type)
+
+    recipients = [user_id for user_id in user_ids if not in_quiet_hours(preferences.get(user_id), now)]
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(user_id=user_id, title=title, message=message, notification_type=code)
+                for user_id in recipients
+            ],
+            batch_size=500,
+        )
+        count_created(notifications)
+        logs = NotificationLog.objects.bulk_create(
+            [
+                NotificationLog(notification=notification, delivery_method=channel, delivery_status='queued')
+                for notification in notifications
+                for channel in enabled_channels(preferences.get(notification.user_id))
+            ],
+            batch_size=500,
+        )
+        log_ids = [log.pk for log in logs]
+        transaction.on_commit(lambda: enqueue_delivery(log_ids))
+    return notifications
+
+
+def enqueue_delivery(log_ids: List[int]) -> int:
+    """Раздаёт записи журнала задачам доставки пачками; возвращает число пачек."""
+    from .tasks import deliver_notification_batch
+
+    batches = [log_ids[i:i + DELIVERY_BATCH] for i in range(0, len(log_ids), DELIVERY_BATCH)]
+    for batch in batches:
+        deliver_notification_batch.delay(batch)
+    return len(batches)
+
+
+def _email(log: NotificationLog) -> Optional[EmailMessage]:
+    recipient = log.notification.user
+    if not recipient.email:
+        return None
+    return EmailMessage(
+        subject=f"Уведомление: {log.notification.title}",
+        body=log.notification.message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient.email],
+    )
+
+
+def deliver_batch(log_ids: Iterable[int], final: bool = True) -> Dict[str, int]:
+    """
+    Доставляет пачку записей журнала в статусе 'queued'.
+
+    Письма пачки отправляются по одному через общее SMTP-соединение, и
+    запись журнала письма помечается 'sent' сразу после его отправки.
+    Если соединение упало, оставшиеся письма остаются 'queued' (при
+    final=False — для повтора задачи) или помечаются 'failed' с текстом
+    ошибки. Push и SMS пока только отмечаются отправленными — внешних
+    сервисов доставки нет.
+    """
+    logs = list(
+        NotificationLog.objects
+        .filter(pk__in=list(log_ids), delivery_status='queued')
+        .select_related('notification__user')
+    )
+    emails = [log for log in logs if log.delivery_method == 'email']
+    for log in logs:
+        if log.delivery_method != 'email':
+            log.delivery_status = 'sent'
+
+    error = None
+    if emails:
+        messages = [(log, _email(log)) for log in emails]
+        for log, email in messages:
+            if email is None:
+                log.delivery_status = 'failed'
+                log.error_message = 'У получателя не указан email'
+        try:
+            with get_connection() as connection:
+                for log, email in messages:
+                    if email is None:
+                        continue
+                    connection.send_messages([email])
+                    # Отправленное письмо не должно уйти повторно при повторе пачки
+                    NotificationLog.objects.filter(pk=log.pk).update(delivery_status='sent')
+                    log.delivery_status = 'sent'
+        except Exception as exc:
+            error = exc
+        for log, email in messages:
+            if email is not None and log.delivery_status == 'queued' and error is not None and final:
+                log.delivery_status = 'failed'
+                log.error_message = str(error)
+
+    NotificationLog.objects.bulk_update(logs, ['delivery_status', 'error_message'], batch_size=500)
+    if error is not None and not final:
+        raise error
+    return {
+        'sent': sum(1 for log in logs if log.delivery_status == 'sent'),
+        'failed': sum(1 for log in logs if log.delivery_status == 'failed'),
+        'queued': sum(1 for log in logs if log.delivery_status == 'queued'),
+    }
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.notifications.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает счётчики уведомлений (всего / непрочитанных) из таблицы уведомлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            default=None,
+            help='ID пользователя (можно указать несколько раз; по умолчанию — все)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересборка счётчиков уведомлений...')
+
+        count = rebuild_counters(options['user'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Готово. Пользователей обработано: {count}')
+        )
@@ -272,4 +272,65 @@ class NotificationLog(models.Model):
         ordering = ['-sent_at']
     
     def __str__(self):
-        return f"Лог {self.notification.title} - {self.delivery_method}" 
\ No newline at end of file
+        return f"Лог {self.notification.title} - {self.delivery_method}" 
+
+class NotificationCounter(models.Model):
+    """Счётчики уведомлений пользователя (значок в шапке читает одну строку)"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter',
+        verbose_name='Пользователь'
+    )
+    total = models.IntegerField(
+        default=0,
+        verbose_name='Всего уведомлений'
+    )
+    unread = models.IntegerField(
+        default=0,
+        verbose_name='Непрочитанных'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+    
+    class Meta:
+        verbose_name = 'Счётчик уведомлений'
+        verbose_name_plural = 'Счётчики уведомлений'
+    
+    def __str__(self):
+        return f"{self.user}: {self.unread}/{self.total}"
+
+
+# Счётчики поддерживаются при создании и прочтении уведомления, удаление сбрасывает их.
+# Пакетные пути (bulk_create, update) корректируют их сами — см. counters.py.
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+
+@receiver(pre_save, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    instance._was_read = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._was_read = Notification.objects.filter(pk=instance.pk).values_list('is_read', flat=True).first()
+
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, **kwargs):
+    if kwargs.get('raw'):
+        return
+    from .counters import adjust
+    if created:
+        adjust({instance.user_id: (1, 0 if instance.is_read else 1)})
+    elif instance._was_read is not None and instance._was_read != instance.is_read:
+        adjust({instance.user_id: (0, 1 if instance._was_read else -1)})
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    # Экземпляр мог устареть (is_read меняется и пакетно), поэтому счётчик
+    # сбрасывается и пересобирается при следующем чтении
+    from .counters import reset
+    reset([instance.user_id])
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from .delivery import deliver_batch
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def deliver_notification_batch(self, log_ids):
+    """
+    Доставляет пачку записей NotificationLog по каналам (см. delivery.py).
+
+    При ошибке SMTP пачка повторяется (только недоставленные письма);
+    после последней попытки письма помечаются 'failed'.
+    """
+    final = self.request.retries >= self.max_retries
+    try:
+        result = deliver_batch(log_ids, final=final)
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=self.default_retry_delay * (self.request.retries + 1))
+    return {
+        'status': 'success',
+        'message': f"Доставлено уведомлений: {result['sent']}, ошибок: {result['failed']}",
+        **result,
+    }
@@ -4,13 +4,20 @@ from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+from unittest.mock import patch
 import json
 
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from .models import (
     Notification, NotificationType, NotificationTemplate,
-    NotificationGroup, NotificationPreference, NotificationLog
+    NotificationGroup, NotificationPreference, NotificationLog, NotificationCounter
 )
+from .counters import get_counts, mark_read, rebuild_counters
+from .delivery import deliver_batch
 from .utils import NotificationService
 
 User = get_user_model()
@@ -681,4 +688,164 @@ class NotificationIntegrationTest(TestCase):
         
         # Заголовок + 3 уведомления
         self.assertEqual(len(lines), 4)
-        self.assertIn('ID,Заголовок,Сообщение,Тип,Приоритет,Статус,Дата создания,Дата прочтения', lines[0]) 
\ No newline at end of file
+        self.assertIn('ID,Заголовок,Сообщение,Тип,Приоритет,Статус,Дата создания,Дата прочтения', lines[0]) 
+
+class NotificationFanOutTest(TestCase):
+    """Тесты пакетной рассылки и доставки по каналам"""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'worker{i}', email=f'w{i}@example.com', password='pass')
+            for i in range(5)
+        ]
+        self.service = NotificationService()
+    
+    def send(self, users):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            count = self.service.send_bulk_notifications(
+                title='Смена', message='Собрание в 9:00', recipient_ids=[u.id for u in users]
+            )
+        return count, callbacks
+    
+    def test_query_count_does_not_grow_with_recipients(self):
+        with CaptureQueriesContext(connection) as one:
+            self.send(self.users[:1])
+        with CaptureQueriesContext(connection) as many:
+            count, callbacks = self.send(self.users)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(count, 5)
+        self.assertEqual(len(callbacks), 1)
+        # email и push включены по умолчанию
+        self.assertEqual(NotificationLog.objects.filter(delivery_status='queued').count(), 12)
+    
+    def test_quiet_hours_and_channels(self):
+        NotificationPreference.objects.create(
+            user=self.users[0], quiet_hours_start=time(0, 0), quiet_hours_end=time(23, 59, 59)
+        )
+        NotificationPreference.objects.create(
+            user=self.users[1], email_notifications=False, push_notifications=False, sms_notifications=True
+        )
+        count, _ = self.send(self.users[:2])
+        self.assertEqual(count, 1)
+        self.assertEqual(
+            list(NotificationLog.objects.values_list('notification__user', 'delivery_method')),
+            [(self.users[1].id, 'sms')],
+        )
+    
+    def test_delivery_batch(self):
+        _, callbacks = self.send(self.users[:3])
+        with patch('apps.notifications.tasks.deliver_notification_batch.delay') as delay:
+            callbacks[0]()
+        log_ids = delay.call_args.args[0]
+        
+        result = deliver_batch(log_ids)
+        self.assertEqual(result, {'sent': 6, 'failed': 0, 'queued': 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(deliver_batch(log_ids)['sent'], 0)
+    
+    def test_delivery_keeps_emails_queued_for_retry(self):
+        _, callbacks = self.send(self.users[:2])
+        log_ids = list(NotificationLog.objects.values_list('pk', flat=True))
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('smtp down')):
+            with self.assertRaises(OSError):
+                deliver_batch(log_ids, final=False)
+            self.assertEqual(NotificationLog.objects.filter(delivery_status='queued').count(), 2)
+            result = deliver_batch(log_ids, final=True)
+        self.assertEqual(result['failed'], 2)
+        self.assertEqual(NotificationLog.objects.get(delivery_method='email', notification__user=self.users[0]).error_message, 'smtp down')
+
+    
+    def test_retry_does_not_resend_delivered_emails(self):
+        from django.core.mail.backends.locmem import EmailBackend
+        
+        self.send(self.users[:3])
+        log_ids = list(NotificationLog.objects.values_list('pk', flat=True))
+        real_send = EmailBackend.send_messages
+        calls = []
+        
+        def flaky(backend, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise OSError('smtp down')
+            return real_send(backend, messages)
+        
+        with patch.object(EmailBackend, 'send_messages', flaky):
+            with self.assertRaises(OSError):
+                deliver_batch(log_ids, final=False)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(NotificationLog.objects.filter(delivery_method='email', delivery_status='sent').count(), 1)
+        
+        deliver_batch(log_ids, final=False)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.users[:3]))
+
+class NotificationCounterTest(TestCase):
+    """Тесты счётчиков уведомлений"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+    
+    def add(self, user, count, is_read=False):
+        return [
+            Notification.objects.create(user=user, title=f'Уведомление {i}', message='Тест', is_read=is_read)
+            for i in range(count)
+        ]
+    
+    def test_counters_follow_create_read_and_delete(self):
+        self.add(self.user, 1)
+        self.assertEqual(get_counts(self.user), {'total': 1, 'unread': 1})
+        notifications = self.add(self.user, 3) + self.add(self.user, 1, is_read=True)
+        self.assertEqual(get_counts(self.user), {'total': 5, 'unread': 4})
+        
+        notifications[0].mark_as_read()
+        self.assertEqual(mark_read(Notification.objects.filter(user=self.user)), 3)
+        self.assertEqual(get_counts(self.user), {'total': 5, 'unread': 0})
+        
+        notifications[1].delete()
+        self.assertEqual(get_counts(self.user), {'total': 4, 'unread': 0})
+        
+        with self.captureOnCommitCallbacks(execute=False):
+            NotificationService().send_bulk_notifications(
+                title='Смена', message='Собрание', recipient_ids=[self.user.id, self.other.id]
+            )
+        self.assertEqual(get_counts(self.user), {'total': 5, 'unread': 1})
+        self.assertEqual(get_counts(self.other), {'total': 1, 'unread': 1})
+    
+    def test_admin_mark_as_read_updates_counters(self):
+        from django.contrib.admin.sites import site
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from django.test import RequestFactory
+
+        self.add(self.user, 3)
+        self.add(self.other, 1)
+        request = RequestFactory().post('/')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        site._registry[Notification].mark_as_read(request, Notification.objects.filter(user=self.user))
+        self.assertEqual(get_counts(self.user), {'total': 3, 'unread': 0})
+        self.assertEqual(get_counts(self.other), {'total': 1, 'unread': 1})
+    
+    def test_rebuild_and_unread_endpoint(self):
+        self.add(self.user, 2)
+        get_counts(self.user)
+        NotificationCounter.objects.filter(user=self.user).update(total=99, unread=99)
+        self.assertEqual(rebuild_counters(), 1)
+        self.assertEqual(get_counts(self.user), {'total': 2, 'unread': 2})
+        
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('notifications:unread_count'))
+        self.assertEqual(response.json(), {'unread_count': 2})
+        self.assertEqual(sum('notification' in q['sql'] for q in ctx.captured_queries), 1)
+    
+    def test_stats_single_grouped_query(self):
+        self.add(self.user, 2)
+        Notification.objects.create(user=self.user, title='Внимание', message='Тест', notification_type='warning')
+        get_counts(self.user)
+        service = NotificationService()
+        with CaptureQueriesContext(connection) as ctx:
+            stats = service.get_notification_stats(self.user)
+        self.assertEqual(len(ctx), 3)
+        self.assertEqual((stats['total'], stats['unread'], stats['read']), (3, 3, 0))
+        self.assertEqual(stats['by_type'], {'Информация': 2, 'Предупреждение': 1})
@@ -1,9 +1,7 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.utils import timezone
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Count
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
@@ -13,6 +11,8 @@ from .models import (
     Notification, NotificationType, NotificationTemplate,
     NotificationGroup, NotificationLog
 )
+from .counters import get_counts
+from .delivery import fan_out, in_quiet_hours, load_preferences
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -66,46 +66,20 @@ class NotificationService:
             Созданное уведомление или None в случае ошибки
         """
         try:
-            # Проверяем настройки пользователя
-            if not self._should_send_notification(recipient):
+            # Тип, приоритет, ссылка, срок и связанный объект в модели
+            # уведомления не хранятся — сохраняются заголовок, текст и тип
+            notifications = fan_out(
+                [recipient.pk],
+                title,
+                message,
+                notification_type or self.default_notification_type,
+            )
+            if not notifications:
                 logger.info(f"Уведомления отключены для пользователя {recipient.username}")
                 return None
             
-            # Используем тип по умолчанию, если не указан
-            if not notification_type:
-                notification_type = self.default_notification_type
-            
-            if not notification_type:
-                logger.error("Не указан тип уведомления и нет типа по умолчанию")
-                return None
-            
-            # Создаем уведомление
-            notification = Notification.objects.create(
-                recipient=recipient,
-                title=title,
-                message=message,
-                notification_type=notification_type,
-                priority=priority,
-                action_url=action_url or '',
-                action_text=action_text or '',
-                expires_at=expires_at,
-                metadata=metadata or {}
-            )
-            
-            # Если указан связанный объект, связываем его
-            if content_object:
-                from django.contrib.contenttypes.models import ContentType
-                notification.content_type = ContentType.objects.get_for_model(content_object)
-                notification.object_id = content_object.id
-                notification.save()
-            
-            # Отправляем уведомления по различным каналам
-            self._send_email_notification(notification)
-            self._send_push_notification(notification)
-            self._send_sms_notification(notification)
-            
-            logger.info(f"Уведомление отправлено: {notification.id} для {recipient.username}")
-            return notification
+            logger.info(f"Уведомление отправлено: {notifications[0].id} для {recipient.username}")
+            return notifications[0]
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления: {e}")
@@ -139,27 +113,21 @@ class NotificationService:
             
         Returns:
             Количество созданных уведомлений
+        
+        Настройки получателей загружаются одним запросом, уведомления и
+        записи журнала создаются bulk_create, а доставка по каналам уходит
+        в очередь пачками (см. delivery.py).
         """
         created_count = 0
         
         try:
-            recipients = User.objects.filter(id__in=recipient_ids)
-            
-            for recipient in recipients:
-                notification = self.send_notification(
-                    recipient=recipient,
-                    title=title,
-                    message=message,
-                    notification_type=notification_type,
-                    priority=priority,
-                    action_url=action_url,
-                    action_text=action_text,
-                    expires_at=expires_at,
-                    metadata=metadata
-                )
-                
-                if notification:
-                    created_count += 1
+            notifications = fan_out(
+                recipient_ids,
+                title,
+                message,
+                notification_type or self.default_notification_type,
+            )
+            created_count = len(notifications)
             
             logger.info(f"Массовая отправка завершена: {created_count} уведомлений")
             
@@ -264,133 +232,8 @@ class NotificationService:
     
     def _should_send_notification(self, user: User) -> bool:
         """Проверить, следует ли отправлять уведомление пользователю"""
-        try:
-            preferences = NotificationPreference.objects.get(user=user)
-            
-            # Проверяем время тишины
-            if preferences.quiet_hours_start and preferences.quiet_hours_end:
-                now = timezone.now().time()
-                if preferences.quiet_hours_start <= preferences.quiet_hours_end:
-                    # Обычный день (например, 9:00 - 18:00)
-                    if preferences.quiet_hours_start <= now <= preferences.quiet_hours_end:
-                        return False
-                else:
-                    # Переход через полночь (например, 22:00 - 6:00)
-                    if now >= preferences.quiet_hours_start or now <= preferences.quiet_hours_end:
-                        return False
-            
-            return True
-            
-        except NotificationPreference.DoesNotExist:
-            # Если настройки не найдены, отправляем по умолчанию
-            return True
-    
-    def _send_email_notification(self, notification: Notification):
-        """Отправить email уведомление"""
-        try:
-            preferences = NotificationPreference.objects.get(user=notification.recipient)
-            
-            if not preferences.email_notifications:
-                return
-            
-            # Формируем email
-            subject = f"Уведомление: {notification.title}"
-            
-            context = {
-                'notification': notification,
-                'user': notification.recipient
-            }
-            
-            html_message = render_to_string(
-                'notifications/email/notification.html',
-                context
-            )
-            
-            plain_message = render_to_string(
-                'notifications/email/notification.txt',
-                context
-            )
-            
-            # Отправляем email
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[notification.recipient.email],
-                html_message=html_message,
-                fail_silently=True
-            )
-            
-            # Логируем отправку
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='email',
-                delivery_status='sent'
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки email: {e}")
-            # Логируем ошибку
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='email',
-                delivery_status='failed',
-                error_message=str(e)
-            )
-    
-    def _send_push_notification(self, notification: Notification):
-        """Отправить push уведомление"""
-        try:
-            preferences = NotificationPreference.objects.get(user=notification.recipient)
-            
-            if not preferences.push_notifications:
-                return
-            
-            # Здесь должна быть логика отправки push уведомлений
-            # Например, через Firebase Cloud Messaging или Web Push API
-            
-            # Логируем отправку
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='push',
-                delivery_status='sent'
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки push: {e}")
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='push',
-                delivery_status='failed',
-                error_message=str(e)
-            )
-    
-    def _send_sms_notification(self, notification: Notification):
-        """Отправить SMS уведомление"""
-        try:
-            preferences = NotificationPreference.objects.get(user=notification.recipient)
-            
-            if not preferences.sms_notifications:
-                return
-            
-            # Здесь должна быть логика отправки SMS
-            # Например, через внешний SMS сервис
-            
-            # Логируем отправку
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='sms',
-                delivery_status='sent'
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки SMS: {e}")
-            NotificationLog.objects.create(
-                notification=notification,
-                delivery_method='sms',
-                delivery_status='failed',
-                error_message=str(e)
-            )
+        preferences = load_preferences([user.pk]).get(user.pk)
+        return not in_quiet_hours(preferences, timezone.localtime().time())
     
     def cleanup_expired_notifications(self):
         """Очистка истекших уведомлений"""
@@ -408,37 +251,35 @@ class NotificationService:
             return 0
     
     def get_notification_stats(self, user: User) -> Dict[str, Any]:
-        """Получить статистику уведомлений пользователя"""
+        """
+        Получить статистику уведомлений пользователя
+        
+        Итоги читаются из счётчика пользователя, разбивка по типам —
+        одним сгруппированным запросом. Приоритета и архива в модели
+        уведомления нет, поэтому by_priority пуст, а archived равен 0.
+        """
         try:
-            notifications = Notification.objects.filter(recipient=user)
+            notifications = Notification.objects.filter(user=user)
+            counts = get_counts(user)
             
             stats = {
-                'total': notifications.count(),
-                'unread': notifications.filter(status='unread').count(),
-                'read': notifications.filter(status='read').count(),
-                'archived': notifications.filter(status='archived').count(),
+                'total': counts['total'],
+                'unread': counts['unread'],
+                'read': counts['total'] - counts['unread'],
+                'archived': 0,
                 'by_type': {},
                 'by_priority': {},
                 'recent': []
             }
             
             # Статистика по типам
-            for notification_type in NotificationType.objects.filter(is_active=True):
-                count = notifications.filter(notification_type=notification_type).count()
-                if count > 0:
-                    stats['by_type'][notification_type.name] = count
-            
-            # Статистика по приоритетам
-            for priority, _ in Notification.PRIORITY_CHOICES:
-                count = notifications.filter(priority=priority).count()
-                if count > 0:
-                    stats['by_priority'][priority] = count
+            type_names = dict(Notification.NOTIFICATION_TYPES)
+            for row in notifications.order_by().values('notification_type').annotate(count=Count('id')):
+                stats['by_type'][type_names.get(row['notification_type'], row['notification_type'])] = row['count']
             
             # Последние уведомления
             stats['recent'] = list(
-                notifications.select_related('notification_type')[:5].values(
-                    'id', 'title', 'notification_type__name', 'created_at', 'status'
-                )
+                notifications[:5].values('id', 'title', 'notification_type', 'created_at', 'is_read')
             )
             
             return stats
@@ -34,6 +34,7 @@ from .serializers import (
     BulkNotificationSerializer, NotificationStatsSerializer,
     MarkAsReadSerializer, NotificationFilterSerializer
 )
+from .counters import get_counts, mark_read
 from .utils import NotificationService
 
 
@@ -53,10 +54,7 @@ class NotificationListView(LoginRequiredMixin, ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['unread_count'] = Notification.objects.filter(
-            user=self.request.user,
-            is_read=False
-        ).count()
+        context['unread_count'] = get_counts(self.request.user)['unread']
         context['page_title'] = 'Уведомления'
         return context
 
@@ -125,13 +123,9 @@ class NotificationDashboardView(LoginRequiredMixin, TemplateView):
         user = self.request.user
         
         # Статистика (упрощенная под текущую модель)
-        context['total_notifications'] = Notification.objects.filter(
-            user=user
-        ).count()
-        context['unread_count'] = Notification.objects.filter(
-            user=user,
-            is_read=False
-        ).count()
+        counts = get_counts(user)
+        context['total_notifications'] = counts['total']
+        context['unread_count'] = counts['unread']
         context['recent_notifications'] = Notification.objects.filter(
             user=user
         )[:10]
@@ -163,8 +157,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """Отметить уведомления как прочитанные"""
         ids = request.data if isinstance(request.data, list) else request.data.get('ids', [])
         qs = self.get_queryset().filter(id__in=ids)
-        for n in qs:
-            n.mark_as_read()
+        mark_read(qs)
         return Response({'marked_count': qs.count()})
 
 
@@ -218,10 +211,7 @@ class NotificationPreferenceViewSet(viewsets.ModelViewSet):
 @login_required
 def notification_bell(request):
     """Страница уведомлений (мобильная)"""
-    unread_count = Notification.objects.filter(
-        user=request.user,
-        is_read=False
-    ).count()
+    unread_count = get_counts(request.user)['unread']
     
     notifications = Notification.objects.filter(
         user=request.user
@@ -238,8 +228,7 @@ def notification_bell(request):
 @require_http_methods(["GET"])
 def unread_count(request):
     """Простой endpoint для получения количества непрочитанных уведомлений"""
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'unread_count': count}) 
+    return JsonResponse({'unread_count': get_counts(request.user)['unread']})
 
 
 class NotificationsComingSoonView(TemplateView):
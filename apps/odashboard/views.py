@@ -3,12 +3,13 @@ from django.http import HttpResponseForbidden, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.db.models import Count, Sum, Q
-from datetime import datetime, timedelta
+from datetime import timedelta
 from apps.users.models import User
 from apps.operations.workshops.models import Workshop
 from apps.employee_tasks.models import EmployeeTask
 from apps.defects.models import Defect
 from apps.orders.models import OrderStage
+from apps.orders.analytics import workshop_production_chart as production_chart
 
 # Create your views here.
 
@@ -102,66 +103,31 @@ def workshop_production_chart(request):
             }, status=400)
         
         period = request.GET.get('period', 'week')
+        end_date = timezone.now().date()
         
-        # Определяем период
-        if period == 'week':
-            days = 7
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=days-1)
-            date_format = '%a'  # Mon, Tue, etc.
-        elif period == 'month':
-            days = 30
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=days-1)
-            date_format = '%d'  # Day of month
-        elif period == 'year':
-            days = 12
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=365)
+        # Определяем период: год — 12 месячных корзин, иначе — дни
+        if period == 'year':
+            granularity = 'month'
+            start_date = end_date.replace(day=1)
+            for _ in range(11):
+                start_date = (start_date - timedelta(days=1)).replace(day=1)
             date_format = '%b'  # Jan, Feb, etc.
+        elif period == 'month':
+            granularity = 'day'
+            start_date = end_date - timedelta(days=29)
+            date_format = None  # Day of month
         else:
-            period = 'week'
-            days = 7
-            end_date = timezone.now().date()
-            start_date = end_date - timedelta(days=days-1)
-            date_format = '%a'
-        
-        # Генерируем метки для графика
-        labels = []
-        products_data = []
-        defective_data = []
+            granularity = 'day'
+            start_date = end_date - timedelta(days=6)
+            date_format = '%a'  # Mon, Tue, etc.
         
-        current_date = start_date
-        for i in range(days):
-            if period == 'week':
-                labels.append(current_date.strftime(date_format))
-            elif period == 'month':
-                labels.append(str(current_date.day))
-            else:  # year
-                labels.append(current_date.strftime(date_format))
-            
-            # Подсчитываем данные за день
-            day_start = timezone.make_aware(datetime.combine(current_date, datetime.min.time()))
-            day_end = timezone.make_aware(datetime.combine(current_date, datetime.max.time()))
-            
-            # Произведенные товары за день
-            daily_products = EmployeeTask.objects.filter(
-                stage__workshop=workshop,
-                completed_at__gte=day_start,
-                completed_at__lte=day_end
-            ).aggregate(total=Sum('completed_quantity'))['total'] or 0
-            
-            # Браки за день
-            daily_defective = Defect.objects.filter(
-                user__workshop=workshop,
-                created_at__gte=day_start,
-                created_at__lte=day_end
-            ).count()
-            
-            products_data.append(daily_products)
-            defective_data.append(daily_defective)
-            
-            current_date += timedelta(days=1)
+        chart = production_chart(workshop, start_date, end_date, granularity)
+        labels = [
+            bucket.strftime(date_format) if date_format else str(bucket.day)
+            for bucket in chart['buckets']
+        ]
+        products_data = chart['products']
+        defective_data = chart['defective']
         
         return JsonResponse({
             'labels': labels,
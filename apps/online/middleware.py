@@ -1,5 +1,5 @@
 from django.utils import timezone
-from .models import UserActivity
+from . import presence
 
 class UserActivityMiddleware:
     def __init__(self, get_response):
@@ -9,10 +9,11 @@ class UserActivityMiddleware:
         # Обрабатываем запрос
         response = self.get_response(request)
         
-        # Обновляем активность пользователя, если он аутентифицирован
+        # Отмечаем активность в кэше (не чаще раза в минуту на пользователя);
+        # в UserActivity она попадает пакетно задачей flush_user_activity
         if request.user.is_authenticated:
             try:
-                UserActivity.update_user_activity(request.user)
+                presence.touch(request.user.pk)
             except Exception:
                 # Игнорируем ошибки при обновлении активности
                 pass
@@ -20,15 +20,35 @@ class UserActivity(models.Model):
     
     @classmethod
     def get_online_users(cls):
-        """Получить всех пользователей, которые были активны в последние 15 минут"""
-        threshold = timezone.now() - timedelta(minutes=15)
-        return cls.objects.filter(last_seen__gte=threshold, is_online=True)
+        """
+        Пользователи, активные в последние 15 минут, по данным присутствия в кэше.
+
+        Возвращает несохранённые записи активности (user, last_seen),
+        отсортированные по последней активности.
+        """
+        from . import presence
+
+        seen = presence.online_users()
+        users = User.objects.in_bulk(list(seen))
+        activities = [
+            cls(user=users[user_id], last_seen=last_seen, is_online=True)
+            for user_id, last_seen in seen.items()
+            if user_id in users
+        ]
+        activities.sort(key=lambda activity: activity.last_seen, reverse=True)
+        return activities
     
     @classmethod
     def update_user_activity(cls, user):
-        """Обновить активность пользователя"""
-        activity, created = cls.objects.get_or_create(user=user)
-        activity.last_seen = timezone.now()
+        """Немедленно обновить активность пользователя в БД (минуя отложенную запись)"""
+        from . import presence
+
+        now = timezone.now()
+        activity = cls.objects.filter(user=user).order_by('-pk').first()
+        if activity is None:
+            activity = cls(user=user)
+        activity.last_seen = now
         activity.is_online = True
         activity.save()
+        presence.touch(user.pk, now)
         return activity
@@ -0,0 +1,151 @@
+"""
+Присутствие пользователей в кэше с отложенной записью в UserActivity.
+
+Middleware отмечает пользователя не чаще раза в TOUCH_INTERVAL секунд:
+атомарный cache.add ключа-метки пропускает повторные запросы, а первая
+отметка в интервале дописывается в журнал отметок (счётчик cache.incr +
+ключ слота). Периодическая задача flush_user_activity забирает новые
+слоты, пакетно пишет last_seen в UserActivity и обновляет снимок
+присутствия — его читают get_online_users и online_users_api.
+
+Журнал и снимок должны жить в общем для процессов кэше (Redis в
+production); при пустом кэше снимок восстанавливается из UserActivity.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+TOUCH_INTERVAL = 60  # секунд между отметками одного пользователя
+ONLINE_WINDOW = timedelta(minutes=15)
+FLUSH_BATCH = 5000  # слотов журнала за один сброс
+SLOT_TTL = 60 * 60  # слот живёт дольше любого интервала сброса
+FLUSH_LOCK_TTL = 5 * 60
+
+KEY_PREFIX = 'online:presence'
+SEEN_KEY = KEY_PREFIX + ':seen:{}'
+SLOT_KEY = KEY_PREFIX + ':slot:{}'
+HEAD_KEY = KEY_PREFIX + ':head'
+FLUSHED_KEY = KEY_PREFIX + ':flushed'
+SNAPSHOT_KEY = KEY_PREFIX + ':snapshot'
+FLUSH_LOCK_KEY = KEY_PREFIX + ':flush-lock'
+
+
+def _next_slot() -> int:
+    try:
+        return cache.incr(HEAD_KEY)
+    except ValueError:
+        # Счётчика ещё нет (холодный кэш): создаём атомарно и повторяем
+        cache.add(HEAD_KEY, 0, timeout=None)
+        return cache.incr(HEAD_KEY)
+
+
+def touch(user_id, now: Optional[datetime] = None) -> bool:
+    """
+    Отмечает активность пользователя.
+
+    Возвращает True, если отметка записана, и False, если пользователь уже
+    отмечался в текущем интервале.
+    """
+    if not user_id:
+        return False
+    stamp = (now or timezone.now()).timestamp()
+    if not cache.add(SEEN_KEY.format(user_id), stamp, timeout=TOUCH_INTERVAL):
+        return False
+    cache.set(SLOT_KEY.format(_next_slot()), (user_id, stamp), timeout=SLOT_TTL)
+    return True
+
+
+def pending(limit: int = FLUSH_BATCH) -> Tuple[int, Dict[int, float]]:
+    """Ещё не сброшенные отметки: (последний прочитанный слот, {id пользователя: время})."""
+    flushed = cache.get(FLUSHED_KEY, 0)
+    head = cache.get(HEAD_KEY, 0)
+    if head < flushed:
+        # Счётчик слотов потерян (вытеснение/перезапуск кэша) — читаем с начала
+        flushed = 0
+    head = min(head, flushed + limit)
+    if head <= flushed:
+        return flushed, {}
+    slots = cache.get_many([SLOT_KEY.format(slot) for slot in range(flushed + 1, head + 1)])
+    seen: Dict[int, float] = {}
+    for user_id, stamp in slots.values():
+        if stamp > seen.get(user_id, 0):
+            seen[user_id] = stamp
+    return head, seen
+
+
+def _load_snapshot() -> Dict[int, float]:
+    """Снимок присутствия; при пустом кэше — из UserActivity за окно онлайна."""
+    from .models import UserActivity
+
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        threshold = timezone.now() - ONLINE_WINDOW
+        snapshot = {}
+        rows = UserActivity.objects.filter(last_seen__gte=threshold, is_online=True).values_list('user_id', 'last_seen')
+        for user_id, last_seen in rows:
+            snapshot[user_id] = max(snapshot.get(user_id, 0), last_seen.timestamp())
+        cache.set(SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def _prune(seen: Dict[int, float], now: datetime) -> Dict[int, float]:
+    threshold = (now - ONLINE_WINDOW).timestamp()
+    return {user_id: stamp for user_id, stamp in seen.items() if stamp >= threshold}
+
+
+def online_users() -> Dict[int, datetime]:
+    """Пользователи, активные за ONLINE_WINDOW: {id пользователя: последняя активность}."""
+    seen = dict(_load_snapshot())
+    for user_id, stamp in pending()[1].items():
+        if stamp > seen.get(user_id, 0):
+            seen[user_id] = stamp
+    now = timezone.now()
+    return {
+        user_id: datetime.fromtimestamp(stamp, tz=dt_timezone.utc)
+        for user_id, stamp in _prune(seen, now).items()
+    }
+
+
+def flush() -> int:
+    """
+    Пакетно записывает накопленные отметки в UserActivity и обновляет снимок.
+
+    Одновременно работает один сброс (блокировка в кэше). Возвращает число
+    обновлённых пользователей.
+    """
+    from .models import UserActivity
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TTL):
+        return 0
+    try:
+        head, seen = pending()
+        if seen:
+            moments = {user_id: datetime.fromtimestamp(stamp, tz=dt_timezone.utc) for user_id, stamp in seen.items()}
+            with transaction.atomic():
+                latest = {}
+                for activity in UserActivity.objects.filter(user_id__in=moments).order_by('pk'):
+                    latest[activity.user_id] = activity
+                for user_id, activity in latest.items():
+                    activity.last_seen = moments[user_id]
+                    activity.is_online = True
+                UserActivity.objects.bulk_update(list(latest.values()), ['last_seen', 'is_online'], batch_size=500)
+                UserActivity.objects.bulk_create(
+                    [UserActivity(user_id=user_id, is_online=True) for user_id in moments if user_id not in latest],
+                    batch_size=500,
+                )
+
+        snapshot = _load_snapshot()
+        for user_id, stamp in seen.items():
+            if stamp > snapshot.get(user_id, 0):
+                snapshot[user_id] = stamp
+        cache.set(SNAPSHOT_KEY, _prune(snapshot, timezone.now()), timeout=None)
+        cache.set(FLUSHED_KEY, head, timeout=None)
+        return len(seen)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
@@ -0,0 +1,18 @@
+from celery import shared_task
+
+from .presence import flush
+
+
+@shared_task
+def flush_user_activity():
+    """
+    Пакетно переносит отметки присутствия из кэша в UserActivity.
+
+    Запускается по расписанию раз в минуту (см. core/celery.py).
+    """
+    updated = flush()
+    return {
+        'status': 'success',
+        'message': f'Обновлена активность пользователей: {updated}',
+        'users': updated,
+    }
@@ -1,5 +1,6 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 from .models import UserActivity
@@ -8,6 +9,7 @@ User = get_user_model()
 
 class OnlineAppTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         # Создаем тестовых пользователей
         self.admin_user = User.objects.create_user(
             username='admin',
@@ -125,7 +127,7 @@ class OnlineAppTestCase(TestCase):
         
         # Тест метода get_online_users
         online_users = UserActivity.get_online_users()
-        self.assertEqual(online_users.count(), 3)
+        self.assertEqual(len(online_users), 3)
         
         # Тест метода update_user_activity
         old_time = activity.last_seen
@@ -150,3 +152,48 @@ class OnlineAppTestCase(TestCase):
         activity = UserActivity.objects.get(user=self.regular_user)
         self.assertTrue(activity.is_online)
         self.assertGreaterEqual(activity.last_seen, timezone.now() - timezone.timedelta(minutes=1))
+
+
+
+class PresenceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='worker', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        UserActivity.objects.all().delete()
+
+    def test_touch_is_throttled_per_user(self):
+        from apps.online import presence
+
+        self.assertTrue(presence.touch(self.user.pk))
+        self.assertFalse(presence.touch(self.user.pk))
+        self.assertTrue(presence.touch(self.other.pk))
+        _, seen = presence.pending()
+        self.assertEqual(set(seen), {self.user.pk, self.other.pk})
+
+    def test_middleware_does_not_write_to_db(self):
+        from django.test import RequestFactory
+        from apps.online.middleware import UserActivityMiddleware
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            UserActivityMiddleware(lambda req: None)(request)
+        self.assertEqual([a.user for a in UserActivity.get_online_users()], [self.user])
+
+    def test_flush_writes_batch(self):
+        from apps.online import presence
+
+        presence.touch(self.user.pk)
+        presence.touch(self.other.pk)
+        self.assertEqual(presence.flush(), 2)
+        self.assertEqual(UserActivity.objects.filter(is_online=True).count(), 2)
+        # Повторный сброс без новых отметок ничего не пишет
+        with self.assertNumQueries(0):
+            self.assertEqual(presence.flush(), 0)
+        self.assertEqual(len(UserActivity.get_online_users()), 2)
+
+    def test_snapshot_rebuilt_from_db_on_cold_cache(self):
+        UserActivity.objects.create(user=self.user, is_online=True)
+        cache.clear()
+        self.assertEqual([a.user for a in UserActivity.get_online_users()], [self.user])
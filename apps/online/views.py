@@ -4,6 +4,7 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
 from .models import UserActivity
+from . import presence
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -21,14 +22,14 @@ def online_users_view(request):
         return redirect('home')
     
     # Обновляем активность текущего пользователя
-    UserActivity.update_user_activity(request.user)
+    presence.touch(request.user.pk)
     
     # Получаем всех онлайн пользователей
     online_users = UserActivity.get_online_users()
     
     context = {
         'online_users': online_users,
-        'total_online': online_users.count(),
+        'total_online': len(online_users),
         'current_time': timezone.now(),
     }
     
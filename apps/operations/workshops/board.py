@@ -0,0 +1,212 @@
+"""
+Доска заказов цехов одним фиксированным набором запросов.
+
+Для любого числа цехов доска собирается так:
+
+- сводка цехов — два сгруппированных запроса (этапы и задачи по цехам)
+  и один запрос активных дополнительных мастеров;
+- этапы с заказом, клиентом, позицией и товаром — один запрос с
+  select_related;
+- задачи сотрудников всех этапов — один запрос, статистика этапа
+  считается по ним в памяти.
+
+Планшеты мастеров опрашивают доску с курсором since: возвращаются только
+этапы, изменённые после него (OrderStage.updated_at; изменение задачи
+отмечает свой этап), а этапы, ушедшие из работы, — списком removed_stages.
+Новый курсор отдаётся в ответе.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Workshop, WorkshopMaster
+
+
+ACTIVE_STAGE_STATUSES = ('in_progress', 'partial')
+
+# Перекрытие курсора: этап, сохранённый транзакцией, которая закоммитилась
+# позже чтения доски, всё равно попадёт в следующий опрос
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+
+def _full_name(user) -> str:
+    if hasattr(user, 'get_full_name'):
+        return user.get_full_name()
+    return f"{user.first_name} {user.last_name}".strip()
+
+
+def workshop_summaries(workshops: Iterable[Workshop]) -> Dict[int, dict]:
+    """Сводка цехов (как Workshop.get_workshop_summary): {id цеха: сводка}."""
+    from apps.employee_tasks.models import EmployeeTask
+    from apps.orders.models import OrderStage
+
+    workshops = list(workshops)
+    ids = [workshop.pk for workshop in workshops]
+
+    stage_counts = {
+        row['workshop_id']: row
+        for row in OrderStage.objects
+        .filter(workshop_id__in=ids, status__in=ACTIVE_STAGE_STATUSES)
+        .values('workshop_id')
+        .annotate(total_stages=Count('id'), active_orders=Count('order_id', distinct=True))
+    }
+    task_counts = {
+        row['stage__workshop_id']: row
+        for row in EmployeeTask.objects
+        .filter(stage__workshop_id__in=ids)
+        .values('stage__workshop_id')
+        .annotate(
+            total_tasks=Count('id'),
+            completed_tasks=Count('id', filter=Q(completed_quantity__gte=F('quantity'))),
+        )
+    }
+    masters = defaultdict(list)
+    for link in WorkshopMaster.objects.filter(workshop_id__in=ids, is_active=True).select_related('master'):
+        masters[link.workshop_id].append(link.master)
+
+    summaries = {}
+    for workshop in workshops:
+        stages = stage_counts.get(workshop.pk, {})
+        tasks = task_counts.get(workshop.pk, {})
+        total_tasks = tasks.get('total_tasks', 0)
+        completed_tasks = tasks.get('completed_tasks', 0)
+        all_masters = ([workshop.manager] if workshop.manager else []) + masters[workshop.pk]
+        summaries[workshop.pk] = {
+            'workshop_name': workshop.name,
+            'manager_name': workshop.manager.get_full_name() if workshop.manager else 'Не назначен',
+            'all_masters': [master.get_full_name() for master in all_masters],
+            'total_stages': stages.get('total_stages', 0),
+            'total_tasks': total_tasks,
+            'completed_tasks': completed_tasks,
+            'active_orders': stages.get('active_orders', 0),
+            'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0,
+        }
+    return summaries
+
+
+def _stage_entry(stage, tasks) -> dict:
+    item = stage.order_item
+    product = item.product
+    order = stage.order
+    total_assigned = sum(task.quantity for task in tasks)
+    total_completed = sum(task.completed_quantity for task in tasks)
+    total_defective = sum(task.defective_quantity for task in tasks)
+    return {
+        'stage': {
+            'id': stage.id,
+            'operation': stage.operation,
+            'plan_quantity': stage.plan_quantity,
+            'completed_quantity': stage.completed_quantity,
+            'status': stage.status,
+            'deadline': stage.deadline.isoformat() if stage.deadline else None,
+            'parallel_group': stage.parallel_group,
+        },
+        'order': {
+            'id': order.id,
+            'name': order.name,
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'client_name': order.client.name if order.client else 'Не указан',
+        },
+        'product': {
+            'id': product.id if product else None,
+            'name': product.name if product else 'Не указан',
+            'is_glass': product.is_glass if product else False,
+            'glass_type': item.glass_type,
+            'glass_type_display': item.get_glass_type_display(),
+            'img': product.img.url if product and product.img else None,
+            'size': item.size,
+            'color': item.color,
+            'paint_type': item.paint_type,
+            'paint_color': item.paint_color,
+            'cnc_specs': item.cnc_specs,
+            'cutting_specs': item.cutting_specs,
+            'packaging_notes': item.packaging_notes,
+        },
+        'tasks': [
+            {
+                'id': task.id,
+                'employee_name': _full_name(task.employee),
+                'quantity': task.quantity,
+                'completed_quantity': task.completed_quantity,
+                'defective_quantity': task.defective_quantity,
+                'is_completed': task.is_completed,
+            }
+            for task in tasks
+        ],
+        'statistics': {
+            'total_assigned': total_assigned,
+            'total_completed': total_completed,
+            'total_defective': total_defective,
+            'remaining': stage.plan_quantity - total_completed,
+            'progress_percent': (total_completed / stage.plan_quantity * 100) if stage.plan_quantity > 0 else 0,
+        },
+    }
+
+
+def workshop_orders(workshop_ids: Iterable[int], since: Optional[datetime] = None):
+    """
+    Этапы цехов в работе: ({id цеха: [строки доски]}, {id цеха: [id снятых этапов]}).
+
+    С since возвращаются только этапы, изменённые после курсора; снятые
+    этапы (вышли из работы после курсора) считаются только в этом режиме.
+    """
+    from apps.employee_tasks.models import EmployeeTask
+    from apps.orders.models import OrderStage
+
+    workshop_ids = list(workshop_ids)
+    stages = (
+        OrderStage.objects
+        .filter(workshop_id__in=workshop_ids, order_item__isnull=False)
+        .select_related('order', 'order__client', 'order_item', 'order_item__product')
+        .order_by('workshop_id', 'id')
+    )
+    if since is not None:
+        stages = stages.filter(updated_at__gte=since - CURSOR_OVERLAP)
+    else:
+        stages = stages.filter(status__in=ACTIVE_STAGE_STATUSES)
+
+    active, removed = [], defaultdict(list)
+    for stage in stages:
+        if stage.status in ACTIVE_STAGE_STATUSES:
+            active.append(stage)
+        else:
+            removed[stage.workshop_id].append(stage.id)
+
+    tasks = defaultdict(list)
+    if active:
+        for task in (
+            EmployeeTask.objects
+            .filter(stage_id__in=[stage.id for stage in active])
+            .select_related('employee')
+            .order_by('id')
+        ):
+            tasks[task.stage_id].append(task)
+
+    orders = defaultdict(list)
+    for stage in active:
+        orders[stage.workshop_id].append(_stage_entry(stage, tasks[stage.id]))
+    return orders, removed
+
+
+def build_board(workshops: Iterable[Workshop], since: Optional[datetime] = None) -> List[dict]:
+    """
+    Доска по цехам: [{'workshop': сводка, 'orders': [...]}].
+
+    С since у каждого цеха есть и 'removed_stages'.
+    """
+    workshops = list(workshops)
+    summaries = workshop_summaries(workshops)
+    orders, removed = workshop_orders([workshop.pk for workshop in workshops], since)
+    board = []
+    for workshop in workshops:
+        entry = {'workshop': summaries[workshop.pk], 'orders': orders.get(workshop.pk, [])}
+        if since is not None:
+            entry['removed_stages'] = removed.get(workshop.pk, [])
+        board.append(entry)
+    return board
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 15:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('defects', '0008_defectrework'),
+        ('operations_workshops', '0008_storagezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storagezone',
+            name='packaging_defect',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='packaging_storage_zones', to='defects.defect', verbose_name='Брак упаковки'),
+        ),
+        migrations.AddField(
+            model_name='storagezone',
+            name='packaging_input_quantity',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True, verbose_name='Взято в упаковку'),
+        ),
+        migrations.AddField(
+            model_name='storagezone',
+            name='packaging_scrap_quantity',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12, verbose_name='Брак упаковки (кол-во)'),
+        ),
+    ]
@@ -99,131 +99,18 @@ class Workshop(models.Model):
         """
         Возвращает информацию о заказах в цехе с полной информацией о товарах
         """
-        from apps.orders.models import OrderStage
-        from apps.employee_tasks.models import EmployeeTask
-        
-        # Получаем все активные этапы в цехе
-        stages = OrderStage.objects.filter(
-            workshop=self,
-            status__in=['in_progress', 'partial']
-        ).select_related(
-            'order', 'order_item', 'order_item__product'
-        ).prefetch_related(
-            'employee_tasks'
-        )
-        
-        orders_info = []
-        
-        for stage in stages:
-            if not stage.order_item:
-                continue
-                
-            # Получаем задачи сотрудников для этого этапа
-            employee_tasks = EmployeeTask.objects.filter(stage=stage).select_related('employee')
-            
-            # Подсчитываем статистику
-            total_assigned = sum(task.quantity for task in employee_tasks)
-            total_completed = sum(task.completed_quantity for task in employee_tasks)
-            total_defective = sum(task.defective_quantity for task in employee_tasks)
-            
-            # Получаем информацию о товаре
-            product_info = {
-                'id': stage.order_item.product.id if stage.order_item.product else None,
-                'name': stage.order_item.product.name if stage.order_item.product else 'Не указан',
-                'is_glass': stage.order_item.product.is_glass if stage.order_item.product else False,
-                'glass_type': stage.order_item.glass_type,
-                'glass_type_display': stage.order_item.get_glass_type_display(),
-                'img': stage.order_item.product.img.url if stage.order_item.product and stage.order_item.product.img else None,
-                'size': stage.order_item.size,
-                'color': stage.order_item.color,
-                'paint_type': stage.order_item.paint_type,
-                'paint_color': stage.order_item.paint_color,
-                'cnc_specs': stage.order_item.cnc_specs,
-                'cutting_specs': stage.order_item.cutting_specs,
-                'packaging_notes': stage.order_item.packaging_notes,
-            }
-            
-            # Информация о заказе
-            order_info = {
-                'id': stage.order.id,
-                'name': stage.order.name,
-                'status': stage.order.status,
-                'status_display': stage.order.get_status_display(),
-                'client_name': stage.order.client.name if stage.order.client else 'Не указан',
-            }
-            
-            # Информация об этапе
-            stage_info = {
-                'id': stage.id,
-                'operation': stage.operation,
-                'plan_quantity': stage.plan_quantity,
-                'completed_quantity': stage.completed_quantity,
-                'status': stage.status,
-                'deadline': stage.deadline.isoformat() if stage.deadline else None,
-                'parallel_group': stage.parallel_group,
-            }
-            
-            # Информация о задачах сотрудников
-            tasks_info = []
-            for task in employee_tasks:
-                tasks_info.append({
-                    'id': task.id,
-                    'employee_name': task.employee.get_full_name() if hasattr(task.employee, 'get_full_name') else f"{task.employee.first_name} {task.employee.last_name}".strip(),
-                    'quantity': task.quantity,
-                    'completed_quantity': task.completed_quantity,
-                    'defective_quantity': task.defective_quantity,
-                    'is_completed': task.is_completed,
-                })
-            
-            orders_info.append({
-                'stage': stage_info,
-                'order': order_info,
-                'product': product_info,
-                'tasks': tasks_info,
-                'statistics': {
-                    'total_assigned': total_assigned,
-                    'total_completed': total_completed,
-                    'total_defective': total_defective,
-                    'remaining': stage.plan_quantity - total_completed,
-                    'progress_percent': (total_completed / stage.plan_quantity * 100) if stage.plan_quantity > 0 else 0,
-                }
-            })
-        
-        return orders_info
+        from .board import workshop_orders
+
+        orders, _ = workshop_orders([self.pk])
+        return orders.get(self.pk, [])
 
     def get_workshop_summary(self):
         """
         Возвращает сводную информацию о цехе
         """
-        from apps.orders.models import OrderStage
-        from apps.employee_tasks.models import EmployeeTask
-        from django.db.models import F
-        
-        # Общая статистика
-        total_stages = OrderStage.objects.filter(workshop=self, status__in=['in_progress', 'partial']).count()
-        total_tasks = EmployeeTask.objects.filter(stage__workshop=self).count()
-        total_completed_tasks = EmployeeTask.objects.filter(stage__workshop=self, completed_quantity__gte=F('quantity')).count()
-        
-        # Статистика по заказам
-        active_orders = OrderStage.objects.filter(
-            workshop=self,
-            status__in=['in_progress', 'partial']
-        ).values('order').distinct().count()
-        
-        # Получаем всех мастеров
-        all_masters = self.get_all_masters()
-        master_names = [master.get_full_name() for master in all_masters]
-        
-        return {
-            'workshop_name': self.name,
-            'manager_name': self.manager.get_full_name() if self.manager else 'Не назначен',
-            'all_masters': master_names,
-            'total_stages': total_stages,
-            'total_tasks': total_tasks,
-            'completed_tasks': total_completed_tasks,
-            'active_orders': active_orders,
-            'completion_rate': (total_completed_tasks / total_tasks * 100) if total_tasks > 0 else 0,
-        }
+        from .board import workshop_summaries
+
+        return workshop_summaries([self])[self.pk]
 
 
 class WorkshopMaster(models.Model):
@@ -387,6 +274,28 @@ class StorageZone(models.Model):
         decimal_places=3,
         default=0,
     )
+    # Брак упаковки (ID2), из которой получена партия; переносится в готовую продукцию
+    packaging_defect = models.ForeignKey(
+        'defects.Defect',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='packaging_storage_zones',
+        verbose_name='Брак упаковки',
+    )
+    packaging_input_quantity = models.DecimalField(
+        'Взято в упаковку',
+        max_digits=12,
+        decimal_places=3,
+        null=True,
+        blank=True,
+    )
+    packaging_scrap_quantity = models.DecimalField(
+        'Брак упаковки (кол-во)',
+        max_digits=12,
+        decimal_places=3,
+        default=0,
+    )
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
 
     class Meta:
@@ -417,6 +326,33 @@ class StorageZone(models.Model):
         self.save(update_fields=['used_quantity'])
         return amount
 
+    def packaging_share(self, used_before, used_after):
+        """
+        Доля входа и брака упаковки, приходящаяся на часть партии,
+        списанную складом между used_before и used_after.
+
+        Считается как разность нарастающих долей, поэтому при заборе
+        партии по частям доли в сумме дают ровно вход и брак всей партии.
+        Возвращает (вход, брак); вход — None, если он не сохранён.
+        """
+        from decimal import Decimal
+
+        total = self.total_quantity or 0
+        if total <= 0:
+            return self.packaging_input_quantity, self.packaging_scrap_quantity or Decimal('0')
+        step = Decimal('0.001')
+
+        def share(value):
+            value = Decimal(str(value or 0))
+            before = (value * Decimal(str(used_before)) / total).quantize(step)
+            after = (value * Decimal(str(used_after)) / total).quantize(step)
+            return after - before
+
+        input_quantity = None
+        if self.packaging_input_quantity is not None:
+            input_quantity = share(self.packaging_input_quantity)
+        return input_quantity, share(self.packaging_scrap_quantity)
+
 
 class WorkshopLog(models.Model):
     """
@@ -466,4 +402,13 @@ class WorkshopLog(models.Model):
             user=user,
             action=action[:120] if action else '',
             description=description or '',
-        )
\ No newline at end of file
+        )
+
+
+# Сброс кэша списка цехов с мастерами (apps/workshops/api.py)
+from django.conf import settings
+from core.caching import invalidate_on
+
+ALL_WORKSHOPS_CACHE = 'workshops-all'
+
+invalidate_on(ALL_WORKSHOPS_CACHE, Workshop, WorkshopMaster, settings.AUTH_USER_MODEL)
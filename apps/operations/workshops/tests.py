@@ -1,3 +1,87 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.clients.models import Client
+from apps.employee_tasks.models import EmployeeTask
+from apps.orders.models import Order, OrderItem, OrderStage
+from apps.products.models import Product
+
+from .board import build_board
+from .models import Workshop, WorkshopMaster
+
+User = get_user_model()
+
+
+class WorkshopBoardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="master", password="pass")
+        self.worker = User.objects.create_user(username="worker", password="pass")
+        self.client.force_login(self.user)
+        self.order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+        self.product = Product.objects.create(name="Дверь")
+
+    def add_workshop(self, name, stages=2):
+        workshop = Workshop.objects.create(name=name, manager=self.user)
+        WorkshopMaster.objects.create(workshop=workshop, master=self.worker)
+        for i in range(stages):
+            item = OrderItem.objects.create(order=self.order, product=self.product, quantity=5)
+            stage = OrderStage.objects.create(
+                order=self.order, order_item=item, workshop=workshop,
+                operation=name, plan_quantity=5, parallel_group=i + 1,
+            )
+            EmployeeTask.objects.create(stage=stage, employee=self.worker, quantity=5, completed_quantity=2)
+        return workshop
+
+    def board_queries(self, workshops):
+        workshops = list(Workshop.objects.filter(pk__in=[w.pk for w in workshops]).select_related('manager'))
+        with CaptureQueriesContext(connection) as ctx:
+            board = build_board(workshops)
+        return len(ctx), board
+
+    def test_query_count_does_not_grow_with_workshops(self):
+        first = self.add_workshop("Распил")
+        one, board = self.board_queries([first])
+        more = [first, self.add_workshop("Кромка", stages=3), self.add_workshop("Покраска", stages=1)]
+        many, board = self.board_queries(more)
+        self.assertEqual(one, many)
+        self.assertEqual([len(entry['orders']) for entry in board], [2, 3, 1])
+        self.assertEqual(board[0]['workshop']['total_tasks'], 2)
+        self.assertEqual(len(board[0]['workshop']['all_masters']), 2)
+        stats = board[0]['orders'][0]['statistics']
+        self.assertEqual((stats['total_assigned'], stats['total_completed'], stats['remaining']), (5, 2, 3))
+
+    def test_since_returns_changed_and_removed_stages(self):
+        workshop = self.add_workshop("Распил", stages=3)
+        stages = list(OrderStage.objects.filter(workshop=workshop).order_by('id'))
+        OrderStage.objects.filter(workshop=workshop).update(updated_at=timezone.now() - timedelta(minutes=10))
+        since = timezone.now() - timedelta(minutes=1)
+
+        task = EmployeeTask.objects.get(stage=stages[0])
+        task.completed_quantity = 5
+        task.save()
+        stages[1].status = 'completed'
+        stages[1].save()
+
+        entry = build_board([workshop], since)[0]
+        self.assertEqual([row['stage']['id'] for row in entry['orders']], [stages[0].id])
+        self.assertEqual(entry['removed_stages'], [stages[1].id])
+
+    def test_api_since_cursor(self):
+        workshop = self.add_workshop("Распил")
+        url = reverse("all-workshops-orders-info")
+        full = self.client.get(url)
+        self.assertEqual(full.status_code, 200)
+        self.assertIn("X-Board-Cursor", full)
+        self.assertTrue(any(entry['workshop']['workshop_name'] == workshop.name for entry in full.json()))
 
-# Create your tests here.
+        later = (timezone.now() + timedelta(minutes=1)).isoformat()
+        delta = self.client.get(url, {"since": later}).json()
+        self.assertIn("cursor", delta)
+        self.assertTrue(all(entry['orders'] == [] for entry in delta['workshops']))
+        self.assertEqual(self.client.get(url, {"since": "вчера"}).status_code, 400)
@@ -9,6 +9,9 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.db.models import Sum, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .board import build_board, workshop_summaries
 import json
 
 # Create your views here.
@@ -31,43 +34,54 @@ def _get_active_workshops(limit=None):
 		return qs[:limit]
 	return qs
 
+def _parse_since(request):
+	"""Курсор доски ?since=<ISO-дата>; (курсор, ошибка)."""
+	raw = request.query_params.get('since')
+	if not raw:
+		return None, None
+	since = parse_datetime(raw)
+	if since is None:
+		return None, Response({'error': 'Некорректный параметр since'}, status=400)
+	if timezone.is_naive(since):
+		since = timezone.make_aware(since)
+	return since, None
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def workshop_orders_info(request, workshop_id):
 	"""
 	Получает информацию о заказах в конкретном цехе с полной информацией о товарах
 	"""
-	try:
-		workshop = Workshop.objects.get(id=workshop_id)
-		orders_info = workshop.get_orders_info()
-		workshop_summary = workshop.get_workshop_summary()
-		
-		return Response({
-			'workshop': workshop_summary,
-			'orders': orders_info
-		})
-	except Workshop.DoesNotExist:
+	since, error = _parse_since(request)
+	if error:
+		return error
+	workshop = Workshop.objects.select_related('manager').filter(id=workshop_id).first()
+	if workshop is None:
 		return Response({'error': 'Цех не найден'}, status=404)
+	cursor = timezone.now().isoformat()
+	entry = build_board([workshop], since)[0]
+	if since is not None:
+		entry['cursor'] = cursor
+	response = Response(entry)
+	response['X-Board-Cursor'] = cursor
+	return response
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def all_workshops_orders_info(request):
 	"""
-	Получает информацию о заказах во всех цехах
+	Получает информацию о заказах во всех цехах.
+
+	С ?since= возвращает только этапы, изменённые после курсора, и новый курсор.
 	"""
-	workshops = _get_active_workshops()
-	result = []
-	
-	for workshop in workshops:
-		workshop_summary = workshop.get_workshop_summary()
-		orders_info = workshop.get_orders_info()
-		
-		result.append({
-			'workshop': workshop_summary,
-			'orders': orders_info
-		})
-	
-	return Response(result)
+	since, error = _parse_since(request)
+	if error:
+		return error
+	cursor = timezone.now().isoformat()
+	board = build_board(_get_active_workshops().select_related('manager'), since)
+	response = Response({'cursor': cursor, 'workshops': board} if since is not None else board)
+	response['X-Board-Cursor'] = cursor
+	return response
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -81,7 +95,8 @@ def workshops_stats(request):
 	from datetime import timedelta
 
 	# Берём все активные цеха, чтобы в статистике отображались и ID1–ID4
-	workshops = list(_get_active_workshops())
+	workshops = list(_get_active_workshops().select_related('manager'))
+	summaries = workshop_summaries(workshops)
 	now = timezone.now()
 	week_ago = now - timedelta(days=7)
 	month_ago = now - timedelta(days=30)
@@ -106,7 +121,7 @@ def workshops_stats(request):
 			Q(user__workshop=workshop) | Q(employee_task__stage__workshop=workshop)
 		).aggregate(total=Sum('quantity'))['total'] or 0
 		stats['defects'] = float(defects_kg)
-		stats['summary'] = workshop.get_workshop_summary()
+		stats['summary'] = summaries[workshop.pk]
 		workshops_stats.append(stats)
 
 	return Response({
@@ -460,6 +475,7 @@ def workshops_list(request):
 		'workshop_masters__master',
 		'manager'
 	))
+	summaries = workshop_summaries(workshops)
 	
 	# Подготавливаем данные для каждого цеха
 	workshops_data = []
@@ -472,7 +488,7 @@ def workshops_list(request):
 	for workshop in workshops:
 		try:
 			workshop_stats = _calculate_workshop_stats(workshop, week_ago, month_ago)
-			workshop_summary = workshop.get_workshop_summary()
+			workshop_summary = summaries[workshop.pk]
 			# Подсчитываем сотрудников в цехе
 			employees_count = workshop_stats.get('employees_count', workshop.users.count())
 			
@@ -0,0 +1,227 @@
+"""
+Агрегация временных рядов для дашбордов.
+
+Вместо цикла «запрос на каждый день» каждая серия считается одним
+сгруппированным запросом (Trunc по дню/неделе/месяцу), а пустые корзины
+дозаполняются нулями в Python. Количество запросов не зависит от длины
+периода.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from core.caching import cache_aside
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+DASHBOARD_CACHE_NAMESPACE = 'orders-dashboard'
+DASHBOARD_CACHE_TTL = 300
+
+LABEL_FORMATS = {
+    'day': '%d.%m',
+    'week': '%d.%m',
+    'month': '%m.%Y',
+}
+
+
+def bucket_start(value: date, granularity: str) -> date:
+    """Начало корзины, в которую попадает дата (совпадает с Trunc в БД)."""
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value: date, granularity: str) -> date:
+    if granularity == 'week':
+        return value + timedelta(days=7)
+    if granularity == 'month':
+        if value.month == 12:
+            return value.replace(year=value.year + 1, month=1, day=1)
+        return value.replace(month=value.month + 1, day=1)
+    return value + timedelta(days=1)
+
+
+def bucket_range(start: date, end: date, granularity: str) -> List[date]:
+    """Все корзины периода [start, end] включительно, по порядку."""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, granularity)
+    return buckets
+
+
+def grouped_series(queryset, date_field: str, aggregate, granularity: str = 'day') -> Dict[date, object]:
+    """
+    Один GROUP BY-запрос: {начало корзины: значение агрегата}.
+
+    date_field может быть DateTimeField (в т.ч. через связь, например
+    'order__created_at') — усечение выполняется в текущем часовом поясе,
+    как и фильтры вида created_at__date.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Неизвестная гранулярность: {granularity}')
+    rows = (
+        queryset
+        .annotate(bucket=Trunc(date_field, granularity, output_field=DateField()))
+        .values('bucket')
+        .annotate(total=aggregate)
+        .order_by()
+    )
+    return {row['bucket']: row['total'] for row in rows if row['bucket'] is not None}
+
+
+def fill_buckets(series: Dict[date, object], buckets: Iterable[date], default=0) -> list:
+    return [series.get(bucket) or default for bucket in buckets]
+
+
+def resolve_window(period: str, granularity: Optional[str] = None, today: Optional[date] = None):
+    """
+    Переводит ?period=week|month|year в (start, end, granularity).
+
+    По умолчанию сохраняется прежняя дневная детализация графиков;
+    гранулярность можно переопределить параметром.
+    """
+    today = today or timezone.localdate()
+    days = {'month': 30, 'year': 365}.get(period, 7)
+    granularity = granularity if granularity in GRANULARITIES else 'day'
+    start = today - timedelta(days=days - 1)
+    return start, today, granularity
+
+
+def revenue_chart(start: date, end: date, granularity: str = 'day') -> dict:
+    """
+    Серии для графика выручки: доход, продажи (шт), число заказов и брак.
+
+    Ровно четыре сгруппированных запроса на любой период.
+    """
+    from apps.employee_tasks.models import EmployeeTask
+    from .models import Order, OrderDefect, OrderItem
+
+    buckets = bucket_range(start, end, granularity)
+    window_start = buckets[0] if buckets else start
+
+    orders = grouped_series(
+        Order.objects.filter(created_at__date__gte=window_start, created_at__date__lte=end),
+        'created_at', Count('id'), granularity,
+    )
+
+    items_qs = (
+        OrderItem.objects
+        .filter(order__created_at__date__gte=window_start, order__created_at__date__lte=end)
+        .annotate(bucket=Trunc('order__created_at', granularity, output_field=DateField()))
+        .values('bucket')
+        .annotate(revenue=Sum(F('product__price') * F('quantity')), sales=Sum('quantity'))
+        .order_by()
+    )
+    revenue, sales = {}, {}
+    for row in items_qs:
+        revenue[row['bucket']] = row['revenue']
+        sales[row['bucket']] = row['sales']
+
+    order_defects = grouped_series(
+        OrderDefect.objects.filter(date__date__gte=window_start, date__date__lte=end),
+        'date', Sum('quantity'), granularity,
+    )
+    task_defects = grouped_series(
+        EmployeeTask.objects.filter(created_at__date__gte=window_start, created_at__date__lte=end),
+        'created_at', Sum('defective_quantity'), granularity,
+    )
+
+    label_format = LABEL_FORMATS[granularity]
+    return {
+        'labels': [bucket.strftime(label_format) for bucket in buckets],
+        'revenue': fill_buckets(revenue, buckets),
+        'defects': [
+            (order_defects.get(bucket) or 0) + (task_defects.get(bucket) or 0)
+            for bucket in buckets
+        ],
+        'orders_count': fill_buckets(orders, buckets),
+        'sales': fill_buckets(sales, buckets),
+    }
+
+
+def workshop_production_chart(workshop, start: date, end: date, granularity: str = 'day') -> dict:
+    """
+    Выпуск и брак цеха по корзинам: два сгруппированных запроса.
+
+    Возвращает корзины вместе с сериями, подписи формирует вызывающий код.
+    """
+    from apps.defects.models import Defect
+    from apps.employee_tasks.models import EmployeeTask
+
+    buckets = bucket_range(start, end, granularity)
+    window_start = buckets[0] if buckets else start
+
+    products = grouped_series(
+        EmployeeTask.objects.filter(
+            stage__workshop=workshop,
+            completed_at__date__gte=window_start,
+            completed_at__date__lte=end,
+        ),
+        'completed_at', Sum('completed_quantity'), granularity,
+    )
+    defective = grouped_series(
+        Defect.objects.filter(
+            user__workshop=workshop,
+            created_at__date__gte=window_start,
+            created_at__date__lte=end,
+        ),
+        'created_at', Count('id'), granularity,
+    )
+
+    return {
+        'buckets': buckets,
+        'products': fill_buckets(products, buckets),
+        'defective': fill_buckets(defective, buckets),
+    }
+
+
+@cache_aside(DASHBOARD_CACHE_NAMESPACE, ttl=DASHBOARD_CACHE_TTL)
+def dashboard_overview() -> dict:
+    """
+    Сводные показатели главного дашборда.
+
+    Кэшируются в пространстве DASHBOARD_CACHE_NAMESPACE и сбрасываются при
+    изменении заказов, позиций, брака, задач и готовой продукции (см.
+    orders/models.py); «выпуск за 30 дней» и число сотрудников обновляются
+    не реже DASHBOARD_CACHE_TTL.
+    """
+    from django.contrib.auth import get_user_model
+
+    from apps.employee_tasks.models import EmployeeTask, ProductionDailyRollup
+    from apps.finished_goods.models import FinishedGood
+    from .models import Order, OrderDefect, OrderItem
+
+    items = OrderItem.objects.aggregate(
+        income=Sum(F('product__price') * F('quantity')),
+        sales=Sum('quantity'),
+    )
+    order_defects_total = OrderDefect.objects.aggregate(total=Sum('quantity'))['total'] or 0
+    employee_tasks_defects_total = ProductionDailyRollup.objects.aggregate(total=Sum('defective'))['total'] or 0
+    month_start = timezone.now() - timedelta(days=30)
+    products_last_month = EmployeeTask.objects.filter(
+        completed_at__isnull=False,
+        completed_at__gte=month_start,
+    ).aggregate(total=Sum('completed_quantity'))['total'] or 0
+    stock_value = FinishedGood.objects.filter(status='stock').aggregate(
+        total=Sum(F('quantity') * F('product__price'))
+    )['total'] or 0
+    return {
+        'total_income': items['income'] or 0,
+        'product_sales': items['sales'] or 0,
+        'defective_products': order_defects_total + employee_tasks_defects_total,
+        'total_employees': get_user_model().objects.count(),
+        'products_last_month': products_last_month,
+        'total_orders': Order.objects.count(),
+        'active_orders': Order.objects.filter(status__in=['production', 'new']).count(),
+        'stock_value': stock_value,
+    }
@@ -0,0 +1,190 @@
+"""
+Приём заказов: создание заказа, его позиций и этапов.
+
+Все товары пакета проверяются одним запросом (in_bulk), позиции
+вставляются одним bulk_create, а заказ, позиции и этапы создаются в одной
+транзакции — при ошибке не остаётся заказов без позиций или этапов.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+
+from .models import Order, OrderItem, create_order_stages
+
+
+ITEM_FIELDS = (
+    'size', 'color', 'glass_type', 'paint_type', 'paint_color',
+    'cnc_specs', 'cutting_specs', 'preparation_specs', 'packaging_notes',
+)
+
+DEFAULT_GLASS_TYPE = 'sandblasted'
+
+
+class OrderIngestionError(ValueError):
+    """Некорректные данные заказа; текст пригоден для ответа API."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _quantity(item_data) -> int:
+    quantity = _as_int(item_data.get('quantity', 1))
+    if quantity is None or quantity < 0:
+        raise OrderIngestionError(f"Некорректное количество: {item_data.get('quantity')}")
+    return quantity
+
+
+def _items_list(items_data) -> List[dict]:
+    """Позиции заказа как список объектов; иначе OrderIngestionError."""
+    if not isinstance(items_data, (list, tuple)):
+        raise OrderIngestionError('Позиции заказа должны быть списком')
+    for number, item_data in enumerate(items_data, start=1):
+        if not isinstance(item_data, dict):
+            raise OrderIngestionError(f"Некорректная позиция {number}: ожидается объект")
+    return list(items_data)
+
+
+def load_products(items_data: Iterable[dict]) -> Dict[int, object]:
+    """Все товары позиций одним запросом: {id: Product}."""
+    from apps.products.models import Product
+
+    ids = {_as_int(item.get('product_id')) for item in items_data}
+    ids.discard(None)
+    return Product.objects.in_bulk(ids) if ids else {}
+
+
+def build_order_items(items_data: Iterable[dict], products: Dict[int, object], skip_missing: bool = False) -> List[OrderItem]:
+    """
+    Несохранённые OrderItem без заказа.
+
+    Отсутствующие товары либо пропускаются (skip_missing), либо приводят
+    к OrderIngestionError со списком всех ненайденных id.
+    """
+    items, missing = [], []
+    for item_data in items_data:
+        product = products.get(_as_int(item_data.get('product_id')))
+        if product is None:
+            if not skip_missing:
+                missing.append(item_data.get('product_id'))
+            continue
+        item = OrderItem(
+            product=product,
+            quantity=_quantity(item_data),
+            **{field: item_data.get(field) or '' for field in ITEM_FIELDS},
+        )
+        # bulk_create не вызывает OrderItem.save(), повторяем его значение по умолчанию
+        if product.is_glass and not item.glass_type:
+            item.glass_type = DEFAULT_GLASS_TYPE
+        items.append(item)
+    if missing:
+        raise OrderIngestionError('Товары не найдены: ' + ', '.join(str(pk) for pk in missing))
+    return items
+
+
+def _attach(order, items: List[OrderItem]) -> None:
+    for item in items:
+        item.order = order
+
+
+def create_order(name, client, items_data, *, status='production', comment='', products=None) -> Order:
+    """Создаёт заказ с позициями и этапами в одной транзакции."""
+    items_data = _items_list(items_data)
+    if products is None:
+        products = load_products(items_data)
+    items = build_order_items(items_data, products)
+    with transaction.atomic():
+        order = Order.objects.create(name=name, client=client, status=status, comment=comment or '')
+        _attach(order, items)
+        OrderItem.objects.bulk_create(items)
+        create_order_stages(order, items=items)
+    return order
+
+
+def replace_order_items(order, items_data) -> List[OrderItem]:
+    """
+    Заменяет позиции заказа и пересоздаёт этапы.
+
+    Как и раньше при редактировании, позиции без товара или с
+    несуществующим товаром пропускаются.
+    """
+    items_data = _items_list(items_data)
+    items = build_order_items(items_data, load_products(items_data), skip_missing=True)
+    with transaction.atomic():
+        order.items.all().delete()
+        order.stages.all().delete()
+        _attach(order, items)
+        OrderItem.objects.bulk_create(items)
+        create_order_stages(order, items=items)
+    return items
+
+
+def create_orders(orders_data: List[dict]) -> List[Order]:
+    """
+    Пакетное создание заказов: всё или ничего.
+
+    Клиенты и товары всех заказов загружаются двумя запросами. Ошибки
+    собираются по индексам заказов в OrderIngestionError.errors до начала
+    записи в БД.
+    """
+    from apps.clients.models import Client
+
+    valid, errors = [], {}
+    for index, data in enumerate(orders_data):
+        try:
+            if not isinstance(data, dict):
+                raise OrderIngestionError('Заказ должен быть объектом')
+            items_data = _items_list(data.get('items_data') or [])
+            if not data.get('name') or not data.get('client_id') or not items_data:
+                raise OrderIngestionError('Необходимо указать название заказа, клиента и товары')
+        except OrderIngestionError as e:
+            errors[index] = str(e)
+            continue
+        valid.append((index, data, items_data))
+
+    client_ids = {_as_int(data.get('client_id')) for _, data, _ in valid}
+    client_ids.discard(None)
+    clients = Client.objects.in_bulk(client_ids) if client_ids else {}
+    products = load_products(item for _, _, items_data in valid for item in items_data)
+
+    prepared = []
+    for index, data, items_data in valid:
+        try:
+            client = clients.get(_as_int(data.get('client_id')))
+            if client is None:
+                raise OrderIngestionError(f"Клиент не найден: {data.get('client_id')}")
+            items = build_order_items(items_data, products)
+        except OrderIngestionError as e:
+            errors[index] = str(e)
+            continue
+        prepared.append((data, client, items))
+
+    if errors:
+        raise OrderIngestionError('Некорректные заказы в пакете', errors=errors)
+
+    orders = []
+    with transaction.atomic():
+        all_items = []
+        for data, client, items in prepared:
+            order = Order.objects.create(
+                name=data['name'],
+                client=client,
+                status='production',
+                comment=data.get('comment') or '',
+            )
+            _attach(order, items)
+            all_items.extend(items)
+            orders.append(order)
+        OrderItem.objects.bulk_create(all_items)
+        for order, (_, _, items) in zip(orders, prepared):
+            create_order_stages(order, items=items)
+    return orders
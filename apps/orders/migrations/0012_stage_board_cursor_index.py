@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finished_goods', '0006_pendingcostrecalculation'),
+        ('operations_workshops', '0008_storagezone'),
+        ('orders', '0011_add_preparation_specs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderstage',
+            index=models.Index(fields=['workshop', 'updated_at'], name='stage_workshop_updated_idx'),
+        ),
+    ]
@@ -160,6 +160,10 @@ class OrderStage(models.Model):
 
     class Meta:
         unique_together = ('order', 'workshop', 'stage_type', 'finished_good', 'order_item', 'parallel_group')
+        indexes = [
+            # Опрос доски цехов по курсору since
+            models.Index(fields=['workshop', 'updated_at'], name='stage_workshop_updated_idx'),
+        ]
         verbose_name = 'Этап заказа'
         verbose_name_plural = 'Этапы заказа'
 
@@ -261,83 +265,11 @@ class OrderStage(models.Model):
     def confirm_stage(self, completed_qty):
         """
         Мастер подтверждает выполнение этапа. Если выполнено не всё — остаток остаётся, выполненное уходит дальше.
+
+        Переход выполняется в apps.orders.workflow под блокировкой этапа.
         """
-        from apps.orders.models import OrderStage
-        
-        # Проверяем, можно ли переходить к упаковке (для стеклянных изделий)
-        if not self.can_proceed_to_packaging():
-            return False, "Нельзя переходить к упаковке: резка стекла не завершена"
-        
-        if completed_qty >= self.plan_quantity:
-            self.completed_quantity = self.plan_quantity
-            self.status = 'done'
-            self.save()
-            
-            # Если это этап резки стекла, отмечаем его как завершенный
-            if self.is_glass_stage() and 'распил стекла' in (self.operation or '').lower():
-                if self.order_item:
-                    self.order_item.glass_cutting_completed = True
-                    self.order_item.glass_cutting_quantity = completed_qty
-                    self.order_item.save()
-            
-            # Если это этап упаковки, создаем запись в finished_goods
-            if self.is_packaging_stage():
-                self._create_finished_good(completed_qty)
-            
-            # Специальная логика для цеха ID4 (Пресс) - завершаем заказ
-            if self.workshop and self.workshop.id == 4:
-                # Завершаем весь заказ
-                self.order.status = 'completed'
-                self.order.save()
-                print(f"Заказ {self.order.id} завершен после выполнения этапа в цеху 4")
-                return True, "Заказ завершен"
-            
-            self._activate_next_stage(self.plan_quantity)
-        elif completed_qty > 0:
-            # Часть выполнено, часть — остаток
-            self.completed_quantity = completed_qty
-            self.status = 'partial'
-            self.save()
-            
-            # Если это этап резки стекла, отмечаем его как завершенный
-            if self.is_glass_stage() and 'распил стекла' in (self.operation or '').lower():
-                if self.order_item:
-                    self.order_item.glass_cutting_completed = True
-                    self.order_item.glass_cutting_quantity = completed_qty
-                    self.order_item.save()
-            
-            # Если это этап упаковки, создаем запись в finished_goods
-            if self.is_packaging_stage():
-                self._create_finished_good(completed_qty)
-            
-            # Специальная логика для цеха ID4 (Пресс) - завершаем заказ даже при частичном выполнении
-            if self.workshop and self.workshop.id == 4:
-                # Завершаем весь заказ
-                self.order.status = 'completed'
-                self.order.save()
-                print(f"Заказ {self.order.id} завершен после частичного выполнения этапа в цеху 4")
-                return True, "Заказ завершен"
-            
-            self._activate_next_stage(completed_qty)
-            # Создаём новый этап-остаток в этом же цехе
-            OrderStage.objects.create(
-                order=self.order,
-                order_item=self.order_item,
-                stage_type=self.stage_type,
-                workshop=self.workshop,
-                operation=self.operation,
-                sequence=self.sequence,
-                plan_quantity=self.plan_quantity - completed_qty,
-                completed_quantity=0,
-                deadline=None,  # Можно задать новый срок
-                status='in_progress',
-                parallel_group=self.parallel_group,
-            )
-        else:
-            # Ничего не сделано — этап остаётся в работе
-            pass
-        
-        return True, "Этап подтвержден"
+        from .workflow import confirm_stage
+        return confirm_stage(self, completed_qty)
     
     def _create_finished_good(self, quantity):
         """Создает запись в finished_goods при завершении упаковки"""
@@ -375,73 +307,8 @@ class OrderStage(models.Model):
         Активирует следующий этап, если он есть, и передаёт туда qty.
         Если следующего этапа нет — создаёт его по workflow.
         """
-        from apps.orders.models import OrderStage
-        
-        # Определяем, к какому потоку относится текущий этап
-        current_parallel_group = self.parallel_group
-        current_order_item = self.order_item
-        
-        # Ищем следующий этап в том же потоке
-        next_seq = self.sequence + 1
-        
-        if current_parallel_group is not None:
-            # Для параллельных потоков ищем следующий этап в той же группе
-            next_stage = OrderStage.objects.filter(
-                order=self.order,
-                order_item=current_order_item,
-                parallel_group=current_parallel_group,
-                sequence=next_seq
-            ).first()
-        else:
-            # Для основного потока ищем следующий этап
-            next_stage = OrderStage.objects.filter(
-                order=self.order,
-                order_item=current_order_item,
-                parallel_group__isnull=True,
-                sequence=next_seq
-            ).first()
-        
-        if next_stage:
-            # Активируем существующий этап
-            next_stage.plan_quantity += qty
-            next_stage.status = 'in_progress'
-            next_stage.save()
-        else:
-            # Создаем новый этап по workflow
-            if current_parallel_group is not None:
-                # Для параллельных потоков (стекло)
-                workflow_steps = [step for step in ORDER_WORKFLOW if step.get("parallel_group") == current_parallel_group]
-            else:
-                # Для основного потока (обычные товары)
-                workflow_steps = [step for step in ORDER_WORKFLOW if step.get("parallel_group") is None]
-            
-            if next_seq - 1 < len(workflow_steps):
-                step = workflow_steps[next_seq - 1]
-                from apps.operations.workshops.models import Workshop
-                try:
-                    workshop = Workshop.objects.get(pk=step["workshop"])
-                    
-                    OrderStage.objects.create(
-                        order=self.order,
-                        order_item=current_order_item,
-                        sequence=next_seq,
-                        stage_type='workshop',
-                        workshop=workshop,
-                        operation=step["operation"],
-                        plan_quantity=qty,
-                        deadline=timezone.now().replace(hour=18, minute=0, second=0, microsecond=0).date(),
-                        status='in_progress',
-                        parallel_group=current_parallel_group,
-                    )
-                except Workshop.DoesNotExist:
-                    print(f"Workshop with ID {step['workshop']} not found, cannot create next stage")
-            else:
-                # Если это последний этап в workflow
-                # Для стеклянного потока (parallel_group=1) — не создаём упаковку, этапы завершаются на цехе 5
-                if current_parallel_group is None:
-                    self._create_packaging_stage(qty)
-                else:
-                    return
+        from .workflow import activate_next_stage
+        return activate_next_stage(self, qty)
     
     def _create_packaging_stage(self, qty):
         """
@@ -461,7 +328,7 @@ class OrderStage(models.Model):
             return
         
         # Создаем этап упаковки
-        OrderStage.objects.create(
+        return OrderStage.objects.create(
             order=self.order,
             order_item=self.order_item,
             sequence=self.sequence + 1,
@@ -835,13 +702,22 @@ ORDER_WORKFLOW = [
 ]
 
 
-def create_order_stages(order):
+def create_order_stages(order, items=None):
+    """
+    Создает агрегированные этапы заказа в цехах 1 и 4.
+
+    items — уже загруженные позиции (например, после bulk_create), чтобы не
+    перечитывать их из БД.
+    """
     from apps.operations.workshops.models import Workshop
     
-    # Получаем все позиции заказа
-    order_items = order.items.all()
+    # Получаем все позиции заказа вместе с товарами одним запросом
+    if items is not None:
+        order_items = list(items)
+    else:
+        order_items = list(order.items.select_related('product'))
     
-    if not order_items.exists():
+    if not order_items:
         # Если нет позиций, не создаем этапы
         print(f"Warning: No items found for order {order.id}, skipping stage creation")
         return
@@ -965,4 +841,17 @@ def create_stages_on_order(sender, instance, created, **kwargs):
     if created and not instance.stages.exists():
         # Создаем этапы только если есть позиции заказа
         if instance.items.exists():
-            create_order_stages(instance)
\ No newline at end of file
+            create_order_stages(instance)
+
+
+# Сброс кэша главного дашборда (analytics.dashboard_overview)
+from core.caching import invalidate_on
+from .analytics import DASHBOARD_CACHE_NAMESPACE
+
+invalidate_on(
+    DASHBOARD_CACHE_NAMESPACE,
+    Order, OrderItem, OrderDefect,
+    'employee_tasks.EmployeeTask',
+    'finished_goods.FinishedGood',
+    'products.Product',
+)
@@ -4,6 +4,7 @@ from apps.clients.models import Client
 from apps.products.models import Product
 from apps.operations.workshops.models import Workshop
 from apps.employee_tasks.serializers import EmployeeTaskSerializer
+from core.api import SparseFieldsetMixin
 
 
 def _safe_str(value):
@@ -169,7 +170,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return data
 
 
-class OrderStageSerializer(serializers.ModelSerializer):
+class OrderStageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     workshop = WorkshopShortSerializer(read_only=True)
     assigned = EmployeeTaskSerializer(source='employee_tasks', many=True, read_only=True)
     order_name = serializers.CharField(source='order.name', read_only=True)
@@ -317,7 +318,7 @@ class OrderDefectSerializer(serializers.ModelSerializer):
         return data
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     client = ClientFullSerializer(read_only=True)
     product = ProductFullSerializer(read_only=True)
     client_id = serializers.PrimaryKeyRelatedField(queryset=Client.objects.all(), write_only=True, source='client')
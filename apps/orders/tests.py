@@ -1,3 +1,399 @@
-from django.test import TestCase
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.clients.models import Client
+from apps.employee_tasks.models import EmployeeTask
+from apps.operations.workshops.models import Workshop
+from apps.products.models import Product
+from apps.users.models import User
+from core.instrumentation import QueryBudgetExceeded, snapshot
+
+from .analytics import bucket_range, dashboard_overview, revenue_chart
+from .ingestion import OrderIngestionError, create_order, create_orders
+from .models import Order, OrderItem, OrderStage
+from .workflow import TransitionError, next_workflow_step, resolve_transfer, stage_transition, transfer_stage
+
+
+class RevenueChartTests(TestCase):
+    def setUp(self):
+        self.client_obj = Client.objects.create(name="Клиент")
+        self.product = Product.objects.create(name="Дверь", price=Decimal("100.00"))
+
+    def test_bucket_range_week_and_month(self):
+        self.assertEqual(
+            bucket_range(date(2026, 3, 4), date(2026, 3, 17), 'week'),
+            [date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16)],
+        )
+        self.assertEqual(
+            bucket_range(date(2025, 11, 20), date(2026, 1, 5), 'month'),
+            [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)],
+        )
+
+    def test_revenue_chart_fills_empty_days(self):
+        order = Order.objects.create(name="Заказ", client=self.client_obj)
+        OrderItem.objects.create(order=order, product=self.product, quantity=3)
+
+        today = timezone.localdate()
+        chart = revenue_chart(today - timedelta(days=6), today)
+
+        self.assertEqual(len(chart['labels']), 7)
+        self.assertEqual(chart['revenue'][:6], [0] * 6)
+        self.assertEqual(chart['revenue'][-1], Decimal("300.00"))
+        self.assertEqual(chart['sales'][-1], 3)
+        self.assertEqual(chart['orders_count'][-1], 1)
+
+    def test_revenue_chart_query_count_is_constant(self):
+        today = timezone.localdate()
+        with CaptureQueriesContext(connection) as week:
+            revenue_chart(today - timedelta(days=6), today)
+        with CaptureQueriesContext(connection) as year:
+            revenue_chart(today - timedelta(days=364), today)
+        self.assertEqual(len(week), 4)
+        self.assertEqual(len(year), 4)
+
+
+class OrderIngestionTests(TestCase):
+    def setUp(self):
+        Workshop.objects.get_or_create(pk=1, defaults={"name": "Распил"})
+        Workshop.objects.get_or_create(pk=4, defaults={"name": "Заготовка"})
+        self.client_obj = Client.objects.create(name="Клиент")
+        self.door = Product.objects.create(name="Дверь", price=Decimal("100.00"))
+        self.glass = Product.objects.create(name="Стекло", price=Decimal("50.00"), is_glass=True)
+
+    def test_create_order_with_items_and_stages(self):
+        order = create_order("Заказ", self.client_obj, [
+            {'product_id': self.door.id, 'quantity': '2'},
+            {'product_id': self.glass.id, 'quantity': 3},
+        ])
+
+        items = {item.product_id: item for item in order.items.all()}
+        self.assertEqual(items[self.glass.id].glass_type, 'sandblasted')
+        self.assertEqual(items[self.door.id].glass_type, '')
+        stages = order.stages.order_by('workshop_id')
+        self.assertEqual([stage.workshop_id for stage in stages], [1, 4])
+        self.assertEqual({stage.plan_quantity for stage in stages}, {5})
+        self.assertEqual({stage.parallel_group for stage in stages}, {1})
+
+    def test_missing_product_creates_nothing(self):
+        with self.assertRaises(OrderIngestionError):
+            create_order("Заказ", self.client_obj, [
+                {'product_id': self.door.id},
+                {'product_id': 999999},
+            ])
+        self.assertFalse(Order.objects.exists())
+
+    def test_batch_validates_all_orders_before_writing(self):
+        with self.assertRaises(OrderIngestionError) as ctx:
+            create_orders([
+                {'name': "Первый", 'client_id': self.client_obj.id, 'items_data': [{'product_id': self.door.id}]},
+                {'name': "Второй", 'client_id': 999999, 'items_data': [{'product_id': self.door.id}]},
+            ])
+        self.assertEqual(list(ctx.exception.errors), [1])
+        self.assertFalse(Order.objects.exists())
+
+    def test_non_object_items_are_rejected(self):
+        self.client.force_login(User.objects.create_user(username="manager", password="pass"))
+        for items_data in ([[self.door.id, 1]], [5], {'product_id': self.door.id}):
+            response = self.client.post('/orders/api/create/', {
+                'name': "Заказ", 'client_id': self.client_obj.id, 'items_data': items_data,
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 400, items_data)
+
+        response = self.client.post('/orders/api/create/batch/', [
+            {'name': "Первый", 'client_id': self.client_obj.id, 'items_data': [{'product_id': self.door.id}]},
+            {'name': "Второй", 'client_id': self.client_obj.id, 'items_data': [7]},
+            "Третий",
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.json()['errors']), ['1', '2'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_batch_item_queries_do_not_grow_with_items(self):
+        def batch(items_per_order):
+            return [
+                {
+                    'name': f"Заказ {n}",
+                    'client_id': self.client_obj.id,
+                    'items_data': [{'product_id': self.door.id}] * items_per_order,
+                }
+                for n in range(2)
+            ]
+
+        with CaptureQueriesContext(connection) as small:
+            create_orders(batch(1))
+        with CaptureQueriesContext(connection) as large:
+            create_orders(batch(20))
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(OrderItem.objects.count(), 42)
+
+
+class StageWorkflowTests(TestCase):
+    def setUp(self):
+        for pk in (2, 3, 9, 10):
+            Workshop.objects.get_or_create(pk=pk, defaults={"name": f"Цех {pk}"})
+        self.order = Order.objects.create(name="Заказ", client=Client.objects.create(name="Клиент"))
+
+    def glass_stage(self, workshop_id, sequence, plan=10):
+        return OrderStage.objects.create(
+            order=self.order, workshop_id=workshop_id, sequence=sequence,
+            plan_quantity=plan, parallel_group=1, operation="Операция",
+        )
+
+    def test_workflow_index_and_transfer_rules(self):
+        self.assertEqual(next_workflow_step(1, 1).workshop, 3)
+        self.assertIsNone(next_workflow_step(None, 1))
+        self.assertIsNone(next_workflow_step(1, 10))
+        self.assertEqual(resolve_transfer(True, 2, 12), 'glass_assembly')
+        self.assertEqual(resolve_transfer(False, 5, 6), 'press_exit')
+        with self.assertRaises(TransitionError):
+            resolve_transfer(True, 3, 12)
+
+    def test_repeated_confirmation_does_not_double_advance(self):
+        stage = self.glass_stage(2, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(stage.confirm_stage(10)[0])
+        success, _ = OrderStage.objects.get(pk=stage.pk).confirm_stage(10)
+
+        self.assertFalse(success)
+        next_stage = OrderStage.objects.get(order=self.order, workshop_id=3)
+        self.assertEqual(next_stage.plan_quantity, 10)
+
+    def test_confirmation_emits_event(self):
+        events = []
+
+        def receiver(sender, **kwargs):
+            events.append((kwargs['action'], kwargs['quantity'], kwargs['target'].workshop_id))
+
+        stage_transition.connect(receiver)
+        self.addCleanup(stage_transition.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.glass_stage(2, 1).confirm_stage(4)
+        self.assertEqual(events, [('confirm', 4, 3)])
+
+    def test_transfer_to_workshop_and_repeat_is_rejected(self):
+        stage = OrderStage.objects.create(order=self.order, workshop_id=2, sequence=1, plan_quantity=8)
+
+        result = transfer_stage(stage.pk, target_workshop_id=10, completed_qty=5)
+
+        self.assertEqual(result['completed_quantity'], 5)
+        self.assertEqual(OrderStage.objects.get(order=self.order, workshop_id=10).plan_quantity, 5)
+        with self.assertRaises(TransitionError):
+            transfer_stage(stage.pk, target_workshop_id=10, completed_qty=5)
+
+    def test_confirmation_queries_do_not_depend_on_position(self):
+        first, late = self.glass_stage(2, 1), self.glass_stage(9, 8)
+        with CaptureQueriesContext(connection) as early_queries:
+            first.confirm_stage(10)
+        with CaptureQueriesContext(connection) as late_queries:
+            late.confirm_stage(10)
+        self.assertEqual(len(early_queries), len(late_queries))
+
+
+class DashboardOverviewCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_obj = Client.objects.create(name="Клиент")
+
+    def test_overview_cached_and_invalidated_by_orders(self):
+        self.assertEqual(dashboard_overview()["active_orders"], 0)
+        with self.assertNumQueries(0):
+            dashboard_overview()
+
+        Order.objects.create(name="Заказ", client=self.client_obj, status="production")
+        self.assertEqual(dashboard_overview()["active_orders"], 1)
+
+
+class ByWorkshopQueryBudgetTests(TestCase):
+    url = '/orders/api/orders/by_workshop/'
+
+    def setUp(self):
+        cache.clear()
+        Workshop.objects.get_or_create(pk=1, defaults={"name": "Распил"})
+        Workshop.objects.get_or_create(pk=4, defaults={"name": "Заготовка"})
+        self.client_obj = Client.objects.create(name="Клиент")
+        self.door = Product.objects.create(name="Дверь", price=Decimal("100.00"))
+        self.glass = Product.objects.create(name="Стекло", price=Decimal("50.00"), is_glass=True)
+        self.worker = User.objects.create_user(username="worker", password="pass")
+        self.staff = User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def add_orders(self, count):
+        for n in range(count):
+            order = create_order(f"Заказ {n}", self.client_obj, [
+                {'product_id': self.door.id, 'quantity': 2},
+                {'product_id': self.glass.id, 'quantity': 1},
+            ])
+            order.stages.update(status='in_progress')
+            EmployeeTask.objects.create(stage=order.stages.first(), employee=self.worker, quantity=1)
+
+    def test_queries_do_not_grow_with_orders(self):
+        self.add_orders(1)
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(len(self.client.get(self.url).json()), 1)
+        self.add_orders(4)
+        with CaptureQueriesContext(connection) as five:
+            data = self.client.get(self.url).json()
+
+        self.assertEqual(len(data), 5)
+        self.assertEqual(len(one), len(five))
+        cutting = Workshop.objects.get(pk=1).name
+        self.assertEqual(data[0]['workshops_info'][cutting]['quantity'], 3)
+
+    @override_settings(QUERY_BUDGETS={'orders:order-by-workshop': 1})
+    def test_exceeded_budget_fails(self):
+        self.add_orders(1)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(self.url)
+
+        row = next(row for row in snapshot() if row['name'] == 'orders:order-by-workshop')
+        self.assertEqual(row['query_budget'], 1)
+        self.assertEqual(row['over_budget'], 1)
+
+    def test_metrics_are_recorded_and_staff_only(self):
+        self.add_orders(2)
+        self.client.get(self.url)
+
+        row = next(row for row in snapshot() if row['name'] == 'orders:order-by-workshop')
+        self.assertEqual(row['requests'], 1)
+        self.assertEqual(row['query_budget'], 12)
+        self.assertLessEqual(row['max_queries'], 12)
+        self.assertEqual(self.client.get('/metrics/requests/').status_code, 200)
+
+        self.client.force_login(self.worker)
+        self.assertEqual(self.client.get('/metrics/requests/').status_code, 403)
+
+
+class ApiPaginationTests(TestCase):
+    def setUp(self):
+        Workshop.objects.get_or_create(pk=1, defaults={"name": "Распил"})
+        Workshop.objects.get_or_create(pk=4, defaults={"name": "Заготовка"})
+        self.client_obj = Client.objects.create(name="Клиент")
+        self.door = Product.objects.create(name="Дверь", price=Decimal("100.00"))
+        self.client.force_login(User.objects.create_user(username="master", password="pass"))
+
+    def walk(self, url, params):
+        pages, url = [], f"{url}?{'&'.join(f'{k}={v}' for k, v in params.items())}"
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            url = data['next']
+        return pages
+
+    def test_orders_cursor_pages(self):
+        for n in range(5):
+            create_order(f"Заказ {n}", self.client_obj, [{'product_id': self.door.id, 'quantity': 1}])
+        # Одинаковое время создания: порядок держится на id
+        Order.objects.filter(name__in=["Заказ 1", "Заказ 2", "Заказ 3"]).update(created_at=timezone.now())
+
+        pages = self.walk('/orders/api/orders/', {'page_size': 2, 'fields': 'id,name'})
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertNotIn('count', pages[0])
+
+        back = self.client.get(pages[1]['previous']).json()
+        self.assertEqual(back['results'], pages[0]['results'])
+        self.assertEqual(self.client.get('/orders/api/orders/', {'cursor': 'испорчен'}).status_code, 404)
+
+    def test_stages_cursor_keeps_stages_without_deadline_last(self):
+        order = create_order("Заказ", self.client_obj, [{'product_id': self.door.id, 'quantity': 1}])
+        stages = list(order.stages.order_by('id'))
+        OrderStage.objects.filter(pk=stages[0].pk).update(deadline=date(2026, 1, 10))
+        expected = list(OrderStage.objects.exclude(deadline=None).order_by('deadline', 'sequence', 'id').values_list('id', flat=True))
+        expected += list(OrderStage.objects.filter(deadline=None).order_by('sequence', 'id').values_list('id', flat=True))
+
+        pages = self.walk('/orders/api/stages/', {'page_size': 1, 'fields': 'id'})
+        self.assertEqual([row['id'] for page in pages for row in page['results']], expected)
+
+    def test_sparse_fieldsets_collapse_nested_objects(self):
+        create_order("Заказ", self.client_obj, [{'product_id': self.door.id, 'quantity': 1}])
+
+        row = self.client.get('/orders/api/orders/', {'fields': 'id,client,items'}).json()['results'][0]
+        self.assertEqual(set(row), {'id', 'client', 'items'})
+        self.assertEqual(row['client'], self.client_obj.id)
+        self.assertEqual(len(row['items']), 1)
+        self.assertIsInstance(row['items'][0], int)
+
+        row = self.client.get('/orders/api/orders/', {'fields': 'id,client', 'expand': 'client'}).json()['results'][0]
+        self.assertEqual(row['client']['name'], "Клиент")
+        full = self.client.get('/orders/api/orders/').json()['results'][0]
+        self.assertEqual(full['items'][0]['product']['name'], "Дверь")
+
+    def test_defects_cursor_pages(self):
+        from apps.defects.models import Defect
+
+        defects = [Defect.objects.create(product=self.door, quantity=Decimal(n + 1)) for n in range(5)]
+        Defect.objects.filter(pk__in=[d.pk for d in defects[1:4]]).update(created_at=timezone.now())
+
+        pages = self.walk('/defects/api/defects/', {'page_size': 2, 'fields': 'id,quantity'})
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(ids, list(Defect.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertEqual(set(pages[0]['results'][0]), {'id', 'quantity'})
+
+    def test_finished_goods_cursor_and_annotated_fields(self):
+        from apps.finished_goods.models import FinishedGood
+
+        goods = [FinishedGood.objects.create(product=self.door, quantity=n + 1) for n in range(5)]
+        FinishedGood.objects.filter(pk__in=[g.pk for g in goods[:3]]).update(received_at=timezone.now())
+        FinishedGood.objects.filter(pk=goods[0].pk).update(
+            packaging_input_quantity=Decimal("2"), packaging_scrap_quantity=Decimal("1"),
+        )
+
+        url = '/finished_goods/api/finished_goods/'
+        pages = self.walk(url, {'page_size': 2, 'fields': 'id,efficiency,input_quantity'})
+        rows = [row for page in pages for row in page['results']]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            list(FinishedGood.objects.order_by('-received_at', '-id').values_list('id', flat=True)),
+        )
+        self.assertEqual({key for row in rows for key in row}, {'id', 'efficiency', 'input_quantity'})
+        by_id = {row['id']: row for row in rows}
+        self.assertEqual(by_id[goods[0].pk], {'id': goods[0].pk, 'efficiency': 50.0, 'input_quantity': 2.0})
+        self.assertEqual(by_id[goods[4].pk]['efficiency'], 100.0)
+
+
+class ListApiConsumerContractTests(TestCase):
+    """Страницы, читающие списки с курсорной пагинацией, не рассчитывают на count"""
+
+    list_urls = re.compile(
+        r"fetch\(\s*[`'\"]/(orders/api/orders|orders/api/stages|finished_goods/api/finished_goods|defects/api/defects)/[`'\"?]"
+    )
+
+    def templates(self):
+        root = Path(settings.BASE_DIR) / 'apps'
+        for path in sorted(root.glob('*/templates/**/*.html')):
+            yield path, path.read_text(encoding='utf-8')
+
+    def test_list_consumers_do_not_read_count(self):
+        checked = 0
+        for path, source in self.templates():
+            for match in self.list_urls.finditer(source):
+                # Код обработки ответа — до следующего запроса
+                following = source[match.end():]
+                handler = following[:following.find('fetch(')] if 'fetch(' in following else following[:1500]
+                self.assertIsNone(re.search(r'\.count\b', handler), f"{path}: список читает count")
+                checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_director_dashboards_take_totals_from_overview(self):
+        cache.clear()
+        client_obj = Client.objects.create(name="Клиент")
+        for n in range(3):
+            Order.objects.create(name=f"Заказ {n}", client=client_obj, status="new" if n else "done")
+        self.client.force_login(User.objects.create_user(username="director", password="pass"))
+
+        for name in ('dashboard.html', 'dashboard_mobile.html'):
+            source = (Path(settings.BASE_DIR) / 'apps/director/templates/director' / name).read_text(encoding='utf-8')
+            self.assertTrue("fetch('/orders/api/dashboard/overview/'" in source, f"{name}: нет запроса сводки")
+        overview = self.client.get('/orders/api/dashboard/overview/').json()
+        self.assertEqual((overview['total_orders'], overview['active_orders']), (3, 2))
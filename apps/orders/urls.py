@@ -3,6 +3,7 @@ from .views import (
     OrderViewSet,
     OrderPageView,
     OrderCreateAPIView,
+    OrderBatchCreateAPIView,
     OrderStageConfirmAPIView,
     StageViewSet,
     OrderStageTransferAPIView,
@@ -41,6 +42,7 @@ urlpatterns = [
     path('api/requests/approve/<int:request_id>/', ApproveRequestAPIView.as_view(), name='approve-request'),
     path('api/', include(router.urls)),
     path('api/create/', OrderCreateAPIView.as_view(), name='orders-create'),
+    path('api/create/batch/', OrderBatchCreateAPIView.as_view(), name='orders-create-batch'),
     path('api/stages/<int:stage_id>/confirm/', OrderStageConfirmAPIView.as_view(), name='order-stage-confirm'),
     path('api/stages/<int:stage_id>/transfer/', OrderStageTransferAPIView.as_view(), name='order-stage-transfer'),
     path('api/stages/<int:stage_id>/postpone/', OrderStagePostponeAPIView.as_view(), name='order-stage-postpone'),
@@ -0,0 +1,434 @@
+"""
+Переходы этапов заказа между цехами.
+
+ORDER_WORKFLOW и правила переводов (стекло только между цехами 2 и 12,
+завершение заказа на цехе 4, снятие стекла при выходе с цеха 5 в 6+)
+компилируются при импорте в таблицы с доступом по ключу. Каждый переход
+выполняется в транзакции под select_for_update исходного этапа с
+фиксированным числом запросов, поэтому повторное/параллельное
+подтверждение одного этапа не передаёт количество дальше дважды.
+
+После фиксации транзакции отправляется сигнал stage_transition.
+"""
+from __future__ import annotations
+
+from collections import namedtuple
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import ORDER_WORKFLOW, WORKSHOP_OPERATIONS, OrderItem, OrderStage
+
+
+WorkflowStep = namedtuple('WorkflowStep', ['workshop', 'operation', 'sequence', 'parallel_group'])
+
+GLASS_WORKSHOPS = (2, 12)
+GLASS_ASSEMBLY_WORKSHOP = 12
+ORDER_COMPLETION_WORKSHOP = 4
+PRESS_WORKSHOP = 5
+
+# Этапы в этих статусах уже передали своё количество дальше
+FINISHED_STATUSES = ('done', 'partial', 'completed')
+
+# Действия перевода
+PRESS_EXIT = 'press_exit'
+GLASS_ASSEMBLY = 'glass_assembly'
+TO_WORKSHOP = 'to_workshop'
+
+# Отправляется после коммита: stage, action, quantity, target (этап-получатель или None)
+stage_transition = Signal()
+
+
+class TransitionError(Exception):
+    """Переход запрещён правилами или неприменим к этапу."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def compile_workflow(workflow: Iterable[dict]) -> Dict[Tuple[Optional[int], int], WorkflowStep]:
+    """
+    {(parallel_group, номер шага в потоке): шаг}.
+
+    Номер шага — позиция в потоке начиная с 1, как её считал прежний
+    поиск по списку (workflow_steps[next_seq - 1]).
+    """
+    index = {}
+    positions = {}
+    for step in workflow:
+        group = step.get('parallel_group')
+        positions[group] = positions.get(group, 0) + 1
+        index[(group, positions[group])] = WorkflowStep(
+            step['workshop'], step['operation'], step['sequence'], group,
+        )
+    return index
+
+
+def classify_transfer(is_glass: bool, from_workshop: Optional[int], to_workshop: int) -> str:
+    """Правило перевода этапа; TransitionError, если перевод запрещён."""
+    if from_workshop == PRESS_WORKSHOP and to_workshop > PRESS_WORKSHOP:
+        return PRESS_EXIT
+    if is_glass:
+        if from_workshop not in GLASS_WORKSHOPS:
+            raise TransitionError('Glass items may only be processed in workshops 2 and 12')
+        if to_workshop not in GLASS_WORKSHOPS:
+            raise TransitionError('Glass items can only be transferred to workshop 2 or 12')
+        if to_workshop == GLASS_ASSEMBLY_WORKSHOP:
+            return GLASS_ASSEMBLY
+    return TO_WORKSHOP
+
+
+def compile_transfer_table(workshop_ids: Iterable[int]):
+    """{(is_glass, из цеха, в цех): действие или TransitionError} для известных цехов."""
+    workshop_ids = sorted(set(workshop_ids))
+    table = {}
+    for is_glass in (False, True):
+        for source in [None] + workshop_ids:
+            for target in workshop_ids:
+                try:
+                    table[(is_glass, source, target)] = classify_transfer(is_glass, source, target)
+                except TransitionError as e:
+                    table[(is_glass, source, target)] = e
+    return table
+
+
+WORKFLOW_INDEX = compile_workflow(ORDER_WORKFLOW)
+TRANSFER_TABLE = compile_transfer_table(set(WORKSHOP_OPERATIONS) | set(GLASS_WORKSHOPS))
+
+
+def next_workflow_step(parallel_group: Optional[int], sequence: int) -> Optional[WorkflowStep]:
+    return WORKFLOW_INDEX.get((parallel_group, sequence + 1))
+
+
+def resolve_transfer(is_glass: bool, from_workshop: Optional[int], to_workshop: int) -> str:
+    rule = TRANSFER_TABLE.get((is_glass, from_workshop, to_workshop))
+    if rule is None:
+        # Цех вне таблицы — применяем те же правила напрямую
+        rule = classify_transfer(is_glass, from_workshop, to_workshop)
+    if isinstance(rule, TransitionError):
+        raise rule
+    return rule
+
+
+def _emit(stage, action, quantity, target=None):
+    transaction.on_commit(lambda: stage_transition.send(
+        sender=OrderStage, stage=stage, action=action, quantity=quantity, target=target,
+    ))
+
+
+def lock_stage(stage_id) -> OrderStage:
+    """Этап под блокировкой строки вместе с цехом, заказом и позицией."""
+    return (
+        OrderStage.objects
+        .select_for_update(of=('self',))
+        .select_related('workshop', 'order', 'order_item__product')
+        .get(pk=stage_id)
+    )
+
+
+def _today_deadline():
+    return timezone.now().replace(hour=18, minute=0, second=0, microsecond=0).date()
+
+
+def _add_to_stage(stage_id, qty):
+    """Атомарно добавляет количество в существующий этап и возвращает его в работу."""
+    now = timezone.now()
+    OrderStage.objects.filter(pk=stage_id).update(
+        plan_quantity=F('plan_quantity') + qty,
+        status='in_progress',
+        date=now,
+        updated_at=now,
+    )
+
+
+def activate_next_stage(stage, qty) -> Optional[OrderStage]:
+    """
+    Передаёт qty в следующий этап потока; если его нет — создаёт по workflow.
+
+    В конце основного потока создаётся упаковка, стеклянный поток
+    завершается без неё.
+    """
+    from apps.operations.workshops.models import Workshop
+
+    next_stage = (
+        OrderStage.objects
+        .select_for_update()
+        .filter(
+            order_id=stage.order_id,
+            order_item_id=stage.order_item_id,
+            parallel_group=stage.parallel_group,
+            sequence=stage.sequence + 1,
+        )
+        .order_by('pk')
+        .first()
+    )
+    if next_stage:
+        _add_to_stage(next_stage.pk, qty)
+        return next_stage
+
+    step = next_workflow_step(stage.parallel_group, stage.sequence)
+    if step is None:
+        if stage.parallel_group is None:
+            return stage._create_packaging_stage(qty)
+        return None
+
+    try:
+        workshop = Workshop.objects.get(pk=step.workshop)
+    except Workshop.DoesNotExist:
+        print(f"Workshop with ID {step.workshop} not found, cannot create next stage")
+        return None
+    return OrderStage.objects.create(
+        order=stage.order,
+        order_item=stage.order_item,
+        sequence=stage.sequence + 1,
+        stage_type='workshop',
+        workshop=workshop,
+        operation=step.operation,
+        plan_quantity=qty,
+        deadline=_today_deadline(),
+        status='in_progress',
+        parallel_group=stage.parallel_group,
+    )
+
+
+def _mark_glass_cutting(stage, completed_qty):
+    if stage.is_glass_stage() and 'распил стекла' in (stage.operation or '').lower():
+        if stage.order_item:
+            stage.order_item.glass_cutting_completed = True
+            stage.order_item.glass_cutting_quantity = completed_qty
+            stage.order_item.save()
+
+
+def _apply_confirmation(stage, completed_qty):
+    """
+    Подтверждение заблокированного этапа.
+
+    Если выполнено не всё — выполненное уходит дальше, а на остаток
+    создаётся новый этап в том же цехе. Возвращает (успех, сообщение, этап-получатель).
+    """
+    if stage.status in FINISHED_STATUSES:
+        return False, "Этап уже подтвержден", None
+
+    # Проверяем, можно ли переходить к упаковке (для стеклянных изделий)
+    if not stage.can_proceed_to_packaging():
+        return False, "Нельзя переходить к упаковке: резка стекла не завершена", None
+
+    if completed_qty <= 0:
+        # Ничего не сделано — этап остаётся в работе
+        return True, "Этап подтвержден", None
+
+    full = completed_qty >= stage.plan_quantity
+    moved_qty = stage.plan_quantity if full else completed_qty
+    stage.completed_quantity = moved_qty
+    stage.status = 'done' if full else 'partial'
+    stage.save()
+
+    _mark_glass_cutting(stage, completed_qty)
+
+    # Если это этап упаковки, создаем запись в finished_goods
+    if stage.is_packaging_stage():
+        stage._create_finished_good(completed_qty)
+
+    # Цех ID4 (Пресс) завершает весь заказ, даже при частичном выполнении
+    if stage.workshop_id == ORDER_COMPLETION_WORKSHOP:
+        stage.order.status = 'completed'
+        stage.order.save()
+        print(f"Заказ {stage.order.id} завершен после выполнения этапа в цеху 4")
+        return True, "Заказ завершен", None
+
+    target = activate_next_stage(stage, moved_qty)
+    if not full:
+        # Создаём новый этап-остаток в этом же цехе
+        OrderStage.objects.create(
+            order=stage.order,
+            order_item=stage.order_item,
+            stage_type=stage.stage_type,
+            workshop=stage.workshop,
+            operation=stage.operation,
+            sequence=stage.sequence,
+            plan_quantity=stage.plan_quantity - completed_qty,
+            completed_quantity=0,
+            deadline=None,  # Можно задать новый срок
+            status='in_progress',
+            parallel_group=stage.parallel_group,
+        )
+    return True, "Этап подтвержден", target
+
+
+def confirm_stage(stage, completed_qty):
+    """Подтверждение этапа мастером: (успех, сообщение)."""
+    with transaction.atomic():
+        locked = lock_stage(stage.pk)
+        success, message, target = _apply_confirmation(locked, completed_qty)
+        if success:
+            _emit(locked, 'confirm', completed_qty, target)
+    stage.status = locked.status
+    stage.completed_quantity = locked.completed_quantity
+    return success, message
+
+
+def _strip_glass_items(stage, target_workshop_id):
+    """При выходе с цеха 5 дальше идут только нестеклянные товары."""
+    _, deleted = stage.order.items.filter(product__is_glass=True).delete()
+    glass_count = deleted.get(OrderItem._meta.label, 0)
+    if glass_count:
+        print(f"Удалено {glass_count} стеклянных товаров из заказа {stage.order.id} при переводе с пресса в цех {target_workshop_id}")
+
+
+def _transfer_press_exit(stage, workshop, qty):
+    _strip_glass_items(stage, workshop.id)
+
+    # Завершаем текущий этап полностью (статус 'completed')
+    _apply_confirmation(stage, stage.plan_quantity)
+    stage.status = 'completed'
+    stage.save(update_fields=['status'])
+
+    non_glass_quantity = stage.order.items.filter(product__is_glass=False).aggregate(
+        total=Sum('quantity')
+    )['total'] or 0
+    target = OrderStage.objects.create(
+        order=stage.order,
+        order_item=None,  # Агрегированный этап для всех нестеклянных товаров
+        sequence=(stage.sequence or 0) + 1,
+        stage_type='workshop',
+        workshop=workshop,
+        operation=f"Передано из: {stage.workshop.name if stage.workshop else ''}",
+        plan_quantity=non_glass_quantity,
+        deadline=timezone.now().date(),
+        status='in_progress',
+        parallel_group=stage.parallel_group,
+    )
+    return target, {'completed_quantity': non_glass_quantity, 'aggregated': True}
+
+
+def _transfer_glass_assembly(stage, workshop, qty):
+    _apply_confirmation(stage, qty)
+
+    # Агрегируем по заказу (order_item=NULL) в цехе сборки стекла
+    target = (
+        OrderStage.objects
+        .select_for_update()
+        .filter(
+            order_id=stage.order_id,
+            order_item__isnull=True,
+            workshop_id=workshop.id,
+            stage_type='workshop',
+            parallel_group=stage.parallel_group,
+        )
+        .order_by('sequence')
+        .first()
+    )
+    if target:
+        _add_to_stage(target.pk, qty)
+    else:
+        target = OrderStage.objects.create(
+            order=stage.order,
+            order_item=None,
+            sequence=(stage.sequence or 0) + 1,
+            stage_type='workshop',
+            workshop=workshop,
+            operation=f"Сборка заказа (стекло) из: {stage.workshop.name if stage.workshop else ''}",
+            plan_quantity=qty,
+            deadline=timezone.now().date(),
+            status='in_progress',
+            parallel_group=stage.parallel_group,
+        )
+    return target, {'completed_quantity': qty, 'aggregated': True}
+
+
+def _transfer_to_workshop(stage, workshop, qty):
+    _apply_confirmation(stage, qty)
+
+    # Ищем этап по заказу и позиции в выбранном цехе (без учёта sequence)
+    target = (
+        OrderStage.objects
+        .select_for_update()
+        .filter(
+            order_id=stage.order_id,
+            order_item_id=stage.order_item_id,
+            workshop_id=workshop.id,
+            stage_type='workshop',
+            parallel_group=stage.parallel_group,
+        )
+        .order_by('sequence')
+        .first()
+    )
+    if target:
+        OrderStage.objects.filter(pk=target.pk).update(
+            plan_quantity=qty, status='in_progress', updated_at=timezone.now(),
+        )
+    else:
+        target = OrderStage.objects.create(
+            order=stage.order,
+            order_item=stage.order_item,
+            sequence=(stage.sequence or 0) + 1,
+            stage_type='workshop',
+            workshop=workshop,
+            operation=f"Передано из: {stage.workshop.name if stage.workshop else ''}",
+            plan_quantity=qty,
+            deadline=timezone.now().date(),
+            status='in_progress',
+            parallel_group=stage.parallel_group,
+        )
+    return target, {'completed_quantity': qty}
+
+
+TRANSFER_HANDLERS = {
+    PRESS_EXIT: _transfer_press_exit,
+    GLASS_ASSEMBLY: _transfer_glass_assembly,
+    TO_WORKSHOP: _transfer_to_workshop,
+}
+
+
+def _clamp_quantity(value, plan_quantity):
+    try:
+        qty = int(value) if value is not None else plan_quantity
+    except (TypeError, ValueError):
+        qty = plan_quantity
+    return max(0, min(qty, plan_quantity))
+
+
+def transfer_stage(stage_id, target_workshop_id=None, completed_qty=None) -> dict:
+    """
+    Перевод этапа в другой цех по таблице правил.
+
+    Без target_workshop_id этап подтверждается на весь план и уходит дальше
+    по workflow. Возвращает данные для ответа API.
+    """
+    from apps.operations.workshops.models import Workshop
+
+    with transaction.atomic():
+        stage = lock_stage(stage_id)
+        if stage.status in FINISHED_STATUSES:
+            raise TransitionError('Этап уже подтвержден')
+        result = {'status': 'ok', 'stage': stage.id, 'action': 'transferred'}
+
+        if not target_workshop_id:
+            if stage.workshop_id == PRESS_WORKSHOP:
+                _strip_glass_items(stage, stage.workshop_id + 1)
+            _, _, target = _apply_confirmation(stage, stage.plan_quantity)
+            _emit(stage, 'transfer', stage.plan_quantity, target)
+            return result
+
+        try:
+            target_workshop_id = int(target_workshop_id)
+        except (TypeError, ValueError):
+            raise TransitionError('target_workshop_id must be an integer')
+
+        is_glass = bool(stage.order_item and stage.order_item.product and stage.order_item.product.is_glass)
+        action = resolve_transfer(is_glass, stage.workshop_id, target_workshop_id)
+
+        workshop = Workshop.objects.filter(pk=target_workshop_id).first()
+        if workshop is None:
+            raise TransitionError('Цех не найден', status_code=404)
+
+        qty = _clamp_quantity(completed_qty, stage.plan_quantity)
+        target, extra = TRANSFER_HANDLERS[action](stage, workshop, qty)
+        _emit(stage, 'transfer', extra['completed_quantity'], target)
+
+    result.update(target_workshop_id=target_workshop_id, **extra)
+    return result
@@ -6,6 +6,9 @@ from django.utils import timezone
 from apps.inventory.models import RawMaterial
 from apps.operations.workshops.models import Workshop
 from apps.services.models import Service
+from core.caching import get_or_set, invalidate_on
+
+COSTING_SETTINGS_CACHE = 'costing-settings'
 
 # Create your models here.
 
@@ -217,6 +220,11 @@ class CostingSettings(models.Model):
 
     @classmethod
     def get_solo(cls):
+        """Единственная запись настроек; кэшируется до её изменения."""
+        return get_or_set(COSTING_SETTINGS_CACHE, ('solo',), cls._load_solo, ttl=3600)
+
+    @classmethod
+    def _load_solo(cls):
         obj, _ = cls.objects.get_or_create(pk=1, defaults={
             "overhead_percent": Decimal('0.00'),
             "overhead_per_unit": Decimal('0.00'),
@@ -224,3 +232,6 @@ class CostingSettings(models.Model):
             "overhead_period_days": 30,
         })
         return obj
+
+
+invalidate_on(COSTING_SETTINGS_CACHE, CostingSettings)
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase
 from decimal import Decimal
 
@@ -48,3 +49,18 @@ class ProductCostingTests(TestCase):
 
         bd2 = calculate_product_cost(p, quantity=3)
         self.assertEqual(bd2["totals_for_quantity"]["total"], Decimal("1021.50"))
+
+
+class CostingSettingsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_get_solo_is_cached_until_saved(self):
+        CostingSettings.get_solo()  # создание записи сбрасывает кэш
+        CostingSettings.get_solo()
+        with self.assertNumQueries(0):
+            settings = CostingSettings.get_solo()
+
+        settings.overhead_percent = Decimal("7.00")
+        settings.save()
+        self.assertEqual(CostingSettings.get_solo().overhead_percent, Decimal("7.00"))
@@ -3,18 +3,19 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, Prefetch
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
 
-from apps.operations.workshops.models import Workshop, NeutralBatch, StorageZone
-from apps.employee_tasks.models import EmployeeTask
+from apps.operations.workshops.models import ALL_WORKSHOPS_CACHE, Workshop, WorkshopMaster, NeutralBatch, StorageZone
+from apps.employee_tasks.models import ProductionDailyRollup
 from apps.inventory.models import EmployeeMaterialBalance
 from apps.services.models import Service
 from apps.defects.models import Defect
 from apps.orders.models import OrderItem
 from apps.products.models import Product
+from core.caching import cache_aside
 
 User = get_user_model()
 
@@ -76,42 +77,52 @@ class WorkshopEmployeesView(APIView):
 		employees = User.objects.filter(workshop_id=workshop_id)
 		return Response([{'id': e.id, 'name': e.get_full_name()} for e in employees])
 
-class AllWorkshopsView(APIView):
-	permission_classes = [IsAuthenticated]
-	def get(self, request):
-		workshops = Workshop.objects.filter(is_active=True).order_by('name', 'id')
-		workshops_data = []
+@cache_aside(ALL_WORKSHOPS_CACHE, ttl=600)
+def _all_workshops_data():
+	"""Активные цеха с мастерами; кэшируется до изменения цехов, мастеров или сотрудников"""
+	workshops = (
+		Workshop.objects.filter(is_active=True)
+		.select_related('manager')
+		.prefetch_related(Prefetch(
+			'workshop_masters',
+			queryset=WorkshopMaster.objects.filter(is_active=True).select_related('master'),
+			to_attr='active_masters',
+		))
+		.order_by('name', 'id')
+	)
+	workshops_data = []
+	
+	for workshop in workshops:
+		master_info = []
 		
-		for workshop in workshops:
-			# Получаем всех мастеров цеха
-			all_masters = workshop.get_all_masters()
-			master_info = []
-			
-			# Главный мастер
-			if workshop.manager:
-				master_info.append({
-					'id': workshop.manager.id,
-					'name': workshop.manager.get_full_name(),
-					'role': 'main_manager'
-				})
-			
-			# Дополнительные мастера
-			additional_masters = workshop.workshop_masters.filter(is_active=True).select_related('master')
-			for wm in additional_masters:
-				master_info.append({
-					'id': wm.master.id,
-					'name': wm.master.get_full_name(),
-					'role': 'additional_master'
-				})
-			
-			workshops_data.append({
-				'id': workshop.id,
-				'name': workshop.name,
-				'masters': master_info,
-				'master_count': len(master_info)
+		# Главный мастер
+		if workshop.manager:
+			master_info.append({
+				'id': workshop.manager.id,
+				'name': workshop.manager.get_full_name(),
+				'role': 'main_manager'
 			})
 		
-		return Response(workshops_data)
+		# Дополнительные мастера
+		for wm in workshop.active_masters:
+			master_info.append({
+				'id': wm.master.id,
+				'name': wm.master.get_full_name(),
+				'role': 'additional_master'
+			})
+		
+		workshops_data.append({
+			'id': workshop.id,
+			'name': workshop.name,
+			'masters': master_info,
+			'master_count': len(master_info)
+		})
+	return workshops_data
+
+class AllWorkshopsView(APIView):
+	permission_classes = [IsAuthenticated]
+	def get(self, request):
+		return Response(_all_workshops_data())
 
 class WorkshopMastersView(APIView):
 	permission_classes = [IsAuthenticated]
@@ -233,17 +244,20 @@ class MasterWorkshopsStatsView(APIView):
         master_workshops = list(set(master_workshops))
         
         # Периоды для статистики
-        now = timezone.now()
-        week_ago = now - timedelta(days=7)
-        month_ago = now - timedelta(days=30)
+        today = timezone.localdate()
+        week_ago = today - timedelta(days=7)
+        month_ago = today - timedelta(days=30)
+        
+        # Один сгруппированный запрос к дневным итогам по всем цехам мастера
+        rollup_stats = self._rollup_stats([w.id for w in master_workshops], week_ago, month_ago)
         
         # Общая статистика по всем цехам мастера
-        total_stats = self._calculate_total_stats(master_workshops, week_ago, month_ago)
+        total_stats = self._calculate_total_stats(master_workshops, rollup_stats)
         
         # Статистика по каждому цеху
         workshops_stats = []
         for workshop in master_workshops:
-            workshop_stats = self._calculate_workshop_stats(workshop, week_ago, month_ago)
+            workshop_stats = self._calculate_workshop_stats(workshop, rollup_stats.get(workshop.id, {}))
             workshops_stats.append(workshop_stats)
         
         return Response({
@@ -251,56 +265,49 @@ class MasterWorkshopsStatsView(APIView):
             'workshops': workshops_stats
         })
     
-    def _calculate_total_stats(self, workshops, week_ago, month_ago):
-        """Рассчитывает общую статистику по всем цехам мастера"""
-        # Получаем все задачи по цехам мастера
-        workshop_ids = [w.id for w in workshops]
-        all_tasks = EmployeeTask.objects.filter(stage__workshop_id__in=workshop_ids)
-        
-        # Статистика за неделю
-        week_tasks = all_tasks.filter(created_at__gte=week_ago)
-        week_completed = week_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
-        
-        # Статистика за месяц
-        month_tasks = all_tasks.filter(created_at__gte=month_ago)
-        month_completed = month_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
-        
-        # Общая статистика
-        total_completed = all_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
-        
-        # Количество сотрудников
-        total_employees = sum(w.users.count() for w in workshops)
+    STAT_KEYS = (
+        'week_completed', 'week_defects',
+        'month_completed', 'month_defects',
+        'total_completed', 'total_defects', 'total_quantity',
+    )
+    
+    def _rollup_stats(self, workshop_ids, week_ago, month_ago):
+        """Суммы за неделю/месяц/всё время по каждому цеху из ProductionDailyRollup"""
+        rows = ProductionDailyRollup.objects.filter(workshop_id__in=workshop_ids).values('workshop_id').annotate(
+            week_completed=Sum('completed', filter=Q(date__gte=week_ago)),
+            week_defects=Sum('defective', filter=Q(date__gte=week_ago)),
+            month_completed=Sum('completed', filter=Q(date__gte=month_ago)),
+            month_defects=Sum('defective', filter=Q(date__gte=month_ago)),
+            total_completed=Sum('completed'),
+            total_defects=Sum('defective'),
+            total_quantity=Sum('quantity'),
+        ).order_by()
+        return {
+            row['workshop_id']: {key: row[key] or 0 for key in self.STAT_KEYS}
+            for row in rows
+        }
+    
+    def _build_stats(self, stats):
+        """Формирует блоки week/month/total из сумм"""
+        total_quantity = stats.get('total_quantity', 0)
+        total_completed_quantity = stats.get('total_completed', 0)
+        total_defects = stats.get('total_defects', 0)
         
         # Эффективность (процент выполненных задач без брака)
-        total_quantity = all_tasks.aggregate(total=Sum('quantity'))['total'] or 0
-        total_completed_quantity = total_completed['total'] or 0
-        total_defects = total_completed['defects'] or 0
-        
         efficiency = 0
         if total_quantity > 0:
             efficiency = round(((total_completed_quantity - total_defects) / total_quantity) * 100, 1)
         
         return {
-            'total_workshops': len(workshops),
-            'total_employees': total_employees,
             'week_stats': {
-                'completed_works': week_completed['total'] or 0,
-                'defects': week_completed['defects'] or 0,
-                'efficiency': self._calculate_efficiency(week_completed['total'] or 0, week_completed['defects'] or 0)
+                'completed_works': stats.get('week_completed', 0),
+                'defects': stats.get('week_defects', 0),
+                'efficiency': self._calculate_efficiency(stats.get('week_completed', 0), stats.get('week_defects', 0))
             },
             'month_stats': {
-                'completed_works': month_completed['total'] or 0,
-                'defects': month_completed['defects'] or 0,
-                'efficiency': self._calculate_efficiency(month_completed['total'] or 0, month_completed['defects'] or 0)
+                'completed_works': stats.get('month_completed', 0),
+                'defects': stats.get('month_defects', 0),
+                'efficiency': self._calculate_efficiency(stats.get('month_completed', 0), stats.get('month_defects', 0))
             },
             'total_stats': {
                 'completed_works': total_completed_quantity,
@@ -309,65 +316,30 @@ class MasterWorkshopsStatsView(APIView):
             }
         }
     
-    def _calculate_workshop_stats(self, workshop, week_ago, month_ago):
-        """Рассчитывает статистику по конкретному цеху"""
-        # Получаем задачи цеха
-        workshop_tasks = EmployeeTask.objects.filter(stage__workshop=workshop)
-        
-        # Статистика за неделю
-        week_tasks = workshop_tasks.filter(created_at__gte=week_ago)
-        week_completed = week_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
-        
-        # Статистика за месяц
-        month_tasks = workshop_tasks.filter(created_at__gte=month_ago)
-        month_completed = month_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
-        
-        # Общая статистика
-        total_completed = workshop_tasks.aggregate(
-            total=Sum('completed_quantity'),
-            defects=Sum('defective_quantity')
-        )
+    def _calculate_total_stats(self, workshops, rollup_stats):
+        """Рассчитывает общую статистику по всем цехам мастера"""
+        totals = {key: sum(stats[key] for stats in rollup_stats.values()) for key in self.STAT_KEYS}
         
         # Количество сотрудников
-        employees_count = workshop.users.count()
-        
-        # Эффективность
-        total_quantity = workshop_tasks.aggregate(total=Sum('quantity'))['total'] or 0
-        total_completed_quantity = total_completed['total'] or 0
-        total_defects = total_completed['defects'] or 0
-        
-        efficiency = 0
-        if total_quantity > 0:
-            efficiency = round(((total_completed_quantity - total_defects) / total_quantity) * 100, 1)
+        total_employees = sum(w.users.count() for w in workshops)
         
+        return {
+            'total_workshops': len(workshops),
+            'total_employees': total_employees,
+            **self._build_stats(totals),
+        }
+    
+    def _calculate_workshop_stats(self, workshop, stats):
+        """Рассчитывает статистику по конкретному цеху"""
         return {
             'id': workshop.id,
             'name': workshop.name,
             'description': workshop.description,
-            'employees_count': employees_count,
-            'week_stats': {
-                'completed_works': week_completed['total'] or 0,
-                'defects': week_completed['defects'] or 0,
-                'efficiency': self._calculate_efficiency(week_completed['total'] or 0, week_completed['defects'] or 0)
-            },
-            'month_stats': {
-                'completed_works': month_completed['total'] or 0,
-                'defects': month_completed['defects'] or 0,
-                'efficiency': self._calculate_efficiency(month_completed['total'] or 0, month_completed['defects'] or 0)
-            },
-            'total_stats': {
-                'completed_works': total_completed_quantity,
-                'defects': total_defects,
-                'efficiency': efficiency
-            }
+            'employees_count': workshop.users.count(),
+            **self._build_stats(stats),
         }
     
+    @staticmethod
     def _calculate_efficiency(completed, defects):
         """Рассчитывает эффективность в процентах"""
         if completed == 0:
@@ -728,6 +700,8 @@ class PackagingReportView(APIView):
                 order_item=order_item,
                 order=order,
                 total_quantity=produced_quantity,
+                packaging_input_quantity=total_input,
+                packaging_scrap_quantity=scrap_quantity,
             )
             
             # Логируем действие
@@ -753,6 +727,8 @@ class PackagingReportView(APIView):
                         f"Packaging defect: {scrap_quantity} kg of {total_input} kg."
                     ),
                 )
+                storage_zone.packaging_defect = defect
+                storage_zone.save(update_fields=["packaging_defect"])
 
             # Заработок для сдельной оплаты: ставка берётся из персональной ставки сотрудника
             # или, если она не задана, из первой активной услуги цеха.
@@ -925,7 +901,10 @@ class WarehouseReportView(APIView):
             )
 
             # Списываем из партии только тот объём, с которым реально работаем
+            used_before = zone.used_quantity or 0
             zone.consume(total_input)
+            # Вход и брак упаковки — в доле забранной части партии
+            packaging_input, packaging_scrap = zone.packaging_share(used_before, zone.used_quantity)
 
             # Создаём запись в складе готовой продукции
             from apps.finished_goods.models import FinishedGood
@@ -937,6 +916,9 @@ class WarehouseReportView(APIView):
                 quantity=int(produced_quantity),
                 workshop=workshop,
                 status="stock",
+                packaging_defect_id=zone.packaging_defect_id,
+                packaging_input_quantity=packaging_input,
+                packaging_scrap_quantity=packaging_scrap,
             )
 
             # Пытаемся сразу посчитать фактическую себестоимость по реальным задачам и расходам сырья
@@ -0,0 +1,224 @@
+"""
+Курсорная пагинация и выборочные поля для API.
+
+KeysetPagination листает выборку по составному ключу сортировки
+(например, created_at + id): следующая страница выбирается условием
+«строго после последней строки» вместо OFFSET, COUNT(*) не считается.
+Курсор в ?cursor= хранит значения ключа последней (или первой — для
+предыдущей страницы) строки; ответ — {'next', 'previous', 'results'}.
+Пустые значения (NULL) в ключе идут в конце списка. Последним полем
+ключа должен быть уникальный столбец (id).
+
+SparseFieldsetMixin для сериализаторов: ?fields=id,name,... оставляет в
+ответе только перечисленные поля, а вложенные объекты среди них
+(клиент, товар, этапы) заменяются их id, если не перечислены в
+?expand=. Без ?fields= ответ полный, как раньше. Действует только на
+чтение и только для сериализатора верхнего уровня.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import List, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.utils.http import urlencode
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def _query_list(request, param: str) -> Optional[List[str]]:
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по составному ключу ordering (см. модуль)."""
+    ordering: Sequence[str] = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    # ---- ключ и курсор ----
+
+    def _fields(self, queryset):
+        return [queryset.model._meta.get_field(key.lstrip('-')) for key in self.ordering]
+
+    def _values(self, row) -> list:
+        return [getattr(row, key.lstrip('-')) for key in self.ordering]
+
+    def encode_cursor(self, values, reverse: bool) -> str:
+        payload = {
+            'v': [value.isoformat() if hasattr(value, 'isoformat') else value for value in values],
+            'r': reverse,
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: str, queryset):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['v']
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            fields = self._fields(queryset)
+            values = [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+            return values, bool(payload.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    # ---- сортировка и условие «после курсора» ----
+
+    def _order_by(self, reverse: bool):
+        expressions = []
+        for key in self.ordering:
+            descending = key.startswith('-') != reverse
+            field = F(key.lstrip('-'))
+            # NULL в конце при прямом обходе, в начале — при обратном
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+            expressions.append(field.desc(**nulls) if descending else field.asc(**nulls))
+        return expressions
+
+    def _beyond(self, values, reverse: bool) -> Q:
+        """Строки строго после values по ключу (при reverse — строго до них)."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for key, value in zip(self.ordering, values):
+            name = key.lstrip('-')
+            lookup = 'lt' if key.startswith('-') != reverse else 'gt'
+            if value is None:
+                # NULL стоят последними: после них ничего, до них — все непустые
+                step = Q(**{f'{name}__isnull': False}) if reverse else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                step = Q(**{f'{name}__{lookup}': value})
+                if not reverse:
+                    step |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & step
+            equal &= same
+        return condition
+
+    # ---- DRF ----
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        values, reverse = self.decode_cursor(cursor, queryset) if cursor else (None, False)
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._beyond(values, reverse))
+        rows = list(queryset[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(self._values(rows[-1]), reverse=False)
+            if values is not None and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(self._values(rows[0]), reverse=True)
+        return rows
+
+    def _link(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = cursor
+        return f"{self.base_url.split('?', 1)[0]}?{urlencode(sorted(params.lists()), doseq=True)}"
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CreatedAtPagination(KeysetPagination):
+    """Новые записи первыми: (created_at, id) по убыванию."""
+    ordering = ('-created_at', '-id')
+
+
+class ReceivedAtPagination(KeysetPagination):
+    """Готовая продукция: последние поступления первыми, (received_at, id)."""
+    ordering = ('-received_at', '-id')
+
+
+class StageDeadlinePagination(KeysetPagination):
+    """Этапы по сроку и очередности: (deadline, sequence, id), без срока — в конце."""
+    ordering = ('deadline', 'sequence', 'id')
+
+
+class SparseFieldsetMixin:
+    """Выборочные поля сериализатора по ?fields= и ?expand= (см. модуль)."""
+
+    def _is_top_level(self) -> bool:
+        root = self.root
+        return root is self or (isinstance(self.parent, serializers.ListSerializer) and self.parent is root)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._is_top_level():
+            return fields
+        only = _query_list(request, 'fields')
+        if only is None:
+            return fields
+        expand = set(_query_list(request, 'expand') or [])
+        sparse = {}
+        for name in only:
+            field = fields.get(name)
+            if field is None or field.write_only:
+                continue
+            if isinstance(field, serializers.BaseSerializer) and name not in expand:
+                field = self._collapsed(name, field)
+            sparse[name] = field
+        return sparse
+
+    @staticmethod
+    def _collapsed(name: str, field):
+        """Вложенный объект -> его id (список id для many=True)."""
+        many = isinstance(field, serializers.ListSerializer)
+        source = field.source if field.source and field.source != name else None
+        kwargs = {'read_only': True, 'many': many}
+        if source:
+            kwargs['source'] = source
+        return serializers.PrimaryKeyRelatedField(**kwargs)
@@ -0,0 +1,96 @@
+"""
+Кэш-aside поверх общего кэша Django (Redis в production).
+
+Ключи разбиты на пространства имён с версией: ключ значения имеет вид
+``<namespace>:v<версия>:<части ключа>``, а сброс пространства — это
+атомарное увеличение его версии (cache.incr). Старые значения больше не
+читаются и истекают по TTL, поэтому глобальный cache.clear() не нужен.
+
+Сброс привязывается к моделям через invalidate_on(...): на post_save и
+post_delete версия увеличивается сразу (чтобы текущая транзакция не
+прочитала устаревшее значение) и ещё раз после коммита (чтобы значение,
+закэшированное параллельным запросом до коммита, тоже стало недоступным).
+"""
+from __future__ import annotations
+
+import functools
+from typing import Callable, Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+VERSION_KEY = 'ns:{}:version'
+
+DEFAULT_TTL = 300
+
+
+def namespace_version(namespace: str) -> int:
+    version = cache.get(VERSION_KEY.format(namespace))
+    if version is None:
+        cache.add(VERSION_KEY.format(namespace), 1, timeout=None)
+        version = cache.get(VERSION_KEY.format(namespace), 1)
+    return version
+
+
+def make_key(namespace: str, *parts) -> str:
+    suffix = ':'.join(str(part) for part in parts) or '-'
+    return f'{namespace}:v{namespace_version(namespace)}:{suffix}'
+
+
+def get_or_set(namespace: str, parts: Iterable, producer: Callable, ttl: int = DEFAULT_TTL):
+    """Значение из кэша или результат producer(), сохранённый на ttl секунд."""
+    key = make_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = producer()
+        cache.set(key, value, timeout=ttl)
+    return value
+
+
+def cache_aside(namespace: str, ttl: int = DEFAULT_TTL, key: Optional[Callable] = None):
+    """
+    Декоратор кэш-aside для функций без побочных эффектов.
+
+    key(*args, **kwargs) возвращает части ключа; по умолчанию — сами аргументы.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parts = key(*args, **kwargs) if key else (*args, *sorted(kwargs.items()))
+            return get_or_set(namespace, (func.__name__, *parts), lambda: func(*args, **kwargs), ttl)
+        wrapper.invalidate = lambda: invalidate(namespace)
+        return wrapper
+    return decorator
+
+
+def _bump(namespace: str) -> None:
+    try:
+        cache.incr(VERSION_KEY.format(namespace))
+    except ValueError:
+        # Версии ещё нет — значит, и значений этого пространства нет
+        cache.add(VERSION_KEY.format(namespace), 1, timeout=None)
+
+
+def invalidate(*namespaces: str) -> None:
+    """Сбрасывает пространства имён сейчас и ещё раз после коммита транзакции."""
+    for namespace in namespaces:
+        _bump(namespace)
+    transaction.on_commit(lambda: [_bump(namespace) for namespace in namespaces])
+
+
+def invalidate_on(namespace: str, *senders) -> None:
+    """
+    Сбрасывает пространство при сохранении или удалении моделей senders.
+
+    senders — классы моделей или строки 'app_label.Model'.
+    """
+    def receiver(sender, **kwargs):
+        if not kwargs.get('raw'):
+            invalidate(namespace)
+
+    for sender in senders:
+        uid = f'caching:{namespace}:{sender}'
+        post_save.connect(receiver, sender=sender, weak=False, dispatch_uid=uid + ':save')
+        post_delete.connect(receiver, sender=sender, weak=False, dispatch_uid=uid + ':delete')
@@ -42,9 +42,11 @@ app.conf.update(
     task_routes={
         'apps.orders.tasks.*': {'queue': 'orders'},
         'apps.finance.tasks.*': {'queue': 'finance'},
+        'apps.finished_goods.tasks.*': {'queue': 'finance'},
         'apps.defects.tasks.*': {'queue': 'defects'},
         'apps.employee_tasks.tasks.*': {'queue': 'tasks'},
         'apps.inventory.tasks.*': {'queue': 'inventory'},
+        'apps.notifications.tasks.*': {'queue': 'notifications'},
     },
     
     # Queue configuration
@@ -74,6 +76,10 @@ app.conf.update(
             'exchange': 'inventory',
             'routing_key': 'inventory',
         },
+        'notifications': {
+            'exchange': 'notifications',
+            'routing_key': 'notifications',
+        },
     },
     
     # Task execution settings
@@ -108,10 +114,26 @@ app.conf.update(
             'task': 'apps.attendance.tasks.auto_checkout_after_6pm',
             'schedule': 3600.0,  # Every hour (will check if it's after 6pm)
         },
+        'refresh-production-rollup': {
+            'task': 'apps.employee_tasks.tasks.refresh_production_rollup',
+            'schedule': 86400.0,  # Daily
+        },
+        'recalculate-pending-finished-good-costs': {
+            'task': 'apps.finished_goods.tasks.recalculate_pending_costs',
+            'schedule': 30.0,  # Окно схлопывания пересчёта себестоимости
+        },
+        'flush-user-activity': {
+            'task': 'apps.online.tasks.flush_user_activity',
+            'schedule': 60.0,  # Отложенная запись присутствия в UserActivity
+        },
         'cleanup-old-attendance': {
             'task': 'apps.attendance.tasks.cleanup_old_attendance_records',
             'schedule': 604800.0,  # Weekly
         },
+        'cleanup-export-jobs': {
+            'task': 'apps.finance.tasks.cleanup_export_jobs',
+            'schedule': 86400.0,  # Daily: файлы асинхронных выгрузок
+        },
     },
     
     # Monitoring
@@ -0,0 +1,329 @@
+"""
+Замеры запросов по имени URL: время, запросы к БД, повторы и кэш.
+
+RequestMetricsMiddleware на время запроса подключает обёртку выполнения
+SQL (connection.execute_wrapper) и счётчик обращений к кэшу, а после
+ответа добавляет замер в скользящие гистограммы в общем кэше (см.
+record). Для каждого имени URL хранится окно из METRICS_BUCKETS
+интервалов по METRICS_BUCKET_SECONDS: число запросов, суммарное и
+максимальное время, запросы к БД и их время, попадания в кэш и
+гистограммы времени и числа запросов. Повторяющиеся запросы (одинаковый
+SQL больше DUPLICATE_THRESHOLD раз — признак N+1) учитываются по
+отпечатку SQL.
+
+Бюджеты запросов объявляются в settings.QUERY_BUDGETS ({имя URL: N})
+или декоратором @query_budget(N) на view или action ViewSet; оба
+источника сводит budgets() по именам URL. Превышение
+пишется в журнал, а при settings.QUERY_BUDGETS_ENFORCE (включено при
+запуске тестов) поднимает QueryBudgetExceeded — тест упадёт.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import connection
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+METRICS_NAMESPACE = 'request-metrics'
+METRICS_BUCKET_SECONDS = 300
+METRICS_BUCKETS = 12
+
+DUPLICATE_THRESHOLD = 2
+
+# Границы корзин гистограмм (последняя корзина — «больше последней границы»)
+LATENCY_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)|\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запрос сделал больше запросов к БД, чем разрешено бюджетом эндпоинта."""
+
+
+def query_budget(limit: int):
+    """Объявляет бюджет запросов к БД для view-функции или action ViewSet."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def fingerprint(sql: str) -> str:
+    """SQL без литералов и с одинаковыми списками IN (...) — для поиска повторов."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('(...)', sql)
+
+
+class QueryCollector:
+    """Обёртка connection.execute_wrapper: считает запросы, их время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self) -> Dict[str, int]:
+        return {sql: n for sql, n in self.fingerprints.items() if n > DUPLICATE_THRESHOLD}
+
+
+class CacheCounter:
+    """Считает попадания и промахи cache.get текущего потока на время запроса."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        original = self.backend.get
+        sentinel = object()
+
+        def get(key, default=None, version=None):
+            value = original(key, sentinel, version=version)
+            if value is sentinel:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+        self.backend.get = get
+        return self
+
+    def __exit__(self, *exc):
+        # Снимаем подмену: метод экземпляра снова берётся из класса
+        self.backend.__dict__.pop('get', None)
+        return False
+
+
+def _decorated_budget(func) -> Optional[int]:
+    """Бюджет из декоратора @query_budget на view-функции или action ViewSet."""
+    budget = getattr(func, 'query_budget', None)
+    if budget is None and getattr(func, 'cls', None) is not None:
+        # DRF: as_view хранит класс и соответствие методов и actions
+        view = getattr(func, 'view_class', None) or func.cls
+        actions = getattr(func, 'actions', None) or {}
+        for name in set(actions.values()):
+            budget = getattr(getattr(view, name, None), 'query_budget', None)
+            if budget is not None:
+                break
+    return budget
+
+
+@lru_cache(maxsize=None)
+def _decorated_budgets(resolver) -> Dict[str, int]:
+    """Бюджеты декораторов по именам URL: URLconf обходится один раз на резолвер."""
+    budgets = {}
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                namespace = f'{prefix}{pattern.namespace}:' if pattern.namespace else prefix
+                walk(pattern.url_patterns, namespace)
+            elif pattern.name:
+                budget = _decorated_budget(pattern.callback)
+                if budget is not None:
+                    budgets.setdefault(f'{prefix}{pattern.name}', budget)
+
+    walk(resolver.url_patterns, '')
+    return budgets
+
+
+def budgets() -> Dict[str, int]:
+    """Бюджеты эндпоинтов по именам URL: декораторы, поверх — settings.QUERY_BUDGETS."""
+    return {**_decorated_budgets(get_resolver()), **getattr(settings, 'QUERY_BUDGETS', {})}
+
+
+def view_budget(resolver_match) -> Optional[int]:
+    """Бюджет эндпоинта: из settings.QUERY_BUDGETS или декоратора на view/action."""
+    if resolver_match is None:
+        return None
+    return budgets().get(resolver_match.view_name, _decorated_budget(resolver_match.func))
+
+
+def _bucket_index(value: float, bounds) -> int:
+    return bisect_left(bounds, value)
+
+
+def _metrics_key(bucket: int, name: str) -> str:
+    return f'{METRICS_NAMESPACE}:{bucket}:{name}'
+
+
+def _names_key(bucket: int) -> str:
+    return f'{METRICS_NAMESPACE}:{bucket}:names'
+
+
+def _empty_stats() -> dict:
+    return {
+        'requests': 0,
+        'errors': 0,
+        'time_ms': 0.0,
+        'max_time_ms': 0.0,
+        'queries': 0,
+        'max_queries': 0,
+        'db_time_ms': 0.0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'over_budget': 0,
+        'latency_histogram': [0] * (len(LATENCY_BOUNDS_MS) + 1),
+        'query_histogram': [0] * (len(QUERY_BOUNDS) + 1),
+        'duplicates': {},
+    }
+
+
+def record(name: str, sample: dict, now: Optional[float] = None) -> None:
+    """
+    Добавляет замер запроса в текущий интервал гистограмм эндпоинта name.
+
+    Запись — чтение и перезапись словаря интервала: при одновременных
+    запросах к одному эндпоинту часть замеров может потеряться, что
+    допустимо для статистики.
+    """
+    bucket = int((now or time.time()) // METRICS_BUCKET_SECONDS)
+    ttl = METRICS_BUCKET_SECONDS * (METRICS_BUCKETS + 1)
+    key = _metrics_key(bucket, name)
+    stats = cache.get(key) or _empty_stats()
+    stats['requests'] += 1
+    stats['errors'] += 1 if sample['status'] >= 500 else 0
+    stats['time_ms'] += sample['time_ms']
+    stats['max_time_ms'] = max(stats['max_time_ms'], sample['time_ms'])
+    stats['queries'] += sample['queries']
+    stats['max_queries'] = max(stats['max_queries'], sample['queries'])
+    stats['db_time_ms'] += sample['db_time_ms']
+    stats['cache_hits'] += sample['cache_hits']
+    stats['cache_misses'] += sample['cache_misses']
+    stats['over_budget'] += 1 if sample.get('over_budget') else 0
+    stats['latency_histogram'][_bucket_index(sample['time_ms'], LATENCY_BOUNDS_MS)] += 1
+    stats['query_histogram'][_bucket_index(sample['queries'], QUERY_BOUNDS)] += 1
+    for sql, n in sample['duplicates'].items():
+        stats['duplicates'][sql] = max(stats['duplicates'].get(sql, 0), n)
+    cache.set(key, stats, timeout=ttl)
+
+    names = cache.get(_names_key(bucket)) or set()
+    if name not in names:
+        names.add(name)
+        cache.set(_names_key(bucket), names, timeout=ttl)
+
+
+def snapshot(now: Optional[float] = None) -> List[dict]:
+    """Итоги по эндпоинтам за окно METRICS_BUCKETS интервалов (для страницы метрик)."""
+    current = int((now or time.time()) // METRICS_BUCKET_SECONDS)
+    buckets = range(current - METRICS_BUCKETS + 1, current + 1)
+    names = set()
+    for names_in_bucket in cache.get_many([_names_key(b) for b in buckets]).values():
+        names |= names_in_bucket
+    keys = {_metrics_key(b, name): name for b in buckets for name in names}
+    totals = {}
+    for key, stats in cache.get_many(list(keys)).items():
+        total = totals.setdefault(keys[key], _empty_stats())
+        for field in ('requests', 'errors', 'time_ms', 'queries', 'db_time_ms', 'cache_hits', 'cache_misses', 'over_budget'):
+            total[field] += stats[field]
+        total['max_time_ms'] = max(total['max_time_ms'], stats['max_time_ms'])
+        total['max_queries'] = max(total['max_queries'], stats['max_queries'])
+        for histogram in ('latency_histogram', 'query_histogram'):
+            total[histogram] = [a + b for a, b in zip(total[histogram], stats[histogram])]
+        for sql, n in stats['duplicates'].items():
+            total['duplicates'][sql] = max(total['duplicates'].get(sql, 0), n)
+
+    endpoint_budgets = budgets()
+    rows = []
+    for name, total in totals.items():
+        requests = total['requests'] or 1
+        lookups = total['cache_hits'] + total['cache_misses']
+        rows.append({
+            'name': name,
+            'requests': total['requests'],
+            'errors': total['errors'],
+            'avg_time_ms': round(total['time_ms'] / requests, 2),
+            'max_time_ms': round(total['max_time_ms'], 2),
+            'avg_queries': round(total['queries'] / requests, 2),
+            'max_queries': total['max_queries'],
+            'avg_db_time_ms': round(total['db_time_ms'] / requests, 2),
+            'cache_hit_ratio': round(total['cache_hits'] / lookups, 3) if lookups else None,
+            'query_budget': endpoint_budgets.get(name),
+            'over_budget': total['over_budget'],
+            'latency_histogram': dict(zip([f'<={b}' for b in LATENCY_BOUNDS_MS] + ['>'], total['latency_histogram'])),
+            'query_histogram': dict(zip([f'<={b}' for b in QUERY_BOUNDS] + ['>'], total['query_histogram'])),
+            'duplicate_queries': sorted(
+                ({'sql': sql, 'count': n} for sql, n in total['duplicates'].items()),
+                key=lambda row: -row['count'],
+            )[:10],
+        })
+    rows.sort(key=lambda row: -row['avg_time_ms'] * row['requests'])
+    return rows
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware замеров запросов по имени URL (см. модуль).
+
+    Статика, медиа и сама страница метрик не замеряются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.skip_prefixes = tuple(
+            prefix for prefix in (getattr(settings, 'STATIC_URL', None), getattr(settings, 'MEDIA_URL', None)) if prefix
+        )
+
+    def __call__(self, request):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True) or request.path.startswith(self.skip_prefixes):
+            return self.get_response(request)
+
+        collector = QueryCollector()
+        started = time.perf_counter()
+        with CacheCounter(caches[DEFAULT_CACHE_ALIAS]) as counter, \
+                connection.execute_wrapper(collector):
+            response = self.get_response(request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else None
+        if not name or name == 'request-metrics':
+            return response
+
+        budget = view_budget(match)
+        over_budget = budget is not None and collector.count > budget
+        try:
+            record(name, {
+                'status': response.status_code,
+                'time_ms': elapsed_ms,
+                'queries': collector.count,
+                'db_time_ms': collector.duration * 1000,
+                'cache_hits': counter.hits,
+                'cache_misses': counter.misses,
+                'duplicates': collector.duplicates(),
+                'over_budget': over_budget,
+            })
+        except Exception as e:
+            logger.warning(f"Не удалось записать метрики запроса {name}: {e}")
+
+        if over_budget:
+            message = f"{name}: {collector.count} запросов к БД при бюджете {budget}"
+            logger.warning(message)
+            if getattr(settings, 'QUERY_BUDGETS_ENFORCE', False):
+                duplicates = '\n'.join(f"  {n}× {sql}" for sql, n in collector.duplicates().items())
+                raise QueryBudgetExceeded(f"{message}\n{duplicates}".rstrip())
+        return response
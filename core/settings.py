@@ -101,6 +101,7 @@ UNFOLD = {
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',   
+    'core.instrumentation.RequestMetricsMiddleware',  # Время, запросы к БД и кэш по эндпоинтам (/metrics/requests/)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -114,6 +115,12 @@ MIDDLEWARE = [
     'apps.online.middleware.UserActivityMiddleware',  # Middleware для отслеживания активности пользователей
 ]
 
+# Бюджеты запросов к БД по имени URL (см. core/instrumentation.py);
+# эндпоинты также объявляют бюджет декоратором @query_budget(N).
+# При запуске тестов превышение бюджета роняет тест.
+QUERY_BUDGETS = {}
+QUERY_BUDGETS_ENFORCE = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -120,13 +120,30 @@ REST_FRAMEWORK = {
 }
 
 # ==================== ПРОИЗВОДИТЕЛЬНОСТЬ ====================
-# Кэширование (можно настроить Redis или другой кэш)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Кэширование: общий для всех воркеров gunicorn и Celery кэш (Redis).
+# CACHE_BACKEND=file — файловый кэш на одном сервере (стенды, отладка без Redis).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis')
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_FILE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+            'KEY_PREFIX': 'smart_factory',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+            'KEY_PREFIX': 'smart_factory',
+            'TIMEOUT': 300,
+        }
     }
-}
 
 # Оптимизация статики
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
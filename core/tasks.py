@@ -60,13 +60,22 @@ def database_maintenance():
         raise
 
 @shared_task
-def clear_expired_cache():
-    """Clear expired cache entries."""
+def clear_expired_cache(namespaces=None):
+    """
+    Invalidate the given cache namespaces (see core.caching).
+
+    The shared cache is never cleared globally: expired keys are evicted by
+    the backend itself, and stale data is dropped by bumping the namespace
+    version.
+    """
     try:
-        # Clear Django's cache
-        cache.clear()
-        logger.info("Cache cleared successfully")
-        return "Cache cleared successfully"
+        from core.caching import invalidate
+
+        namespaces = list(namespaces or [])
+        if namespaces:
+            invalidate(*namespaces)
+        logger.info(f"Cache namespaces invalidated: {namespaces}")
+        return f"Invalidated {len(namespaces)} cache namespaces"
     except Exception as e:
         logger.error(f"Error in clear_expired_cache task: {e}")
         raise
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView, RedirectView
-from .views import HomeView
+from .views import HomeView, request_metrics
 from .error_views import (
     custom_400, custom_401, custom_403, custom_404, 
     custom_500, custom_502, custom_503, custom_error
@@ -57,6 +57,7 @@ urlpatterns = [
 	path('error/', custom_error, name='custom_error'),
 	path('support/', include('apps.support.urls')),
 	path('online/', include('apps.online.urls')),
+	path('metrics/requests/', request_metrics, name='request-metrics'),
 	# Тестовые URL для проверки страниц ошибок (только для разработки)
 	path('test/error/400/', test_400_view, name='test_400'),
 	path('test/error/401/', test_401_view, name='test_401'),
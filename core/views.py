@@ -1,4 +1,5 @@
 from django.shortcuts import redirect
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView
 from apps.users.models import User
@@ -60,4 +61,18 @@ class HomeView(TemplateView):
             User.Role.WORKER: '/employee_tasks/tasks/',
         }
         
-        return role_redirects.get(role, None)
\ No newline at end of file
+        return role_redirects.get(role, None)
+
+
+def request_metrics(request):
+    """
+    Метрики запросов по эндпоинтам за последний час (только для staff)
+
+    Среднее и максимальное время, запросы к БД, доля попаданий в кэш,
+    гистограммы и повторяющиеся запросы — см. core/instrumentation.py
+    """
+    from .instrumentation import snapshot
+
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+    return JsonResponse({'endpoints': snapshot()}, json_dumps_params={'ensure_ascii': False})